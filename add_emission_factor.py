@@ -1,24 +1,40 @@
-import mysql.connector
+"""
+Add or update an emission factor.
+
+    python add_emission_factor.py                     # human_daily, 1.0 kg per person per day
+    python add_emission_factor.py electricity 0.65 kg_co2e_per_kwh --valid-from 2025-01-01
+
+With --valid-from the factor only applies from that date on: the factor in effect
+before it keeps applying to earlier dates. Without it the factor applies to all dates
+up to the next dated factor, if any.
+"""
+import argparse
+from datetime import date
+
 from dotenv import load_dotenv
-import os
+
+import db_backends
+import factor_cache
 
 load_dotenv()
 
-conn = mysql.connector.connect(
-    host=os.getenv('DB_HOST', 'localhost'),
-    user=os.getenv('DB_USER', 'root'),
-    password=os.getenv('DB_PASSWORD'),
-    database=os.getenv('DB_NAME', 'campus_carbon')
-)
+parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+parser.add_argument('source_type', nargs='?', default='human_daily')
+parser.add_argument('factor', nargs='?', type=float, default=1.0, help='kg CO2e per unit')
+parser.add_argument('factor_unit', nargs='?', default='kg_co2e_per_person_per_day')
+parser.add_argument('--valid-from', type=date.fromisoformat, default=None, metavar='YYYY-MM-DD')
+args = parser.parse_args()
+
+backend = db_backends.from_env()
+conn = backend.connect()
 
 cursor = conn.cursor()
-cursor.execute("""
-    INSERT INTO emission_factors (source_type, factor, factor_unit) 
-    VALUES ('human_daily', 1.0, 'kg_co2e_per_person_per_day') 
-    ON DUPLICATE KEY UPDATE 
-        factor = VALUES(factor), 
-        factor_unit = VALUES(factor_unit)
-""")
+valid_from, valid_to = factor_cache.add_factor_period(
+    cursor, args.source_type, args.factor, args.factor_unit,
+    valid_from=args.valid_from or factor_cache.BEGINNING)
+# Bump the cache version so running app workers reload their emission factors
+factor_cache.bump_factor_version(cursor, backend)
 conn.commit()
-print('✅ Emission factor added/updated successfully')
+print(f"✅ Emission factor added/updated successfully: {args.source_type} = {args.factor} {args.factor_unit} "
+      f"from {valid_from} to {valid_to or 'further notice'}")
 conn.close()
@@ -1,18 +1,14 @@
-import mysql.connector
 from dotenv import load_dotenv
-import os
 import hashlib
 
+import db_backends
+
 # Load environment variables
 load_dotenv()
 
-# Connect to database
-conn = mysql.connector.connect(
-    host=os.getenv('DB_HOST'),
-    user=os.getenv('DB_USER'),
-    password=os.getenv('DB_PASSWORD'),
-    database=os.getenv('DB_NAME')
-)
+# Connect to database (DB_BACKEND picks MySQL or SQLite)
+backend = db_backends.from_env()
+conn = backend.connect()
 
 cursor = conn.cursor()
 
@@ -36,7 +32,7 @@ try:
     print(f"\n✅ User '{username}' added successfully!")
     print(f"   Username: {username}")
     print(f"   Password: {password}")
-except mysql.connector.IntegrityError:
+except backend.IntegrityError:
     print(f"\n⚠️ User '{username}' already exists!")
 
 conn.close()
@@ -0,0 +1,652 @@
+"""
+Optional in-process columnar store for dashboard analytics.
+
+Keeps `activity_data` (summed per site and source per day) and `human_population`
+(per site per day) in NumPy arrays indexed by day ordinal, so window totals and day/week/month/year
+rollups are array slices and `np.add.reduceat` calls instead of per-row Python
+dict updates. The store refreshes incrementally when marked dirty by an ingest
+endpoint or when its refresh interval elapses. Auto-increment ids are taken at
+insert time but become visible at commit, so a slow transaction can commit a row
+below ids already read: rows above `settled_id` (the MAX(id) seen `settle_seconds`
+ago) form a tail that is re-read on every refresh and applied as a difference, and
+only settled rows are added for good.
+Emission factors are effective-dated, so each series has a factor per day; when
+they change, only the changed days are re-weighted and the prefix sums are
+rebuilt from the first of them on.
+Every query takes an optional `sites` filter (site codes); None means all sites.
+
+Enabled in app.py with ANALYTICS_STORE=1 (requires numpy).
+"""
+import logging
+import threading
+import time
+from collections import deque
+from datetime import date, datetime
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import factor_cache
+
+logger = logging.getLogger(__name__)
+
+# date(1970, 1, 1).toordinal(); converts day ordinals to numpy datetime64[D]
+EPOCH_ORDINAL = 719163
+
+# Extra days allocated past the newest date so daily inserts rarely reallocate
+GROWTH_DAYS = 64
+
+# Upper bound for "every loaded day" range queries (clipped to the arrays)
+MAX_ORDINAL = date.max.toordinal()
+
+# Ids re-read on each refresh after the first load (inserts still in flight then)
+INITIAL_TAIL_IDS = 1000
+
+GROUPED_ACTIVITY = """
+    SELECT site_code, date, source_type, SUM(raw_value) AS raw_total, COUNT(*) AS row_count
+    FROM activity_data
+    WHERE {where}
+    GROUP BY site_code, date, source_type
+"""
+
+
+def to_ordinal(value):
+    """Day ordinal for a date, datetime or 'YYYY-MM-DD' string."""
+    if isinstance(value, datetime):
+        return value.date().toordinal()
+    if isinstance(value, date):
+        return value.toordinal()
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').toordinal()
+
+
+def bucket_starts(ords, kind):
+    """Indices where a new day/week/month/year bucket begins in a contiguous ordinal range."""
+    if kind == 'day':
+        return np.arange(len(ords))
+    if kind == 'week':
+        # date.fromordinal(1) is a Monday, so this groups Monday..Sunday (ISO weeks)
+        key = (ords - 1) // 7
+    else:
+        d64 = (ords - EPOCH_ORDINAL).astype('datetime64[D]')
+        key = d64.astype('datetime64[M]' if kind == 'month' else 'datetime64[Y]').astype(np.int64)
+    return np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+
+
+def ordinal_strings(ords, unit='D'):
+    """'YYYY-MM-DD' (unit='D') or 'YYYY-MM' (unit='M') strings for an array of day ordinals."""
+    d64 = (np.asarray(ords, dtype=np.int64) - EPOCH_ORDINAL).astype('datetime64[D]')
+    return np.datetime_as_string(d64, unit=unit).tolist()
+
+
+def bucket_labels(ords, kind):
+    """Labels used by the dashboard payload for the buckets starting at `ords`."""
+    if kind == 'day':
+        return ordinal_strings(ords, 'D')
+    if kind == 'month':
+        return ordinal_strings(ords, 'M')
+    labels = []
+    for o in ords.tolist():
+        d = date.fromordinal(o)
+        if kind == 'week':
+            iso_year, iso_week, _ = d.isocalendar()
+            labels.append(f"{iso_year}-W{iso_week:02d}")
+        else:
+            labels.append(d.year)
+    return labels
+
+
+def rollup(ords, values, present, kind):
+    """
+    Sum `values` into calendar buckets over a contiguous ordinal range.
+    Returns [(label, total)] for buckets that contain at least one present day.
+    """
+    if len(ords) == 0:
+        return []
+    starts = bucket_starts(ords, kind)
+    has_data = np.add.reduceat(present.astype(np.int64), starts) > 0
+    totals = np.add.reduceat(values, starts)[has_data]
+    starts = starts[has_data]
+    return list(zip(bucket_labels(ords[starts], kind), totals.tolist()))
+
+
+class EmissionsStore:
+    """Day-indexed NumPy arrays of activity and headcount data."""
+
+    def __init__(self, refresh_interval=5.0, factor_loader=None, settle_seconds=60.0):
+        """
+        `factor_loader(connection)` returns a factor_cache.FactorTimeline; defaults to reading
+        emission_factors. `settle_seconds` bounds how long an insert may take to commit.
+        """
+        self.refresh_interval = refresh_interval
+        self.settle_seconds = settle_seconds
+        self.factor_loader = factor_loader
+        self._lock = threading.RLock()
+        # Reads served without touching the DB / reads that triggered a refresh
+        self.stats = {'hit': 0, 'refresh': 0}
+        self._reset()
+
+    def _reset(self):
+        self.sites = []
+        self.site_index = {}
+        # One raw/counts row per (site row, source_type) series
+        self.series = []
+        self.series_index = {}
+        self.timeline = factor_cache.FactorTimeline()
+        self._periods = {}
+        self.day0 = None
+        self.raw = np.zeros((0, 0))
+        self.counts = np.zeros((0, 0), dtype=np.int64)
+        # kg CO2e per unit of each series per day; NaN where no factor applies
+        self.factor_grid = np.zeros((0, 0))
+        # First day column whose factored prefix sums are out of date (None: all current)
+        self.dirty_col = 0
+        self.raw_cum = self.count_cum = self.em_cum = None
+        # Headcounts: one row per site
+        self.students = np.zeros((0, 0), dtype=np.int64)
+        self.staff = np.zeros((0, 0), dtype=np.int64)
+        self.human_present = np.zeros((0, 0), dtype=bool)
+        # kg CO2e per person of the human_daily factor per day; 0 where none applies
+        self.human_factor = np.zeros(0)
+        self._build_index()
+        # Rows with id <= settled_id are in the arrays for good; rows above it were
+        # added from the last tail read (grouped, by (site, date, source))
+        self.settled_id = 0
+        self._tail = {}
+        # (monotonic time, MAX(id)) observations waiting to settle
+        self._observed = deque()
+        self.loaded = False
+        self.refreshed_at = 0.0
+        self.dirty = True
+
+    # ---- Maintenance ----
+    def mark_dirty(self):
+        """Called after writes so the next read picks up new rows."""
+        self.dirty = True
+
+    def needs_refresh(self):
+        return self.dirty or (time.monotonic() - self.refreshed_at) > self.refresh_interval
+
+    def ensure_fresh(self, connect, close=True):
+        """
+        Refresh from the database when dirty or stale. `connect` returns a DB
+        connection (or None); pass close=False when the caller owns it.
+        A loaded store keeps serving if the DB is unavailable.
+        """
+        if not self.needs_refresh():
+            self.stats['hit'] += 1
+            return
+        with self._lock:
+            if not self.needs_refresh():
+                self.stats['hit'] += 1
+                return
+            self.stats['refresh'] += 1
+            connection = connect()
+            if not connection:
+                if self.loaded:
+                    logger.warning("Analytics store refresh skipped: no database connection")
+                    return
+                raise RuntimeError("Analytics store could not connect to the database")
+            try:
+                self.refresh(connection)
+            finally:
+                if close:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+
+    def load(self, connection):
+        """Full reload from scratch."""
+        with self._lock:
+            self._reset()
+            self.refresh(connection)
+
+    def refresh(self, connection):
+        """Pull activity rows added since the last refresh, plus factors and headcounts."""
+        with self._lock:
+            cursor = connection.cursor(dictionary=True)
+            try:
+                if self.factor_loader:
+                    self._set_timeline(self.factor_loader(connection))
+                else:
+                    self._set_timeline(factor_cache.load_timeline(cursor))
+
+                self._refresh_activity(cursor)
+
+                # Headcounts are upserted per site and day, so reload them in full
+                cursor.execute("SELECT site_code, date, student_count, staff_count FROM human_population")
+                self._load_human(cursor.fetchall())
+                self._build_index()
+            finally:
+                cursor.close()
+            connection.commit()  # end the read snapshot so the next refresh sees new rows
+            self.loaded = True
+            self.dirty = False
+            self.refreshed_at = time.monotonic()
+
+    def _refresh_activity(self, cursor):
+        """Add newly settled activity rows and apply the change in the unsettled tail."""
+        cursor.execute("SELECT MAX(id) AS max_id FROM activity_data")
+        max_id = (cursor.fetchone() or {}).get('max_id') or 0
+        now = time.monotonic()
+        if not self.loaded:
+            settle_to = max(max_id - INITIAL_TAIL_IDS, 0)
+        else:
+            # Every id up to a MAX(id) seen settle_seconds ago has committed (or rolled back) by now
+            settle_to = self.settled_id
+            while self._observed and now - self._observed[0][0] >= self.settle_seconds:
+                settle_to = max(settle_to, self._observed.popleft()[1])
+        self._observed.append((now, max_id))
+
+        if settle_to > self.settled_id:
+            cursor.execute(GROUPED_ACTIVITY.format(where='id > %s AND id <= %s'), (self.settled_id, settle_to))
+            self._add_activity(cursor.fetchall())
+            self.settled_id = settle_to
+        cursor.execute(GROUPED_ACTIVITY.format(where='id > %s'), (self.settled_id,))
+        tail = {(row['site_code'], to_ordinal(row['date']), row['source_type']):
+                (float(row['raw_total'] or 0), int(row['row_count'])) for row in cursor.fetchall()}
+        # The new tail minus the one already added (rows now settled were re-added above)
+        changes = []
+        for key in tail.keys() | self._tail.keys():
+            raw, count = tail.get(key, (0.0, 0))
+            old_raw, old_count = self._tail.get(key, (0.0, 0))
+            if raw != old_raw or count != old_count:
+                changes.append({'site_code': key[0], 'date': date.fromordinal(key[1]), 'source_type': key[2],
+                                'raw_total': raw - old_raw, 'row_count': count - old_count})
+        self._add_activity(changes)
+        self._tail = tail
+
+    def _ensure_days(self, lo, hi):
+        """Grow the day axis so ordinals lo..hi are addressable."""
+        n_days = self.raw.shape[1]
+        if self.day0 is not None and lo >= self.day0 and hi < self.day0 + n_days:
+            return
+        new_day0 = lo if self.day0 is None else min(lo, self.day0)
+        old_hi = hi if self.day0 is None else max(hi, self.day0 + n_days - 1)
+        new_days = old_hi - new_day0 + 1 + GROWTH_DAYS
+        offset = 0 if self.day0 is None else self.day0 - new_day0
+
+        def grow(values):
+            out = np.zeros((values.shape[0], new_days), dtype=values.dtype)
+            out[:, offset:offset + n_days] = values
+            return out
+
+        self.day0 = new_day0
+        self.raw, self.counts = grow(self.raw), grow(self.counts)
+        self.students, self.staff = grow(self.students), grow(self.staff)
+        self.human_present = grow(self.human_present)
+        # Every column may have moved: look the factors up again
+        self.factor_grid = self._factor_block(range(len(self.series)), 0, new_days)
+        self.human_factor = np.nan_to_num(self._source_factors(factor_cache.HUMAN_SOURCE, 0, new_days))
+        self.dirty_col = 0
+
+    def _set_timeline(self, timeline):
+        """Use new emission factors, re-weighting only the days on which they changed."""
+        changed = timeline.changed_range(self.timeline)
+        if changed is None:
+            return
+        self.timeline = timeline
+        self._periods = {}
+        for source, periods in timeline.periods.items():
+            self._periods[source] = (
+                np.array([to_ordinal(valid_from) for valid_from, _, _, _ in periods], dtype=np.int64),
+                np.array([to_ordinal(valid_to) if valid_to else MAX_ORDINAL for _, valid_to, _, _ in periods],
+                         dtype=np.int64),
+                np.array([factor for _, _, factor, _ in periods]),
+            )
+        if self.day0 is None:
+            return
+        _, i0, i1 = self._span(to_ordinal(changed[0]), to_ordinal(changed[1]))
+        if i1 > i0:
+            self.factor_grid[:, i0:i1] = self._factor_block(range(len(self.series)), i0, i1)
+            self.human_factor[i0:i1] = np.nan_to_num(self._source_factors(factor_cache.HUMAN_SOURCE, i0, i1))
+            self.dirty_col = i0 if self.dirty_col is None else min(self.dirty_col, i0)
+        if self.loaded:
+            logger.info(f"Analytics store: emission factors changed for {changed[0]}..{changed[1]}")
+
+    def _factor_block(self, series_rows, i0, i1):
+        """Factors of `series_rows` on day columns i0:i1 (NaN where none applies)."""
+        block = np.full((len(series_rows), i1 - i0), np.nan)
+        for k, i in enumerate(series_rows):
+            block[k] = self._source_factors(self.series[i][1], i0, i1)
+        return block
+
+    def _source_factors(self, source, i0, i1):
+        """Factors of `source` on day columns i0:i1 (NaN where none applies)."""
+        out = np.full(i1 - i0, np.nan)
+        periods = self._periods.get(source)
+        if self.day0 is None or periods is None:
+            return out
+        ords = np.arange(self.day0 + i0, self.day0 + i1, dtype=np.int64)
+        starts, ends, values = periods
+        pos = np.searchsorted(starts, ords, side='right') - 1
+        inside = (pos >= 0) & (ords <= ends[np.maximum(pos, 0)])
+        out[inside] = values[pos[inside]]
+        return out
+
+    @staticmethod
+    def _add_row(values):
+        return np.vstack([values, np.zeros((1, values.shape[1]), dtype=values.dtype)])
+
+    def _site_row(self, site):
+        idx = self.site_index.get(site)
+        if idx is None:
+            idx = len(self.sites)
+            self.sites.append(site)
+            self.site_index[site] = idx
+            self.students = self._add_row(self.students)
+            self.staff = self._add_row(self.staff)
+            self.human_present = self._add_row(self.human_present)
+        return idx
+
+    def _series_row(self, site, source):
+        key = (self._site_row(site), source)
+        idx = self.series_index.get(key)
+        if idx is None:
+            idx = len(self.series)
+            self.series.append(key)
+            self.series_index[key] = idx
+            self.raw = self._add_row(self.raw)
+            self.counts = self._add_row(self.counts)
+            self.factor_grid = np.vstack([self.factor_grid, self._factor_block([idx], 0, self.raw.shape[1])])
+            self.dirty_col = 0
+        return idx
+
+    def _add_activity(self, rows):
+        if not rows:
+            return
+        ords = np.array([to_ordinal(row['date']) for row in rows], dtype=np.int64)
+        self._ensure_days(int(ords.min()), int(ords.max()))
+        series = np.array([self._series_row(row['site_code'], row['source_type']) for row in rows], dtype=np.int64)
+        vals = np.array([float(row['raw_total'] or 0) for row in rows])
+        cnts = np.array([int(row['row_count']) for row in rows], dtype=np.int64)
+        cols = ords - self.day0
+        np.add.at(self.raw, (series, cols), vals)
+        np.add.at(self.counts, (series, cols), cnts)
+        first = int(cols.min())
+        self.dirty_col = first if self.dirty_col is None else min(self.dirty_col, first)
+
+    def _load_human(self, rows):
+        self.students[:] = 0
+        self.staff[:] = 0
+        self.human_present[:] = False
+        if not rows:
+            return
+        ords = np.array([to_ordinal(row['date']) for row in rows], dtype=np.int64)
+        self._ensure_days(int(ords.min()), int(ords.max()))
+        site_rows = np.array([self._site_row(row['site_code']) for row in rows], dtype=np.int64)
+        cols = ords - self.day0
+        self.students[site_rows, cols] = [int(row['student_count']) for row in rows]
+        self.staff[site_rows, cols] = [int(row['staff_count']) for row in rows]
+        self.human_present[site_rows, cols] = True
+
+    def _build_index(self):
+        """
+        Prefix sums over the day axis (one leading zero column), so the total of
+        any inclusive day range is cum[..., i1] - cum[..., i0]. A change on one day
+        shifts every later prefix, so activity sums are rebuilt from `dirty_col` on;
+        they only count days with an emission factor (the SQL JOIN).
+        Headcount sums are kept per site and summed over all sites (the unfiltered case).
+        """
+        def cum(values, axis=-1):
+            pad = [(0, 0)] * values.ndim
+            pad[axis] = (1, 0)
+            return np.pad(np.cumsum(values, axis=axis), pad)
+
+        c0 = self.dirty_col
+        if c0 is not None:
+            if self.em_cum is None or self.em_cum.shape != (self.raw.shape[0], self.raw.shape[1] + 1):
+                c0 = 0
+            grid = self.factor_grid[:, c0:]
+            covered = ~np.isnan(grid)
+            factored = {
+                'raw_cum': np.where(covered, self.raw[:, c0:], 0.0),
+                'count_cum': np.where(covered, self.counts[:, c0:], 0),
+                'em_cum': self.raw[:, c0:] * np.nan_to_num(grid) / 1000,
+            }
+            for name, values in factored.items():
+                if c0 == 0:
+                    setattr(self, name, cum(values))
+                else:
+                    prefix = getattr(self, name)
+                    prefix[:, c0 + 1:] = prefix[:, c0:c0 + 1] + np.cumsum(values, axis=-1)
+            self.dirty_col = None
+
+        students = np.where(self.human_present, self.students, 0)
+        staff = np.where(self.human_present, self.staff, 0)
+        self.students_cum = cum(students)
+        self.staff_cum = cum(staff)
+        self.all_students_cum = cum(students.sum(axis=0))
+        self.all_staff_cum = cum(staff.sum(axis=0))
+        # Human emissions in kg (person-days x the human_daily factor of each day)
+        human_kg = (students + staff) * self.human_factor
+        self.human_kg_cum = cum(human_kg)
+        self.all_human_kg_cum = cum(human_kg.sum(axis=0))
+        # Days with a headcount at any site
+        self.all_human_days_cum = cum(self.human_present.any(axis=0).astype(np.int64))
+
+    # ---- Queries ----
+    def _span(self, lo, hi):
+        """Clip an inclusive ordinal range to array columns; returns (first_ordinal, i0, i1)."""
+        if self.day0 is None:
+            return lo, 0, 0
+        i0 = max(lo - self.day0, 0)
+        i1 = min(hi - self.day0 + 1, self.raw.shape[1])
+        if i1 <= i0:
+            return lo, 0, 0
+        return self.day0 + i0, i0, i1
+
+    def _site_rows(self, sites):
+        """Site row indices for a site filter (None = all sites; unknown codes match nothing)."""
+        if sites is None:
+            return None
+        return [self.site_index[site] for site in sites if site in self.site_index]
+
+    def _series_rows(self, site_rows=None):
+        """Indices of the series of the selected site rows (None = all sites)."""
+        return [i for i, (site_row, _) in enumerate(self.series) if site_rows is None or site_row in site_rows]
+
+    def _range_sum(self, cum, lo, hi):
+        """Total of an inclusive ordinal range from a prefix-sum array (two lookups)."""
+        _, i0, i1 = self._span(lo, hi)
+        return cum[..., i1] - cum[..., i0]
+
+    def range_totals(self, lo, hi, sites=None):
+        """
+        O(1)-per-series totals for an inclusive ordinal range: tonnes per source
+        (only sources with rows on days that have a factor), overall tonnes, electricity kWh and
+        human headcount sums (per-day sums across the selected sites).
+        """
+        with self._lock:
+            site_rows = self._site_rows(sites)
+            idx = self._series_rows(site_rows)
+            raw = self._range_sum(self.raw_cum[idx], lo, hi)
+            rows = self._range_sum(self.count_cum[idx], lo, hi)
+            tonnes = self._range_sum(self.em_cum[idx], lo, hi)
+            sources = {}
+            energy = 0.0
+            for i, r, t, n in zip(idx, raw.tolist(), tonnes.tolist(), rows.tolist()):
+                source = self.series[i][1]
+                if n > 0:
+                    sources[source] = sources.get(source, 0.0) + t
+                if source == 'electricity':
+                    energy += r
+
+            if site_rows is None:
+                human_days = int(self._range_sum(self.all_human_days_cum, lo, hi))
+                students = int(self._range_sum(self.all_students_cum, lo, hi))
+                staff = int(self._range_sum(self.all_staff_cum, lo, hi))
+                human_kg = float(self._range_sum(self.all_human_kg_cum, lo, hi))
+            else:
+                _, i0, i1 = self._span(lo, hi)
+                human_days = int(self.human_present[site_rows, i0:i1].any(axis=0).sum())
+                students = int(self._range_sum(self.students_cum[site_rows], lo, hi).sum())
+                staff = int(self._range_sum(self.staff_cum[site_rows], lo, hi).sum())
+                human_kg = float(self._range_sum(self.human_kg_cum[site_rows], lo, hi).sum())
+            return {
+                'sources': sources,
+                'total': float(tonnes.sum()),
+                'electricity_raw': energy,
+                'human_days': human_days,
+                'people': students + staff,
+                'students': students,
+                'staff': staff,
+                'human_emissions': human_kg / 1000,
+            }
+
+    def all_time_totals(self, sites=None):
+        """range_totals() over every loaded day."""
+        return self.range_totals(1, MAX_ORDINAL, sites)
+
+    def _window_emissions(self, lo, hi, site_rows=None):
+        """(first_ordinal, per-series tonnes matrix, per-series row counts on factored days, series indices)."""
+        first, i0, i1 = self._span(lo, hi)
+        idx = self._series_rows(site_rows)
+        grid = self.factor_grid[idx, i0:i1]
+        em = self.raw[idx, i0:i1] * np.nan_to_num(grid) / 1000
+        return first, em, np.where(np.isnan(grid), 0, self.counts[idx, i0:i1]), idx
+
+    def daily_series(self, lo, hi, sites=None):
+        """
+        (names, tonnes matrix) of daily emissions per source over the inclusive ordinal
+        range (one column per day, 0 outside the loaded data), plus a last 'human' row
+        (headcounts x the human_daily factor); sources only appear with rows on days that have a factor.
+        """
+        with self._lock:
+            site_rows = self._site_rows(sites)
+            first, em, counts, idx = self._window_emissions(lo, hi, site_rows)
+            offset = first - lo
+            recorded = counts.sum(axis=1) > 0
+            sources = sorted({self.series[i][1] for i, seen in zip(idx, recorded.tolist()) if seen})
+            row_of = {source: r for r, source in enumerate(sources)}
+            out = np.zeros((len(sources) + 1, hi - lo + 1))
+            keep = [k for k, i in enumerate(idx) if self.series[i][1] in row_of]
+            target = np.array([row_of[self.series[idx[k]][1]] for k in keep], dtype=np.int64)
+            np.add.at(out[:, offset:offset + em.shape[1]], target, em[keep])
+
+            _, i0, i1 = self._span(lo, hi)
+            rows = slice(None) if site_rows is None else site_rows
+            present = self.human_present[rows, i0:i1]
+            people = np.where(present, self.students[rows, i0:i1] + self.staff[rows, i0:i1], 0).sum(axis=0)
+            out[-1, offset:offset + (i1 - i0)] = people * self.human_factor[i0:i1] / 1000
+            return sources + ['human'], out
+
+    def dashboard(self, start_ord, end_ord, window_days, sections, sites=None):
+        """Build the /api/dashboard payload (row format) for the requested sections."""
+        with self._lock:
+            return self._dashboard(start_ord, end_ord, window_days, sections, sites)
+
+    def _dashboard(self, start_ord, end_ord, window_days, sections, sites):
+        data = {}
+        totals = self.range_totals(start_ord, end_ord, sites)
+        total_emissions = totals['total']
+        breakdown = list(totals['sources'].items())
+
+        if 'kpis' in sections:
+            prev_emissions = self.range_totals(start_ord - window_days, start_ord, sites)['total']
+            percent_change = 0.0
+            if prev_emissions > 0:
+                percent_change = ((total_emissions - prev_emissions) / prev_emissions) * 100.0
+            biggest_source = max(breakdown, key=lambda x: x[1]) if breakdown else ('N/A', 0)
+            data['kpis'] = {
+                'total_emissions': round(total_emissions, 2),
+                'percent_change': round(percent_change, 2),
+                'biggest_source': biggest_source[0],
+                'biggest_source_percent': round((biggest_source[1] / total_emissions * 100) if total_emissions > 0 else 0, 1),
+                'energy_saved': round(totals['electricity_raw'], 0),
+                'previous_emissions': round(prev_emissions, 2)
+            }
+        if 'source_breakdown' in sections:
+            data['source_breakdown'] = [
+                {'source': source, 'emissions': round(val, 2), 'percentage': round((val / total_emissions * 100) if total_emissions > 0 else 0, 1)}
+                for source, val in breakdown
+            ]
+        if 'human_emissions' in sections:
+            data['human_emissions'] = self._human_emissions(start_ord, end_ord, totals, sites)
+
+        bucketed = ('daily_trend', 'weekly_trend', 'monthly_trend', 'weekly_comparison', 'yearly_comparison')
+        if not any(name in sections for name in bucketed):
+            return data
+
+        # Only the calendar series need the per-day slice of the window
+        first, em, counts, _ = self._window_emissions(start_ord, end_ord, self._site_rows(sites))
+        ords = np.arange(first, first + em.shape[1], dtype=np.int64)
+        daily = em.sum(axis=0)
+        day_present = counts.sum(axis=0) > 0
+
+        if 'daily_trend' in sections:
+            data['daily_trend'] = [
+                {'date': label, 'emissions': round(val, 2)}
+                for label, val in rollup(ords, daily, day_present, 'day')
+            ]
+        if 'weekly_trend' in sections or 'weekly_comparison' in sections:
+            weekly = [
+                {'label': label, 'emissions': round(val, 2)}
+                for label, val in rollup(ords, daily, day_present, 'week')
+            ]
+            if 'weekly_trend' in sections:
+                data['weekly_trend'] = weekly
+        if 'monthly_trend' in sections:
+            data['monthly_trend'] = [
+                {'month': label, 'emissions': round(val, 2)}
+                for label, val in rollup(ords, daily, day_present, 'month')
+            ]
+        if 'weekly_comparison' in sections:
+            data['weekly_comparison'] = weekly
+        if 'yearly_comparison' in sections:
+            data['yearly_comparison'] = [
+                {'year': label, 'emissions': round(val, 2)}
+                for label, val in rollup(ords, daily, day_present, 'year')
+            ]
+        return data
+
+    def _human_emissions(self, start_ord, end_ord, totals, sites=None):
+        n = totals['human_days']
+        avg_students = int(totals['students'] / n) if n else 0
+        avg_staff = int(totals['staff'] / n) if n else 0
+
+        first, i0, i1 = self._span(start_ord, end_ord)
+        site_rows = self._site_rows(sites)
+        if site_rows is None:
+            site_rows = slice(None)
+        # Per-day totals across the selected sites
+        present = self.human_present[site_rows, i0:i1]
+        students = np.where(present, self.students[site_rows, i0:i1], 0).sum(axis=0)
+        staff = np.where(present, self.staff[site_rows, i0:i1], 0).sum(axis=0)
+        present = present.any(axis=0)
+        ords = np.arange(first, first + (i1 - i0), dtype=np.int64)
+        # Sum kg per bucket and convert once (exact for whole-kg factors, like MySQL's DECIMAL math)
+        kg = np.where(present, students + staff, 0) * self.human_factor[i0:i1]
+
+        rows = np.flatnonzero(present)
+        return {
+            'total_emissions': round(totals['human_emissions'], 2),
+            'avg_student_count': avg_students,
+            'avg_staff_count': avg_staff,
+            'avg_total_count': avg_students + avg_staff,
+            'daily_trend': [
+                {'date': label, 'emissions': round(val / 1000, 2)}
+                for label, val in rollup(ords, kg, present, 'day')
+            ],
+            'weekly_trend': [
+                {'label': label, 'emissions': round(val / 1000, 2)}
+                for label, val in rollup(ords, kg, present, 'week')
+            ],
+            'monthly_trend': [
+                {'month': label, 'emissions': round(val / 1000, 2)}
+                for label, val in rollup(ords, kg, present, 'month')
+            ],
+            'population_data': [
+                {
+                    'date': d,
+                    'students': s,
+                    'staff': f,
+                    'total': s + f,
+                    'emissions': round(day_kg / 1000, 3)
+                }
+                for d, s, f, day_kg in zip(ordinal_strings(ords[rows]), students[rows].tolist(),
+                                           staff[rows].tolist(), kg[rows].tolist())
+            ]
+        }
@@ -1,16 +1,52 @@
 import os
+import random
+import re
 import sys
+import gzip
+import json
 import logging
-from datetime import datetime, timedelta
+import math
+import time
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
 from functools import wraps
 
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import (
+    Flask, Response, g, render_template, request, jsonify, session, redirect, url_for, send_from_directory
+)
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-import mysql.connector
-from mysql.connector import pooling
 import jwt
 from dotenv import load_dotenv
 
+import analytics_store
+import bulk_export
+import columnar_store
+import db_backends
+import downsampling
+import factor_cache
+import forecasting
+import ingest_buffer
+import instrumentation
+import live_updates
+import metrics
+import profiling
+import result_cache
+import singleflight
+import unit_registry
+import warmup
+import spool
+
+# Optional speedups: faster JSON encoding and brotli response compression
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 # ---- Setup ----
 load_dotenv()
 
@@ -19,48 +55,1081 @@ logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
 logger = logging.getLogger(__name__)
 
 # Fail fast if DB password missing (avoid accidental leaking / fallback)
-if not os.environ.get('DB_PASSWORD'):
+if os.environ.get('DB_BACKEND', 'mysql').lower() == 'mysql' and not os.environ.get('DB_PASSWORD'):
     raise ValueError("DB_PASSWORD not found in environment variables (.env). Please set DB_PASSWORD before running the app.")
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SESSION_SECRET', 'change-this-in-.env')
 CORS(app)
 
+# ---- Instrumentation ----
+# REQUEST_TIMING=1 adds a Server-Timing header (pool wait, SQL, aggregation, serialization,
+# compression) and logs queries slower than SLOW_QUERY_MS; both can be changed at runtime
+# through /api/admin/instrumentation. These hooks are registered first so they run last.
+instrumentation.settings.enabled = os.environ.get('REQUEST_TIMING', '0').lower() in ('1', 'true', 'yes')
+instrumentation.settings.slow_query_ms = float(os.environ.get('SLOW_QUERY_MS', 200))
+
+app.before_request(instrumentation.start_request)
+app.after_request(instrumentation.finish_request)
+
+# ---- Metrics ----
+# Prometheus text at /metrics. Under several workers set METRICS_DIR to a directory shared
+# by all of them so each scrape merges every worker's counters (see metrics.py).
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1').lower() in ('1', 'true', 'yes')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+registry = metrics.Registry(
+    directory=os.environ.get('METRICS_DIR') or None,
+    flush_interval=float(os.environ.get('METRICS_FLUSH_SECONDS', 5)),
+)
+http_requests = registry.counter('http_requests_total', 'HTTP requests by route, method and status.')
+http_errors = registry.counter('http_request_errors_total', 'HTTP 4xx/5xx responses by route.')
+http_latency = registry.histogram('http_request_duration_seconds', 'Time spent in the Flask handler.')
+ingested_rows = registry.counter('ingested_rows_total', 'Rows committed by the ingest endpoints.')
+db_connect_errors = registry.counter('db_connection_errors_total', 'Failed connection/pool acquisitions.')
+db_acquire_latency = registry.histogram(
+    'db_pool_wait_seconds', 'Time to get a connection from the pool.',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+db_pool_size = registry.gauge('db_pool_size', 'Configured connections in the pool.')
+db_pool_in_use = registry.gauge('db_pool_in_use', 'Pooled connections currently checked out.')
+cache_lookups = registry.counter('cache_lookups_total', 'In-process cache lookups by cache and result.')
+sse_clients = registry.gauge('sse_subscribers', 'Open /api/stream connections.')
+exported_rows = registry.counter('exported_rows_total', 'Rows streamed by /api/export, by format.')
+
+@app.before_request
+def start_request_metrics():
+    if METRICS_ENABLED:
+        registry.start_flusher()
+        g.metrics_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('metrics_started')
+    if started is None:
+        return response
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    status = response.status_code
+    http_requests.inc(route=route, method=request.method, status=status)
+    http_latency.observe(time.perf_counter() - started, route=route, method=request.method)
+    if status >= 400:
+        http_errors.inc(route=route, status_class=f"{status // 100}xx")
+    return response
+
+# ---- Profiling ----
+# Profile a single request by adding ?__profile=1 (cProfile) or ?__profile=speedscope (sampling
+# flame graph) as one of the PROFILE_ADMINS users (comma-separated usernames, default admin).
+# The profile is saved to PROFILE_DIR (name in the X-Profile header), or returned instead of
+# the response with &__profile_output=inline.
+# PROFILE_SAMPLE_RATE > 0 also profiles that fraction of requests under PROFILE_PATHS.
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_SAMPLE_MODE = os.environ.get('PROFILE_SAMPLE_MODE', 'speedscope')
+PROFILE_PATHS = tuple(p.strip() for p in os.environ.get('PROFILE_PATHS', '/api/').split(',') if p.strip())
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 1))
+PROFILE_ADMINS = {u.strip() for u in os.environ.get('PROFILE_ADMINS', 'admin').split(',') if u.strip()}
+profile_store = profiling.ProfileStore(PROFILE_DIR, keep=int(os.environ.get('PROFILE_KEEP', 50)))
+
+@app.before_request
+def start_profiling():
+    requested = request.args.get('__profile')
+    if requested:
+        auth_error = profile_admin_error()
+        if auth_error:
+            return auth_error
+        mode = 'cprofile' if requested in ('1', 'true', 'cprofile') else requested
+        if mode not in profiling.MODES:
+            return jsonify({'error': f"__profile must be one of 1, {', '.join(profiling.MODES)}"}), 400
+        inline = request.args.get('__profile_output') == 'inline'
+    elif (PROFILE_SAMPLE_RATE > 0 and request.path.startswith(PROFILE_PATHS)
+            and random.random() < PROFILE_SAMPLE_RATE):
+        mode, inline = PROFILE_SAMPLE_MODE, False
+    else:
+        return None
+
+    profiler = profiling.create_session(mode, PROFILE_INTERVAL_MS, name=f"{request.method} {request.full_path}")
+    if not profiler.start():
+        g.profile_busy = True
+        return None
+    g.profile = (profiler, inline, time.perf_counter())
+
+@app.after_request
+def finish_profiling(response):
+    if g.pop('profile_busy', False):
+        response.headers['X-Profile'] = 'busy'
+    active = g.pop('profile', None)
+    if active is None:
+        return response
+    profiler, inline, started = active
+    profiler.stop()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    if inline:
+        mimetype = 'text/plain' if profiler.mode == 'cprofile' else 'application/json'
+        return Response(profiler.summary(), mimetype=mimetype, headers={'X-Profile-Status': str(response.status_code)})
+    try:
+        name = profile_store.save(profiler, request.method, request.path, elapsed_ms)
+    except OSError:
+        logger.exception("Could not save request profile")
+        return response
+    logger.info(f"Saved {profiler.mode} profile of {request.method} {request.path} ({elapsed_ms:.0f} ms): {name}")
+    response.headers['X-Profile'] = name
+    return response
+
+@app.teardown_request
+def abandon_profiling(exc):
+    # after_request did not run (e.g. an after_request hook failed); release the profiler
+    active = g.pop('profile', None)
+    if active is not None:
+        active[0].stop()
+
+# ---- Response encoding ----
+def json_default(value):
+    """Non-JSON types, encoded alike by both backends: dates as ISO 8601, then Flask's defaults (Decimal as a string, ...)."""
+    if isinstance(value, date):
+        return value.isoformat()
+    return DefaultJSONProvider.default(value)
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider with ISO 8601 dates instead of HTTP dates."""
+    default = staticmethod(json_default)
+
+class OrjsonProvider(StdlibJSONProvider):
+    """JSON provider backed by orjson; jsonify() goes through the inherited response()."""
+    def dumps(self, obj, **kwargs):
+        # Dates go through json_default too, so both backends format them the same way
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+
+# JSON_BACKEND=orjson|stdlib (default: orjson when installed)
+JSON_BACKEND = os.environ.get('JSON_BACKEND', 'orjson' if orjson else 'stdlib').lower()
+if JSON_BACKEND == 'orjson' and orjson:
+    app.json = OrjsonProvider(app)
+    logger.info("Using orjson JSON backend.")
+else:
+    app.json = StdlibJSONProvider(app)
+app.json.dumps = instrumentation.timed('serialize', app.json.dumps)
+
+# Compress JSON responses at or above this many bytes (0 disables compression)
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+
+def choose_encoding(accept_encoding):
+    """Pick 'br' or 'gzip' from an Accept-Encoding header (honouring q=0), or None."""
+    accepted = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    if brotli and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', accepted.get('*', 0)) > 0:
+        return 'gzip'
+    return None
+
+@app.after_request
+def compress_json_response(response):
+    """Negotiate gzip/brotli compression for JSON API responses."""
+    if (COMPRESS_MIN_SIZE <= 0
+            or response.mimetype != 'application/json'
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or not 200 <= response.status_code < 300):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+    if not encoding:
+        return response
+
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+    with instrumentation.span('compress'):
+        if encoding == 'br':
+            body = brotli.compress(body, quality=min(COMPRESS_LEVEL, 11))
+        else:
+            body = gzip.compress(body, compresslevel=COMPRESS_LEVEL)
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+def to_columnar(rows, keys):
+    """Turn [{k: v, ...}, ...] into {k: [v, ...], ...} (compact `format=columnar` output)."""
+    return {key: [row[key] for row in rows] for key in keys}
+
+# Series columns per dashboard section, used for `format=columnar`
+DASHBOARD_SERIES_COLUMNS = {
+    'daily_trend': ('date', 'emissions'),
+    'weekly_trend': ('label', 'emissions'),
+    'monthly_trend': ('month', 'emissions'),
+    'weekly_comparison': ('label', 'emissions'),
+    'yearly_comparison': ('year', 'emissions'),
+    'population_data': ('date', 'students', 'staff', 'total', 'emissions'),
+    'interval_trend': ('time', 'emissions'),
+}
+
+def columnar_dashboard(data):
+    """Convert the trend series of a dashboard payload (and its human block) to columnar form."""
+    out = {}
+    for key, value in data.items():
+        if key in DASHBOARD_SERIES_COLUMNS:
+            out[key] = to_columnar(value, DASHBOARD_SERIES_COLUMNS[key])
+        elif key == 'human_emissions':
+            out[key] = columnar_dashboard(value)
+        else:
+            out[key] = value
+    return out
+
 # Runtime debug flag (used to enable development-only helpers)
 DEBUG_MODE = os.environ.get('FLASK_DEBUG', 'True').lower() in ('1', 'true', 'yes')
 
-DB_CONFIG = {
-    'host': os.environ.get('DB_HOST', 'localhost'),
-    'user': os.environ.get('DB_USER', 'root'),
-    'password': os.environ.get('DB_PASSWORD'),  # no default
-    'database': os.environ.get('DB_NAME', 'campus_carbon'),
-    'port': int(os.environ.get('DB_PORT', 3306)),
-}
+# DB_BACKEND=mysql (default, pooled) or sqlite (one file at DB_PATH: CI, benchmarks, small sites)
+backend = db_backends.from_env(pool_size=5)
+logger.info(f"Database backend: {backend.name}")
 
-# Create a simple connection pool (fall back to None if pool creation fails)
-pool = None
-try:
-    pool = pooling.MySQLConnectionPool(pool_name="mypool", pool_size=5, **DB_CONFIG)
-    logger.info("MySQL connection pool created.")
-except Exception as e:
-    pool = None
-    logger.warning(f"Could not create connection pool; will use single connections. Reason: {e}")
+# Headcounts: one row per site and day, replaced when re-submitted
+HUMAN_UPSERT = backend.upsert('human_population', ('site_code', 'date', 'student_count', 'staff_count'),
+                              keys=('site_code', 'date'), replace=('student_count', 'staff_count'))
 
-def get_db_connection():
+def get_db_connection(pooled=True):
     """
-    Returns a MySQL connection from pool if available, otherwise a fresh connection.
+    Returns a connection from the pool if available, otherwise a fresh connection.
+    pooled=False always opens a fresh one (long-running readers that should not hold a pool slot).
     Caller is responsible for closing the connection.
     """
+    started = time.perf_counter()
     try:
-        if pool:
-            conn = pool.get_connection()
-        else:
-            conn = mysql.connector.connect(**DB_CONFIG)
-        return conn
+        conn = backend.connect(pooled)
+        db_acquire_latency.observe(time.perf_counter() - started)
+        return instrumentation.wrap_connection(conn, started)
     except Exception as e:
+        db_connect_errors.inc()
         logger.error(f"Error connecting to database: {e}")
         return None
 
+class DatabaseUnavailable(Exception):
+    """No connection could be obtained (get_db_connection() returned None)."""
+
+def with_connection(fn):
+    """fn(connection) on a fresh connection that is closed afterwards; raises DatabaseUnavailable."""
+    connection = get_db_connection()
+    if not connection:
+        raise DatabaseUnavailable()
+    try:
+        return fn(connection)
+    finally:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+# Emission factors are cached in process; FACTOR_CHECK_SECONDS bounds how stale they can be
+emission_factors = factor_cache.EmissionFactorCache(
+    check_interval=float(os.environ.get('FACTOR_CHECK_SECONDS', 30))
+)
+
+def apply_factors(rows, factors, key='raw_total', date_key='date', day=None):
+    """
+    Attach `emissions_tonnes` to grouped rows (raw sum x factor / 1000), using the
+    factor in effect on the row's `date_key` column (or on `day` for rows without one).
+    Rows whose source has no factor on that date are dropped, like the former JOIN.
+    """
+    out = []
+    for row in rows:
+        factor = factors.factor(row['source_type'], row.get(date_key) or day)
+        if factor is None:
+            continue
+        raw_total = float(row[key] or 0)
+        row['raw_total'] = raw_total
+        row['emissions_tonnes'] = raw_total * factor / 1000
+        out.append(row)
+    return out
+
+def human_kg(factors, day, people):
+    """Kilograms for `people` person-days on `day`, with the human_daily factor in effect then (0 without one)."""
+    factor = factors.factor(factor_cache.HUMAN_SOURCE, day)
+    return float(people or 0) * factor if factor is not None else 0.0
+
+def human_tonnes(factors, day, people):
+    """human_kg() in tonnes."""
+    return human_kg(factors, day, people) / 1000
+
+def factored_source_totals(cursor, query, start_date, end_date, params, factors):
+    """
+    Per-source rows (raw_total, emissions_tonnes) of a `GROUP BY source_type` query
+    run through grouped_rows() once per stretch of the range with constant factors,
+    so a factor change mid-range weights each side with its own factor.
+    """
+    totals = {}
+    for first, last in factors.segments(start_date, end_date):
+        rows = grouped_rows(cursor, query, first, last, params, keys=('source_type',))
+        for row in apply_factors(rows, factors, day=first):
+            into = totals.get(row['source_type'])
+            if into is None:
+                totals[row['source_type']] = row
+            else:
+                into['raw_total'] += row['raw_total']
+                into['emissions_tonnes'] += row['emissions_tonnes']
+    return list(totals.values())
+
+def factor_scope(start_date, end_date):
+    """Emission factors in effect over a date range, for result cache keys (None: do not cache)."""
+    return emission_factors.scope(get_db_connection, start_date, end_date)
+
+# ---- Sites ----
+# Every activity/headcount row belongs to a site (campus or building). Rows posted
+# without one go to DEFAULT_SITE, which is also what pre-multi-site data was migrated to.
+DEFAULT_SITE = os.environ.get('DEFAULT_SITE', 'main')
+SITE_CODE_RE = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+
+def parse_site_code(value):
+    """Validated site code for an ingest record (missing -> DEFAULT_SITE); raises ValueError."""
+    if value is None or value == '':
+        return DEFAULT_SITE
+    value = str(value).strip()
+    if not SITE_CODE_RE.match(value):
+        raise ValueError(f'Invalid site code: "{value}"')
+    return value
+
+def parse_site_filter(args):
+    """
+    `site=a,b` query arg as a sorted tuple of site codes. Missing/empty means all
+    sites (None), i.e. a cross-site rollup. Raises ValueError on malformed codes.
+    """
+    raw = args.get('site')
+    if not raw:
+        return None
+    sites = {code.strip() for code in raw.split(',') if code.strip()}
+    for code in sites:
+        if not SITE_CODE_RE.match(code):
+            raise ValueError(f'Invalid site code: "{code}"')
+    return tuple(sorted(sites)) or None
+
+def site_filter_sql(sites, column='site_code'):
+    """(` AND column IN (...)`, params) restricting a query to `sites`; empty for all sites."""
+    if sites is None:
+        return '', ()
+    return f" AND {column} IN ({', '.join(['%s'] * len(sites))})", tuple(sites)
+
+# Optional in-process NumPy analytics store for /api/dashboard (ANALYTICS_STORE=1)
+analytics = None
+if os.environ.get('ANALYTICS_STORE', 'False').lower() in ('1', 'true', 'yes'):
+    if analytics_store.np is None:
+        logger.warning("ANALYTICS_STORE is enabled but numpy is not installed; using SQL aggregation.")
+    else:
+        analytics = analytics_store.EmissionsStore(
+            refresh_interval=float(os.environ.get('ANALYTICS_REFRESH_SECONDS', 5)),
+            factor_loader=emission_factors.timeline,
+            settle_seconds=float(os.environ.get('ANALYTICS_SETTLE_SECONDS', 60)),
+        )
+        logger.info("Analytics store enabled.")
+
+# Fitted /api/forecast models, per site filter and as-of date, until new data arrives
+# (or FORECAST_MODEL_TTL seconds, which bounds staleness after other workers' writes)
+FORECAST_HISTORY_DAYS = int(os.environ.get('FORECAST_HISTORY_DAYS', 3 * 365))
+FORECAST_HARMONICS = int(os.environ.get('FORECAST_HARMONICS', 3))
+FORECAST_MIN_DAYS = int(os.environ.get('FORECAST_MIN_DAYS', 28))
+FORECAST_MAX_DAYS = int(os.environ.get('FORECAST_MAX_DAYS', 730))
+FORECAST_TARGET_TONNES = os.environ.get('FORECAST_TARGET_TONNES')
+forecast_models = None
+if forecasting.np is not None:
+    forecast_models = forecasting.ModelCache(ttl=float(os.environ.get('FORECAST_MODEL_TTL', 600)))
+
+# Concurrent identical /api/dashboard requests share one computation (SINGLEFLIGHT=0 disables).
+# SINGLEFLIGHT_DIR (a directory local to the host) also coalesces across worker processes.
+SINGLEFLIGHT_ENABLED = os.environ.get('SINGLEFLIGHT', 'True').lower() in ('1', 'true', 'yes')
+dashboard_flights = singleflight.Group(
+    shared_dir=os.environ.get('SINGLEFLIGHT_DIR') or None,
+    wait_timeout=float(os.environ.get('SINGLEFLIGHT_TIMEOUT', 30)),
+    encode=lambda data: app.json.dumps(data),
+)
+singleflight_calls = registry.counter('singleflight_calls_total',
+                                      'Dashboard computations run (leader) or joined (shared*).')
+
+# Optional result cache shared by all workers: RESULT_CACHE=sqlite (one host, file at
+# RESULT_CACHE_PATH) or redis (RESULT_CACHE_URL, needs `pip install .[cache]`);
+# memory keeps entries in each worker. Every write is logged there with its dates and
+# sites, which invalidates the overlapping entries in all workers at once.
+RESULT_CACHE = os.environ.get('RESULT_CACHE', 'off').lower()
+shared_results = None
+try:
+    if RESULT_CACHE == 'memory':
+        cache_backend = result_cache.MemoryBackend()
+    elif RESULT_CACHE == 'sqlite':
+        cache_backend = result_cache.SQLiteBackend(os.environ.get('RESULT_CACHE_PATH', 'cache/results.sqlite3'))
+    elif RESULT_CACHE == 'redis':
+        cache_backend = result_cache.RedisBackend(os.environ.get('RESULT_CACHE_URL', 'redis://localhost:6379/0'))
+    else:
+        cache_backend = None
+    if cache_backend is not None:
+        shared_results = result_cache.ResultCache(
+            cache_backend,
+            ttl=float(os.environ.get('RESULT_CACHE_TTL', 300)),
+            encode=lambda value: app.json.dumps(value),
+        )
+        logger.info(f"Shared result cache enabled ({RESULT_CACHE}).")
+except Exception as e:
+    logger.warning(f"RESULT_CACHE={RESULT_CACHE} could not be enabled; results are not cached. Reason: {e}")
+
+def cache_scope(scope):
+    """(first, last, sites) as the result cache compares it: ISO dates, sorted sites or None for all."""
+    if scope is None:
+        return None
+    first, last, sites = scope
+    return factor_cache.iso_day(first), factor_cache.iso_day(last), sorted(sites) if sites else None
+
+def result_cached(name, params, scope=None):
+    """Whether cached_result() would serve (name, params) from the shared cache."""
+    return shared_results is not None and shared_results.contains(name, params, cache_scope(scope))
+
+def cached_result(name, params, compute, cache=True, scope=None, missing_only=False):
+    """
+    compute() through the shared result cache when it is enabled (and `cache`). `scope`
+    is the (first, last, sites) the result reads, so writes elsewhere keep it cached.
+    `missing_only` (warm-up) returns None without reading the value when it is cached.
+    """
+    if shared_results is None or not cache:
+        return compute()
+    if missing_only and result_cached(name, params, scope):
+        return None
+    return shared_results.get_or_compute(name, params, compute, cache_scope(scope))[0]
+
+# ---- Columnar history ----
+# Optional DuckDB/Parquet snapshot of data older than COLUMNAR_RECENT_DAYS (COLUMNAR_HISTORY=1,
+# needs `pip install .[columnar]`; see columnar_store.py). Ranges of at least COLUMNAR_MIN_DAYS
+# days, and the all-time totals, read their older dates from it and only the rest from MySQL.
+COLUMNAR_MIN_DAYS = int(os.environ.get('COLUMNAR_MIN_DAYS', 180))
+# Bounds for all-time queries written as date ranges
+ALL_DATES = ('1000-01-01', '9999-12-31')
+history = None
+if os.environ.get('COLUMNAR_HISTORY', 'False').lower() in ('1', 'true', 'yes'):
+    if columnar_store.duckdb is None:
+        logger.warning("COLUMNAR_HISTORY is enabled but duckdb is not installed; all queries use MySQL.")
+    else:
+        history = columnar_store.HistorySnapshot(
+            os.environ.get('COLUMNAR_DIR', 'columnar'),
+            recent_days=int(os.environ.get('COLUMNAR_RECENT_DAYS', 30)),
+            refresh_interval=float(os.environ.get('COLUMNAR_REFRESH_SECONDS', 3600)),
+            check_interval=float(os.environ.get('COLUMNAR_CHECK_SECONDS', 5)),
+        )
+        logger.info("Columnar history snapshot enabled.")
+
+def history_end(cursor, start_date, end_date):
+    """Last date of [start_date, end_date] to read from the columnar snapshot, or None for MySQL only."""
+    if history is None:
+        return None
+    cutoff = history.cutoff()
+    if cutoff is None or start_date >= cutoff:
+        return None
+    span = (datetime.strptime(min(end_date, ALL_DATES[1]), '%Y-%m-%d')
+            - datetime.strptime(max(start_date, ALL_DATES[0]), '%Y-%m-%d')).days + 1
+    if span < COLUMNAR_MIN_DAYS or not history.usable(cursor):
+        return None
+    day_before_cutoff = (datetime.strptime(cutoff, '%Y-%m-%d') - timedelta(days=1)).strftime('%Y-%m-%d')
+    return min(end_date, day_before_cutoff)
+
+def merge_grouped(rows, keys):
+    """Add up rows that share their `keys` values (a group split between two engines)."""
+    merged = {}
+    for row in rows:
+        key = tuple(row[k] for k in keys)
+        if key not in merged:
+            merged[key] = dict(row)
+            continue
+        into = merged[key]
+        for column, value in row.items():
+            if column not in keys and value is not None:
+                into[column] = value if into[column] is None else float(into[column]) + float(value)
+    return list(merged.values())
+
+def grouped_rows(cursor, query, start_date, end_date, params=(), keys=()):
+    """
+    Rows of `query`, which takes `date BETWEEN %s AND %s` then `params` and groups by `keys`.
+    For long ranges the dates before the columnar snapshot's cutoff are read from it.
+    """
+    split = history_end(cursor, start_date, end_date)
+    if split is not None:
+        try:
+            rows = history.fetchall(query, (start_date, split) + tuple(params))
+        except Exception:
+            logger.exception("Columnar history query failed; using MySQL")
+        else:
+            live_start = (datetime.strptime(split, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+            if live_start <= end_date:
+                cursor.execute(query, (live_start, end_date) + tuple(params))
+                rows += cursor.fetchall()
+            # DECIMAL sums from either engine would not add up with the other's floats
+            return merge_grouped([{k: float(v) if isinstance(v, Decimal) else v for k, v in row.items()}
+                                  for row in rows], keys)
+    cursor.execute(query, (start_date, end_date) + tuple(params))
+    return cursor.fetchall()
+
+# Server-sent events broker for live dashboard updates (/api/stream). Each stream lives in
+# one worker, so events are shared through LIVE_EVENTS: redis (pub/sub on RESULT_CACHE_URL,
+# the default when RESULT_CACHE=redis), version (the default otherwise: every write bumps
+# the `activity_data` row of cache_versions and each worker polls it every
+# LIVE_POLL_SECONDS, sending its streams `reload` after another worker's write) or local
+# (one process only).
+LIVE_EVENTS = os.environ.get('LIVE_EVENTS', 'redis' if RESULT_CACHE == 'redis' else 'version').lower()
+DATA_VERSION_KEY = 'activity_data'
+
+def read_data_version():
+    """The shared data version in cache_versions, or None when it cannot be read."""
+    connection = get_db_connection()
+    if not connection:
+        return None
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT version FROM cache_versions WHERE name = %s", (DATA_VERSION_KEY,))
+        row = cursor.fetchone()
+        return row[0] if row else 0
+    except Exception as e:
+        # Older databases without cache_versions: nothing to compare
+        logger.debug(f"cache_versions unavailable: {e}")
+        return None
+    finally:
+        if cursor:
+            cursor.close()
+        connection.close()
+
+live_relay = live_watch = None
+if LIVE_EVENTS == 'redis':
+    try:
+        if isinstance(getattr(shared_results, 'backend', None), result_cache.RedisBackend):
+            redis_client = shared_results.backend.client
+        else:
+            redis_client = result_cache.RedisBackend(os.environ.get('RESULT_CACHE_URL', 'redis://localhost:6379/0')).client
+        live_relay = live_updates.RedisRelay(redis_client)
+    except Exception as e:
+        logger.warning(f"LIVE_EVENTS=redis could not be enabled; polling the data version instead. Reason: {e}")
+        LIVE_EVENTS = 'version'
+if LIVE_EVENTS == 'version':
+    live_watch = live_updates.VersionWatch(read_data_version, interval=float(os.environ.get('LIVE_POLL_SECONDS', 2)))
+broker = live_updates.EventBroker(max_subscribers=int(os.environ.get('SSE_MAX_CLIENTS', 500)),
+                                  relay=live_relay, watch=live_watch)
+SSE_HEARTBEAT_SECONDS = float(os.environ.get('SSE_HEARTBEAT_SECONDS', 20))
+def collect_runtime_metrics():
+    """Copy pool, cache and SSE state into gauges/counters at snapshot time."""
+    usage = backend.pool_usage()
+    if usage:
+        size, in_use = usage
+        db_pool_size.set(size)
+        if in_use is not None:
+            db_pool_in_use.set(in_use)
+    for result, count in emission_factors.stats.items():
+        cache_lookups.set_total(count, cache='emission_factors', result=result)
+    for result, count in dashboard_flights.stats.items():
+        singleflight_calls.set_total(count, result=result)
+    if shared_results is not None:
+        cache_lookups.set_total(shared_results.stats['hit'], cache='results', result='hit')
+        cache_lookups.set_total(shared_results.stats['miss'], cache='results', result='miss')
+    if analytics is not None:
+        for result, count in analytics.stats.items():
+            cache_lookups.set_total(count, cache='analytics_store', result=result)
+    if forecast_models is not None:
+        for result, count in forecast_models.stats.items():
+            cache_lookups.set_total(count, cache='forecast_models', result=result)
+    sse_clients.set(broker.subscriber_count())
+
+registry.add_collector(collect_runtime_metrics)
+
+# Uploads touching more distinct dates than this make clients refetch instead of patching
+LIVE_MAX_DATES = int(os.environ.get('LIVE_MAX_DATES', 366))
+
+# Render the dashboard page with its initial data inlined (DASHBOARD_DEFAULT_DAYS window,
+# which the page's #dateRange selects; it must be one of its options)
+DASHBOARD_INLINE_BOOTSTRAP = os.environ.get('DASHBOARD_INLINE_BOOTSTRAP', '1') == '1'
+DASHBOARD_RANGES = (7, 30, 90, 180, 365)
+DASHBOARD_DEFAULT_DAYS = int(os.environ.get('DASHBOARD_DEFAULT_DAYS', 365))
+if DASHBOARD_DEFAULT_DAYS not in DASHBOARD_RANGES:
+    logger.warning(f"DASHBOARD_DEFAULT_DAYS={DASHBOARD_DEFAULT_DAYS} is not a dashboard time period "
+                   f"({', '.join(map(str, DASHBOARD_RANGES))}); using 365.")
+    DASHBOARD_DEFAULT_DAYS = 365
+
+# Logged once: the bump failing on every write (no cache_versions table) is not news
+data_version_warned = False
+
+def bump_data_version(connection):
+    """
+    Advance the shared data version after a committed write (LIVE_EVENTS=version), in its
+    own short transaction so writers do not queue on the row lock. Without cache_versions
+    (see migrate_cache_versions.sql) other workers' streams only miss the reload.
+    """
+    global data_version_warned
+    live_watch.note_local_write()
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        cursor.execute(backend.upsert('cache_versions', ('name', 'version'), keys=('name',), add=('version',)),
+                       (DATA_VERSION_KEY, 1))
+        connection.commit()
+    except Exception as e:
+        live_watch.forget_local_write()
+        try:
+            connection.rollback()
+        except Exception:
+            pass
+        if not data_version_warned:
+            data_version_warned = True
+            logger.warning(f"Could not bump the shared data version; other workers' live streams "
+                           f"will not reload after writes here. Reason: {e}")
+    finally:
+        if cursor:
+            cursor.close()
+
+def notify_data_changed(connection, rows):
+    """Mark derived data stale after a write committed on `connection` of `rows` ((site, date, ...) tuples)."""
+    if live_watch is not None:
+        bump_data_version(connection)
+    if analytics is not None:
+        analytics.mark_dirty()
+    if history is not None:
+        history.mark_dirty()
+    if forecast_models is not None:
+        forecast_models.invalidate()
+    dashboard_flights.bump()
+    if shared_results is not None:
+        days = sorted({factor_cache.iso_day(row[1]) for row in rows})
+        if days:
+            shared_results.note_write(days[0], days[-1], {row[0] for row in rows})
+        if warmer is not None:
+            warmer.trigger()
+
+def notify_factors_changed():
+    """
+    Refresh derived data after an emission factor edit. Raw sums (columnar history) do
+    not change, and cached results are keyed by the factors of their window
+    (factor_scope()), so only windows that overlap the changed dates miss.
+    """
+    if analytics is not None:
+        analytics.mark_dirty()
+    if warmer is not None:
+        warmer.trigger()
+
+def publish_activity_update(connection, records):
+    """
+    Push an `activity` event for newly committed (site, date, source_type, raw_value) records:
+    per site/date/source emission deltas (with week/month/year labels) and the new daily
+    totals, overall and per site. Only runs when someone is listening; errors never fail the write.
+    """
+    if not broker.has_subscribers():
+        return
+    cursor = None
+    try:
+        factors = emission_factors.timeline(connection)
+        deltas = {}
+        for site, date_value, source_type, raw_value in records:
+            d = datetime.strptime(str(date_value)[:10], '%Y-%m-%d').date()
+            if factors.factor(source_type, d) is not None:
+                key = (d, site, source_type)
+                deltas[key] = deltas.get(key, 0) + float(raw_value)
+        dates = sorted({d for d, _, _ in deltas})
+        if len(dates) > LIVE_MAX_DATES:
+            broker.publish('reload', {'reason': 'bulk_update'})
+            return
+        if not dates:
+            return
+
+        cursor = connection.cursor(dictionary=True)
+        placeholders = ', '.join(['%s'] * len(dates))
+        cursor.execute(f"""
+            SELECT site_code, date, source_type, SUM(raw_value) as raw_total
+            FROM activity_data
+            WHERE date IN ({placeholders})
+            GROUP BY site_code, date, source_type
+        """, [d.strftime('%Y-%m-%d') for d in dates])
+        daily_totals = {}
+        site_daily_totals = {}
+        for row in apply_factors(cursor.fetchall(), factors):
+            day = str(row['date'])[:10]
+            daily_totals[day] = daily_totals.get(day, 0) + row['emissions_tonnes']
+            per_site = site_daily_totals.setdefault(row['site_code'], {})
+            per_site[day] = per_site.get(day, 0) + row['emissions_tonnes']
+
+        changes = []
+        for (d, site, source_type), raw in sorted(deltas.items()):
+            iso_year, iso_week, _ = d.isocalendar()
+            changes.append({
+                'site': site,
+                'date': d.strftime('%Y-%m-%d'),
+                'week': f"{iso_year}-W{iso_week:02d}",
+                'month': d.strftime('%Y-%m'),
+                'year': d.year,
+                'source': source_type,
+                'raw': raw,
+                'emissions': raw * factors.factor(source_type, d) / 1000
+            })
+        broker.publish('activity', {'changes': changes, 'daily_totals': daily_totals,
+                                    'site_daily_totals': site_daily_totals})
+    except Exception:
+        logger.exception("Could not publish live activity update")
+        broker.publish('reload', {'reason': 'publish_error'})
+    finally:
+        if cursor:
+            cursor.close()
+
+# ---- High-rate ingest ----
+# Smart-meter readings posted to /api/ingest/readings are buffered per worker and
+# written in multi-row INSERTs, one COMMIT per flush (see ingest_buffer.py).
+# Each flush stores the raw readings (meter_readings) and their per-day sums
+# (activity_data, the daily tier) together; see downsampling.py for the other tiers.
+INGEST_INSERT_ROWS = int(os.environ.get('INGEST_INSERT_ROWS', 1000))
+INGEST_MAX_REQUEST_ROWS = int(os.environ.get('INGEST_MAX_REQUEST_ROWS', 50000))
+INGEST_ACK_TIMEOUT = float(os.environ.get('INGEST_ACK_TIMEOUT', 30))
+READING_FIELDS = ('site', 'ts', 'source_type', 'raw_value', 'unit')
+
+def insert_values(cursor, statement, rows):
+    """Run `statement` ("INSERT ... VALUES") as multi-row inserts of INGEST_INSERT_ROWS rows each."""
+    placeholder = '(' + ', '.join(['%s'] * len(rows[0])) + ')'
+    for start in range(0, len(rows), INGEST_INSERT_ROWS):
+        chunk = rows[start:start + INGEST_INSERT_ROWS]
+        cursor.execute(f"{statement} {', '.join([placeholder] * len(chunk))}",
+                       [value for row in chunk for value in row])
+
+def store_readings(cursor, rows):
+    """
+    Insert (site, reading_time, source_type, raw_value, unit) rows into meter_readings and
+    their per-day sums into activity_data (no commit). Returns the activity_data rows.
+    """
+    daily = {}
+    for site, reading_time, source_type, raw_value, unit in rows:
+        key = (site, reading_time.strftime('%Y-%m-%d'), source_type, unit)
+        daily[key] = daily.get(key, 0.0) + raw_value
+    daily_rows = [key[:3] + (raw_value, key[3]) for key, raw_value in daily.items()]
+    insert_values(cursor, "INSERT INTO meter_readings (site_code, reading_time, source_type, raw_value, unit) VALUES",
+                  rows)
+    insert_values(cursor, "INSERT INTO activity_data (site_code, date, source_type, raw_value, unit) VALUES",
+                  daily_rows)
+    return daily_rows
+
+def write_readings(rows):
+    """Flush callback: store (site, reading_time, source_type, raw_value, unit) rows and commit once."""
+    connection = None if spool_first() else get_db_connection()
+    if not connection:
+        if ingest_spool is None:
+            raise RuntimeError('Database connection error')
+        # Spooled rows count as committed: the spool is fsynced and replayed later
+        spool_rows('readings', spooled_readings(rows), 'ingest_readings')
+        return
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        daily_rows = store_readings(cursor, rows)
+        connection.commit()
+        ingested_rows.inc(len(rows), endpoint='ingest_readings')
+        notify_data_changed(connection, daily_rows)
+        publish_activity_update(connection, [row[:4] for row in daily_rows])
+    except Exception:
+        try:
+            connection.rollback()
+        except Exception:
+            pass
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+ingest_batcher = ingest_buffer.MicroBatcher(
+    write_readings,
+    max_batch_rows=int(os.environ.get('INGEST_BATCH_ROWS', 5000)),
+    max_delay_ms=float(os.environ.get('INGEST_MAX_DELAY_MS', 100)),
+    max_pending_rows=int(os.environ.get('INGEST_MAX_PENDING_ROWS', 100000)),
+    submit_timeout=float(os.environ.get('INGEST_SUBMIT_TIMEOUT', 2)),
+)
+ingest_pending = registry.gauge('ingest_pending_rows', 'Readings buffered or being flushed.')
+ingest_rate = registry.gauge('ingest_rows_per_second', 'Committed readings per second (last minute).')
+ingest_rejected = registry.counter('ingest_rejected_rows_total', 'Readings refused with 503 (buffer full).')
+
+def collect_ingest_metrics():
+    ingest_pending.set(ingest_batcher.pending_rows())
+    ingest_rate.set(round(ingest_batcher.rows_per_second(), 1))
+    ingest_rejected.set_total(ingest_batcher.stats['rejected_rows'])
+
+registry.add_collector(collect_ingest_metrics)
+
+# Raw readings are kept RAW_RETENTION_DAYS, hourly rollups HOURLY_RETENTION_MONTHS,
+# daily sums (activity_data) forever. Every worker runs the compactor; row locks keep it safe.
+retention = downsampling.RetentionPolicy(
+    raw_days=int(os.environ.get('RAW_RETENTION_DAYS', 14)),
+    hourly_months=int(os.environ.get('HOURLY_RETENTION_MONTHS', 13)),
+)
+compactor = downsampling.Compactor(
+    get_db_connection, retention, dialect=backend,
+    interval=float(os.environ.get('COMPACTION_INTERVAL_SECONDS', 60)),
+    batch_size=int(os.environ.get('COMPACTION_BATCH_ROWS', 10000)),
+)
+
+# ---- Ingest spool ----
+# When MySQL is unreachable (or the pool is exhausted), /api/data, /api/upload_csv,
+# /api/human_data and /api/ingest/readings append to a local write-ahead spool
+# (spool.py) and answer 202. A drainer replays it in bulk once MySQL answers again.
+# SPOOL_MODE=always spools every write (ingest never waits for MySQL), off disables it.
+SPOOL_MODE = os.environ.get('SPOOL_MODE', 'fallback').lower()
+SPOOL_DRAIN_INTERVAL = float(os.environ.get('SPOOL_DRAIN_SECONDS', 5))
+SPOOL_DEDUP_DAYS = int(os.environ.get('SPOOL_DEDUP_DAYS', 7))
+ingest_spool = None
+if SPOOL_MODE != 'off':
+    ingest_spool = spool.Spool(
+        os.environ.get('SPOOL_DIR', 'spool'),
+        segment_bytes=int(os.environ.get('SPOOL_SEGMENT_MB', 64)) * 1024 * 1024,
+        fsync=os.environ.get('SPOOL_FSYNC', 'True').lower() in ('1', 'true', 'yes'),
+        # Replays a record may fail before it goes to SPOOL_DIR/dead-letter.jsonl
+        max_attempts=int(os.environ.get('SPOOL_MAX_ATTEMPTS', 3)),
+    )
+spooled_rows = registry.counter('spooled_rows_total', 'Rows written to the ingest spool instead of MySQL.')
+spool_backlog = registry.gauge('spool_backlog_bytes', 'Spooled bytes waiting for replay.')
+
+def collect_spool_metrics():
+    if ingest_spool is not None:
+        spool_backlog.set(ingest_spool.backlog_bytes())
+
+registry.add_collector(collect_spool_metrics)
+
+def spool_first():
+    """
+    True when writes must go to the spool without trying MySQL: always mode, or
+    earlier writes are still waiting for replay (so they are applied in order).
+    """
+    return ingest_spool is not None and (SPOOL_MODE == 'always' or ingest_spool.has_backlog())
+
+# total_count (INT) holds the sum of both counts
+MAX_HEADCOUNT = 10 ** 9
+
+def parse_day(value):
+    """'YYYY-MM-DD' for a date field; raises ValueError (checked before a row is stored or spooled)."""
+    try:
+        return datetime.strptime(str(value), '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f'Invalid date format: "{value}" (expected YYYY-MM-DD)')
+
+def spool_rows(kind, rows, endpoint):
+    """Append one request's rows to the spool (fsynced before returning)."""
+    ingest_spool.append(kind, rows)
+    spooled_rows.inc(len(rows), endpoint=endpoint)
+
+def spooled_readings(rows):
+    """Parsed readings in spool (JSON) form: timestamps as 'YYYY-MM-DD HH:MM:SS'."""
+    return [(site, t.isoformat(sep=' '), source_type, raw_value, unit)
+            for site, t, source_type, raw_value, unit in rows]
+
+def spooled_response(kind, rows, endpoint):
+    """202 after spooling `rows`, or 500 when there is no spool or it cannot be written."""
+    if ingest_spool is None:
+        return jsonify({'error': 'Database connection error'}), 500
+    try:
+        spool_rows(kind, rows, endpoint)
+    except OSError:
+        logger.exception("Could not write to the ingest spool")
+        return jsonify({'error': 'Database connection error'}), 500
+    return jsonify({'message': 'Accepted; queued for the database', 'spooled': len(rows)}), 202
+
+# Ingested activity values are stored in the unit their source's emission factor is per
+# (unit_registry.py); this many per-row unit errors are listed in a 400 response
+UNIT_ERRORS_SHOWN = int(os.environ.get('UNIT_ERRORS_SHOWN', 100))
+
+def normalize_activity_rows(rows, connection=None):
+    """
+    Convert (site, date, source_type, raw_value, unit) rows to each source's canonical unit.
+    Returns (rows, errors) with errors as [(index, message)] for unknown or incompatible units.
+    Without a connection (spooling) the factor units loaded last are used.
+    """
+    entries = emission_factors.entries
+    if connection:
+        try:
+            entries = emission_factors.get(connection)
+        except Exception:
+            logger.exception("Could not check emission factor units; using the cached ones")
+    values, names, errors = unit_registry.normalize(
+        [row[2] for row in rows], [row[3] for row in rows], [row[4] for row in rows],
+        {source: entry['factor_unit'] for source, entry in entries.items()})
+    return [row[:3] + (value, name) for row, value, name in zip(rows, values, names)], errors
+
+def unit_errors_response(errors, connection=None, places=None):
+    """
+    400 listing rows (1-based) whose unit was rejected; closes `connection`.
+    For meter readings `places` names where each reading came from ('line 3', 'row 7').
+    """
+    if connection:
+        try:
+            connection.close()
+        except Exception:
+            pass
+    if places is None:
+        numbers = [str(index + 1) for index, _ in errors]
+        details = [{'row': index + 1, 'error': message} for index, message in errors[:UNIT_ERRORS_SHOWN]]
+        noun = 'rows'
+    else:
+        numbers = [places[index] for index, _ in errors]
+        details = [{'reading': index + 1, 'at': places[index], 'error': message}
+                   for index, message in errors[:UNIT_ERRORS_SHOWN]]
+        noun = 'readings'
+    shown = ', '.join(numbers[:20]) + (' ...' if len(numbers) > 20 else '')
+    return jsonify({
+        'error': f'Unknown or incompatible units in {len(errors)} {noun}: {shown}',
+        'unit_errors': details,
+    }), 400
+
+def replay_spooled(records):
+    """
+    Spool drainer callback: apply records in one transaction, skipping ids recorded in
+    ingest_spool_applied by an earlier (interrupted) replay. Returns how many were applied.
+    """
+    connection = get_db_connection()
+    if not connection:
+        raise spool.Unavailable('Database connection error')
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        ids = [record['id'] for record in records]
+        cursor.execute(
+            f"SELECT id FROM ingest_spool_applied WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+        done = {row[0] for row in cursor.fetchall()}
+        fresh = [record for record in records if record['id'] not in done]
+        rows = {'activity': [], 'human': [], 'readings': []}
+        for record in fresh:
+            rows[record['kind']].extend(tuple(row) for row in record['rows'])
+
+        activity = list(rows['activity'])
+        if activity:
+            insert_values(cursor, "INSERT INTO activity_data (site_code, date, source_type, raw_value, unit) VALUES",
+                          activity)
+        if rows['readings']:
+            readings = [(site, datetime.fromisoformat(t), source_type, raw_value, unit)
+                        for site, t, source_type, raw_value, unit in rows['readings']]
+            activity += store_readings(cursor, readings)
+        if rows['human']:
+            cursor.executemany(HUMAN_UPSERT, rows['human'])
+            if history is not None:
+                history.note_write(row[1] for row in rows['human'])
+        if fresh:
+            insert_values(cursor, "INSERT INTO ingest_spool_applied (id) VALUES", [(r['id'],) for r in fresh])
+        cursor.execute(backend.delete_limited('ingest_spool_applied', 'applied_at < %s'),
+                       (datetime.now() - timedelta(days=SPOOL_DEDUP_DAYS), 1000))
+        connection.commit()
+        if not fresh:
+            return 0
+        ingested_rows.inc(sum(len(r) for r in rows.values()), endpoint='spool_replay')
+        notify_data_changed(connection, activity + list(rows['human']))
+        if activity:
+            publish_activity_update(connection, [row[:4] for row in activity])
+        if rows['human']:
+            broker.publish('reload', {'reason': 'spool_replay'})
+        return len(fresh)
+    except Exception:
+        try:
+            connection.rollback()
+        except Exception:
+            pass
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+@app.before_request
+def start_background_jobs():
+    compactor.start()
+    if ingest_spool is not None:
+        ingest_spool.start_drainer(replay_spooled, interval=SPOOL_DRAIN_INTERVAL)
+    if history is not None:
+        history.start(lambda: get_db_connection(pooled=False))
+    if warmer is not None:
+        # Workers forked after import (gunicorn --preload) need their own thread
+        warmer.start()
+
+def parse_reading(record, defaults, where):
+    """One reading (dict) -> (site, reading_time, source_type, raw_value, unit); raises ValueError."""
+    if not isinstance(record, dict):
+        raise ValueError(f'Invalid reading at {where}')
+    values = {field: record.get(field, defaults.get(field)) for field in READING_FIELDS}
+    ts = values['ts'] or record.get('date')
+    if not ts or not values['source_type'] or values['raw_value'] is None or not values['unit']:
+        raise ValueError(f'Missing required fields at {where} (ts, source_type, raw_value, unit)')
+    try:
+        reading_time = datetime.fromisoformat(str(ts).strip().replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f'Invalid timestamp at {where}: "{ts}" (expected YYYY-MM-DD[THH:MM[:SS]])')
+    if reading_time.tzinfo is not None:
+        # Stored as server-local wall time, like the DATE columns
+        reading_time = reading_time.astimezone().replace(tzinfo=None)
+    try:
+        raw_value = float(values['raw_value'])
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid numeric value at {where}: "{values["raw_value"]}"')
+    if not math.isfinite(raw_value):
+        raise ValueError(f'Invalid numeric value at {where}: "{values["raw_value"]}"')
+    site = parse_site_code(values['site'])
+    return (site, reading_time.replace(microsecond=0), str(values['source_type']), raw_value, str(values['unit']))
+
+def parse_readings(body, mimetype, args):
+    """
+    Readings from a request body. Query args `site`, `source_type` and `unit` are defaults.
+    - NDJSON (application/x-ndjson): one reading object per line.
+    - JSON: {"readings": [{...}, ...]} or the compact form
+      {"columns": ["ts", "raw_value"], "rows": [["2025-11-14T00:15", 12.5], ...], "source_type": ...}
+      whose top-level fields are defaults too.
+    Returns (readings, places), places naming where each reading is ('line 3', 'row 7', 'reading 2').
+    """
+    defaults = {field: args.get(field) for field in ('site', 'source_type', 'unit')}
+    if mimetype in ('application/x-ndjson', 'application/jsonl', 'application/json-seq'):
+        readings, places = [], []
+        for number, line in enumerate(body.splitlines(), start=1):
+            line = line.strip().lstrip('\x1e')
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise ValueError(f'Invalid JSON at line {number}')
+            places.append(f'line {number}')
+            readings.append(parse_reading(record, defaults, places[-1]))
+        return readings, places
+
+    try:
+        payload = json.loads(body or 'null')
+    except ValueError:
+        raise ValueError('Invalid JSON body')
+    if not isinstance(payload, dict):
+        raise ValueError('Expected a JSON object with "readings" or "columns"/"rows"')
+    defaults.update({field: payload[field] for field in READING_FIELDS if payload.get(field) is not None})
+    if 'rows' in payload:
+        columns = payload.get('columns')
+        if not isinstance(columns, list) or not isinstance(payload['rows'], list):
+            raise ValueError('"columns" and "rows" must be arrays')
+        unknown = set(columns) - set(READING_FIELDS) - {'date'}
+        if unknown:
+            raise ValueError(f"Unknown column(s): {', '.join(sorted(map(str, unknown)))}")
+        readings, places = [], []
+        for number, row in enumerate(payload['rows'], start=1):
+            if not isinstance(row, list) or len(row) != len(columns):
+                raise ValueError(f'Row {number} must have {len(columns)} values')
+            places.append(f'row {number}')
+            readings.append(parse_reading(dict(zip(columns, row)), defaults, places[-1]))
+        return readings, places
+    records = payload.get('readings')
+    if not isinstance(records, list):
+        raise ValueError('Expected a JSON object with "readings" or "columns"/"rows"')
+    places = [f'reading {number}' for number in range(1, len(records) + 1)]
+    return [parse_reading(record, defaults, where) for record, where in zip(records, places)], places
+
 # ---- Authentication helpers ----
 def login_required(f):
     """Session-based decorator for web routes."""
@@ -71,6 +1140,33 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def api_auth_error():
+    """
+    None when the request carries a valid session (web login) or a valid JWT in
+    Authorization: Bearer <token>; otherwise the (JSON, 401) error to return.
+    """
+    # 1) Session-based (browser)
+    if 'user_id' in session:
+        return None
+
+    # 2) JWT-based (API clients)
+    auth_header = request.headers.get('Authorization', '')
+    if auth_header.startswith('Bearer '):
+        token = auth_header.split(' ', 1)[1].strip()
+        try:
+            payload = jwt.decode(token, app.secret_key, algorithms=['HS256'])
+            # optional: set some request-level attributes if needed
+            request.user_id = payload.get('user_id')
+            request.username = payload.get('username')
+            return None
+        except jwt.ExpiredSignatureError:
+            return jsonify({'error': 'Token expired'}), 401
+        except jwt.InvalidTokenError:
+            return jsonify({'error': 'Invalid token'}), 401
+
+    # No valid auth provided
+    return jsonify({'error': 'Authentication required'}), 401
+
 def api_token_required(f):
     """
     Decorator to protect API endpoints:
@@ -79,33 +1175,53 @@ def api_token_required(f):
     """
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        # 1) Session-based (browser)
-        if 'user_id' in session:
-            return f(*args, **kwargs)
-
-        # 2) JWT-based (API clients)
-        auth_header = request.headers.get('Authorization', '')
-        if auth_header.startswith('Bearer '):
-            token = auth_header.split(' ', 1)[1].strip()
-            try:
-                payload = jwt.decode(token, app.secret_key, algorithms=['HS256'])
-                # optional: set some request-level attributes if needed
-                request.user_id = payload.get('user_id')
-                return f(*args, **kwargs)
-            except jwt.ExpiredSignatureError:
-                return jsonify({'error': 'Token expired'}), 401
-            except jwt.InvalidTokenError:
-                return jsonify({'error': 'Invalid token'}), 401
-
-        # No valid auth provided
-        return jsonify({'error': 'Authentication required'}), 401
+        auth_error = api_auth_error()
+        if auth_error:
+            return auth_error
+        return f(*args, **kwargs)
+
+    return decorated_function
+
+def profile_admin_error():
+    """
+    None when the request is authenticated as one of PROFILE_ADMINS; otherwise the
+    (JSON, 401) authentication error or (JSON, 403).
+    """
+    auth_error = api_auth_error()
+    if auth_error:
+        return auth_error
+    username = session.get('username') if 'user_id' in session else getattr(request, 'username', None)
+    if username not in PROFILE_ADMINS:
+        return jsonify({'error': 'Restricted to administrators'}), 403
+    return None
+
+def profile_admin_required(f):
+    """Decorator for the profile and admin endpoints: an authenticated user listed in PROFILE_ADMINS."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        auth_error = profile_admin_error()
+        if auth_error:
+            return auth_error
+        return f(*args, **kwargs)
 
     return decorated_function
 
 # ---- Routes ----
 @app.route('/')
 def index():
-    return render_template('dashboard.html')
+    """Dashboard page; the initial data is inlined so the page needs no extra round trips."""
+    bootstrap = None
+    if DASHBOARD_INLINE_BOOTSTRAP:
+        try:
+            start_dt, end_dt, window_days = parse_dashboard_window({}, DASHBOARD_DEFAULT_DAYS)
+            bootstrap = cached_dashboard_bootstrap(start_dt, end_dt, window_days, set(DASHBOARD_SECTIONS))
+            bootstrap = dict(bootstrap, days=DASHBOARD_DEFAULT_DAYS)
+        except DatabaseUnavailable:
+            pass
+        except Exception:
+            # The page still works; the client falls back to /api/dashboard/bootstrap
+            logger.exception("Error inlining dashboard bootstrap")
+    return render_template('dashboard.html', bootstrap=bootstrap, default_days=DASHBOARD_DEFAULT_DAYS)
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -206,6 +1322,7 @@ def api_login():
     if user and (user['password'] == password or user['password'] == hashed_password):
         payload = {
             'user_id': user['id'],
+            'username': user['username'],
             'exp': datetime.utcnow() + timedelta(hours=24)
         }
         token = jwt.encode(payload, app.secret_key, algorithm='HS256')
@@ -260,6 +1377,7 @@ def add_data():
     """
     Protected endpoint for adding activity records.
     Accepts JWT (Authorization Bearer) or active session.
+    Optional `site` (defaults to DEFAULT_SITE).
     """
     data = request.get_json() or {}
     date = data.get('date')
@@ -269,20 +1387,44 @@ def add_data():
 
     if not all([date, source_type, raw_value, unit]):
         return jsonify({'error': 'Missing required fields'}), 400
-
-    connection = get_db_connection()
+    try:
+        value = float(raw_value)
+    except (ValueError, TypeError):
+        value = math.nan
+    if not math.isfinite(value):
+        return jsonify({'error': f'Invalid numeric value: "{raw_value}"'}), 400
+    raw_value = value
+    try:
+        date = parse_day(date)
+        site = parse_site_code(data.get('site'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    connection = None if spool_first() else get_db_connection()
+    (row,), unit_errors = normalize_activity_rows([(site, date, source_type, raw_value, unit)], connection)
+    if unit_errors:
+        if connection:
+            try:
+                connection.close()
+            except Exception:
+                pass
+        return jsonify({'error': unit_errors[0][1]}), 400
+    _, _, _, raw_value, unit = row
     if not connection:
-        return jsonify({'error': 'Database connection error'}), 500
+        return spooled_response('activity', [row], 'add_data')
 
     cursor = None
     try:
         cursor = connection.cursor()
         cursor.execute(
-            "INSERT INTO activity_data (date, source_type, raw_value, unit) VALUES (%s, %s, %s, %s)",
-            (date, source_type, raw_value, unit)
+            "INSERT INTO activity_data (site_code, date, source_type, raw_value, unit) VALUES (%s, %s, %s, %s, %s)",
+            row
         )
         connection.commit()
-        return jsonify({'message': 'Data added successfully'}), 201
+        ingested_rows.inc(endpoint='add_data')
+        notify_data_changed(connection, [row])
+        publish_activity_update(connection, [(site, date, source_type, raw_value)])
+        return jsonify({'message': 'Data added successfully', 'raw_value': raw_value, 'unit': unit}), 201
     except Exception as e:
         logger.exception("Error inserting activity_data")
         return jsonify({'error': 'Failed to insert data'}), 500
@@ -300,6 +1442,7 @@ def add_human_data():
     """
     CORE FEATURE: Add human population data (students + staff counts).
     Protected endpoint - requires authentication.
+    One headcount per site and day (optional `site`, defaults to DEFAULT_SITE).
     """
     data = request.get_json() or {}
     date = data.get('date')
@@ -314,63 +1457,73 @@ def add_human_data():
         staff_count = int(staff_count)
         if student_count < 0 or staff_count < 0:
             return jsonify({'error': 'Counts must be non-negative'}), 400
-    except ValueError:
+    except (ValueError, TypeError):
         return jsonify({'error': 'Counts must be valid integers'}), 400
+    if student_count > MAX_HEADCOUNT or staff_count > MAX_HEADCOUNT:
+        return jsonify({'error': f'Counts must be at most {MAX_HEADCOUNT}'}), 400
+    try:
+        date = parse_day(date)
+        site = parse_site_code(data.get('site'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    connection = get_db_connection()
+    connection = None if spool_first() else get_db_connection()
     if not connection:
-        return jsonify({'error': 'Database connection error'}), 500
+        # Spooled headcounts are acknowledged without cumulative stats
+        return spooled_response('human', [(site, date, student_count, staff_count)], 'add_human_data')
 
     cursor = None
     try:
         cursor = connection.cursor(dictionary=True)
-        cursor.execute(
-            """INSERT INTO human_population (date, student_count, staff_count) 
-               VALUES (%s, %s, %s)
-               ON DUPLICATE KEY UPDATE 
-               student_count = VALUES(student_count), 
-               staff_count = VALUES(staff_count)""",
-            (date, student_count, staff_count)
-        )
+        cursor.execute(HUMAN_UPSERT, (site, date, student_count, staff_count))
         connection.commit()
+        if history is not None:
+            history.note_write([date])
+        ingested_rows.inc(endpoint='add_human_data')
+        notify_data_changed(connection, [(site, date)])
         
-        # Calculate emissions for this entry
+        # Calculate emissions for this entry with the human_daily factor of its date
+        factors = emission_factors.timeline(connection)
         total_people = student_count + staff_count
-        emissions_kg = total_people * 1.0  # 1 kg CO2 per person per day
-        emissions_tonnes = emissions_kg / 1000
-        
-        # Get total cumulative emissions from all records
-        cursor.execute("""
-            SELECT 
-                SUM(total_count * 1.0 / 1000) as total_emissions,
-                COUNT(*) as record_count,
-                AVG(student_count) as avg_students,
-                AVG(staff_count) as avg_staff
-            FROM human_population
-        """)
-        stats = cursor.fetchone()
-        
-        total_emissions_all = float(stats['total_emissions'] or 0)
-        record_count = stats['record_count'] or 0
-        avg_students = int(stats['avg_students'] or 0)
-        avg_staff = int(stats['avg_staff'] or 0)
+        emissions_tonnes = human_tonnes(factors, date, total_people)
         
+        # Get total cumulative emissions from all records (every site)
+        stats = query_human_stats(cursor, factors)
+
+        entry = {
+            'site': site,
+            'date': date,
+            'student_count': student_count,
+            'staff_count': staff_count,
+            'total_count': total_people,
+            'this_day_emissions_tonnes': round(emissions_tonnes, 3)
+        }
+        cumulative_stats = {
+            'total_emissions_tonnes': round(stats['total_emissions'], 2),
+            'total_records': stats['record_count'],
+            'average_students': stats['avg_students'],
+            'average_staff': stats['avg_staff'],
+            'average_population': stats['avg_students'] + stats['avg_staff']
+        }
+        if broker.has_subscribers():
+            # Every site's headcount for the day, so site-filtered views can re-sum it
+            cursor.execute(
+                "SELECT site_code, student_count, staff_count FROM human_population WHERE date = %s",
+                (date,)
+            )
+            day_sites = [
+                {'site': row['site_code'], 'student_count': int(row['student_count']),
+                 'staff_count': int(row['staff_count'])}
+                for row in cursor.fetchall()
+            ]
+            broker.publish('human', {'entry': entry, 'day_sites': day_sites,
+                                     'factor': factors.factor(factor_cache.HUMAN_SOURCE, date),
+                                     'cumulative_stats': cumulative_stats})
+
         return jsonify({
             'message': 'Human population data added successfully',
-            'data': {
-                'date': date,
-                'student_count': student_count,
-                'staff_count': staff_count,
-                'total_count': total_people,
-                'this_day_emissions_tonnes': round(emissions_tonnes, 3)
-            },
-            'cumulative_stats': {
-                'total_emissions_tonnes': round(total_emissions_all, 2),
-                'total_records': record_count,
-                'average_students': avg_students,
-                'average_staff': avg_staff,
-                'average_population': avg_students + avg_staff
-            }
+            'data': entry,
+            'cumulative_stats': cumulative_stats
         }), 201
     except Exception as e:
         logger.exception("Error inserting human_population")
@@ -383,17 +1536,108 @@ def add_human_data():
         except Exception:
             pass
 
-@app.route('/api/dashboard', methods=['GET'])
-def get_dashboard_data():
+def query_human_stats(cursor, factors, sites=None):
     """
-    Public dashboard JSON (no auth).
+    All-time human_population aggregates shared by stats, recommendations and ingest responses.
+    Records and averages are per day, over headcounts summed across the selected sites
+    (the same numbers as before for a single site). Emissions weight the person-days of
+    each human_daily factor period with that factor.
     """
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
+    site_sql, params = site_filter_sql(sites)
+    # Sums and distinct days add up across date ranges, so the columnar history can serve the older part
+    rows = grouped_rows(cursor, f"""
+        SELECT 
+            COUNT(DISTINCT date) as human_days,
+            SUM(student_count) as students,
+            SUM(staff_count) as staff,
+            SUM(total_count) as people
+        FROM human_population
+        WHERE date BETWEEN %s AND %s{site_sql}
+    """, *ALL_DATES, params)
+    totals = rows[0] if rows else {}
+    emissions_kg = 0.0
+    for source, first, last, factor in factors.scope(*ALL_DATES):
+        if source != factor_cache.HUMAN_SOURCE:
+            continue
+        if (first, last) == ALL_DATES:
+            people = totals.get('people')
+        else:
+            period = grouped_rows(cursor, f"""
+                SELECT SUM(total_count) as people
+                FROM human_population
+                WHERE date BETWEEN %s AND %s{site_sql}
+            """, first, last, params)
+            people = period[0].get('people') if period else None
+        emissions_kg += float(people or 0) * factor
+    return human_stats_from_totals({
+        'human_days': int(totals.get('human_days') or 0),
+        'students': float(totals.get('students') or 0),
+        'staff': float(totals.get('staff') or 0),
+        'people': float(totals.get('people') or 0),
+        'human_emissions': emissions_kg / 1000,
+    })
+
+def cumulative_stats_payload(stats):
+    """Body of /api/human_cumulative_stats from query_human_stats() output."""
+    return {
+        'total_emissions': round(stats['total_emissions'], 2),
+        'total_records': stats['record_count'],
+        'average_students': stats['avg_students'],
+        'average_staff': stats['avg_staff'],
+        'average_population': stats['avg_students'] + stats['avg_staff']
+    }
+
+def query_source_totals(connection, sites=None):
+    """All-time emissions per source, largest first (rows have source_type and total_emissions)."""
+    factors = emission_factors.timeline(connection)
+    site_sql, params = site_filter_sql(sites)
+    cursor = connection.cursor(dictionary=True)
+    try:
+        results = factored_source_totals(cursor, f"""
+            SELECT 
+                source_type,
+                SUM(raw_value) as raw_total
+            FROM activity_data
+            WHERE date BETWEEN %s AND %s{site_sql}
+            GROUP BY source_type
+        """, *ALL_DATES, params, factors)
+    finally:
+        cursor.close()
+    for row in results:
+        row['total_emissions'] = row['emissions_tonnes']
+    results.sort(key=lambda row: row['total_emissions'], reverse=True)
+    return results
+
+# Top-level sections of the /api/dashboard payload, in response order.
+DASHBOARD_SECTIONS = (
+    'kpis', 'daily_trend', 'weekly_trend', 'monthly_trend', 'source_breakdown',
+    'weekly_comparison', 'yearly_comparison', 'human_emissions',
+)
+
+def parse_dashboard_sections(raw):
+    """
+    Parse an `include=` value (comma separated section names) into a set.
+    Missing/empty means every section. Raises ValueError on unknown names.
+    """
+    if not raw:
+        return set(DASHBOARD_SECTIONS)
+    sections = {s.strip() for s in raw.split(',') if s.strip()}
+    unknown = sections - set(DASHBOARD_SECTIONS)
+    if unknown:
+        raise ValueError(f"Unknown dashboard section(s): {', '.join(sorted(unknown))}")
+    return sections or set(DASHBOARD_SECTIONS)
+
+def parse_dashboard_window(args, default_days=180):
+    """
+    (start_dt, end_dt, window_days) from `start_date`/`end_date` query args.
+    Defaults to the last `default_days` days; raises ValueError on malformed dates.
+    """
+    start_date = args.get('start_date')
+    end_date = args.get('end_date')
 
     if not start_date or not end_date:
         end_date = datetime.now().strftime('%Y-%m-%d')
-        start_date = (datetime.now() - timedelta(days=180)).strftime('%Y-%m-%d')
+        start_date = (datetime.now() - timedelta(days=default_days)).strftime('%Y-%m-%d')
 
     # Normalize and validate date range; also compute window length for comparisons
     start_dt = datetime.strptime(start_date, '%Y-%m-%d')
@@ -401,126 +1645,106 @@ def get_dashboard_data():
     if end_dt < start_dt:
         start_dt, end_dt = end_dt, start_dt
     window_days = max((end_dt - start_dt).days, 1)
+    return start_dt, end_dt, window_days
+
+def dashboard_from_store(start_dt, end_dt, window_days, sections, sites=None, connect=None, close=True):
+    """Dashboard payload from the analytics store, or None when it is disabled or fails."""
+    if analytics is None:
+        return None
+    try:
+        analytics.ensure_fresh(connect or get_db_connection, close=close)
+        return analytics.dashboard(start_dt.toordinal(), end_dt.toordinal(), window_days, sections, sites)
+    except Exception:
+        logger.exception("Analytics store failed; falling back to SQL aggregation")
+        return None
+
+def daily_activity_query(sites=None):
+    """
+    Raw sums per (date, source) over `date BETWEEN %s AND %s` and `sites` (params from
+    site_filter_sql()); each date's factors are applied to the grouped rows.
+    With a site filter the (site_code, date, ...) index covers the query.
+    """
+    return f"""
+        SELECT 
+            date,
+            source_type,
+            SUM(raw_value) as raw_total
+        FROM activity_data
+        WHERE date BETWEEN %s AND %s{site_filter_sql(sites)[0]}
+        GROUP BY date, source_type
+        ORDER BY date
+    """
+
+def daily_human_query(sites=None):
+    """Headcounts per day (summed over `sites`), like daily_activity_query(); see human_tonnes()."""
+    return f"""
+        SELECT 
+            h.date,
+            SUM(h.student_count) as student_count,
+            SUM(h.staff_count) as staff_count,
+            SUM(h.total_count) as total_count
+        FROM human_population h
+        WHERE h.date BETWEEN %s AND %s{site_filter_sql(sites, 'h.site_code')[0]}
+        GROUP BY h.date
+        ORDER BY h.date
+    """
+
+def build_dashboard_data(connection, start_dt, end_dt, window_days, sections, sites=None):
+    """
+    Aggregate the /api/dashboard payload (row format) with SQL on `connection`,
+    over `sites` (None = every site).
+    """
     start_date = start_dt.strftime('%Y-%m-%d')
     end_date = end_dt.strftime('%Y-%m-%d')
-
-    connection = get_db_connection()
-    if not connection:
-        return jsonify({'error': 'Database connection error'}), 500
+    site_sql, site_params = site_filter_sql(sites)
+
+    # Work out which intermediate aggregates the requested sections depend on
+    want_kpis = 'kpis' in sections
+    want_daily = 'daily_trend' in sections
+    want_weekly = 'weekly_trend' in sections or 'weekly_comparison' in sections
+    want_monthly = 'monthly_trend' in sections
+    want_yearly = 'yearly_comparison' in sections
+    want_breakdown = want_kpis or 'source_breakdown' in sections
+    want_human = 'human_emissions' in sections
+    want_buckets = want_daily or want_weekly or want_monthly or want_yearly
 
     cursor = None
     try:
+        factors = emission_factors.timeline(connection)
         cursor = connection.cursor(dictionary=True)
-        query = """
+        query = daily_activity_query(sites)
+        # Per-source totals only (split where factors change); used when no time-bucketed section is requested
+        source_totals_query = f"""
             SELECT 
-                a.date,
-                a.source_type,
-                a.raw_value,
-                a.unit,
-                e.factor,
-                (a.raw_value * e.factor / 1000) as emissions_tonnes
-            FROM activity_data a
-            JOIN emission_factors e ON a.source_type = e.source_type
-            WHERE a.date BETWEEN %s AND %s
-            ORDER BY a.date
+                source_type,
+                SUM(raw_value) as raw_total
+            FROM activity_data
+            WHERE date BETWEEN %s AND %s{site_sql}
+            GROUP BY source_type
         """
-        cursor.execute(query, (start_date, end_date))
-        results = cursor.fetchall()
-
-        total_emissions = sum(row['emissions_tonnes'] for row in results)
-
+        total_emissions = 0
+        energy_saved = 0
         source_breakdown = {}
-        for row in results:
-            source = row['source_type']
-            source_breakdown[source] = source_breakdown.get(source, 0) + row['emissions_tonnes']
-
-        biggest_source = max(source_breakdown.items(), key=lambda x: x[1]) if source_breakdown else ('N/A', 0)
 
         # Daily, weekly, monthly, and yearly aggregations
         daily_data = {}
         weekly_data = {}
         monthly_data = {}
         yearly_data = {}
-        
-        for row in results:
-            raw_date = row['date']
-            if isinstance(raw_date, datetime):
-                d = raw_date.date()
-            else:
-                try:
-                    d = datetime.strptime(str(raw_date), '%Y-%m-%d').date()
-                except Exception:
-                    continue
-
-            year = d.year
-            iso_year, iso_week, _ = d.isocalendar()
-            week_label = f"{iso_year}-W{iso_week:02d}"
-            month = str(row['date'])[:7]
-            date_str = d.strftime('%Y-%m-%d')
 
-            daily_data[date_str] = daily_data.get(date_str, 0) + row['emissions_tonnes']
-            weekly_data[week_label] = weekly_data.get(week_label, 0) + row['emissions_tonnes']
-            monthly_data[month] = monthly_data.get(month, 0) + row['emissions_tonnes']
-            yearly_data[year] = yearly_data.get(year, 0) + row['emissions_tonnes']
-
-        # Previous period uses same window length as current selection
-        prev_start_dt = start_dt - timedelta(days=window_days)
-        prev_start = prev_start_dt.strftime('%Y-%m-%d')
-        prev_end = start_dt.strftime('%Y-%m-%d')
-        cursor.execute(query, (prev_start, prev_end))
-        prev_results = cursor.fetchall()
-        prev_emissions = sum(row['emissions_tonnes'] for row in prev_results)
-
-        percent_change = 0.0
-        if prev_emissions > 0:
-            percent_change = ((total_emissions - prev_emissions) / prev_emissions) * 100.0
-
-        weekly_comparison = [
-            {'label': label, 'emissions': round(val, 2)}
-            for label, val in sorted(weekly_data.items())
-        ]
-        yearly_comparison = [
-            {'year': year, 'emissions': round(val, 2)}
-            for year, val in sorted(yearly_data.items())
-        ]
+        if want_buckets:
+            results = apply_factors(
+                grouped_rows(cursor, query, start_date, end_date, site_params, keys=('date', 'source_type')), factors)
 
-        energy_saved = 0
-        for row in results:
-            if row['source_type'] == 'electricity':
-                try:
-                    energy_saved += float(row['raw_value'])
-                except Exception:
-                    try:
-                        energy_saved += row['raw_value']
-                    except Exception:
-                        pass
+            for row in results:
+                emissions = row['emissions_tonnes']
+                total_emissions += emissions
+                if want_breakdown:
+                    source = row['source_type']
+                    source_breakdown[source] = source_breakdown.get(source, 0) + emissions
+                if want_kpis and row['source_type'] == 'electricity':
+                    energy_saved += row['raw_total']
 
-        # CORE FEATURE: Get human population emissions data
-        human_query = """
-            SELECT 
-                h.date,
-                h.student_count,
-                h.staff_count,
-                h.total_count,
-                (h.total_count * 1.0 / 1000) as emissions_tonnes
-            FROM human_population h
-            WHERE h.date BETWEEN %s AND %s
-            ORDER BY h.date
-        """
-        cursor.execute(human_query, (start_date, end_date))
-        human_results = cursor.fetchall()
-        
-        # Aggregate human emissions data
-        human_daily_data = {}
-        human_weekly_data = {}
-        human_monthly_data = {}
-        human_yearly_data = {}
-        human_total_emissions = 0
-        avg_student_count = 0
-        avg_staff_count = 0
-        
-        if human_results:
-            for row in human_results:
                 raw_date = row['date']
                 if isinstance(raw_date, datetime):
                     d = raw_date.date()
@@ -529,330 +1753,812 @@ def get_dashboard_data():
                         d = datetime.strptime(str(raw_date), '%Y-%m-%d').date()
                     except Exception:
                         continue
-                
-                year = d.year
-                iso_year, iso_week, _ = d.isocalendar()
-                week_label = f"{iso_year}-W{iso_week:02d}"
-                month = str(row['date'])[:7]
-                date_str = d.strftime('%Y-%m-%d')
-                
+
+                if want_daily:
+                    date_str = d.strftime('%Y-%m-%d')
+                    daily_data[date_str] = daily_data.get(date_str, 0) + emissions
+                if want_weekly:
+                    iso_year, iso_week, _ = d.isocalendar()
+                    week_label = f"{iso_year}-W{iso_week:02d}"
+                    weekly_data[week_label] = weekly_data.get(week_label, 0) + emissions
+                if want_monthly:
+                    month = str(row['date'])[:7]
+                    monthly_data[month] = monthly_data.get(month, 0) + emissions
+                if want_yearly:
+                    yearly_data[d.year] = yearly_data.get(d.year, 0) + emissions
+        elif want_breakdown:
+            source_totals = factored_source_totals(cursor, source_totals_query, start_date, end_date,
+                                                   site_params, factors)
+            for row in source_totals:
                 emissions = row['emissions_tonnes']
-                human_daily_data[date_str] = human_daily_data.get(date_str, 0) + emissions
-                human_weekly_data[week_label] = human_weekly_data.get(week_label, 0) + emissions
-                human_monthly_data[month] = human_monthly_data.get(month, 0) + emissions
-                human_yearly_data[year] = human_yearly_data.get(year, 0) + emissions
-                human_total_emissions += emissions
-                avg_student_count += row['student_count']
-                avg_staff_count += row['staff_count']
-            
-            avg_student_count = int(avg_student_count / len(human_results))
-            avg_staff_count = int(avg_staff_count / len(human_results))
-        
-        dashboard_data = {
-            'kpis': {
+                source_breakdown[row['source_type']] = emissions
+                total_emissions += emissions
+                if row['source_type'] == 'electricity':
+                    energy_saved += row['raw_total']
+
+        dashboard_data = {}
+
+        if want_kpis:
+            # Previous period uses same window length as current selection
+            prev_start_dt = start_dt - timedelta(days=window_days)
+            prev_start = prev_start_dt.strftime('%Y-%m-%d')
+            prev_end = start_dt.strftime('%Y-%m-%d')
+            prev_totals = factored_source_totals(cursor, source_totals_query, prev_start, prev_end,
+                                                 site_params, factors)
+            prev_emissions = sum(row['emissions_tonnes'] for row in prev_totals)
+
+            percent_change = 0.0
+            if prev_emissions > 0:
+                percent_change = ((total_emissions - prev_emissions) / prev_emissions) * 100.0
+
+            biggest_source = max(source_breakdown.items(), key=lambda x: x[1]) if source_breakdown else ('N/A', 0)
+            dashboard_data['kpis'] = {
                 'total_emissions': round(total_emissions, 2),
                 'percent_change': round(percent_change, 2),
                 'biggest_source': biggest_source[0],
                 'biggest_source_percent': round((biggest_source[1] / total_emissions * 100) if total_emissions > 0 else 0, 1),
-                'energy_saved': round(energy_saved, 0)
-            },
-            'daily_trend': [
+                'energy_saved': round(energy_saved, 0),
+                'previous_emissions': round(prev_emissions, 2)
+            }
+
+        if want_daily:
+            dashboard_data['daily_trend'] = [
                 {'date': date, 'emissions': round(emissions, 2)}
                 for date, emissions in sorted(daily_data.items())
-            ],
-            'weekly_trend': weekly_comparison,
-            'monthly_trend': [
+            ]
+        if want_weekly:
+            weekly_comparison = [
+                {'label': label, 'emissions': round(val, 2)}
+                for label, val in sorted(weekly_data.items())
+            ]
+            if 'weekly_trend' in sections:
+                dashboard_data['weekly_trend'] = weekly_comparison
+        if want_monthly:
+            dashboard_data['monthly_trend'] = [
                 {'month': month, 'emissions': round(emissions, 2)}
                 for month, emissions in sorted(monthly_data.items())
-            ],
-            'source_breakdown': [
+            ]
+        if 'source_breakdown' in sections:
+            dashboard_data['source_breakdown'] = [
                 {'source': source, 'emissions': round(emissions, 2), 'percentage': round((emissions / total_emissions * 100) if total_emissions > 0 else 0, 1)}
                 for source, emissions in source_breakdown.items()
-            ],
-            'weekly_comparison': weekly_comparison,
-            'yearly_comparison': yearly_comparison,
-            # CORE FEATURE: Human emissions data
-            'human_emissions': {
-                'total_emissions': round(human_total_emissions, 2),
-                'avg_student_count': avg_student_count,
-                'avg_staff_count': avg_staff_count,
-                'avg_total_count': avg_student_count + avg_staff_count,
-                'daily_trend': [
-                    {'date': date, 'emissions': round(emissions, 2)}
-                    for date, emissions in sorted(human_daily_data.items())
-                ],
-                'weekly_trend': [
-                    {'label': label, 'emissions': round(val, 2)}
-                    for label, val in sorted(human_weekly_data.items())
-                ],
-                'monthly_trend': [
-                    {'month': month, 'emissions': round(emissions, 2)}
-                    for month, emissions in sorted(human_monthly_data.items())
-                ],
-                'population_data': [
-                    {
-                        'date': str(row['date']),
-                        'students': row['student_count'],
-                        'staff': row['staff_count'],
-                        'total': row['total_count'],
-                        'emissions': round(row['emissions_tonnes'], 3)
-                    }
-                    for row in human_results
-                ]
-            }
-        }
-        return jsonify(dashboard_data)
-    except Exception as e:
-        logger.exception("Error building dashboard data")
-        return jsonify({'error': 'Internal error'}), 500
+            ]
+        if 'weekly_comparison' in sections:
+            dashboard_data['weekly_comparison'] = weekly_comparison
+        if want_yearly:
+            dashboard_data['yearly_comparison'] = [
+                {'year': year, 'emissions': round(val, 2)}
+                for year, val in sorted(yearly_data.items())
+            ]
+
+        if want_human:
+            # CORE FEATURE: Get human population emissions data (per day, summed over sites)
+            human_results = grouped_rows(cursor, daily_human_query(sites), start_date, end_date, site_params,
+                                         keys=('date',))
+            dashboard_data['human_emissions'] = build_human_emissions(human_results, factors)
+
+        return dashboard_data
     finally:
         if cursor:
             cursor.close()
+
+def parse_interval_tier(args, start_dt):
+    """
+    Tier for the optional `granularity=hour|raw` series (None for the default `day`,
+    which the daily sections already cover). Raises ValueError past the tier's retention.
+    """
+    tier = retention.choose_tier(args.get('granularity', 'day'), start_dt)
+    return None if tier == 'daily' else tier
+
+def build_interval_trend(connection, start_dt, end_dt, tier, sites=None):
+    """
+    Sub-daily emissions series from the hourly tier (plus raw readings not yet
+    rolled up) or from raw readings, as [{'time': 'YYYY-MM-DD HH:MM', 'emissions': t}].
+    """
+    window = (start_dt.strftime('%Y-%m-%d'), (end_dt + timedelta(days=1)).strftime('%Y-%m-%d'))
+    site_sql, site_params = site_filter_sql(sites)
+    if tier == 'hourly':
+        query = f"""
+            SELECT {backend.strftime('%Y-%m-%d %H:00', 'hour')} as bucket, source_type, SUM(raw_total) as raw_total
+            FROM meter_readings_hourly
+            WHERE hour >= %s AND hour < %s{site_sql}
+            GROUP BY bucket, source_type
+            UNION ALL
+            SELECT {backend.strftime('%Y-%m-%d %H:00', 'reading_time')} as bucket, source_type, SUM(raw_value) as raw_total
+            FROM meter_readings
+            WHERE rolled_up = 0 AND reading_time >= %s AND reading_time < %s{site_sql}
+            GROUP BY bucket, source_type
+        """
+        params = (window + site_params) * 2
+    else:
+        query = f"""
+            SELECT {backend.strftime('%Y-%m-%d %H:%M', 'reading_time')} as bucket, source_type, SUM(raw_value) as raw_total
+            FROM meter_readings
+            WHERE reading_time >= %s AND reading_time < %s{site_sql}
+            GROUP BY bucket, source_type
+        """
+        params = window + site_params
+
+    factors = emission_factors.timeline(connection)
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute(query, params)
+        series = {}
+        for row in apply_factors(cursor.fetchall(), factors, date_key='bucket'):
+            series[row['bucket']] = series.get(row['bucket'], 0) + row['emissions_tonnes']
+    finally:
+        cursor.close()
+    return [{'time': bucket, 'emissions': round(val, 4)} for bucket, val in sorted(series.items())]
+
+def parse_dashboard_request(args):
+    """Validate dashboard query args; returns (start_dt, end_dt, window_days, sections, sites, format)."""
+    response_format = args.get('format', 'rows')
+    if response_format not in ('rows', 'columnar'):
+        raise ValueError("format must be 'rows' or 'columnar'")
+    sections = parse_dashboard_sections(args.get('include') or args.get('fields'))
+    try:
+        start_dt, end_dt, window_days = parse_dashboard_window(args)
+    except ValueError:
+        raise ValueError('Invalid date format (expected YYYY-MM-DD)')
+    sites = parse_site_filter(args)
+    return start_dt, end_dt, window_days, sections, sites, response_format
+
+def cached_dashboard(start_dt, end_dt, window_days, sections, sites=None, interval_tier=None, missing_only=False):
+    """
+    compute_dashboard() through the result cache, joined with an identical computation
+    already in flight (same window, sections, sites and data version) when there is one.
+    `missing_only`: see cached_result().
+    """
+    params = (start_dt.date(), end_dt.date(), tuple(sorted(sections)), tuple(sorted(sites or ())), interval_tier)
+    # KPIs compare with the previous window of the same length
+    scope = factor_scope(start_dt - timedelta(days=window_days), end_dt)
+    reads = (start_dt - timedelta(days=window_days), end_dt, sites)
+    if missing_only and scope is not None and result_cached('dashboard', params + (scope,), reads):
+        return None
+
+    def compute():
+        return cached_result('dashboard', params + (scope,), lambda: compute_dashboard(
+            start_dt, end_dt, window_days, sections, sites, interval_tier), cache=scope is not None, scope=reads)
+
+    if not SINGLEFLIGHT_ENABLED:
+        return compute()
+    return dashboard_flights.do(params + (scope, dashboard_flights.version()), compute)[0]
+
+def compute_dashboard(start_dt, end_dt, window_days, sections, sites, interval_tier):
+    """Dashboard payload from the analytics store or SQL, plus the optional interval series."""
+    dashboard_data = dashboard_from_store(start_dt, end_dt, window_days, sections, sites)
+    if dashboard_data is not None and interval_tier is None:
+        return dashboard_data
+
+    connection = get_db_connection()
+    if not connection:
+        raise DatabaseUnavailable()
+    try:
+        if dashboard_data is None:
+            dashboard_data = build_dashboard_data(connection, start_dt, end_dt, window_days, sections, sites)
+        if interval_tier:
+            dashboard_data['interval_trend'] = build_interval_trend(connection, start_dt, end_dt,
+                                                                    interval_tier, sites)
+            dashboard_data['interval_tier'] = interval_tier
+        return dashboard_data
+    finally:
         try:
             connection.close()
         except Exception:
             pass
 
-@app.route('/api/recommendations', methods=['GET'])
-def get_recommendations():
-    connection = get_db_connection()
-    if not connection:
+@app.route('/api/dashboard', methods=['GET'])
+def get_dashboard_data():
+    """
+    Public dashboard JSON (no auth).
+    Optional `include=kpis,monthly_trend,...` (alias `fields=`) limits the response
+    to the named sections; queries and loops for other sections are skipped.
+    `format=columnar` returns trend series as parallel arrays instead of row objects.
+    `site=a,b` restricts every section to those sites (default: all sites).
+    `granularity=hour|raw` adds an `interval_trend` series of meter readings from the
+    coarsest tier that covers the window (`interval_tier` says which).
+    """
+    try:
+        start_dt, end_dt, window_days, sections, sites, response_format = parse_dashboard_request(request.args)
+        interval_tier = parse_interval_tier(request.args, start_dt)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        with instrumentation.span('aggregate'):
+            dashboard_data = cached_dashboard(start_dt, end_dt, window_days, sections, sites, interval_tier)
+            # Shared results are read-only; columnar_dashboard builds a new payload
+            if response_format == 'columnar':
+                dashboard_data = columnar_dashboard(dashboard_data)
+        return jsonify(dashboard_data)
+    except DatabaseUnavailable:
         return jsonify({'error': 'Database connection error'}), 500
+    except Exception as e:
+        logger.exception("Error building dashboard data")
+        return jsonify({'error': 'Internal error'}), 500
 
-    cursor = None
+def build_human_emissions(human_results, factors):
+    """Aggregate human_population rows into the dashboard `human_emissions` block (human_daily factor per day)."""
+    human_daily_data = {}
+    human_weekly_data = {}
+    human_monthly_data = {}
+    human_total_emissions = 0
+    avg_student_count = 0
+    avg_staff_count = 0
+
+    if human_results:
+        for row in human_results:
+            raw_date = row['date']
+            if isinstance(raw_date, datetime):
+                d = raw_date.date()
+            else:
+                try:
+                    d = datetime.strptime(str(raw_date), '%Y-%m-%d').date()
+                except Exception:
+                    continue
+
+            iso_year, iso_week, _ = d.isocalendar()
+            week_label = f"{iso_year}-W{iso_week:02d}"
+            month = str(row['date'])[:7]
+            date_str = d.strftime('%Y-%m-%d')
+
+            # Buckets add up kg and convert once (exact for whole-kg factors, as in the analytics store)
+            kg = human_kg(factors, d, row['total_count'])
+            row['emissions_tonnes'] = kg / 1000
+            human_daily_data[date_str] = human_daily_data.get(date_str, 0) + kg
+            human_weekly_data[week_label] = human_weekly_data.get(week_label, 0) + kg
+            human_monthly_data[month] = human_monthly_data.get(month, 0) + kg
+            human_total_emissions += kg
+            avg_student_count += int(row['student_count'])
+            avg_staff_count += int(row['staff_count'])
+
+        avg_student_count = int(avg_student_count / len(human_results))
+        avg_staff_count = int(avg_staff_count / len(human_results))
+
+    return {
+        'total_emissions': round(human_total_emissions / 1000, 2),
+        'avg_student_count': avg_student_count,
+        'avg_staff_count': avg_staff_count,
+        'avg_total_count': avg_student_count + avg_staff_count,
+        'daily_trend': [
+            {'date': date, 'emissions': round(kg / 1000, 2)}
+            for date, kg in sorted(human_daily_data.items())
+        ],
+        'weekly_trend': [
+            {'label': label, 'emissions': round(kg / 1000, 2)}
+            for label, kg in sorted(human_weekly_data.items())
+        ],
+        'monthly_trend': [
+            {'month': month, 'emissions': round(kg / 1000, 2)}
+            for month, kg in sorted(human_monthly_data.items())
+        ],
+        'population_data': [
+            {
+                'date': str(row['date']),
+                # Per-day SUM()s come back as DECIMAL; keep the counts integral
+                'students': int(row['student_count']),
+                'staff': int(row['staff_count']),
+                'total': int(row['total_count']),
+                'emissions': round(row['emissions_tonnes'], 3)
+            }
+            for row in human_results
+        ]
+    }
+
+@app.route('/api/stream', methods=['GET'])
+def stream_updates():
+    """
+    Public server-sent events stream of dashboard deltas.
+    Events: `activity` (emission deltas + new daily totals, overall and per site), `human`
+    (headcount entry + cumulative stats) and `reload` (client should refetch). Honours Last-Event-ID.
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
     try:
-        cursor = connection.cursor(dictionary=True)
-        
-        # Get emission breakdown
-        query = """
-            SELECT 
-                a.source_type,
-                SUM(a.raw_value * e.factor / 1000) as total_emissions
-            FROM activity_data a
-            JOIN emission_factors e ON a.source_type = e.source_type
-            GROUP BY a.source_type
-            ORDER BY total_emissions DESC
-        """
-        cursor.execute(query)
-        results = cursor.fetchall()
-        
-        # Get human emissions data
-        cursor.execute("""
-            SELECT 
-                SUM(total_count * 1.0 / 1000) as total_emissions,
-                AVG(total_count) as avg_population
-            FROM human_population
-        """)
-        human_stats = cursor.fetchone()
-        human_emissions = float(human_stats['total_emissions'] or 0)
-        avg_population = int(human_stats['avg_population'] or 0)
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
 
-        recommendations = []
-        
-        # Source-specific recommendations
-        if results:
-            top_source = results[0]['source_type']
-            top_emissions = results[0]['total_emissions']
-
-            if top_source == 'electricity':
-                recommendations.append({
-                'title': '⚡ Electricity: Your #1 Emission Source',
-                'description': f'Electricity is your largest controllable emission source, contributing {top_emissions:.2f} tonnes CO₂. This is primarily driven by high-consumption devices like air conditioning, lighting, and lab equipment. Tackling this area is the single highest-impact action your campus can take.',
-                'priority': 'High',
-                'impact': 'High',
-                'actionable_steps': [
-                    'Conduct a professional energy audit to identify specific "hotspots" of wastage.',
-                    'Replace all traditional bulbs (fluorescent, incandescent) with high-efficiency LED lighting (saves 75% energy per bulb).',
-                    'Install motion sensors and timers in corridors, washrooms, and meeting rooms so lights are only on when needed.',
-                    'Upgrade old air conditioners to new 5-star rated inverter models (can reduce AC energy use by 30-50%).',
-                    'Set a campus-wide AC temperature policy (e.g., 24°C) to prevent overuse.',
-                    'Aggressively pursue rooftop solar panel installation, starting with main academic blocks and hostels.',
-                    'Implement a "Computers Off" policy at night, enforcing shutdown rather than sleep mode.',
-                    'Install smart power strips on workstation clusters to completely cut power to peripherals (printers, monitors) after hours and eliminate phantom loads.'
-                ],
-                'expected_reduction': '30-50% reduction in electricity-based emissions',
-                'cost': 'Medium to High (Initial) | High ROI (2-5 years)',
-                'timeframe': '6-18 months for full implementation'
-                })
-            
-            elif top_source == 'bus_diesel':
-                recommendations.append({
-                'title': '🚌 Transportation: High Carbon Footprint',
-                'description': f'Campus-owned diesel transport contributes {top_emissions:.2f} tonnes CO₂. These vehicles are a major source of not only CO2 but also harmful local air pollutants (PM2.5). A planned transition to cleaner transport is crucial for both carbon goals and campus health.',
-                'priority': 'High',
-                'impact': 'High',
-                'actionable_steps': [
-                    'Develop a 5-year plan to phase out diesel buses and replace them with electric buses.',
-                    'Install EV charging stations in parking areas to support the transition (for buses, staff, and student vehicles).',
-                    'Optimize bus routes using software to reduce total kilometers traveled and minimize engine idle time.',
-                    'Implement a campus bike-sharing program with dedicated bike racks at key locations (hostels, canteen, main gate).',
-                    'Create dedicated, safe cycling lanes within the campus to encourage biking over private vehicles.',
-                    'Promote a carpooling platform/app for students and staff commuting from the city.',
-                    'Enforce a "No-Idling" zone policy for all vehicles on campus.',
-                    'Partner with public transport authorities to improve bus frequency to the campus gate.'
-                ],
-                'expected_reduction': '40-60% reduction in transport emissions (up to 90% with full EV transition)',
-                'cost': 'High (Vehicle purchase) | Medium (Fuel savings offset cost)',
-                'timeframe': '1-3 years for fleet transition'
-                })
-            
-            elif top_source == 'canteen_lpg':
-                recommendations.append({
-                'title': '🍳 Canteen: Optimize Cooking Operations',
-                'description': f'Canteen LPG (a fossil fuel) contributes {top_emissions:.2f} tonnes CO₂. This is a consistent, daily emission source. Modern, efficient electric alternatives like induction are not only cleaner (especially when paired with solar) but also safer and improve indoor air quality for kitchen staff.',
-                'priority': 'Medium',
-                'impact': 'Medium',
-                'actionable_steps': [
-                    'Phase out LPG stoves and replace them with commercial-grade induction cooktops, which are ~85% efficient (vs. LPG at ~40%).',
-                    'Install solar cookers or solar water heating systems for large-scale water boiling (e.g., for rice, tea).',
-                    'Utilize pressure cookers for items like dals and legumes to reduce cooking time by up to 70%.',
-                    'Implement a "Menu Engineering" policy to batch-cook popular items, reducing stop-start energy waste.',
-                    'Conduct regular maintenance on all kitchen equipment (gaskets, burners) to ensure optimal efficiency.',
-                    'Explore setting up a campus biogas plant to convert food waste into methane for cooking, creating a circular system.',
-                    'Source produce from local farms to reduce the "Scope 3" emissions embedded in your food supply chain.'
-                ],
-                'expected_reduction': '25-40% reduction in cooking-related emissions',
-                'cost': 'Low to Medium',
-                'timeframe': '3-9 months'
-                })
-            
-            elif top_source == 'waste_landfill':
-                recommendations.append({
-                'title': '♻️ Waste: Implement Zero-Waste Campus',
-                'description': f'Waste sent to landfills generates {top_emissions:.2f} tonnes CO₂ (as methane). Methane (CH4) is a greenhouse gas over 25 times more potent than CO₂. A "Zero-Waste" approach, focusing on the 3 R\'s (Reduce, Reuse, Recycle), can drastically cut this.',
-                'priority': 'High',
-                'impact': 'High',
-                'actionable_steps': [
-                    'Conduct a "waste audit" (sorting a day\'s waste) to identify your main waste streams (e.g., plastic, paper, food).',
-                    'Implement a mandatory 3-bin segregation system campus-wide: Organic (food), Recyclable (paper, plastic, metal), and Landfill (other).',
-                    'Start an on-campus composting program for all food waste from canteens and hostels. Use the compost for campus landscaping.',
-                    'Aggressively ban all single-use plastics (cups, plates, straws) in canteens and for all campus events.',
-                    'Install water refill stations across the campus to eliminate the need for single-use plastic water bottles.',
-                    'Set up a "Reuse Store" where students can donate or take items like books, electronics, and clothes at the end of the semester.',
-                    'Partner with local recycling vendors for efficient collection of segregated paper, plastic, and e-waste.',
-                    'Set double-sided printing as the default on all campus computers and printers.'
-                ],
-                'expected_reduction': '50-70% reduction in landfill-bound waste and associated emissions',
-                'cost': 'Low (Primarily operational and awareness-based)',
-                'timeframe': '2-4 months to implement fully'
-                })
-
-        # Human emissions recommendations
-        if human_emissions > 0:
+    sub = broker.subscribe()
+    if sub is None:
+        return jsonify({'error': 'Too many live connections'}), 503
+
+    return Response(
+        broker.stream(sub, last_event_id, heartbeat=SSE_HEARTBEAT_SECONDS),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def build_recommendations(results, human_stats):
+    """
+    Recommendation payload from all-time per-source totals (query_source_totals)
+    and human_population aggregates (query_human_stats).
+    """
+    human_emissions = human_stats['total_emissions']
+    avg_population = human_stats['avg_population']
+
+    recommendations = []
+    
+    # Source-specific recommendations
+    if results:
+        top_source = results[0]['source_type']
+        top_emissions = results[0]['total_emissions']
+
+        if top_source == 'electricity':
             recommendations.append({
-                'title': '👥 Human CO₂: An Indirect Factor',
-            'description': f'The campus population (avg. {avg_population} people) contributes {human_emissions:.2f} tonnes CO₂ from respiration. This is a natural biological process and part of the "short-term carbon cycle." Unlike burning fossil fuels (which releases "long-term" carbon), this is not a target for direct reduction. However, a larger population *indirectly* increases emissions from energy, transport, and waste.',
-            'priority': 'Low',
-            'impact': 'Low (Natural Process)',
+            'title': '⚡ Electricity: Your #1 Emission Source',
+            'description': f'Electricity is your largest controllable emission source, contributing {top_emissions:.2f} tonnes CO₂. This is primarily driven by high-consumption devices like air conditioning, lighting, and lab equipment. Tackling this area is the single highest-impact action your campus can take.',
+            'priority': 'High',
+            'impact': 'High',
             'actionable_steps': [
-                'Note: Do not focus on reducing this number directly. It is a natural process.',
-                'Use this population data to inform indirect emission strategies (e.g., "emissions per student").',
-                'Implement hybrid learning/work models to slightly reduce daily on-campus density, which in turn cuts transport and energy use.',
-                'Stagger class and lab timings to prevent peak-hour congestion for both transport and canteen services.',
-                'Focus on reducing the *per-person* carbon footprint (total emissions / avg_population) rather than the respiration footprint.'
+                'Conduct a professional energy audit to identify specific "hotspots" of wastage.',
+                'Replace all traditional bulbs (fluorescent, incandescent) with high-efficiency LED lighting (saves 75% energy per bulb).',
+                'Install motion sensors and timers in corridors, washrooms, and meeting rooms so lights are only on when needed.',
+                'Upgrade old air conditioners to new 5-star rated inverter models (can reduce AC energy use by 30-50%).',
+                'Set a campus-wide AC temperature policy (e.g., 24°C) to prevent overuse.',
+                'Aggressively pursue rooftop solar panel installation, starting with main academic blocks and hostels.',
+                'Implement a "Computers Off" policy at night, enforcing shutdown rather than sleep mode.',
+                'Install smart power strips on workstation clusters to completely cut power to peripherals (printers, monitors) after hours and eliminate phantom loads.'
             ],
-            'expected_reduction': 'N/A (Focus is on indirect reductions)',
-            'cost': 'N/A',
-            'timeframe': 'Ongoing'
+            'expected_reduction': '30-50% reduction in electricity-based emissions',
+            'cost': 'Medium to High (Initial) | High ROI (2-5 years)',
+            'timeframe': '6-18 months for full implementation'
             })
-
-        # General recommendations (always included)
-        recommendations.extend([
-            {
-                'title': '📊 Data-Driven Decision Making',
-            'description': 'You cannot manage what you do not measure. This analyzer provides the real-time data needed to move from guessing to targeted, effective action. Use this data to prove what works, justify investments (like solar), and hold departments accountable.',
+        
+        elif top_source == 'bus_diesel':
+            recommendations.append({
+            'title': '🚌 Transportation: High Carbon Footprint',
+            'description': f'Campus-owned diesel transport contributes {top_emissions:.2f} tonnes CO₂. These vehicles are a major source of not only CO2 but also harmful local air pollutants (PM2.5). A planned transition to cleaner transport is crucial for both carbon goals and campus health.',
             'priority': 'High',
-            'impact': 'High (Enabler)',
-            'actionable_steps': [
-                'Monitor this dashboard daily. Identify any sudden spikes and investigate the cause.',
-                'Set a clear, public monthly reduction target (e.g., "Reduce electricity use by 5% this month").',
-                'Generate quarterly reports from this data to share with management and the student council.',
-                'Use the data to benchmark your campus against other institutions or national averages.',
-                'Create department-level dashboards to foster friendly competition on reduction goals.'
-            ],
-            'expected_reduction': 'Enables an additional 20-30% reduction through targeted strategies',
-            'cost': 'Free (using this platform)',
-                'timeframe': 'Ongoing'
-            },
-            {
-                'title': '🌱 Green Campus Initiative',
-            'description': 'Technology and infrastructure are only half the solution. A successful carbon reduction plan requires buy-in and active participation from every student and staff member. A "Green Campus" culture makes sustainability the default, not the exception.',
-            'priority': 'Medium',
-            'impact': 'High (Long-term)',
+            'impact': 'High',
             'actionable_steps': [
-                'Form a "Green Team" or "Sustainability Council" with student and staff volunteers from all departments.',
-                'Conduct monthly awareness campaigns, workshops, and guest lectures on sustainability topics.',
-                'Organize large-scale tree plantation drives on campus (focus on native species) to create a carbon sink.',
-                'Display real-time emission data from this dashboard on public screens in the canteen and library.',
-                'Integrate sustainability modules into first-year orientation and relevant academic courses.',
-                'Partner with academic departments to use the campus as a "Living Lab" for sustainability research projects.',
-                'Reward departments and hostels that achieve the highest emission reductions each semester.'
+                'Develop a 5-year plan to phase out diesel buses and replace them with electric buses.',
+                'Install EV charging stations in parking areas to support the transition (for buses, staff, and student vehicles).',
+                'Optimize bus routes using software to reduce total kilometers traveled and minimize engine idle time.',
+                'Implement a campus bike-sharing program with dedicated bike racks at key locations (hostels, canteen, main gate).',
+                'Create dedicated, safe cycling lanes within the campus to encourage biking over private vehicles.',
+                'Promote a carpooling platform/app for students and staff commuting from the city.',
+                'Enforce a "No-Idling" zone policy for all vehicles on campus.',
+                'Partner with public transport authorities to improve bus frequency to the campus gate.'
             ],
-            'expected_reduction': '15-25% reduction through behavioral change',
-            'cost': 'Low',
-                'timeframe': '3-6 months to establish'
-            },
-            {
-                'title': '🏛️ Infrastructure Upgrades (Long-Term Vision)',
-            'description': 'These are high-cost, high-impact capital projects that lock in sustainability and savings for decades. They should be integrated into the campus\'s long-term master plan and budget cycle.',
+            'expected_reduction': '40-60% reduction in transport emissions (up to 90% with full EV transition)',
+            'cost': 'High (Vehicle purchase) | Medium (Fuel savings offset cost)',
+            'timeframe': '1-3 years for fleet transition'
+            })
+        
+        elif top_source == 'canteen_lpg':
+            recommendations.append({
+            'title': '🍳 Canteen: Optimize Cooking Operations',
+            'description': f'Canteen LPG (a fossil fuel) contributes {top_emissions:.2f} tonnes CO₂. This is a consistent, daily emission source. Modern, efficient electric alternatives like induction are not only cleaner (especially when paired with solar) but also safer and improve indoor air quality for kitchen staff.',
             'priority': 'Medium',
-            'impact': 'Very High',
+            'impact': 'Medium',
             'actionable_steps': [
-                'Develop a "Green Building" policy for all new constructions, targeting GRIHA or LEED certification.',
-                'Install campus-wide rainwater harvesting systems to reduce reliance on municipal water and save energy on pumping.',
-                'Upgrade to centralized, energy-efficient HVAC systems with smart zoning controls.',
-                'Create green roofs and vertical gardens on buildings to improve insulation and reduce cooling loads.',
-                'Install smart meters for electricity and water at the building-level for granular data tracking.',
-                'Retrofit old buildings with better insulation and double-glazed windows to reduce heat gain.'
+                'Phase out LPG stoves and replace them with commercial-grade induction cooktops, which are ~85% efficient (vs. LPG at ~40%).',
+                'Install solar cookers or solar water heating systems for large-scale water boiling (e.g., for rice, tea).',
+                'Utilize pressure cookers for items like dals and legumes to reduce cooking time by up to 70%.',
+                'Implement a "Menu Engineering" policy to batch-cook popular items, reducing stop-start energy waste.',
+                'Conduct regular maintenance on all kitchen equipment (gaskets, burners) to ensure optimal efficiency.',
+                'Explore setting up a campus biogas plant to convert food waste into methane for cooking, creating a circular system.',
+                'Source produce from local farms to reduce the "Scope 3" emissions embedded in your food supply chain.'
             ],
-            'expected_reduction': '30-40% long-term reduction on new/retrofitted infrastructure',
-            'cost': 'High (Capital Expenditure)',
-                'timeframe': '1-5 years (Phased)'
-            },
-            {
-                'title': '⭐ Quick Wins: Immediate Actions',
-            'description': 'Build momentum and show immediate progress with these simple, low-cost actions. These wins are highly visible and help build the cultural support needed for larger, more expensive projects.',
+            'expected_reduction': '25-40% reduction in cooking-related emissions',
+            'cost': 'Low to Medium',
+            'timeframe': '3-9 months'
+            })
+        
+        elif top_source == 'waste_landfill':
+            recommendations.append({
+            'title': '♻️ Waste: Implement Zero-Waste Campus',
+            'description': f'Waste sent to landfills generates {top_emissions:.2f} tonnes CO₂ (as methane). Methane (CH4) is a greenhouse gas over 25 times more potent than CO₂. A "Zero-Waste" approach, focusing on the 3 R\'s (Reduce, Reuse, Recycle), can drastically cut this.',
             'priority': 'High',
-            'impact': 'Medium',
+            'impact': 'High',
             'actionable_steps': [
-                'TODAY: Mandate that all classroom projectors, lights, and fans are turned off by the last person leaving.',
-                'THIS WEEK: Set all network printers to double-sided printing by default.',
-                'THIS WEEK: Launch a "phantom load" campaign, encouraging unplugging chargers and devices when not in use.',
-                'THIS MONTH: Place "Save Energy / Save Water" stickers on all switches and taps.',
-                'THIS MONTH: Designate student "Energy Monitors" for each floor/department to ensure compliance after hours.',
-                'THIS MONTH: Start the paper recycling program by placing collection boxes in all offices and classrooms.'
+                'Conduct a "waste audit" (sorting a day\'s waste) to identify your main waste streams (e.g., plastic, paper, food).',
+                'Implement a mandatory 3-bin segregation system campus-wide: Organic (food), Recyclable (paper, plastic, metal), and Landfill (other).',
+                'Start an on-campus composting program for all food waste from canteens and hostels. Use the compost for campus landscaping.',
+                'Aggressively ban all single-use plastics (cups, plates, straws) in canteens and for all campus events.',
+                'Install water refill stations across the campus to eliminate the need for single-use plastic water bottles.',
+                'Set up a "Reuse Store" where students can donate or take items like books, electronics, and clothes at the end of the semester.',
+                'Partner with local recycling vendors for efficient collection of segregated paper, plastic, and e-waste.',
+                'Set double-sided printing as the default on all campus computers and printers.'
             ],
-            'expected_reduction': '10-15% immediate reduction from low-hanging fruit',
-            'cost': 'Very Low',
-                'timeframe': 'Immediate to 1 month'
-            }
-        ])
+            'expected_reduction': '50-70% reduction in landfill-bound waste and associated emissions',
+            'cost': 'Low (Primarily operational and awareness-based)',
+            'timeframe': '2-4 months to implement fully'
+            })
 
-        return jsonify({
-            'recommendations': recommendations,
-            'summary': {
-                'total_recommendations': len(recommendations),
-                'high_priority': len([r for r in recommendations if r['priority'] == 'High']),
-                'estimated_total_reduction': '50-70% achievable with full implementation',
-                'message': 'Start with "Quick Wins" and "High Priority" items for maximum immediate impact!'
-            }
+    # Human emissions recommendations
+    if human_emissions > 0:
+        recommendations.append({
+            'title': '👥 Human CO₂: An Indirect Factor',
+        'description': f'The campus population (avg. {avg_population} people) contributes {human_emissions:.2f} tonnes CO₂ from respiration. This is a natural biological process and part of the "short-term carbon cycle." Unlike burning fossil fuels (which releases "long-term" carbon), this is not a target for direct reduction. However, a larger population *indirectly* increases emissions from energy, transport, and waste.',
+        'priority': 'Low',
+        'impact': 'Low (Natural Process)',
+        'actionable_steps': [
+            'Note: Do not focus on reducing this number directly. It is a natural process.',
+            'Use this population data to inform indirect emission strategies (e.g., "emissions per student").',
+            'Implement hybrid learning/work models to slightly reduce daily on-campus density, which in turn cuts transport and energy use.',
+            'Stagger class and lab timings to prevent peak-hour congestion for both transport and canteen services.',
+            'Focus on reducing the *per-person* carbon footprint (total emissions / avg_population) rather than the respiration footprint.'
+        ],
+        'expected_reduction': 'N/A (Focus is on indirect reductions)',
+        'cost': 'N/A',
+        'timeframe': 'Ongoing'
         })
+
+    # General recommendations (always included)
+    recommendations.extend([
+        {
+            'title': '📊 Data-Driven Decision Making',
+        'description': 'You cannot manage what you do not measure. This analyzer provides the real-time data needed to move from guessing to targeted, effective action. Use this data to prove what works, justify investments (like solar), and hold departments accountable.',
+        'priority': 'High',
+        'impact': 'High (Enabler)',
+        'actionable_steps': [
+            'Monitor this dashboard daily. Identify any sudden spikes and investigate the cause.',
+            'Set a clear, public monthly reduction target (e.g., "Reduce electricity use by 5% this month").',
+            'Generate quarterly reports from this data to share with management and the student council.',
+            'Use the data to benchmark your campus against other institutions or national averages.',
+            'Create department-level dashboards to foster friendly competition on reduction goals.'
+        ],
+        'expected_reduction': 'Enables an additional 20-30% reduction through targeted strategies',
+        'cost': 'Free (using this platform)',
+            'timeframe': 'Ongoing'
+        },
+        {
+            'title': '🌱 Green Campus Initiative',
+        'description': 'Technology and infrastructure are only half the solution. A successful carbon reduction plan requires buy-in and active participation from every student and staff member. A "Green Campus" culture makes sustainability the default, not the exception.',
+        'priority': 'Medium',
+        'impact': 'High (Long-term)',
+        'actionable_steps': [
+            'Form a "Green Team" or "Sustainability Council" with student and staff volunteers from all departments.',
+            'Conduct monthly awareness campaigns, workshops, and guest lectures on sustainability topics.',
+            'Organize large-scale tree plantation drives on campus (focus on native species) to create a carbon sink.',
+            'Display real-time emission data from this dashboard on public screens in the canteen and library.',
+            'Integrate sustainability modules into first-year orientation and relevant academic courses.',
+            'Partner with academic departments to use the campus as a "Living Lab" for sustainability research projects.',
+            'Reward departments and hostels that achieve the highest emission reductions each semester.'
+        ],
+        'expected_reduction': '15-25% reduction through behavioral change',
+        'cost': 'Low',
+            'timeframe': '3-6 months to establish'
+        },
+        {
+            'title': '🏛️ Infrastructure Upgrades (Long-Term Vision)',
+        'description': 'These are high-cost, high-impact capital projects that lock in sustainability and savings for decades. They should be integrated into the campus\'s long-term master plan and budget cycle.',
+        'priority': 'Medium',
+        'impact': 'Very High',
+        'actionable_steps': [
+            'Develop a "Green Building" policy for all new constructions, targeting GRIHA or LEED certification.',
+            'Install campus-wide rainwater harvesting systems to reduce reliance on municipal water and save energy on pumping.',
+            'Upgrade to centralized, energy-efficient HVAC systems with smart zoning controls.',
+            'Create green roofs and vertical gardens on buildings to improve insulation and reduce cooling loads.',
+            'Install smart meters for electricity and water at the building-level for granular data tracking.',
+            'Retrofit old buildings with better insulation and double-glazed windows to reduce heat gain.'
+        ],
+        'expected_reduction': '30-40% long-term reduction on new/retrofitted infrastructure',
+        'cost': 'High (Capital Expenditure)',
+            'timeframe': '1-5 years (Phased)'
+        },
+        {
+            'title': '⭐ Quick Wins: Immediate Actions',
+        'description': 'Build momentum and show immediate progress with these simple, low-cost actions. These wins are highly visible and help build the cultural support needed for larger, more expensive projects.',
+        'priority': 'High',
+        'impact': 'Medium',
+        'actionable_steps': [
+            'TODAY: Mandate that all classroom projectors, lights, and fans are turned off by the last person leaving.',
+            'THIS WEEK: Set all network printers to double-sided printing by default.',
+            'THIS WEEK: Launch a "phantom load" campaign, encouraging unplugging chargers and devices when not in use.',
+            'THIS MONTH: Place "Save Energy / Save Water" stickers on all switches and taps.',
+            'THIS MONTH: Designate student "Energy Monitors" for each floor/department to ensure compliance after hours.',
+            'THIS MONTH: Start the paper recycling program by placing collection boxes in all offices and classrooms.'
+        ],
+        'expected_reduction': '10-15% immediate reduction from low-hanging fruit',
+        'cost': 'Very Low',
+            'timeframe': 'Immediate to 1 month'
+        }
+    ])
+
+    return {
+        'recommendations': recommendations,
+        'summary': {
+            'total_recommendations': len(recommendations),
+            'high_priority': len([r for r in recommendations if r['priority'] == 'High']),
+            'estimated_total_reduction': '50-70% achievable with full implementation',
+            'message': 'Start with "Quick Wins" and "High Priority" items for maximum immediate impact!'
+        }
+    }
+
+def cached_recommendations(sites=None, missing_only=False):
+    """Recommendations from all-time totals, through the result cache (`missing_only`: see cached_result())."""
+    def compute(connection):
+        cursor = connection.cursor(dictionary=True)
+        try:
+            factors = emission_factors.timeline(connection)
+            return build_recommendations(query_source_totals(connection, sites), query_human_stats(cursor, factors, sites))
+        finally:
+            cursor.close()
+    scope = factor_scope(*ALL_DATES)
+    return cached_result('recommendations', (tuple(sorted(sites or ())), scope), lambda: with_connection(compute),
+                         cache=scope is not None, scope=ALL_DATES + (sites,), missing_only=missing_only)
+
+@app.route('/api/recommendations', methods=['GET'])
+def get_recommendations():
+    """Recommendations from all-time totals; optional `site=a,b` filter."""
+    try:
+        sites = parse_site_filter(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        return jsonify(cached_recommendations(sites))
+    except DatabaseUnavailable:
+        return jsonify({'error': 'Database connection error'}), 500
     except Exception as e:
         logger.exception("Error fetching recommendations")
         return jsonify({'error': 'Internal error'}), 500
+
+def cached_cumulative_stats(sites=None, missing_only=False):
+    """All-time human cumulative stats payload, through the result cache (`missing_only`: see cached_result())."""
+    def compute(connection):
+        cursor = connection.cursor(dictionary=True)
+        try:
+            return cumulative_stats_payload(query_human_stats(cursor, emission_factors.timeline(connection), sites))
+        finally:
+            cursor.close()
+    # Keyed by the factors too: emissions use the human_daily factor of each day
+    scope = factor_scope(*ALL_DATES)
+    return cached_result('human_cumulative_stats', (tuple(sorted(sites or ())), scope), lambda: with_connection(compute),
+                         cache=scope is not None, scope=ALL_DATES + (sites,), missing_only=missing_only)
+
+@app.route('/api/human_cumulative_stats', methods=['GET'])
+def get_human_cumulative_stats():
+    """
+    Get all-time cumulative statistics for human emissions.
+    Returns total emissions, record count, and averages across ALL data
+    (all sites, or those in `site=a,b`).
+    """
+    try:
+        sites = parse_site_filter(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        return jsonify(cached_cumulative_stats(sites))
+    except DatabaseUnavailable:
+        return jsonify({'error': 'Database connection error'}), 500
+    except Exception as e:
+        logger.exception("Error fetching cumulative stats")
+        return jsonify({'error': 'Internal error'}), 500
+
+def human_stats_from_totals(totals):
+    """query_human_stats() output from day and headcount totals (SQL or analytics store)."""
+    days = totals['human_days']
+    def avg(total):
+        # MySQL AVG() of an INT column is a 4-decimal DECIMAL; round the same way before truncating
+        return int(round(total / days, 4)) if days else 0
+    return {
+        'total_emissions': totals['human_emissions'],
+        'record_count': days,
+        'avg_students': avg(totals['students']),
+        'avg_staff': avg(totals['staff']),
+        'avg_population': avg(totals['people']),
+    }
+
+def build_dashboard_bootstrap(connection, start_dt, end_dt, window_days, sections, sites=None):
+    """
+    Everything the dashboard page fetches on open (dashboard data, human cumulative
+    stats, recommendations) from a single connection. All-time totals come from the
+    analytics store when it is enabled, so only the store refresh touches the DB.
+    """
+    dashboard_data = dashboard_from_store(start_dt, end_dt, window_days, sections, sites,
+                                          connect=lambda: connection, close=False)
+    if dashboard_data is not None:
+        totals = analytics.all_time_totals(sites)
+        source_totals = [
+            {'source_type': source, 'total_emissions': tonnes}
+            for source, tonnes in sorted(totals['sources'].items(), key=lambda x: x[1], reverse=True)
+        ]
+        human_stats = human_stats_from_totals(totals)
+    else:
+        dashboard_data = build_dashboard_data(connection, start_dt, end_dt, window_days, sections, sites)
+        source_totals = query_source_totals(connection, sites)
+        cursor = connection.cursor(dictionary=True)
+        try:
+            human_stats = query_human_stats(cursor, emission_factors.timeline(connection), sites)
+        finally:
+            cursor.close()
+
+    return {
+        'start_date': start_dt.strftime('%Y-%m-%d'),
+        'end_date': end_dt.strftime('%Y-%m-%d'),
+        'dashboard': dashboard_data,
+        'human_cumulative_stats': cumulative_stats_payload(human_stats),
+        'recommendations': build_recommendations(source_totals, human_stats)
+    }
+
+def cached_dashboard_bootstrap(start_dt, end_dt, window_days, sections, sites=None, missing_only=False):
+    """
+    build_dashboard_bootstrap() on its own connection, through the shared result cache
+    (`missing_only`: see cached_result()).
+    """
+    params = (start_dt.date(), end_dt.date(), tuple(sorted(sections)), tuple(sorted(sites or ())))
+    # Recommendations use all-time totals
+    scope = factor_scope(*ALL_DATES)
+    return cached_result('bootstrap', params + (scope,), lambda: with_connection(
+        lambda connection: build_dashboard_bootstrap(connection, start_dt, end_dt, window_days, sections, sites)),
+        cache=scope is not None, scope=ALL_DATES + (sites,), missing_only=missing_only)
+
+@app.route('/api/dashboard/bootstrap', methods=['GET'])
+def get_dashboard_bootstrap():
+    """
+    Public: /api/dashboard, /api/human_cumulative_stats and /api/recommendations
+    in one response. Accepts the same query args as /api/dashboard.
+    """
+    try:
+        start_dt, end_dt, window_days, sections, sites, response_format = parse_dashboard_request(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        with instrumentation.span('aggregate'):
+            bootstrap = cached_dashboard_bootstrap(start_dt, end_dt, window_days, sections, sites)
+            if response_format == 'columnar':
+                bootstrap = dict(bootstrap, dashboard=columnar_dashboard(bootstrap['dashboard']))
+        return jsonify(bootstrap)
+    except DatabaseUnavailable:
+        return jsonify({'error': 'Database connection error'}), 500
+    except Exception as e:
+        logger.exception("Error building dashboard bootstrap")
+        return jsonify({'error': 'Internal error'}), 500
+
+def query_daily_series(connection, start_dt, end_dt, sites=None):
+    """(names, tonnes matrix) like EmissionsStore.daily_series(), from the dashboard's daily SQL aggregation."""
+    start_date = start_dt.strftime('%Y-%m-%d')
+    end_date = end_dt.strftime('%Y-%m-%d')
+    site_params = site_filter_sql(sites)[1]
+    first = start_dt.toordinal()
+    cursor = None
+    try:
+        factors = emission_factors.timeline(connection)
+        cursor = connection.cursor(dictionary=True)
+        rows = apply_factors(grouped_rows(cursor, daily_activity_query(sites), start_date, end_date, site_params,
+                                          keys=('date', 'source_type')), factors)
+        human_rows = grouped_rows(cursor, daily_human_query(sites), start_date, end_date, site_params,
+                                  keys=('date',))
     finally:
         if cursor:
             cursor.close()
+
+    names = sorted({row['source_type'] for row in rows}) + ['human']
+    row_of = {name: i for i, name in enumerate(names)}
+    values = forecasting.np.zeros((len(names), end_dt.toordinal() - first + 1))
+    for row in rows:
+        values[row_of[row['source_type']], analytics_store.to_ordinal(row['date']) - first] += row['emissions_tonnes']
+    for row in human_rows:
+        values[-1, analytics_store.to_ordinal(row['date']) - first] += human_tonnes(factors, row['date'], row['total_count'])
+    return names, values
+
+def daily_emission_series(start_dt, end_dt, sites=None):
+    """Daily tonnes per source and for human emissions, from the analytics store when enabled, else SQL."""
+    if analytics is not None:
         try:
-            connection.close()
+            analytics.ensure_fresh(get_db_connection)
+            return analytics.daily_series(start_dt.toordinal(), end_dt.toordinal(), sites)
         except Exception:
-            pass
+            logger.exception("Analytics store failed; falling back to SQL aggregation")
+    return with_connection(lambda connection: query_daily_series(connection, start_dt, end_dt, sites))
 
-@app.route('/api/human_cumulative_stats', methods=['GET'])
-def get_human_cumulative_stats():
+def fitted_forecast_model(as_of, sites=None):
     """
-    Get all-time cumulative statistics for human emissions.
-    Returns total emissions, record count, and averages across ALL data.
+    (SeasonalTrendModel, cached) fitted on the FORECAST_HISTORY_DAYS days up to `as_of`
+    (loaded from January 1st on if that is earlier, for the year-to-date actuals).
+    Models are reused until a write, or a factor change within their dates.
+    """
+    fetch_start = min(as_of - timedelta(days=FORECAST_HISTORY_DAYS - 1), datetime(as_of.year, 1, 1))
+
+    def fit():
+        names, values = daily_emission_series(fetch_start, as_of, sites)
+        model = forecasting.SeasonalTrendModel(harmonics=FORECAST_HARMONICS, history_days=FORECAST_HISTORY_DAYS)
+        return model.fit(names, fetch_start.toordinal(), values, total=set(names) - {'human'})
+
+    scope = factor_scope(fetch_start, as_of)
+    if scope is None:
+        return fit(), False
+    key = (as_of.date(), tuple(sorted(sites or ())), FORECAST_HISTORY_DAYS, scope, dashboard_flights.version())
+    return forecast_models.get_or_fit(key, fit)
+
+def parse_forecast_request(args):
+    """Validate forecast query args; returns (as_of, until, sites, target tonnes or None)."""
+    try:
+        as_of = datetime.strptime(args['as_of'], '%Y-%m-%d') if args.get('as_of') else \
+            datetime.combine(datetime.now().date(), datetime.min.time())
+        until = datetime.strptime(args['until'], '%Y-%m-%d') if args.get('until') else \
+            datetime(as_of.year, 12, 31)
+    except ValueError:
+        raise ValueError('Invalid date format (expected YYYY-MM-DD)')
+    if until <= as_of:
+        raise ValueError('until must be after as_of')
+    if (until - as_of).days > FORECAST_MAX_DAYS:
+        raise ValueError(f'until must be at most {FORECAST_MAX_DAYS} days after as_of')
+    sites = parse_site_filter(args)
+    target = args.get('target', FORECAST_TARGET_TONNES)
+    if target in (None, ''):
+        return as_of, until, sites, None
+    try:
+        target = float(target)
+    except ValueError:
+        raise ValueError('target must be a number of tonnes')
+    if not math.isfinite(target) or target < 0:
+        raise ValueError('target must be a number of tonnes')
+    return as_of, until, sites, target
+
+@app.route('/api/forecast', methods=['GET'])
+def get_forecast():
+    """
+    Public: projected tonnes CO2e from January 1st of the `as_of` year (default today) to
+    `until` (default December 31st): recorded emissions so far plus a forecast of the
+    rest, per source, for human emissions and in total (activity sources, like the
+    dashboard KPIs), with ~95% bounds and a monthly split. Optional `site=a,b`, and
+    `target=<tonnes>` (default FORECAST_TARGET_TONNES) to check the total against.
+    """
+    if forecast_models is None:
+        return jsonify({'error': 'Forecasting requires numpy (pip install .[analytics])'}), 501
+    try:
+        as_of, until, sites, target = parse_forecast_request(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        started = time.perf_counter()
+        with instrumentation.span('forecast'):
+            model, cached = fitted_forecast_model(as_of, sites)
+            if model.coef is None or model.days < FORECAST_MIN_DAYS:
+                return jsonify({'error': f'At least {FORECAST_MIN_DAYS} days of data are needed to forecast'}), 422
+            projection = model.project(datetime(as_of.year, 1, 1).toordinal(), until.toordinal())
+    except DatabaseUnavailable:
+        return jsonify({'error': 'Database connection error'}), 500
+    except Exception as e:
+        logger.exception("Error building forecast")
+        return jsonify({'error': 'Internal error'}), 500
+
+    series = projection['series']
+    total = projection['total']
+    forecast = {
+        'as_of': as_of.strftime('%Y-%m-%d'),
+        'period': {'start': f'{as_of.year}-01-01', 'end': until.strftime('%Y-%m-%d')},
+        'fitted_through': datetime.fromordinal(model.last).strftime('%Y-%m-%d'),
+        'forecast_days': projection['forecast_days'],
+        'sources': [entry for entry in series if entry['name'] != 'human'],
+        'human': next(entry for entry in series if entry['name'] == 'human'),
+        'total': total,
+        'monthly': projection['monthly'],
+        'model': {
+            'history_days': model.days,
+            'harmonics': model.used_harmonics,
+            'weekdays': model.weekdays,
+            'cached': cached,
+            'ms': round((time.perf_counter() - started) * 1000, 2),
+        },
+        'target': None,
+    }
+    if target is not None:
+        if total['upper'] <= target:
+            status = 'on_track'
+        elif total['lower'] > target:
+            status = 'off_track'
+        else:
+            status = 'at_risk'
+        forecast['target'] = {
+            'tonnes': target,
+            'gap': round(total['projected'] - target, 2),
+            'status': status,
+        }
+    return jsonify(forecast)
+
+@app.route('/api/sites', methods=['GET'])
+def list_sites():
+    """
+    Public list of sites: registered ones (sites table) plus any site code that only
+    appears in the data. Used to populate the dashboard's site filter.
     """
     connection = get_db_connection()
     if not connection:
@@ -861,31 +2567,98 @@ def get_human_cumulative_stats():
     cursor = None
     try:
         cursor = connection.cursor(dictionary=True)
+        cursor.execute("SELECT code, name, campus FROM sites ORDER BY code")
+        sites = {row['code']: row for row in cursor.fetchall()}
         cursor.execute("""
-            SELECT 
-                SUM(total_count * 1.0 / 1000) as total_emissions,
-                COUNT(*) as record_count,
-                AVG(student_count) as avg_students,
-                AVG(staff_count) as avg_staff
-            FROM human_population
+            SELECT DISTINCT site_code FROM activity_data
+            UNION
+            SELECT DISTINCT site_code FROM human_population
         """)
-        stats = cursor.fetchone()
-        
-        total_emissions = float(stats['total_emissions'] or 0)
-        record_count = stats['record_count'] or 0
-        avg_students = int(stats['avg_students'] or 0)
-        avg_staff = int(stats['avg_staff'] or 0)
-        
+        for row in cursor.fetchall():
+            sites.setdefault(row['site_code'], {'code': row['site_code'], 'name': row['site_code'], 'campus': None})
+        return jsonify({'default_site': DEFAULT_SITE, 'sites': [sites[code] for code in sorted(sites)]})
+    except Exception as e:
+        logger.exception("Error listing sites")
+        return jsonify({'error': 'Internal error'}), 500
+    finally:
+        if cursor:
+            cursor.close()
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+@app.route('/api/sites', methods=['POST'])
+@api_token_required
+def upsert_site():
+    """Register or rename a site: {code, name[, campus]}."""
+    data = request.get_json() or {}
+    name = (data.get('name') or '').strip()
+    campus = (data.get('campus') or '').strip() or None
+    if not data.get('code') or not name:
+        return jsonify({'error': 'Missing required fields: code, name'}), 400
+    try:
+        code = parse_site_code(data.get('code'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    connection = get_db_connection()
+    if not connection:
+        return jsonify({'error': 'Database connection error'}), 500
+
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        cursor.execute(
+            backend.upsert('sites', ('code', 'name', 'campus'), keys=('code',), replace=('name', 'campus')),
+            (code, name, campus)
+        )
+        connection.commit()
+        return jsonify({'message': 'Site saved', 'site': {'code': code, 'name': name, 'campus': campus}}), 201
+    except Exception as e:
+        logger.exception("Error saving site")
+        return jsonify({'error': 'Failed to save site'}), 500
+    finally:
+        if cursor:
+            cursor.close()
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+@app.route('/api/admin/emission_factors/refresh', methods=['POST'])
+@api_token_required
+def refresh_emission_factors():
+    """
+    Bump the emission factor version (so every worker reloads on its next check)
+    and reload this worker's cache immediately.
+    """
+    connection = get_db_connection()
+    if not connection:
+        return jsonify({'error': 'Database connection error'}), 500
+
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        factor_cache.bump_factor_version(cursor, backend)
+        connection.commit()
+        emission_factors.invalidate()
+        entries = emission_factors.get(connection)
+        notify_factors_changed()
+        changed = emission_factors.last_change
         return jsonify({
-            'total_emissions': round(total_emissions, 2),
-            'total_records': record_count,
-            'average_students': avg_students,
-            'average_staff': avg_staff,
-            'average_population': avg_students + avg_staff
+            'message': 'Emission factors reloaded',
+            'version': emission_factors.version,
+            'factors': entries,
+            'changed': {'from': changed[0], 'to': changed[1]} if changed else None
         })
     except Exception as e:
-        logger.exception("Error fetching cumulative stats")
-        return jsonify({'error': 'Internal error'}), 500
+        logger.exception("Error refreshing emission factors")
+        try:
+            connection.rollback()
+        except Exception:
+            pass
+        return jsonify({'error': 'Failed to refresh emission factors'}), 500
     finally:
         if cursor:
             cursor.close()
@@ -894,10 +2667,60 @@ def get_human_cumulative_stats():
         except Exception:
             pass
 
+@app.route('/api/admin/result_cache', methods=['GET', 'POST'])
+@profile_admin_required
+def result_cache_status():
+    """GET: shared result cache counters. POST: invalidate every worker's cached results."""
+    if shared_results is None:
+        return jsonify({'enabled': False, 'mode': RESULT_CACHE})
+    if request.method == 'POST':
+        shared_results.invalidate()
+    return jsonify(dict(shared_results.snapshot(), enabled=True, mode=RESULT_CACHE))
+
+@app.route('/api/admin/columnar', methods=['GET', 'POST'])
+@profile_admin_required
+def columnar_history_status():
+    """GET: columnar history snapshot and query stats. POST: take a new snapshot now."""
+    if history is None:
+        return jsonify({'enabled': False})
+    if request.method == 'POST':
+        try:
+            history.refresh_if_due(lambda: get_db_connection(pooled=False), force=True)
+        except Exception:
+            logger.exception("Columnar history snapshot failed")
+            return jsonify({'error': 'Snapshot failed'}), 500
+    return jsonify(dict(history.snapshot(), enabled=True, min_days=COLUMNAR_MIN_DAYS))
+
+@app.route('/api/admin/instrumentation', methods=['GET', 'POST'])
+@profile_admin_required
+def instrumentation_settings():
+    """
+    Read or change request timing at runtime. The settings are per worker: a POST only
+    changes the worker that handles it, whose pid is returned with the settings.
+    POST JSON: {"enabled": true, "slow_query_ms": 100} (either key optional; 0 disables slow-query logging).
+    """
+    if request.method == 'POST':
+        data = request.get_json() or {}
+        if 'enabled' in data:
+            if not isinstance(data['enabled'], bool):
+                return jsonify({'error': 'enabled must be true or false'}), 400
+            instrumentation.settings.enabled = data['enabled']
+        if 'slow_query_ms' in data:
+            try:
+                slow_query_ms = float(data['slow_query_ms'])
+            except (TypeError, ValueError):
+                return jsonify({'error': 'slow_query_ms must be a number'}), 400
+            if slow_query_ms < 0:
+                return jsonify({'error': 'slow_query_ms must be non-negative'}), 400
+            instrumentation.settings.slow_query_ms = slow_query_ms
+        logger.info(f"Instrumentation settings changed in worker {os.getpid()}: {instrumentation.settings.as_dict()}")
+    return jsonify(dict(instrumentation.settings.as_dict(), pid=os.getpid()))
+
 @app.route('/api/upload_csv', methods=['POST'])
 @api_token_required
 def upload_csv():
-    """Accepts JSON payload with 'records': [{date, source_type, raw_value, unit}, ...]
+    """Accepts JSON payload with 'records': [{date, source_type, raw_value, unit[, site]}, ...]
+    and an optional top-level 'site' used for records without one.
     Validates format and inserts rows into activity_data. Returns 400 with error on invalid format.
     """
     data = request.get_json() or {}
@@ -905,6 +2728,10 @@ def upload_csv():
 
     if not isinstance(records, list) or len(records) == 0:
         return jsonify({'error': 'Invalid CSV format.'}), 400
+    try:
+        default_site = parse_site_code(data.get('site'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     # Basic validation of each record
     for idx, rec in enumerate(records, start=1):
@@ -921,25 +2748,38 @@ def upload_csv():
         
         # Validate raw_value is numeric
         try:
-            rec['raw_value'] = float(rec['raw_value'])
+            value = float(rec['raw_value'])
         except (ValueError, TypeError):
+            value = math.nan
+        if not math.isfinite(value):
             return jsonify({'error': f'Invalid numeric value at row {idx}: "{rec.get("raw_value")}"'}), 400
+        rec['raw_value'] = value
 
-    connection = get_db_connection()
+        try:
+            rec['site'] = parse_site_code(rec['site']) if rec.get('site') else default_site
+        except ValueError as e:
+            return jsonify({'error': f'{e} at row {idx}'}), 400
+
+    rows = [(rec['site'], rec['date'], rec['source_type'], rec['raw_value'], rec['unit']) for rec in records]
+    connection = None if spool_first() else get_db_connection()
+    # One pass over all rows: every unknown or incompatible unit is reported at once
+    rows, unit_errors = normalize_activity_rows(rows, connection)
+    if unit_errors:
+        return unit_errors_response(unit_errors, connection)
+    normalized = sum(1 for rec, row in zip(records, rows) if rec['unit'] != row[4] or rec['raw_value'] != row[3])
     if not connection:
-        return jsonify({'error': 'Database connection error'}), 500
+        return spooled_response('activity', rows, 'upload_csv')
 
     cursor = None
     try:
         cursor = connection.cursor()
-        insert_stmt = "INSERT INTO activity_data (date, source_type, raw_value, unit) VALUES (%s, %s, %s, %s)"
-        insert_values = []
-        for rec in records:
-            insert_values.append((rec['date'], rec['source_type'], rec['raw_value'], rec['unit']))
-
-        cursor.executemany(insert_stmt, insert_values)
+        insert_stmt = "INSERT INTO activity_data (site_code, date, source_type, raw_value, unit) VALUES (%s, %s, %s, %s, %s)"
+        cursor.executemany(insert_stmt, rows)
         connection.commit()
-        return jsonify({'success': True, 'message': f'{len(insert_values)} records inserted.'}), 201
+        ingested_rows.inc(len(rows), endpoint='upload_csv')
+        notify_data_changed(connection, rows)
+        publish_activity_update(connection, [v[:4] for v in rows])
+        return jsonify({'success': True, 'message': f'{len(rows)} records inserted.', 'normalized': normalized}), 201
     except Exception as e:
         logger.exception('Error inserting CSV records')
         try:
@@ -955,6 +2795,288 @@ def upload_csv():
         except Exception:
             pass
 
+@app.route('/api/ingest/readings', methods=['POST'])
+@api_token_required
+def ingest_readings():
+    """
+    High-rate ingest of meter readings (NDJSON or compact JSON arrays, see parse_readings).
+    Rows from concurrent requests are flushed together in multi-row INSERTs; the
+    response is sent only after the flush holding these rows has committed.
+    Returns 503 + Retry-After while the buffer is full (MySQL is behind).
+    """
+    try:
+        rows, places = parse_readings(request.get_data(as_text=True), request.mimetype, request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not rows:
+        return jsonify({'error': 'No readings'}), 400
+    if len(rows) > INGEST_MAX_REQUEST_ROWS:
+        return jsonify({'error': f'At most {INGEST_MAX_REQUEST_ROWS} readings per request'}), 413
+    # Stored in each source's canonical unit like /api/data; factor units are
+    # re-read at most every FACTOR_CHECK_SECONDS, not per request
+    connection = None if emission_factors.fresh() or spool_first() else get_db_connection()
+    rows, unit_errors = normalize_activity_rows(rows, connection)
+    if unit_errors:
+        return unit_errors_response(unit_errors, connection, places)
+    if connection:
+        try:
+            connection.close()
+        except Exception:
+            pass
+    if SPOOL_MODE == 'always':
+        return spooled_response('readings', spooled_readings(rows), 'ingest_readings')
+
+    try:
+        ticket = ingest_batcher.submit(rows)
+    except ingest_buffer.Backpressure as e:
+        response = jsonify({'error': 'Ingest is behind; retry later', 'retry_after': e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
+
+    try:
+        committed = ticket.wait(INGEST_ACK_TIMEOUT)
+    except Exception:
+        return jsonify({'error': 'Failed to insert readings'}), 500
+    if not committed:
+        # Still buffered; it may commit later, so clients must not assume it was lost
+        return jsonify({'error': 'Timed out waiting for the write; readings may still be stored'}), 504
+    return jsonify({
+        'accepted': len(rows),
+        'flush_ms': round(ticket.flush_ms, 2),
+        'rows_per_sec': round(ingest_batcher.rows_per_second(), 1)
+    }), 201
+
+@app.route('/api/ingest/stats', methods=['GET'])
+@api_token_required
+def ingest_stats():
+    """This worker's ingest buffer: committed rows, flushes, backlog and sustained rows/sec, plus the spool."""
+    stats = ingest_batcher.snapshot()
+    stats['spool'] = dict(ingest_spool.snapshot(), mode=SPOOL_MODE) if ingest_spool is not None else None
+    return jsonify(stats)
+
+@app.route('/api/admin/compaction', methods=['GET', 'POST'])
+@api_token_required
+def meter_compaction():
+    """GET: retention settings and this worker's compaction stats. POST: run a pass now."""
+    if request.method == 'POST':
+        try:
+            result = compactor.run_once()
+        except Exception:
+            logger.exception("Meter reading compaction failed")
+            return jsonify({'error': 'Compaction failed'}), 500
+        logger.info(f"Meter reading compaction: {result}")
+    return jsonify({
+        'raw_retention_days': retention.raw_days,
+        'hourly_retention_months': retention.hourly_months,
+        'cutoffs': {tier: cutoff.isoformat() if cutoff else None for tier, cutoff in retention.cutoffs().items()},
+        'interval_seconds': compactor.interval,
+        'stats': compactor.stats
+    })
+
+# ---- Bulk export ----
+# /api/export reads through an unbuffered (server-side) cursor on a connection of its own,
+# outside the pool, and streams each batch as soon as it is encoded: memory stays at one
+# batch and a long export never holds a pooled connection. Run Gunicorn with threads
+# (gthread) so an export occupies one thread rather than a whole worker.
+EXPORT_BATCH_ROWS = int(os.environ.get('EXPORT_BATCH_ROWS', 5000))
+
+def parse_export_date(args, name):
+    """Optional YYYY-MM-DD query arg as a date (None when absent); raises ValueError."""
+    value = args.get(name)
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+def export_filters(start, end, sites):
+    """(` WHERE ...`, params) for an export query over [start, end] and `sites`."""
+    conditions, params = ['1 = 1'], []
+    if start:
+        conditions.append('date >= %s')
+        params.append(start)
+    if end:
+        conditions.append('date <= %s')
+        params.append(end)
+    site_sql, site_params = site_filter_sql(sites)
+    return ' WHERE ' + ' AND '.join(conditions) + site_sql, tuple(params) + site_params
+
+def fetch_batches(cursor, convert):
+    while True:
+        rows = cursor.fetchmany(EXPORT_BATCH_ROWS)
+        if not rows:
+            return
+        yield [convert(row) for row in rows]
+
+def export_batches(connection, start, end, sites=None):
+    """
+    Activity rows with the emission factor in effect on their date (none without one,
+    like a LEFT JOIN), then daily headcounts with the human_daily factor, as
+    bulk_export.COLUMNS tuples.
+    """
+    factors = emission_factors.timeline(connection)
+    where, params = export_filters(start, end, sites)
+    cursor = connection.cursor(buffered=False)
+    try:
+        try:
+            # A slow client stalls the unbuffered read; keep MySQL from dropping it
+            cursor.execute("SET SESSION net_write_timeout = 3600")
+        except Exception as e:
+            logger.debug(f"net_write_timeout not raised: {e}")
+
+        cursor.execute("SELECT date, site_code, source_type, raw_value, unit FROM activity_data"
+                       + where + " ORDER BY date, id", params)
+
+        def activity(row):
+            day, site, source, raw_value, unit = row
+            entry = factors.period(source, day)
+            factor = entry[2] if entry else None
+            return ('activity', day, site, source, float(raw_value), unit, None, None, factor,
+                    entry[3] if entry else None,
+                    float(raw_value) * factor if entry else None)
+        yield from fetch_batches(cursor, activity)
+
+        cursor.execute("SELECT date, site_code, student_count, staff_count, total_count FROM human_population"
+                       + where + " ORDER BY date, site_code", params)
+        def headcount(row):
+            day, site, students, staff, total = row
+            human = factors.period('human_daily', day)
+            return ('human', day, site, 'human_daily', float(total), 'person_days', students, staff,
+                    human[2] if human else None, human[3] if human else None,
+                    total * human[2] if human else None)
+        yield from fetch_batches(cursor, headcount)
+    finally:
+        cursor.close()
+
+def stream_export(connection, fmt, start, end, sites):
+    """Encoded chunks of the export; owns `connection` and closes it when done or abandoned."""
+    rows = 0
+
+    def counted(batches):
+        nonlocal rows
+        for batch in batches:
+            rows += len(batch)
+            yield batch
+
+    try:
+        yield from bulk_export.encode(fmt, counted(export_batches(connection, start, end, sites)))
+        logger.info(f"Export ({fmt}) finished: {rows} rows")
+    except GeneratorExit:
+        logger.info(f"Export ({fmt}) abandoned by the client after {rows} rows")
+        raise
+    except Exception:
+        # Headers are already sent; a truncated body is all the client can be told
+        logger.exception(f"Export ({fmt}) failed after {rows} rows")
+    finally:
+        exported_rows.inc(rows, format=fmt)
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+@app.route('/api/export', methods=['GET'])
+@api_token_required
+def export_data():
+    """
+    Stream activity data (with emission factors) and daily headcounts.
+    Query: start_date / end_date (YYYY-MM-DD, optional: full history), site=a,b,
+    format=csv (default) | ndjson | parquet | arrow.
+    """
+    fmt = request.args.get('format', 'csv').lower()
+    if fmt not in bulk_export.FORMATS:
+        return jsonify({'error': f"format must be one of: {', '.join(bulk_export.FORMATS)}"}), 400
+    if not bulk_export.available(fmt):
+        return jsonify({'error': f'{fmt} export needs pyarrow on the server (pip install .[export])'}), 400
+    try:
+        start = parse_export_date(request.args, 'start_date')
+        end = parse_export_date(request.args, 'end_date')
+        sites = parse_site_filter(request.args)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid filter: {e}'}), 400
+    if start and end and end < start:
+        start, end = end, start
+
+    connection = get_db_connection(pooled=False)
+    if not connection:
+        return jsonify({'error': 'Database connection error'}), 500
+
+    mimetype, extension = bulk_export.FORMATS[fmt]
+    filename = f"emissions_{start or 'all'}_{end or 'all'}.{extension}"
+    return Response(
+        stream_export(connection, fmt, start, end, sites),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/admin/profiles', methods=['GET'])
+@profile_admin_required
+def list_profiles():
+    """Saved request profiles (newest first)."""
+    return jsonify({'directory': PROFILE_DIR, 'profiles': profile_store.list()})
+
+@app.route('/api/admin/profiles/<name>', methods=['GET'])
+@profile_admin_required
+def download_profile(name):
+    """Download one saved profile (.prof for pstats/snakeviz, .speedscope.json for speedscope)."""
+    if not profile_store.path(name):
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_from_directory(os.path.abspath(PROFILE_DIR), name, as_attachment=True)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint; requires `Authorization: Bearer $METRICS_TOKEN` when that is set."""
+    if not METRICS_ENABLED:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    if METRICS_TOKEN and request.headers.get('Authorization', '') != f'Bearer {METRICS_TOKEN}':
+        return jsonify({'error': 'Authentication required'}), 401
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+# ---- Dashboard warm-up ----
+# The dashboard's fixed ranges (#dateRange) get almost all traffic, so their payloads are
+# computed into the result cache at startup, after writes and after each date rollover
+# (see warmup.py). Needs RESULT_CACHE; WARMUP=0 turns it off.
+WARMUP_ENABLED = shared_results is not None and os.environ.get('WARMUP', 'True').lower() in ('1', 'true', 'yes')
+WARMUP_WINDOWS = sorted({int(d) for d in os.environ.get('WARMUP_WINDOWS', '7,30,90,180,365').split(',') if d.strip()}
+                        | {DASHBOARD_DEFAULT_DAYS})
+
+def warm_standard_windows():
+    """Compute the all-sites payloads the dashboard page requests that are not cached; returns how many."""
+    sections = set(DASHBOARD_SECTIONS)
+    # The page derives its dates from the browser's UTC date, the inlined bootstrap from server time
+    days_ending = sorted({datetime.now().date(), datetime.now(timezone.utc).date()})
+    produced = []
+    for today in days_ending:
+        end_dt = datetime(today.year, today.month, today.day)
+        for days in WARMUP_WINDOWS:
+            start_dt = end_dt - timedelta(days=days)
+            produced.append(cached_dashboard(start_dt, end_dt, days, sections, missing_only=True))
+            produced.append(cached_dashboard_bootstrap(start_dt, end_dt, days, sections, missing_only=True))
+    produced.append(cached_recommendations(missing_only=True))
+    produced.append(cached_cumulative_stats(missing_only=True))
+    return sum(value is not None for value in produced)
+
+# One worker warms at a time: a lease in the shared cache, held for at most this long
+WARMUP_LEASE_SECONDS = float(os.environ.get('WARMUP_LEASE_SECONDS', 120))
+
+warmer = None
+if WARMUP_ENABLED:
+    warmer = warmup.Warmer(warm_standard_windows,
+                           min_interval=float(os.environ.get('WARMUP_MIN_INTERVAL_SECONDS', 5)),
+                           claim=lambda: shared_results.lease('warmup', WARMUP_LEASE_SECONDS))
+    warmer.start()
+
+@app.route('/api/admin/warmup', methods=['GET', 'POST'])
+@profile_admin_required
+def dashboard_warmup():
+    """GET: this worker's warm-up stats. POST: warm the standard windows now."""
+    if warmer is None:
+        return jsonify({'enabled': False, 'windows': WARMUP_WINDOWS})
+    if request.method == 'POST':
+        try:
+            warmer.run_once('manual')
+        except DatabaseUnavailable:
+            return jsonify({'error': 'Database connection error'}), 500
+        except Exception:
+            logger.exception("Dashboard warm-up failed")
+            return jsonify({'error': 'Warm-up failed'}), 500
+    return jsonify(dict(warmer.stats, enabled=True, windows=WARMUP_WINDOWS))
+
 # ---- App run ----
 if __name__ == '__main__':
     debug = os.environ.get('FLASK_DEBUG', 'True').lower() in ('1', 'true', 'yes')
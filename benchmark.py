@@ -0,0 +1,504 @@
+"""
+Load-testing and benchmark suite for the API hot paths.
+
+Seeds the database (MySQL or SQLite) with synthetic activity/headcount data shaped like
+Documents/activity_data_sample.csv, then drives the dashboard, recommendation
+and ingest endpoints of a running server at a fixed concurrency and reports
+p50/p95/p99 latency, requests/sec and MySQL statements per request.
+Results are written as JSON and can be compared against a saved baseline.
+
+The `engines` command times the long-window dashboard/recommendation queries
+on the configured database (DB_BACKEND), on a DuckDB/Parquet snapshot of the
+same rows (columnar_store.py, needs `pip install .[columnar]`) and optionally on
+a SQLite file seeded with the same data, without a running server.
+
+Usage:
+  python benchmark.py seed --rows 1000000 --days 1095 --truncate
+  python benchmark.py run --url http://localhost:5000 --concurrency 16 --requests 500 --output bench.json
+  python benchmark.py run --scenarios dashboard,recommendations --compare bench.json
+  python benchmark.py engines --windows 365,730,1095 --repeat 20
+  DB_BACKEND=sqlite DB_PATH=bench.db python benchmark.py seed --rows 1000000 --days 1095
+  python benchmark.py engines --sqlite bench.db
+
+Seeding and DB query counts use the same DB_* settings as app.py (.env).
+Query counts come from MySQL's global `Questions` counter, so they include any
+other traffic on the server; run against a quiet database.
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from urllib.parse import urlsplit
+
+from dotenv import load_dotenv
+
+import db_backends
+from synthetic_data import load_profile
+
+load_dotenv()
+
+
+def connect_db():
+    return db_backends.from_env().connect()
+
+
+def synthetic_rows(rng, profile, start, days, rows):
+    """
+    Yield `rows` (date, source_type, raw_value, unit) tuples over `days` days from
+    `start`. When there is more than one row per source per day the daily value
+    is split across readings, so daily totals keep the sample's magnitude.
+    """
+    sources = list(profile)
+    per_day = max(1, math.ceil(rows / days))
+    readings = max(1, per_day // len(sources))
+    emitted = 0
+    for offset in range(days):
+        d = (start + timedelta(days=offset)).isoformat()
+        for i in range(per_day):
+            if emitted >= rows:
+                return
+            source = sources[i % len(sources)]
+            mean, std, unit = profile[source]
+            value = max(rng.gauss(mean, std), 0.0) / readings
+            yield (d, source, round(value, 2), unit)
+            emitted += 1
+
+
+def seed(args):
+    rng = random.Random(args.seed)
+    profile = load_profile()
+    start = date.today() - timedelta(days=args.days - 1)
+    backend = db_backends.from_env()
+    connection = backend.connect()
+    cursor = connection.cursor()
+    try:
+        if args.truncate:
+            cursor.execute("DELETE FROM activity_data")
+            cursor.execute("DELETE FROM human_population")
+            connection.commit()
+
+        t0 = time.perf_counter()
+        insert_stmt = "INSERT INTO activity_data (date, source_type, raw_value, unit) VALUES (%s, %s, %s, %s)"
+        batch, inserted = [], 0
+        for row in synthetic_rows(rng, profile, start, args.days, args.rows):
+            batch.append(row)
+            if len(batch) >= args.batch_size:
+                cursor.executemany(insert_stmt, batch)
+                connection.commit()
+                inserted += len(batch)
+                batch = []
+                print(f"\r   {inserted:,} activity rows", end='', flush=True)
+        if batch:
+            cursor.executemany(insert_stmt, batch)
+            connection.commit()
+            inserted += len(batch)
+
+        human = [
+            ((start + timedelta(days=offset)).isoformat(), rng.randint(1500, 3500), rng.randint(150, 450))
+            for offset in range(args.days)
+        ]
+        cursor.executemany(
+            backend.upsert('human_population', ('date', 'student_count', 'staff_count'),
+                           keys=('site_code', 'date'), replace=('student_count', 'staff_count')),
+            human
+        )
+        connection.commit()
+        elapsed = time.perf_counter() - t0
+        print(f"\r✅ Seeded {inserted:,} activity rows and {len(human):,} headcount days "
+              f"({start} → {date.today()}) in {elapsed:.1f}s ({inserted / elapsed:,.0f} rows/s)")
+    finally:
+        cursor.close()
+        connection.close()
+
+
+# ---- Load generation ----
+
+def window(days):
+    end = date.today()
+    return f"start_date={(end - timedelta(days=days)).isoformat()}&end_date={end.isoformat()}"
+
+
+def build_scenarios(args, profile):
+    """name -> (method, path, body factory or None, needs auth)."""
+    sources = list(profile)
+    start = date.today() - timedelta(days=args.days - 1)
+
+    def random_date(rng):
+        return (start + timedelta(days=rng.randrange(args.days))).isoformat()
+
+    def upload_body(rng):
+        records = []
+        for _ in range(args.upload_rows):
+            source = rng.choice(sources)
+            mean, std, unit = profile[source]
+            records.append({'date': random_date(rng), 'source_type': source,
+                            'raw_value': round(max(rng.gauss(mean, std), 0.0), 2), 'unit': unit})
+        return {'records': records}
+
+    def readings_body(rng):
+        # One smart meter's consecutive 15-minute interval readings (compact form)
+        mean, std, unit = profile.get('electricity', (100.0, 10.0, 'kWh'))
+        first = datetime.combine(date.fromisoformat(random_date(rng)), datetime.min.time())
+        rows = [[(first + timedelta(minutes=15 * i)).isoformat(timespec='minutes'),
+                 round(max(rng.gauss(mean, std), 0.0) / 96, 3)]
+                for i in range(args.upload_rows)]
+        return {'site': f"meter-{rng.randrange(50)}", 'source_type': 'electricity', 'unit': unit,
+                'columns': ['ts', 'raw_value'], 'rows': rows}
+
+    def human_body(rng):
+        return {'date': random_date(rng), 'student_count': rng.randint(1500, 3500),
+                'staff_count': rng.randint(150, 450)}
+
+    return {
+        'dashboard': ('GET', '/api/dashboard', None, False),
+        'dashboard_30d': ('GET', f'/api/dashboard?{window(30)}', None, False),
+        'dashboard_365d': ('GET', f'/api/dashboard?{window(365)}', None, False),
+        'dashboard_all': ('GET', f'/api/dashboard?{window(args.days)}', None, False),
+        'recommendations': ('GET', '/api/recommendations', None, False),
+        'human_cumulative_stats': ('GET', '/api/human_cumulative_stats', None, False),
+        'upload_csv': ('POST', '/api/upload_csv', upload_body, True),
+        'human_data': ('POST', '/api/human_data', human_body, True),
+        'ingest_readings': ('POST', '/api/ingest/readings', readings_body, True),
+    }
+
+
+class Client:
+    """One keep-alive HTTP connection per worker thread."""
+
+    def __init__(self, base_url, token=None, timeout=60):
+        parts = urlsplit(base_url)
+        self.https = parts.scheme == 'https'
+        self.host = parts.hostname
+        self.port = parts.port
+        self.timeout = timeout
+        self.headers = {'Accept-Encoding': 'gzip'}
+        if token:
+            self.headers['Authorization'] = f'Bearer {token}'
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            conn = self._local.conn = cls(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def request(self, method, path, body=None):
+        """Returns (status, seconds, response bytes); status 0 on connection errors."""
+        headers = dict(self.headers)
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        t0 = time.perf_counter()
+        try:
+            conn = self._connection()
+            conn.request(method, path, body=payload, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+            return response.status, time.perf_counter() - t0, len(data)
+        except (OSError, http.client.HTTPException):
+            self._local.conn = None
+            return 0, time.perf_counter() - t0, 0
+
+
+def login(base_url, username, password):
+    client = Client(base_url)
+    conn = client._connection()
+    conn.request('POST', '/api/login', body=json.dumps({'username': username, 'password': password}),
+                 headers={'Content-Type': 'application/json'})
+    response = conn.getresponse()
+    data = json.loads(response.read() or b'{}')
+    if response.status != 200 or 'token' not in data:
+        raise SystemExit(f"Login failed ({response.status}): {data.get('error', data)}")
+    return data['token']
+
+
+def mysql_questions():
+    """MySQL's global statement counter, or None when the DB is not MySQL or not reachable from here."""
+    if os.environ.get('DB_BACKEND', 'mysql').lower() != 'mysql':
+        return None
+    try:
+        connection = connect_db()
+    except Exception:
+        return None
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SHOW GLOBAL STATUS LIKE 'Questions'")
+        row = cursor.fetchone()
+        cursor.close()
+        # Subtract the SHOW statement itself
+        return int(row[1]) - 1
+    finally:
+        connection.close()
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100.0
+    lo, hi = math.floor(k), math.ceil(k)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def run_scenario(client, name, spec, args):
+    method, path, body_factory, _ = spec
+    rng = random.Random(f"{args.seed}-{name}")
+    bodies = [body_factory(rng) if body_factory else None for _ in range(args.requests)]
+
+    # Warm-up requests are not measured (pools, caches, factor cache)
+    for body in bodies[:args.warmup]:
+        client.request(method, path, body)
+
+    questions_before = mysql_questions() if args.db_stats else None
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda body: client.request(method, path, body), bodies))
+    elapsed = time.perf_counter() - t0
+    questions_after = mysql_questions() if questions_before is not None else None
+
+    latencies = sorted(seconds * 1000 for _, seconds, _ in results)
+    statuses = {}
+    for status, _, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    errors = sum(count for status, count in statuses.items() if not status.startswith('2'))
+    report = {
+        'method': method,
+        'path': path,
+        'requests': len(results),
+        'concurrency': args.concurrency,
+        'errors': errors,
+        'statuses': statuses,
+        'rps': round(len(results) / elapsed, 2) if elapsed > 0 else 0.0,
+        'latency_ms': {
+            'mean': round(statistics.mean(latencies), 3),
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'max': round(latencies[-1], 3),
+        },
+        'response_bytes': round(statistics.mean(size for _, _, size in results)),
+    }
+    if body_factory and body_factory.__name__ in ('upload_body', 'readings_body'):
+        report['rows_per_sec'] = round(len(results) * args.upload_rows / elapsed, 1)
+    if questions_after is not None:
+        report['db_queries_per_request'] = round((questions_after - questions_before) / len(results), 2)
+    return report
+
+
+def compare(results, baseline_path, threshold):
+    """Print p95/RPS changes against a saved run; returns the names that regressed."""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)['scenarios']
+    regressed = []
+    print(f"\n{'scenario':<24}{'p95 ms':>12}{'Δ':>9}{'rps':>12}{'Δ':>9}")
+    for name, report in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]
+        p95, old_p95 = report['latency_ms']['p95'], old['latency_ms']['p95']
+        rps, old_rps = report['rps'], old['rps']
+        d_p95 = (p95 - old_p95) / old_p95 * 100 if old_p95 else 0.0
+        d_rps = (rps - old_rps) / old_rps * 100 if old_rps else 0.0
+        flag = ''
+        if d_p95 > threshold or d_rps < -threshold:
+            regressed.append(name)
+            flag = '  ⚠️ regression'
+        print(f"{name:<24}{p95:>12.1f}{d_p95:>+8.1f}%{rps:>12.1f}{d_rps:>+8.1f}%{flag}")
+    return regressed
+
+
+def run(args):
+    profile = load_profile()
+    scenarios = build_scenarios(args, profile)
+    names = [n.strip() for n in args.scenarios.split(',') if n.strip()]
+    unknown = [n for n in names if n not in scenarios]
+    if unknown:
+        raise SystemExit(f"Unknown scenario(s): {', '.join(unknown)} (choose from {', '.join(scenarios)})")
+
+    token = args.token
+    if not token and any(scenarios[n][3] for n in names):
+        token = login(args.url, args.username, args.password)
+    client = Client(args.url, token=token)
+
+    print("=" * 70)
+    print(f"BENCHMARK {args.url}  concurrency={args.concurrency}  requests={args.requests}")
+    print("=" * 70)
+    results = {}
+    for name in names:
+        report = run_scenario(client, name, scenarios[name], args)
+        results[name] = report
+        lat = report['latency_ms']
+        queries = f"  {report['db_queries_per_request']} q/req" if 'db_queries_per_request' in report else ''
+        print(f"{name:<24} p50 {lat['p50']:8.1f}ms  p95 {lat['p95']:8.1f}ms  p99 {lat['p99']:8.1f}ms  "
+              f"{report['rps']:8.1f} rps  errors {report['errors']}{queries}")
+
+    output = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'url': args.url,
+        'python': platform.python_version(),
+        'host': platform.node(),
+        'settings': {'concurrency': args.concurrency, 'requests': args.requests, 'warmup': args.warmup,
+                     'upload_rows': args.upload_rows, 'days': args.days},
+        'scenarios': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=2)
+        print(f"\n💾 Results saved to {args.output}")
+    if args.compare:
+        regressed = compare(results, args.compare, args.threshold)
+        if regressed:
+            raise SystemExit(f"Regressions over {args.threshold}%: {', '.join(regressed)}")
+
+
+# ---- Engine comparison ----
+
+# The aggregations app.py runs for a dashboard window and for recommendations
+ENGINE_QUERIES = {
+    'daily_by_source': """
+        SELECT date, source_type, SUM(raw_value) as raw_total
+        FROM activity_data WHERE date BETWEEN %s AND %s
+        GROUP BY date, source_type ORDER BY date""",
+    'source_totals': """
+        SELECT source_type, SUM(raw_value) as raw_total
+        FROM activity_data WHERE date BETWEEN %s AND %s
+        GROUP BY source_type""",
+    'human_daily': """
+        SELECT date, SUM(student_count) as student_count, SUM(staff_count) as staff_count,
+               SUM(total_count) as total_count
+        FROM human_population WHERE date BETWEEN %s AND %s
+        GROUP BY date ORDER BY date""",
+}
+
+
+def time_query(execute, repeat):
+    """Sorted latencies (ms) of `repeat` runs after one unmeasured run, and the last result."""
+    rows = execute()
+    latencies = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        rows = execute()
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return sorted(latencies), rows
+
+
+def engines(args):
+    import tempfile
+    import columnar_store
+    if columnar_store.duckdb is None:
+        raise SystemExit("duckdb is not installed (pip install .[columnar])")
+
+    directory = args.snapshot_dir or tempfile.mkdtemp(prefix='columnar-bench-')
+    # recent_days=0: the snapshot holds every row dated before today, the windows end yesterday
+    history = columnar_store.HistorySnapshot(directory, recent_days=0)
+    backend = db_backends.from_env()
+    # {engine: connection} timed with the same SQL; DuckDB runs it on the snapshot
+    connections = {backend.name: backend.connect()}
+    if args.sqlite:
+        connections.setdefault('sqlite', db_backends.SQLiteBackend(args.sqlite).connect())
+    cursors = {}
+    try:
+        meta = history.refresh(connections[backend.name])
+        names = list(connections) + ['duckdb']
+        print("=" * 70)
+        print(f"ENGINES  {' vs '.join(names)}  snapshot {meta['rows']} rows "
+              f"in {history.stats['last_refresh_ms']:.0f} ms  repeat={args.repeat}")
+        print("=" * 70)
+        end = date.today() - timedelta(days=1)
+        results = {}
+        cursors = {name: connection.cursor(dictionary=True) for name, connection in connections.items()}
+        for days in [int(d) for d in args.windows.split(',') if d.strip()]:
+            params = ((end - timedelta(days=days - 1)).isoformat(), end.isoformat())
+            for name, query in ENGINE_QUERIES.items():
+                def on_sql(cursor):
+                    cursor.execute(query, params)
+                    return cursor.fetchall()
+                timings = {engine: time_query(lambda c=cursor: on_sql(c), args.repeat)
+                           for engine, cursor in cursors.items()}
+                timings['duckdb'] = time_query(lambda: history.fetchall(query, params), args.repeat)
+                key = f"{name}_{days}d"
+                row_counts = {engine: len(rows) for engine, (_, rows) in timings.items()}
+                results[key] = {'rows': row_counts[backend.name],
+                                'same_rows': len(set(row_counts.values())) == 1}
+                for engine, (ms, _) in timings.items():
+                    results[key][f"{engine}_ms"] = {'p50': round(percentile(ms, 50), 3),
+                                                    'p95': round(percentile(ms, 95), 3)}
+                r = results[key]
+                print(f"{key:<26}" + ''.join(
+                    f"  {engine} p50 {r[engine + '_ms']['p50']:8.1f}ms p95 {r[engine + '_ms']['p95']:8.1f}ms"
+                    for engine in names) + ('' if r['same_rows'] else '  ROW COUNT MISMATCH'))
+    finally:
+        for cursor in cursors.values():
+            cursor.close()
+        for connection in connections.values():
+            connection.close()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'timestamp': datetime.now().isoformat(timespec='seconds'), 'snapshot_rows': meta['rows'],
+                       'repeat': args.repeat, 'queries': results}, f, indent=2)
+        print(f"\n💾 Results saved to {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_seed = sub.add_parser('seed', help='Insert synthetic activity and headcount rows (DB_BACKEND)')
+    p_seed.add_argument('--rows', type=lambda v: int(float(v)), default=100_000,
+                        help='activity_data rows to insert (1e3 .. 1e7)')
+    p_seed.add_argument('--days', type=int, default=730, help='days of history ending today')
+    p_seed.add_argument('--batch-size', type=int, default=5000)
+    p_seed.add_argument('--seed', type=int, default=42)
+    p_seed.add_argument('--truncate', action='store_true',
+                        help='DELETE all activity_data and human_population rows first')
+
+    p_run = sub.add_parser('run', help='Drive a running server and report latency/throughput')
+    p_run.add_argument('--url', default='http://localhost:5000')
+    p_run.add_argument('--scenarios', default='dashboard,dashboard_365d,recommendations,human_cumulative_stats',
+                       help='comma separated; also dashboard_30d, dashboard_all, upload_csv, human_data, '
+                            'ingest_readings')
+    p_run.add_argument('--concurrency', type=int, default=8)
+    p_run.add_argument('--requests', type=int, default=200, help='measured requests per scenario')
+    p_run.add_argument('--warmup', type=int, default=5)
+    p_run.add_argument('--days', type=int, default=730, help='seeded history length (dates for ingest bodies)')
+    p_run.add_argument('--upload-rows', type=int, default=100, help='records per upload_csv / ingest_readings request')
+    p_run.add_argument('--token', help='JWT for ingest scenarios (otherwise logs in)')
+    p_run.add_argument('--username', default='admin')
+    p_run.add_argument('--password', default='admin123')
+    p_run.add_argument('--no-db-stats', dest='db_stats', action='store_false',
+                       help='skip MySQL query counting')
+    p_run.add_argument('--seed', type=int, default=42)
+    p_run.add_argument('--output', help='write results JSON here')
+    p_run.add_argument('--compare', help='baseline results JSON to compare against')
+    p_run.add_argument('--threshold', type=float, default=10.0,
+                       help='percent p95/RPS change counted as a regression')
+
+    p_engines = sub.add_parser('engines', help='Time long-window aggregations on the database vs a DuckDB/Parquet '
+                                               'snapshot (and SQLite)')
+    p_engines.add_argument('--windows', default='365,730,1095', help='comma separated window lengths in days')
+    p_engines.add_argument('--repeat', type=int, default=20, help='measured runs per query and engine')
+    p_engines.add_argument('--sqlite', help='also time the queries on this SQLite file (seeded with DB_BACKEND=sqlite)')
+    p_engines.add_argument('--snapshot-dir', help='where to write the snapshot (default: a temp directory)')
+    p_engines.add_argument('--output', help='write results JSON here')
+
+    args = parser.parse_args()
+    if args.command == 'seed':
+        seed(args)
+    elif args.command == 'engines':
+        engines(args)
+    else:
+        run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+Streaming encoders for bulk exports (GET /api/export).
+
+encode(fmt, batches) turns an iterable of row batches (lists of tuples in
+COLUMNS order) into an iterable of bytes chunks, one or a few chunks per batch,
+so a response can be sent while the rows are still being read. Memory stays
+bounded by the batch size whatever the number of rows.
+
+Formats:
+- csv: header line, then RFC 4180 rows.
+- ndjson: one JSON object per line.
+- parquet: one row group per batch (optional `pyarrow` package).
+- arrow: Arrow IPC stream, one record batch per batch (optional `pyarrow`).
+"""
+import csv
+import io
+import json
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: pip install .[export]
+    pa = pq = None
+
+# One long-format row per activity record or daily headcount
+COLUMNS = ('record_type', 'date', 'site_code', 'source_type', 'raw_value', 'unit',
+           'student_count', 'staff_count', 'factor', 'factor_unit', 'emissions_kg_co2e')
+
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+COLUMNAR_FORMATS = ('parquet', 'arrow')
+
+
+def available(fmt):
+    """True when `fmt` can be produced here (the columnar formats need pyarrow)."""
+    return fmt in FORMATS and (fmt not in COLUMNAR_FORMATS or pa is not None)
+
+
+def encode(fmt, batches):
+    if fmt == 'csv':
+        return _csv(batches)
+    if fmt == 'ndjson':
+        return _ndjson(batches)
+    if fmt in COLUMNAR_FORMATS:
+        return _columnar(fmt, batches)
+    raise ValueError(f"Unknown export format: {fmt}")
+
+
+def _csv(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\r\n')
+    writer.writerow(COLUMNS)
+    for batch in batches:
+        # csv writes None as an empty field and dates as YYYY-MM-DD
+        writer.writerows(batch)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _ndjson(batches):
+    for batch in batches:
+        lines = [json.dumps(dict(zip(COLUMNS, row)), default=str, separators=(',', ':')) for row in batch]
+        if lines:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands out what was written since the last take()."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def arrow_schema():
+    return pa.schema([
+        ('record_type', pa.string()), ('date', pa.date32()), ('site_code', pa.string()),
+        ('source_type', pa.string()), ('raw_value', pa.float64()), ('unit', pa.string()),
+        ('student_count', pa.int64()), ('staff_count', pa.int64()), ('factor', pa.float64()),
+        ('factor_unit', pa.string()), ('emissions_kg_co2e', pa.float64()),
+    ])
+
+
+def _columnar(fmt, batches):
+    if pa is None:
+        raise RuntimeError('Parquet/Arrow export needs the pyarrow package (pip install .[export])')
+    schema = arrow_schema()
+    sink = _ChunkSink()
+    if fmt == 'parquet':
+        writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    try:
+        for batch in batches:
+            if not batch:
+                continue
+            columns = list(zip(*batch))
+            table = pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema)
+            writer.write_table(table)
+            chunk = sink.take()
+            if chunk:
+                yield chunk
+    finally:
+        writer.close()
+    yield sink.take()
@@ -0,0 +1,308 @@
+"""
+Optional DuckDB/Parquet snapshot of historical data for long-range queries.
+
+MySQL's row store is slow at the dashboard's scan-and-aggregate queries over
+years of activity_data. HistorySnapshot copies everything dated before a
+cutoff (`recent_days` ago) into Parquet files:
+
+- activity.parquet: activity_data summed per (site_code, date, source_type),
+  the finest grain any dashboard or recommendation query groups by,
+- human.parquet: human_population rows,
+
+and runs the app's queries (MySQL dialect, %s placeholders) on them through an
+embedded DuckDB database, where `activity_data` and `human_population` are
+views over those files. app.py splits long date ranges at the cutoff: older
+dates come from here, recent dates and every write stay in MySQL.
+
+Snapshots are written by whichever worker holds the refresh lock into
+`<directory>/snapshot-<time>-<random>/` and published by replacing `current.json`,
+so every worker on the host uses the same files. A snapshot is withdrawn
+(deleting `current.json`) until the next refresh when rows older than its
+cutoff reach MySQL after it was taken: rows with ids past its watermarks
+(checked at most every `check_interval` seconds, and after writes in this
+worker), or headcount upserts reported through note_write(), which change
+rows in place.
+
+Needs the optional `duckdb` package (pip install .[columnar]).
+"""
+import csv
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+
+try:
+    import duckdb
+except ImportError:  # optional: pip install .[columnar]
+    duckdb = None
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; workers then refresh independently
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# (file, SELECT on MySQL, DuckDB column types of its result)
+TABLES = {
+    'activity_data': (
+        'activity',
+        """SELECT site_code, date, source_type, SUM(raw_value) AS raw_value
+           FROM activity_data WHERE date < %s AND id <= %s
+           GROUP BY site_code, date, source_type""",
+        {'site_code': 'VARCHAR', 'date': 'DATE', 'source_type': 'VARCHAR', 'raw_value': 'DOUBLE'},
+    ),
+    'human_population': (
+        'human',
+        """SELECT site_code, date, student_count, staff_count, total_count
+           FROM human_population WHERE date < %s AND id <= %s""",
+        {'site_code': 'VARCHAR', 'date': 'DATE', 'student_count': 'INTEGER',
+         'staff_count': 'INTEGER', 'total_count': 'INTEGER'},
+    ),
+}
+
+FETCH_ROWS = 10000
+
+
+def _quote(path):
+    return "'" + path.replace("'", "''") + "'"
+
+
+class HistorySnapshot:
+    def __init__(self, directory, recent_days=30, refresh_interval=3600.0, check_interval=5.0):
+        self.directory = directory
+        self.recent_days = recent_days
+        self.refresh_interval = refresh_interval
+        self.check_interval = check_interval
+        self.meta = None
+        self._meta_mtime = None
+        self._db = None
+        self._db_name = None
+        self._db_pid = None
+        self._db_lock = threading.Lock()
+        self._local = threading.local()
+        self._dirty = True
+        self._current = False
+        self._checked_at = 0.0
+        self._wake = threading.Event()
+        self._thread_pid = None
+        # queries: answered here; stale: snapshots withdrawn after older rows reached MySQL
+        self.stats = {'queries': 0, 'stale': 0, 'refreshes': 0, 'refresh_failures': 0, 'last_refresh_ms': 0.0}
+
+    # ---- current snapshot ----
+
+    def _load_meta(self):
+        path = os.path.join(self.directory, 'current.json')
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            if mtime != self._meta_mtime:
+                with open(path, encoding='utf-8') as f:
+                    self.meta = json.load(f)
+                self._meta_mtime = mtime
+                self._dirty = True  # a new snapshot: check its watermarks before use
+        except (OSError, ValueError):
+            self.meta = None
+            self._meta_mtime = None
+        return self.meta
+
+    def cutoff(self):
+        """First date not covered by the current snapshot ('YYYY-MM-DD'), or None without one."""
+        meta = self._load_meta()
+        return meta['cutoff'] if meta else None
+
+    def mark_dirty(self):
+        """Called after writes: check the watermarks before the next query."""
+        self._dirty = True
+
+    def note_write(self, dates):
+        """Headcount upserts rewrite rows in place (same id); withdraw the snapshot if they predate it."""
+        cutoff = self.cutoff()
+        if cutoff and any(str(d)[:10] < cutoff for d in dates):
+            self._withdraw()
+
+    def _withdraw(self):
+        self.stats['stale'] += 1
+        self._current = False
+        try:
+            os.remove(os.path.join(self.directory, 'current.json'))
+            logger.info("Columnar history snapshot withdrawn: older rows changed in MySQL")
+        except FileNotFoundError:
+            pass
+        self._wake.set()
+
+    def usable(self, cursor):
+        """True when the current snapshot may answer queries; `cursor` (on MySQL) checks its watermarks."""
+        meta = self._load_meta()
+        if meta is None:
+            return False
+        if self._dirty or time.monotonic() - self._checked_at > self.check_interval:
+            self._dirty = False
+            found = []
+            for table, key in (('activity_data', 'activity_max_id'), ('human_population', 'human_max_id')):
+                cursor.execute(f"SELECT 1 AS found FROM {table} WHERE id > %s AND date < %s LIMIT 1",
+                               (meta[key], meta['cutoff']))
+                found += cursor.fetchall()
+            self._checked_at = time.monotonic()
+            self._current = not found
+            if found:
+                self._withdraw()
+        return self._current
+
+    # ---- queries ----
+
+    def _connection(self):
+        """A DuckDB cursor for this thread on the current snapshot's views."""
+        meta = self._load_meta()
+        if meta is None:
+            raise RuntimeError("No columnar history snapshot")
+        local = self._local
+        if getattr(local, 'name', None) != meta['name'] or local.pid != os.getpid():
+            with self._db_lock:
+                if self._db_name != meta['name'] or self._db_pid != os.getpid():
+                    db = duckdb.connect()
+                    path = os.path.join(self.directory, meta['name'])
+                    for table, (stem, _, _) in TABLES.items():
+                        db.execute(f"CREATE VIEW {table} AS SELECT * FROM read_parquet("
+                                   f"{_quote(os.path.join(path, stem + '.parquet'))})")
+                    self._db, self._db_name, self._db_pid = db, meta['name'], os.getpid()
+                # DuckDB connections are not thread-safe; cursors on one database are
+                local.cursor = self._db.cursor()
+                local.name, local.pid = meta['name'], os.getpid()
+        return local.cursor
+
+    def fetchall(self, query, params=()):
+        """Rows (dicts) of a MySQL-dialect query over the snapshot."""
+        cursor = self._connection()
+        cursor.execute(query.replace('%s', '?'), list(params))
+        columns = [d[0] for d in cursor.description]
+        self.stats['queries'] += 1
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    # ---- refresh ----
+
+    def due(self):
+        meta = self._load_meta()
+        return meta is None or time.time() - meta['created'] >= self.refresh_interval
+
+    def refresh(self, connection):
+        """Copy rows dated before today - recent_days from `connection` (MySQL) and publish them."""
+        t0 = time.perf_counter()
+        cutoff = (date.today() - timedelta(days=self.recent_days)).isoformat()
+        name = f"snapshot-{int(time.time())}-{uuid.uuid4().hex[:8]}"
+        path = os.path.join(self.directory, name)
+        os.makedirs(path, exist_ok=True)
+        meta = {'name': name, 'cutoff': cutoff, 'created': time.time(), 'rows': {}}
+        cursor = connection.cursor()
+        try:
+            for table, (stem, query, columns) in TABLES.items():
+                cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+                max_id = int(cursor.fetchone()[0])
+                meta['activity_max_id' if table == 'activity_data' else 'human_max_id'] = max_id
+                cursor.execute(query, (cutoff, max_id))
+                meta['rows'][table] = self._write_parquet(cursor, os.path.join(path, stem), columns)
+        except Exception:
+            shutil.rmtree(path, ignore_errors=True)
+            raise
+        finally:
+            cursor.close()
+        connection.commit()  # end the read snapshot
+
+        with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        tmp = os.path.join(self.directory, f"current.json.{os.getpid()}.tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(self.directory, 'current.json'))
+        self._prune(keep=name)
+        self.stats['refreshes'] += 1
+        self.stats['last_refresh_ms'] = round((time.perf_counter() - t0) * 1000, 2)
+        logger.info(f"Columnar history snapshot {name}: {meta['rows']} rows before {cutoff} "
+                    f"in {self.stats['last_refresh_ms']} ms")
+        return meta
+
+    def _write_parquet(self, cursor, stem, columns):
+        """Stream the cursor's rows through a CSV file into `<stem>.parquet`; returns the row count."""
+        count = 0
+        with open(stem + '.csv', 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            while True:
+                rows = cursor.fetchmany(FETCH_ROWS)
+                if not rows:
+                    break
+                writer.writerows(rows)
+                count += len(rows)
+        types = ', '.join(f"'{column}': '{kind}'" for column, kind in columns.items())
+        db = duckdb.connect()
+        try:
+            # No dialect sniffing: it fails on an empty file
+            db.execute(f"COPY (SELECT * FROM read_csv({_quote(stem + '.csv')}, auto_detect = false, "
+                       f"header = false, delim = ',', quote = '\"', escape = '\"', columns = {{{types}}}) "
+                       f"ORDER BY date) TO {_quote(stem + '.parquet')} (FORMAT PARQUET, COMPRESSION ZSTD)")
+        finally:
+            db.close()
+            os.remove(stem + '.csv')
+        return count
+
+    def _prune(self, keep):
+        """Remove snapshots older than the previous one (queries may still be reading it)."""
+        names = sorted((n for n in os.listdir(self.directory) if n.startswith('snapshot-')),
+                       key=lambda n: int(n.split('-')[1]))
+        for name in [n for n in names if n != keep][:-1]:
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def refresh_if_due(self, connect, force=False):
+        """
+        Refresh unless another worker is doing it or just did (force=True waits for it, then
+        refreshes anyway); `connect` returns a MySQL connection. Returns the new snapshot's meta or None.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, 'refresh.lock'), 'a') as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX if force else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return None
+            try:
+                if not force and not self.due():
+                    return None
+                connection = connect()
+                if not connection:
+                    raise RuntimeError("no database connection")
+                try:
+                    return self.refresh(connection)
+                finally:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def start(self, connect, poll_interval=60.0):
+        """Keep the snapshot refreshed from a background thread (one per worker process)."""
+        if self._thread_pid == os.getpid():
+            return
+        self._thread_pid = os.getpid()
+
+        def loop():
+            while True:
+                try:
+                    self.refresh_if_due(connect)
+                except Exception as e:
+                    self.stats['refresh_failures'] += 1
+                    logger.warning(f"Columnar history refresh failed: {e}")
+                self._wake.wait(min(poll_interval, self.refresh_interval))
+                self._wake.clear()
+
+        threading.Thread(target=loop, name='columnar-history', daemon=True).start()
+
+    def snapshot(self):
+        meta = self._load_meta()
+        return dict(self.stats, directory=self.directory, recent_days=self.recent_days,
+                    refresh_interval_seconds=self.refresh_interval,
+                    current=None if meta is None else {k: meta[k] for k in ('name', 'cutoff', 'created', 'rows')})
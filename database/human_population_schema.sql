@@ -3,12 +3,14 @@
 
 CREATE TABLE IF NOT EXISTS human_population (
     id INT AUTO_INCREMENT PRIMARY KEY,
+    site_code VARCHAR(64) NOT NULL DEFAULT 'main',
     date DATE NOT NULL,
     student_count INT NOT NULL,
     staff_count INT NOT NULL,
     total_count INT GENERATED ALWAYS AS (student_count + staff_count) STORED,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    UNIQUE KEY unique_date (date)
+    -- One headcount per site per day
+    UNIQUE KEY unique_site_date (site_code, date)
 );
 
 -- Add human CO2 emission factor
@@ -19,3 +21,14 @@ INSERT INTO emission_factors (source_type, factor, factor_unit) VALUES
 ON DUPLICATE KEY UPDATE
     factor = VALUES(factor),
     factor_unit = VALUES(factor_unit);
+
+-- Tell running app workers to reload their cached emission factors
+CREATE TABLE IF NOT EXISTS cache_versions (
+    name VARCHAR(100) PRIMARY KEY,
+    version INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+INSERT INTO cache_versions (name, version) VALUES ('emission_factors', 1)
+ON DUPLICATE KEY UPDATE
+    version = version + 1;
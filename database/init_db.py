@@ -1,32 +1,28 @@
-import mysql.connector
-from mysql.connector import errorcode
 import os
+import sys
 from dotenv import load_dotenv
 
+# Run from the repository root: python database/init_db.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db_backends
+
 # Load environment variables from .env file
 load_dotenv()
 
-# Database Configuration
-DB_CONFIG = {
-    'host': os.environ.get('DB_HOST', 'localhost'),
-    'user': os.environ.get('DB_USER', 'root'),
-    'password': os.environ.get('DB_PASSWORD', ''),
-    'database': os.environ.get('DB_NAME', 'campus_carbon'),
-    'port': int(os.environ.get('DB_PORT', 3306)),
-    'autocommit': False,
-}
+# Database backend (DB_BACKEND=mysql or sqlite, DB_* settings)
+backend = db_backends.from_env()
 
 def init_database():
     """Initializes database schema, admin account, and sample data."""
     try:
-        # Connect to MySQL
-        connection = mysql.connector.connect(**DB_CONFIG)
+        connection = backend.connect()
         cursor = connection.cursor()
-        print("📘 Connected to MySQL successfully!")
+        print(f"📘 Connected to {backend.name} successfully!")
 
         # Step 1: Read and execute schema file
-        print("📄 Reading schema file...")
-        with open('database/schema.sql', 'r', encoding='utf-8') as f:
+        schema_file = db_backends.SCHEMA_FILES[backend.name]
+        print(f"📄 Reading schema file {schema_file}...")
+        with open(schema_file, 'r', encoding='utf-8') as f:
             sql_script = f.read()
 
         # Execute schema statements manually
@@ -124,13 +120,15 @@ def init_database():
         connection.close()
         print("🎯 Database initialization completed successfully!")
 
-    except mysql.connector.Error as err:
-        if err.errno == errorcode.ER_ACCESS_DENIED_ERROR:
+    except backend.Error as err:
+        # mysql.connector error numbers (ER_ACCESS_DENIED_ERROR, ER_BAD_DB_ERROR)
+        errno = getattr(err, 'errno', None)
+        if errno == 1045:
             print("❌ Incorrect MySQL username or password.")
-        elif err.errno == errorcode.ER_BAD_DB_ERROR:
+        elif errno == 1049:
             print("❌ Database not found.")
         else:
-            print(f"❌ MySQL Error: {err}")
+            print(f"❌ Database Error: {err}")
     except Exception as e:
         print(f"❌ General Error: {e}")
 
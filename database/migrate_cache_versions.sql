@@ -0,0 +1,16 @@
+-- Adds the version counters app workers poll to an existing database. Run once, before
+-- the other migrations that bump a version (migrate_factor_validity.sql):
+--   mysql -u root -p campus_carbon < database/migrate_cache_versions.sql
+
+-- Version counters for data cached in the app process (e.g. emission factors).
+-- Bump a row after editing the underlying table so running workers reload it.
+-- `activity_data` is bumped after every ingest write (live updates in other workers).
+CREATE TABLE IF NOT EXISTS cache_versions (
+    name VARCHAR(100) PRIMARY KEY,
+    version INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+INSERT INTO cache_versions (name, version) VALUES ('emission_factors', 1)
+ON DUPLICATE KEY UPDATE
+    version = version + 1;
@@ -0,0 +1,23 @@
+-- Makes emission factors effective-dated on an existing database. Existing factors
+-- become open-ended periods covering all dates, so results do not change. Run once:
+--   mysql -u root -p campus_carbon < database/migrate_factor_validity.sql
+-- Then record a new factor from a date on with
+--   python add_emission_factor.py electricity 0.65 kg_co2e_per_kwh --valid-from 2025-01-01
+
+-- The version table (as in migrate_cache_versions.sql), so the bump below cannot fail halfway
+CREATE TABLE IF NOT EXISTS cache_versions (
+    name VARCHAR(100) PRIMARY KEY,
+    version INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+ALTER TABLE emission_factors
+    ADD COLUMN valid_from DATE NOT NULL DEFAULT '1000-01-01' AFTER factor_unit,
+    ADD COLUMN valid_to DATE NULL AFTER valid_from,
+    DROP INDEX source_type,
+    ADD UNIQUE KEY unique_source_valid_from (source_type, valid_from);
+
+-- Tell running app workers to reload their cached emission factors
+INSERT INTO cache_versions (name, version) VALUES ('emission_factors', 1)
+ON DUPLICATE KEY UPDATE
+    version = version + 1;
@@ -0,0 +1,10 @@
+-- Adds the replay bookkeeping table for the ingest spool to an existing database. Run once:
+--   mysql -u root -p campus_carbon < database/migrate_ingest_spool.sql
+
+-- Ids of spooled ingest records already replayed (spool.py), so a replay that was
+-- interrupted after its commit is not applied twice. Pruned after SPOOL_DEDUP_DAYS.
+CREATE TABLE IF NOT EXISTS ingest_spool_applied (
+    id CHAR(32) PRIMARY KEY,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_spool_applied_at (applied_at)
+);
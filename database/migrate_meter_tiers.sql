@@ -0,0 +1,31 @@
+-- Adds the raw and hourly tiers for smart-meter readings to an existing database.
+-- Readings ingested before this migration stay in activity_data (the daily tier). Run once:
+--   mysql -u root -p campus_carbon < database/migrate_meter_tiers.sql
+
+-- Sub-daily smart-meter readings (POST /api/ingest/readings), kept RAW_RETENTION_DAYS.
+-- The compactor sums them into meter_readings_hourly and sets rolled_up = 1.
+-- Daily sums go straight to activity_data at ingest.
+CREATE TABLE IF NOT EXISTS meter_readings (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    site_code VARCHAR(64) NOT NULL DEFAULT 'main',
+    reading_time DATETIME NOT NULL,
+    source_type VARCHAR(100) NOT NULL,
+    raw_value DOUBLE NOT NULL,
+    unit VARCHAR(50) NOT NULL,
+    rolled_up TINYINT(1) NOT NULL DEFAULT 0,
+    KEY idx_readings_site_time (site_code, reading_time),
+    KEY idx_readings_time (reading_time),
+    KEY idx_readings_pending (rolled_up, id)
+);
+
+-- Hourly rollup of meter_readings, kept HOURLY_RETENTION_MONTHS
+CREATE TABLE IF NOT EXISTS meter_readings_hourly (
+    site_code VARCHAR(64) NOT NULL,
+    hour DATETIME NOT NULL,
+    source_type VARCHAR(100) NOT NULL,
+    unit VARCHAR(50) NOT NULL,
+    raw_total DOUBLE NOT NULL,
+    reading_count INT NOT NULL,
+    PRIMARY KEY (site_code, hour, source_type),
+    KEY idx_hourly_hour (hour)
+);
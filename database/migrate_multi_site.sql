@@ -0,0 +1,22 @@
+-- Adds the site (campus/building) dimension to an existing single-site database.
+-- Existing rows are assigned to the 'main' site. Run once:
+--   mysql -u root -p campus_carbon < database/migrate_multi_site.sql
+
+CREATE TABLE IF NOT EXISTS sites (
+    code VARCHAR(64) PRIMARY KEY,
+    name VARCHAR(200) NOT NULL,
+    campus VARCHAR(100) NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT IGNORE INTO sites (code, name, campus) VALUES ('main', 'Main campus', 'main');
+
+ALTER TABLE activity_data
+    ADD COLUMN site_code VARCHAR(64) NOT NULL DEFAULT 'main' AFTER id,
+    ADD KEY idx_activity_site_date (site_code, date, source_type, raw_value),
+    ADD KEY idx_activity_date (date, source_type, raw_value);
+
+ALTER TABLE human_population
+    ADD COLUMN site_code VARCHAR(64) NOT NULL DEFAULT 'main' AFTER id,
+    DROP INDEX unique_date,
+    ADD UNIQUE KEY unique_site_date (site_code, date);
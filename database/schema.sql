@@ -4,19 +4,77 @@ CREATE TABLE IF NOT EXISTS users (
     password VARCHAR(255) NOT NULL
 );
 
+-- Sites (campuses / buildings). Data rows reference a site by code, `campus` groups
+-- buildings for display.
+CREATE TABLE IF NOT EXISTS sites (
+    code VARCHAR(64) PRIMARY KEY,
+    name VARCHAR(200) NOT NULL,
+    campus VARCHAR(100) NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT IGNORE INTO sites (code, name, campus) VALUES ('main', 'Main campus', 'main');
+
 CREATE TABLE IF NOT EXISTS activity_data (
     id INT AUTO_INCREMENT PRIMARY KEY,
+    site_code VARCHAR(64) NOT NULL DEFAULT 'main',
     date DATE NOT NULL,
     source_type VARCHAR(100) NOT NULL,
     raw_value FLOAT NOT NULL,
-    unit VARCHAR(50) NOT NULL
+    unit VARCHAR(50) NOT NULL,
+    -- Cover the grouped SUM(raw_value) queries: per-site filters use the site-leading
+    -- index, all-site date ranges the date-leading one (MySQL does not skip-scan for GROUP BY)
+    KEY idx_activity_site_date (site_code, date, source_type, raw_value),
+    KEY idx_activity_date (date, source_type, raw_value)
+);
+
+-- Sub-daily smart-meter readings (POST /api/ingest/readings), kept RAW_RETENTION_DAYS.
+-- The compactor sums them into meter_readings_hourly and sets rolled_up = 1.
+-- Daily sums go straight to activity_data at ingest.
+CREATE TABLE IF NOT EXISTS meter_readings (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    site_code VARCHAR(64) NOT NULL DEFAULT 'main',
+    reading_time DATETIME NOT NULL,
+    source_type VARCHAR(100) NOT NULL,
+    raw_value DOUBLE NOT NULL,
+    unit VARCHAR(50) NOT NULL,
+    rolled_up TINYINT(1) NOT NULL DEFAULT 0,
+    KEY idx_readings_site_time (site_code, reading_time),
+    KEY idx_readings_time (reading_time),
+    KEY idx_readings_pending (rolled_up, id)
+);
+
+-- Hourly rollup of meter_readings, kept HOURLY_RETENTION_MONTHS
+CREATE TABLE IF NOT EXISTS meter_readings_hourly (
+    site_code VARCHAR(64) NOT NULL,
+    hour DATETIME NOT NULL,
+    source_type VARCHAR(100) NOT NULL,
+    unit VARCHAR(50) NOT NULL,
+    raw_total DOUBLE NOT NULL,
+    reading_count INT NOT NULL,
+    PRIMARY KEY (site_code, hour, source_type),
+    KEY idx_hourly_hour (hour)
+);
+
+-- Ids of spooled ingest records already replayed (spool.py), so a replay that was
+-- interrupted after its commit is not applied twice. Pruned after SPOOL_DEDUP_DAYS.
+CREATE TABLE IF NOT EXISTS ingest_spool_applied (
+    id CHAR(32) PRIMARY KEY,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_spool_applied_at (applied_at)
 );
 
+-- One row per source and validity period: the factor applies from valid_from through
+-- valid_to (NULL = still in effect). Periods of a source must not overlap; add new ones
+-- with `python add_emission_factor.py SOURCE FACTOR UNIT --valid-from YYYY-MM-DD`.
 CREATE TABLE IF NOT EXISTS emission_factors (
     id INT AUTO_INCREMENT PRIMARY KEY,
-    source_type VARCHAR(100) UNIQUE NOT NULL,
+    source_type VARCHAR(100) NOT NULL,
     factor FLOAT NOT NULL,
-    factor_unit VARCHAR(50) NOT NULL
+    factor_unit VARCHAR(50) NOT NULL,
+    valid_from DATE NOT NULL DEFAULT '1000-01-01',
+    valid_to DATE NULL,
+    UNIQUE KEY unique_source_valid_from (source_type, valid_from)
 );
 
 INSERT INTO emission_factors (source_type, factor, factor_unit) VALUES
@@ -27,3 +85,16 @@ INSERT INTO emission_factors (source_type, factor, factor_unit) VALUES
 ON DUPLICATE KEY UPDATE
     factor = VALUES(factor),
     factor_unit = VALUES(factor_unit);
+
+-- Version counters for data cached in the app process (e.g. emission factors).
+-- Bump a row after editing the underlying table so running workers reload it.
+-- `activity_data` is bumped by every ingest write (live updates in other workers).
+CREATE TABLE IF NOT EXISTS cache_versions (
+    name VARCHAR(100) PRIMARY KEY,
+    version INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+INSERT INTO cache_versions (name, version) VALUES ('emission_factors', 1)
+ON DUPLICATE KEY UPDATE
+    version = version + 1;
@@ -0,0 +1,109 @@
+-- SQLite version of schema.sql + human_population_schema.sql (DB_BACKEND=sqlite).
+-- Created by `DB_BACKEND=sqlite python database/init_db.py`. Keep it in step with the MySQL files.
+-- DATE / DATETIME / TIMESTAMP column types are kept so values read back as date/datetime.
+
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username VARCHAR(100) UNIQUE NOT NULL,
+    password VARCHAR(255) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS sites (
+    code VARCHAR(64) PRIMARY KEY,
+    name VARCHAR(200) NOT NULL,
+    campus VARCHAR(100) NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT OR IGNORE INTO sites (code, name, campus) VALUES ('main', 'Main campus', 'main');
+
+CREATE TABLE IF NOT EXISTS activity_data (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    site_code VARCHAR(64) NOT NULL DEFAULT 'main',
+    date DATE NOT NULL,
+    source_type VARCHAR(100) NOT NULL,
+    raw_value REAL NOT NULL,
+    unit VARCHAR(50) NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_activity_site_date ON activity_data (site_code, date, source_type, raw_value);
+
+-- All-site date ranges need a date-leading index (no skip scan for grouped range reads)
+CREATE INDEX IF NOT EXISTS idx_activity_date ON activity_data (date, source_type, raw_value);
+
+CREATE TABLE IF NOT EXISTS meter_readings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    site_code VARCHAR(64) NOT NULL DEFAULT 'main',
+    reading_time DATETIME NOT NULL,
+    source_type VARCHAR(100) NOT NULL,
+    raw_value REAL NOT NULL,
+    unit VARCHAR(50) NOT NULL,
+    rolled_up INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_readings_site_time ON meter_readings (site_code, reading_time);
+
+CREATE INDEX IF NOT EXISTS idx_readings_time ON meter_readings (reading_time);
+
+CREATE INDEX IF NOT EXISTS idx_readings_pending ON meter_readings (rolled_up, id);
+
+CREATE TABLE IF NOT EXISTS meter_readings_hourly (
+    site_code VARCHAR(64) NOT NULL,
+    hour DATETIME NOT NULL,
+    source_type VARCHAR(100) NOT NULL,
+    unit VARCHAR(50) NOT NULL,
+    raw_total REAL NOT NULL,
+    reading_count INTEGER NOT NULL,
+    PRIMARY KEY (site_code, hour, source_type)
+);
+
+CREATE INDEX IF NOT EXISTS idx_hourly_hour ON meter_readings_hourly (hour);
+
+CREATE TABLE IF NOT EXISTS ingest_spool_applied (
+    id CHAR(32) PRIMARY KEY,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_spool_applied_at ON ingest_spool_applied (applied_at);
+
+-- Effective-dated: valid_from through valid_to (NULL = still in effect)
+CREATE TABLE IF NOT EXISTS emission_factors (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source_type VARCHAR(100) NOT NULL,
+    factor REAL NOT NULL,
+    factor_unit VARCHAR(50) NOT NULL,
+    valid_from DATE NOT NULL DEFAULT '1000-01-01',
+    valid_to DATE NULL,
+    UNIQUE (source_type, valid_from)
+);
+
+INSERT INTO emission_factors (source_type, factor, factor_unit) VALUES
+('electricity', 0.708, 'kg_co2e_per_kwh'),
+('bus_diesel', 2.68, 'kg_co2e_per_liter'),
+('canteen_lpg', 2.93, 'kg_co2e_per_kg'),
+('waste_landfill', 1.25, 'kg_co2e_per_kg'),
+('human_daily', 1.0, 'kg_co2e_per_person_per_day')
+ON CONFLICT (source_type, valid_from) DO UPDATE SET
+    factor = excluded.factor,
+    factor_unit = excluded.factor_unit;
+
+CREATE TABLE IF NOT EXISTS cache_versions (
+    name VARCHAR(100) PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO cache_versions (name, version) VALUES ('emission_factors', 1)
+ON CONFLICT (name) DO UPDATE SET
+    version = version + 1;
+
+CREATE TABLE IF NOT EXISTS human_population (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    site_code VARCHAR(64) NOT NULL DEFAULT 'main',
+    date DATE NOT NULL,
+    student_count INTEGER NOT NULL,
+    staff_count INTEGER NOT NULL,
+    total_count INTEGER GENERATED ALWAYS AS (student_count + staff_count) STORED,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (site_code, date)
+);
@@ -0,0 +1,258 @@
+"""
+Database backends: MySQL (default) or a single SQLite file.
+
+The app's SQL is written once, in the MySQL dialect with %s placeholders, and
+runs on either engine. The few statements that cannot be written portably go
+through the backend's SQL helpers instead of being hardcoded:
+
+- upsert(): ON DUPLICATE KEY UPDATE / ON CONFLICT ... DO UPDATE
+- strftime(): DATE_FORMAT() / strftime() for time buckets
+- delete_limited(): DELETE ... LIMIT (SQLite has no LIMIT on DELETE by default)
+- select_for_update(): SELECT ... FOR UPDATE / BEGIN IMMEDIATE
+
+SQLite connections are wrapped to look like mysql.connector ones: cursor(dictionary=True),
+%s parameters, DATE/DATETIME columns read back as date/datetime. Use it for CI,
+benchmarks and single-building deployments; DB_BACKEND=sqlite selects it and
+DB_PATH names the file (created by `python database/init_db.py`).
+"""
+import logging
+import os
+import re
+import sqlite3
+from datetime import date, datetime
+from decimal import Decimal
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('mysql', 'sqlite')
+
+SCHEMA_FILES = {
+    'mysql': 'database/schema.sql',
+    'sqlite': 'database/schema_sqlite.sql',
+}
+
+
+def _escape(sql):
+    """Literal % for a statement that is run with parameters."""
+    return sql.replace('%', '%%')
+
+
+class MySQLDialect:
+    """SQL for statements that differ between engines (MySQL syntax)."""
+    name = 'mysql'
+
+    def upsert(self, table, columns, keys, replace=(), add=()):
+        """INSERT of one row that updates `replace` columns (new value) and `add` columns (old + new) on a key clash."""
+        updates = [f"{c} = VALUES({c})" for c in replace] + [f"{c} = {c} + VALUES({c})" for c in add]
+        return (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+                f" ON DUPLICATE KEY UPDATE {', '.join(updates)}")
+
+    def upsert_select(self, table, columns, keys, select, replace=(), add=()):
+        """Like upsert() for INSERT ... SELECT `select`."""
+        updates = [f"{c} = VALUES({c})" for c in replace] + [f"{c} = {c} + VALUES({c})" for c in add]
+        return f"INSERT INTO {table} ({', '.join(columns)}) {select} ON DUPLICATE KEY UPDATE {', '.join(updates)}"
+
+    def strftime(self, pattern, column):
+        """SQL formatting datetime `column` with a Python strftime `pattern` (%Y %m %d %H %M %S)."""
+        mysql_pattern = pattern.replace('%M', '%i').replace('%S', '%s')
+        return f"DATE_FORMAT({column}, '{_escape(mysql_pattern)}')"
+
+    def delete_limited(self, table, where):
+        """DELETE of at most %s rows (the last parameter) matching `where`."""
+        return f"DELETE FROM {table} WHERE {where} LIMIT %s"
+
+    def select_for_update(self, cursor, query, params=()):
+        """Run a SELECT whose rows stay locked against other writers until commit/rollback."""
+        cursor.execute(f"{query} FOR UPDATE", params)
+
+
+class MySQLBackend(MySQLDialect):
+    def __init__(self, config, pool_size=0):
+        import mysql.connector
+        self._connector = mysql.connector
+        self.config = config
+        self.Error = mysql.connector.Error
+        self.IntegrityError = mysql.connector.IntegrityError
+        self.pool = None
+        if pool_size:
+            try:
+                from mysql.connector import pooling
+                self.pool = pooling.MySQLConnectionPool(pool_name="mypool", pool_size=pool_size, **config)
+                logger.info("MySQL connection pool created.")
+            except Exception as e:
+                logger.warning(f"Could not create connection pool; will use single connections. Reason: {e}")
+
+    def connect(self, pooled=True):
+        if self.pool and pooled:
+            return self.pool.get_connection()
+        return self._connector.connect(**self.config)
+
+    def pool_usage(self):
+        """(size, in use) of the pool, or None without one."""
+        if not self.pool:
+            return None
+        # mysql.connector keeps idle pooled connections in a queue
+        idle_queue = getattr(self.pool, '_cnx_queue', None)
+        in_use = None if idle_queue is None else self.pool.pool_size - idle_queue.qsize()
+        return self.pool.pool_size, in_use
+
+
+# ---- SQLite ----
+
+_PLACEHOLDER = re.compile(r'%([s%])')
+
+sqlite3.register_adapter(Decimal, float)
+sqlite3.register_adapter(date, date.isoformat)
+# MySQL DATETIME keeps whole seconds; so do we, and the text sorts like the column
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' ', 'seconds'))
+sqlite3.register_converter('DATE', lambda value: date.fromisoformat(value.decode()[:10]))
+sqlite3.register_converter('DATETIME', lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.fromisoformat(value.decode()))
+
+
+def _sqlite_sql(query, params):
+    # Like mysql.connector, %s/%% are only interpreted when parameters are given
+    if params is None:
+        return query
+    return _PLACEHOLDER.sub(lambda m: '?' if m.group(1) == 's' else '%', query)
+
+
+class SQLiteCursor:
+    """mysql.connector-style cursor over sqlite3 (%s params, optional dict rows)."""
+
+    def __init__(self, connection, dictionary=False):
+        self._connection = connection
+        self._cursor = connection.cursor()
+        self._dictionary = dictionary
+
+    def execute(self, query, params=None):
+        self._cursor.execute(_sqlite_sql(query, params), tuple(params or ()))
+
+    def executemany(self, query, seq_of_params):
+        self._cursor.executemany(_sqlite_sql(query, ()), [tuple(p) for p in seq_of_params])
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return {column[0]: value for column, value in zip(self._cursor.description, row)}
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def fetchmany(self, size=1):
+        return [self._row(row) for row in self._cursor.fetchmany(size)]
+
+    def __iter__(self):
+        return (self._row(row) for row in self._cursor)
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def in_transaction(self):
+        return self._connection.in_transaction
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self, dictionary=False, buffered=None):
+        # Rows are always read lazily; `buffered` is accepted for mysql.connector compatibility
+        return SQLiteCursor(self._connection, dictionary)
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def close(self):
+        self._connection.close()
+
+
+class SQLiteDialect:
+    """The same statements in SQLite syntax (3.24+ for upserts)."""
+    name = 'sqlite'
+
+    def _on_conflict(self, keys, replace, add):
+        updates = [f"{c} = excluded.{c}" for c in replace] + [f"{c} = {c} + excluded.{c}" for c in add]
+        return f" ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {', '.join(updates)}"
+
+    def upsert(self, table, columns, keys, replace=(), add=()):
+        return (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+                + self._on_conflict(keys, replace, add))
+
+    def upsert_select(self, table, columns, keys, select, replace=(), add=()):
+        # `select` needs a WHERE clause, or SQLite reads ON CONFLICT as a join constraint
+        return f"INSERT INTO {table} ({', '.join(columns)}) {select}" + self._on_conflict(keys, replace, add)
+
+    def strftime(self, pattern, column):
+        return f"strftime('{_escape(pattern)}', {column})"
+
+    def delete_limited(self, table, where):
+        return f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {where} LIMIT %s)"
+
+    def select_for_update(self, cursor, query, params=()):
+        # SQLite locks the whole database: take the write lock before reading
+        if not cursor.in_transaction:
+            cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute(query, params)
+
+
+class SQLiteBackend(SQLiteDialect):
+    Error = sqlite3.Error
+    IntegrityError = sqlite3.IntegrityError
+    pool = None
+
+    def __init__(self, path, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+
+    def connect(self, pooled=True):
+        # Opening a file is cheap, so there is no pool: `pooled` is ignored
+        connection = sqlite3.connect(self.path, timeout=self.timeout, detect_types=sqlite3.PARSE_DECLTYPES,
+                                     check_same_thread=False)
+        # Readers do not block the writer (and vice versa) across worker processes
+        connection.execute('PRAGMA journal_mode = WAL')
+        connection.execute('PRAGMA synchronous = NORMAL')
+        return SQLiteConnection(connection)
+
+    def pool_usage(self):
+        return None
+
+
+def mysql_config():
+    return {
+        'host': os.environ.get('DB_HOST', 'localhost'),
+        'user': os.environ.get('DB_USER', 'root'),
+        'password': os.environ.get('DB_PASSWORD'),
+        'database': os.environ.get('DB_NAME', 'campus_carbon'),
+        'port': int(os.environ.get('DB_PORT', 3306)),
+    }
+
+
+def from_env(pool_size=0):
+    """The backend named by DB_BACKEND (mysql or sqlite) configured from the DB_* variables."""
+    name = os.environ.get('DB_BACKEND', 'mysql').lower()
+    if name == 'sqlite':
+        return SQLiteBackend(os.environ.get('DB_PATH', 'campus_carbon.db'),
+                             timeout=float(os.environ.get('DB_TIMEOUT_SECONDS', 30)))
+    if name == 'mysql':
+        return MySQLBackend(mysql_config(), pool_size=pool_size)
+    raise ValueError(f"DB_BACKEND must be one of {', '.join(BACKENDS)}, not {name!r}")
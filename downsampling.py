@@ -0,0 +1,189 @@
+"""
+Tiered retention for sub-daily meter readings.
+
+Readings posted to /api/ingest/readings are stored at three resolutions:
+- raw: `meter_readings`, one row per reading, kept `raw_days` days.
+- hourly: `meter_readings_hourly`, sums per site/hour/source, kept `hourly_months` months.
+- daily: `activity_data`, kept forever. Ingest writes the per-day sums there in the
+  same transaction as the raw rows, so every existing day-level query stays current.
+
+The Compactor rolls raw rows that are not yet `rolled_up` into the hourly tier
+(additive upsert, so late readings for an old hour are fine) and then deletes
+rows that have aged out of their tier. Rows are claimed with SELECT ... FOR UPDATE
+(a write lock on SQLite), so compactors in several workers never count a reading twice.
+
+RetentionPolicy.choose_tier() picks the coarsest tier that still has data for a
+window at the requested granularity.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import db_backends
+
+logger = logging.getLogger(__name__)
+
+# Finest to coarsest: (tier, bucket granularity it can serve)
+TIERS = ('raw', 'hourly', 'daily')
+GRANULARITIES = {'raw': 0, 'hour': 1, 'day': 2}
+
+
+def months_before(moment, months):
+    """`moment` shifted back by whole calendar months (day clamped to the month's end)."""
+    month_index = moment.year * 12 + moment.month - 1 - months
+    year, month = divmod(month_index, 12)
+    month += 1
+    next_month = datetime(year + (month == 12), month % 12 + 1, 1)
+    last_day = (next_month - datetime(year, month, 1)).days
+    return moment.replace(year=year, month=month, day=min(moment.day, last_day))
+
+
+class RetentionPolicy:
+    def __init__(self, raw_days=14, hourly_months=13):
+        self.raw_days = raw_days
+        self.hourly_months = hourly_months
+
+    def cutoffs(self, now=None):
+        """{tier: oldest timestamp still kept} (None = kept forever)."""
+        now = now or datetime.now()
+        return {
+            'raw': datetime.fromordinal(now.toordinal() - self.raw_days),
+            'hourly': months_before(datetime(now.year, now.month, now.day), self.hourly_months),
+            'daily': None,
+        }
+
+    def choose_tier(self, granularity, start_dt, now=None):
+        """
+        Coarsest tier whose buckets are no wider than `granularity` ('raw', 'hour' or
+        'day') and whose retention reaches back to `start_dt`. Raises ValueError when
+        no tier qualifies (e.g. hourly data for a window older than hourly retention).
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError("granularity must be 'day', 'hour' or 'raw'")
+        cutoffs = self.cutoffs(now)
+        wanted = GRANULARITIES[granularity]
+        for level, tier in reversed(list(enumerate(TIERS))):
+            if level > wanted:
+                continue
+            if cutoffs[tier] is None or start_dt >= cutoffs[tier]:
+                return tier
+        kept = f"{self.raw_days} days" if granularity == 'raw' else f"{self.hourly_months} months"
+        raise ValueError(f"{granularity} granularity is only kept for {kept}; shorten the window")
+
+
+class Compactor:
+    """Builds the hourly tier and enforces retention, in batches of `batch_size` rows."""
+
+    def __init__(self, connect, policy, interval=60.0, batch_size=10000, dialect=None):
+        # connect() returns a new DB connection (closed after each pass); dialect: its SQL (db_backends)
+        self.connect = connect
+        self.dialect = dialect or db_backends.MySQLDialect()
+        self.policy = policy
+        self.interval = interval
+        self.batch_size = batch_size
+        self.stats = {'runs': 0, 'rolled_up': 0, 'raw_deleted': 0, 'hourly_deleted': 0,
+                      'failures': 0, 'last_run': None, 'last_ms': 0.0}
+        self._lock = threading.Lock()
+        self._thread_pid = None
+
+    def _roll_up_batch(self, connection):
+        """Move one batch of pending raw rows into the hourly tier; returns the row count."""
+        cursor = connection.cursor()
+        try:
+            self.dialect.select_for_update(
+                cursor, "SELECT id FROM meter_readings WHERE rolled_up = 0 ORDER BY id LIMIT %s",
+                (self.batch_size,)
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                connection.rollback()
+                return 0
+            placeholders = ', '.join(['%s'] * len(ids))
+            hour = self.dialect.strftime('%Y-%m-%d %H:00:00', 'reading_time')
+            cursor.execute(self.dialect.upsert_select(
+                'meter_readings_hourly', ('site_code', 'hour', 'source_type', 'unit', 'raw_total', 'reading_count'),
+                keys=('site_code', 'hour', 'source_type'),
+                select=f"""SELECT site_code, {hour}, source_type, MIN(unit), SUM(raw_value), COUNT(*)
+                           FROM meter_readings
+                           WHERE id IN ({placeholders})
+                           GROUP BY site_code, {hour}, source_type""",
+                add=('raw_total', 'reading_count')), ids)
+            cursor.execute(f"UPDATE meter_readings SET rolled_up = 1 WHERE id IN ({placeholders})", ids)
+            connection.commit()
+            return len(ids)
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def _expire(self, connection, sql, cutoff):
+        """Delete expired rows in batches; returns the number removed."""
+        removed = 0
+        cursor = connection.cursor()
+        try:
+            while True:
+                cursor.execute(sql, (cutoff, self.batch_size))
+                connection.commit()
+                removed += cursor.rowcount
+                if cursor.rowcount < self.batch_size:
+                    return removed
+        finally:
+            cursor.close()
+
+    def run_once(self, now=None):
+        """One full pass: roll up everything pending, then apply retention. Returns counts."""
+        with self._lock:
+            t0 = time.perf_counter()
+            connection = self.connect()
+            if connection is None:
+                self.stats['failures'] += 1
+                raise RuntimeError('Database connection error')
+            try:
+                rolled = 0
+                while True:
+                    count = self._roll_up_batch(connection)
+                    rolled += count
+                    if count < self.batch_size:
+                        break
+                cutoffs = self.policy.cutoffs(now)
+                # Only rows already in the hourly tier may leave the raw tier
+                raw_deleted = self._expire(
+                    connection, self.dialect.delete_limited('meter_readings', 'rolled_up = 1 AND reading_time < %s'),
+                    cutoffs['raw'])
+                hourly_deleted = self._expire(
+                    connection, self.dialect.delete_limited('meter_readings_hourly', 'hour < %s'),
+                    cutoffs['hourly'])
+            except Exception:
+                self.stats['failures'] += 1
+                raise
+            finally:
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+            result = {'rolled_up': rolled, 'raw_deleted': raw_deleted, 'hourly_deleted': hourly_deleted}
+            for key, value in result.items():
+                self.stats[key] += value
+            self.stats['runs'] += 1
+            self.stats['last_run'] = datetime.now().isoformat(timespec='seconds')
+            self.stats['last_ms'] = round((time.perf_counter() - t0) * 1000, 2)
+            return result
+
+    def start(self):
+        """Background pass every `interval` seconds; starts once per worker process."""
+        if self.interval <= 0 or self._thread_pid == os.getpid():
+            return
+        self._thread_pid = os.getpid()
+
+        def loop():
+            while True:
+                time.sleep(self.interval)
+                try:
+                    self.run_once()
+                except Exception:
+                    logger.exception("Meter reading compaction failed")
+
+        threading.Thread(target=loop, name='meter-compaction', daemon=True).start()
@@ -0,0 +1,286 @@
+"""
+In-process cache of the `emission_factors` table.
+
+The table has a handful of rows that almost never change, so read paths load
+it once and apply factors to grouped `SUM(raw_value)` results in Python
+instead of joining every activity row. A version number in `cache_versions`
+(bumped by add_emission_factor.py and the admin refresh endpoint) is checked
+at most every `check_interval` seconds so every worker picks up edits.
+
+Factors are effective-dated: each row applies from `valid_from` through
+`valid_to` (inclusive, NULL = still in effect), so a new grid factor only
+changes the dates it covers. FactorTimeline looks a date up by bisection and
+splits date ranges at the days where any factor changes, so per-source totals
+can still be summed in SQL, one query per stretch of constant factors.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_right
+from datetime import date, timedelta
+
+import db_backends
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'emission_factors'
+
+# Factor of human emissions (kg CO2e per person per day), effective-dated like the others
+HUMAN_SOURCE = 'human_daily'
+
+# valid_from of factors that apply to all earlier data (MySQL's smallest DATE)
+BEGINNING = '1000-01-01'
+END_OF_TIME = '9999-12-31'
+
+
+def iso_day(value):
+    """'YYYY-MM-DD' for a date, datetime or date/datetime string (None stays None)."""
+    if value is None:
+        return None
+    if isinstance(value, date):
+        return value.isoformat()[:10]
+    return str(value)[:10]
+
+
+def _shift(day, days):
+    return (date.fromisoformat(day) + timedelta(days=days)).isoformat()
+
+
+def bump_factor_version(cursor, dialect=None):
+    """Increment the emission factor version; caller commits. `dialect`: the db_backends backend (MySQL)."""
+    dialect = dialect or db_backends.MySQLDialect()
+    cursor.execute(
+        dialect.upsert('cache_versions', ('name', 'version'), keys=('name',), add=('version',)),
+        (VERSION_KEY, 1)
+    )
+
+
+def add_factor_period(cursor, source_type, factor, factor_unit, valid_from=BEGINNING):
+    """
+    Make `factor` apply to `source_type` from `valid_from` on (a plain cursor; caller
+    commits and bumps the version). The period in effect on that day is cut short the
+    day before, and the new one runs until that period would have ended, so later
+    factors are kept. Setting a factor on an existing valid_from replaces it.
+    Returns the new period as (valid_from, valid_to).
+    """
+    valid_from = iso_day(valid_from)
+    cursor.execute("""
+        SELECT id, valid_from, valid_to FROM emission_factors
+        WHERE source_type = %s AND valid_from <= %s AND (valid_to IS NULL OR valid_to >= %s)
+    """, (source_type, valid_from, valid_from))
+    current = cursor.fetchone()
+    if current is not None and iso_day(current[1]) == valid_from:
+        cursor.execute("UPDATE emission_factors SET factor = %s, factor_unit = %s WHERE id = %s",
+                       (factor, factor_unit, current[0]))
+        return valid_from, iso_day(current[2])
+
+    if current is not None:
+        valid_to = iso_day(current[2])
+        cursor.execute("UPDATE emission_factors SET valid_to = %s WHERE id = %s",
+                       (_shift(valid_from, -1), current[0]))
+    else:
+        # Before the first period or in a gap: stop where the next period starts
+        cursor.execute("SELECT MIN(valid_from) FROM emission_factors WHERE source_type = %s AND valid_from > %s",
+                       (source_type, valid_from))
+        following = cursor.fetchone()[0]
+        valid_to = _shift(iso_day(following), -1) if following is not None else None
+    cursor.execute("INSERT INTO emission_factors (source_type, factor, factor_unit, valid_from, valid_to) "
+                   "VALUES (%s, %s, %s, %s, %s)", (source_type, factor, factor_unit, valid_from, valid_to))
+    return valid_from, valid_to
+
+
+class FactorTimeline:
+    """Effective-dated factors of every source, sorted by valid_from (periods must not overlap)."""
+
+    def __init__(self, rows=()):
+        # source_type -> [(valid_from, valid_to or None, factor, factor_unit)], days as 'YYYY-MM-DD'
+        self.periods = {}
+        for row in sorted(rows, key=lambda r: (r['source_type'], iso_day(r['valid_from']) or BEGINNING)):
+            self.periods.setdefault(row['source_type'], []).append((
+                iso_day(row['valid_from']) or BEGINNING, iso_day(row['valid_to']),
+                float(row['factor']), row['factor_unit']))
+        self._starts = {source: [p[0] for p in periods] for source, periods in self.periods.items()}
+        # First days of a new set of factors: every valid_from and the day after every valid_to
+        days = set()
+        for periods in self.periods.values():
+            for valid_from, valid_to, _, _ in periods:
+                days.add(valid_from)
+                if valid_to is not None and valid_to < END_OF_TIME:
+                    days.add(_shift(valid_to, 1))
+        self.boundaries = sorted(days)
+
+    def period(self, source, day):
+        """The (valid_from, valid_to, factor, factor_unit) of `source` on `day`, or None."""
+        starts = self._starts.get(source)
+        if not starts:
+            return None
+        day = iso_day(day)
+        i = bisect_right(starts, day) - 1
+        if i < 0:
+            return None
+        found = self.periods[source][i]
+        if found[1] is not None and day > found[1]:
+            return None
+        return found
+
+    def factor(self, source, day):
+        """kg CO2e per unit of `source` on `day` (None when no factor applies)."""
+        found = self.period(source, day)
+        return found[2] if found else None
+
+    def on(self, day):
+        """{source_type: factor} in effect on `day`."""
+        factors = {}
+        for source in self.periods:
+            found = self.period(source, day)
+            if found:
+                factors[source] = found[2]
+        return factors
+
+    def segments(self, start, end):
+        """Split [start, end] ('YYYY-MM-DD', inclusive) into ranges over which no factor changes."""
+        start, end = iso_day(start), iso_day(end)
+        out = []
+        lo, hi = bisect_right(self.boundaries, start), bisect_right(self.boundaries, end)
+        for day in self.boundaries[lo:hi]:
+            out.append((start, _shift(day, -1)))
+            start = day
+        out.append((start, end))
+        return out
+
+    def scope(self, start, end):
+        """The factors that apply within [start, end], clipped to it; equal scopes give equal results."""
+        start, end = iso_day(start), iso_day(end)
+        scope = []
+        for source, periods in sorted(self.periods.items()):
+            # Periods starting after `end` cannot overlap
+            for valid_from, valid_to, factor, _ in periods[:bisect_right(self._starts[source], end)]:
+                if valid_to is None or valid_to >= start:
+                    scope.append((source, max(valid_from, start), min(valid_to or end, end), factor))
+        return tuple(scope)
+
+    def changed_range(self, other):
+        """(first, last) days on which some factor differs from `other`'s, or None when they agree."""
+        days = sorted(set(self.boundaries) | set(other.boundaries) | {BEGINNING})
+        ends = [_shift(day, -1) for day in days[1:]] + [END_OF_TIME]
+        first = last = None
+        for start, end in zip(days, ends):
+            if self.on(start) != other.on(start):
+                first = first or start
+                last = end
+        return (first, last) if first else None
+
+
+def load_timeline(cursor):
+    """Every row of emission_factors as a FactorTimeline (`cursor` returns dict rows)."""
+    cursor.execute("SELECT source_type, valid_from, valid_to, factor, factor_unit FROM emission_factors")
+    return FactorTimeline(cursor.fetchall())
+
+
+class EmissionFactorCache:
+    """Thread-safe FactorTimeline of the emission_factors table with a DB-backed version check."""
+
+    def __init__(self, check_interval=30.0):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self.entries = {}
+        self.current = FactorTimeline()
+        self.version = None
+        self.loaded = False
+        self.checked_at = 0.0
+        # Days whose factors changed in the last reload, as (first, last)
+        self.last_change = None
+        # Lookups served from memory / that checked the version / that reloaded the table
+        self.stats = {'hit': 0, 'check': 0, 'reload': 0}
+
+    def invalidate(self):
+        """Force a version check (and reload if needed) on next use."""
+        self.checked_at = 0.0
+
+    def fresh(self):
+        return self.loaded and (time.monotonic() - self.checked_at) < self.check_interval
+
+    def timeline(self, connection):
+        """The current FactorTimeline, reloaded when the version moved."""
+        if self.fresh():
+            self.stats['hit'] += 1
+            return self.current
+        with self._lock:
+            if self.fresh():
+                self.stats['hit'] += 1
+                return self.current
+            cursor = connection.cursor(dictionary=True)
+            try:
+                version = self._read_version(cursor)
+                self.stats['check'] += 1
+                if not self.loaded or version is None or version != self.version:
+                    self.stats['reload'] += 1
+                    timeline = load_timeline(cursor)
+                    if self.loaded:
+                        self.last_change = timeline.changed_range(self.current)
+                        if self.last_change:
+                            logger.info(f"Emission factors reloaded (version {self.version} -> {version}); "
+                                        f"{self.last_change[0]}..{self.last_change[1]} changed")
+                    self.current = timeline
+                    self.entries = self._entries(timeline)
+                    self.version = version
+                    self.loaded = True
+                self.checked_at = time.monotonic()
+            finally:
+                cursor.close()
+            return self.current
+
+    def get(self, connection):
+        """
+        Return {source_type: {'factor', 'factor_unit', 'periods'}}: the factor in effect
+        today (None if none is) and every dated period, reloading when the version moved.
+        """
+        self.timeline(connection)
+        return self.entries
+
+    def factors(self, connection):
+        """Return {source_type: factor (kg CO2e per unit)} in effect today."""
+        return self.timeline(connection).on(date.today())
+
+    def scope(self, connect, start, end):
+        """
+        FactorTimeline.scope() of [start, end] for result cache keys, checking the version
+        on a connection from `connect()` when due. None when the factors were never loaded.
+        """
+        if not self.fresh():
+            connection = connect()
+            if connection:
+                try:
+                    self.timeline(connection)
+                except Exception:
+                    logger.exception("Emission factor check failed")
+                finally:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+        return self.current.scope(start, end) if self.loaded else None
+
+    @staticmethod
+    def _entries(timeline):
+        today = date.today()
+        entries = {}
+        for source, periods in timeline.periods.items():
+            current = timeline.period(source, today)
+            entries[source] = {
+                'factor': current[2] if current else None,
+                'factor_unit': (current or periods[-1])[3],
+                'periods': [{'valid_from': valid_from, 'valid_to': valid_to, 'factor': factor, 'factor_unit': unit}
+                            for valid_from, valid_to, factor, unit in periods],
+            }
+        return entries
+
+    def _read_version(self, cursor):
+        try:
+            cursor.execute("SELECT version FROM cache_versions WHERE name = %s", (VERSION_KEY,))
+            row = cursor.fetchone()
+            return row['version'] if row else 0
+        except Exception as e:
+            # Older databases without cache_versions: fall back to reloading every interval
+            logger.debug(f"cache_versions unavailable: {e}")
+            return None
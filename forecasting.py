@@ -0,0 +1,191 @@
+"""
+Emissions forecasting for /api/forecast.
+
+A SeasonalTrendModel fits one least-squares model per daily series (tonnes of each
+activity source, plus human emissions): intercept, linear trend, yearly Fourier terms
+and day-of-week offsets. Every series shares the same design matrix, so all of them
+are fitted with one (ridge-regularised) solve of the normal equations and predicted
+with one matrix product, whatever the number of sources or years of history.
+
+ModelCache keeps fitted models per (sites, as-of date, data version, factors) key so
+repeated forecasts only pay for the projection; app.py clears it after writes.
+
+Requires numpy (`pip install .[analytics]`).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# date(1970, 1, 1).toordinal(); converts day ordinals to numpy datetime64[D]
+EPOCH_ORDINAL = 719163
+
+DAYS_PER_YEAR = 365.25
+
+# Each yearly harmonic needs about half a year of history to be estimated
+DAYS_PER_HARMONIC = 182
+
+
+def design(ords, origin, harmonics, weekdays=True):
+    """Design matrix (days x features) for day ordinals: 1, trend (years since `origin`), Fourier terms, weekdays."""
+    ords = np.asarray(ords, dtype=np.int64)
+    columns = [np.ones(len(ords)), (ords - origin) / DAYS_PER_YEAR]
+    for k in range(1, harmonics + 1):
+        angle = (2 * np.pi * k / DAYS_PER_YEAR) * ords
+        columns += [np.sin(angle), np.cos(angle)]
+    if weekdays:
+        # date.fromordinal(1) is a Monday; Monday is the baseline
+        weekday = (ords - 1) % 7
+        columns += [(weekday == day).astype(float) for day in range(1, 7)]
+    return np.column_stack(columns)
+
+
+def month_labels(ords):
+    """'YYYY-MM' label of each day ordinal."""
+    return ((np.asarray(ords, dtype=np.int64) - EPOCH_ORDINAL).astype('datetime64[D]')
+            .astype('datetime64[M]').astype(str))
+
+
+class SeasonalTrendModel:
+    """Trend + yearly seasonality + weekday model, fitted for many daily series at once."""
+
+    def __init__(self, harmonics=3, ridge=1e-3, history_days=3 * 365):
+        self.harmonics = harmonics
+        self.ridge = ridge
+        self.history_days = history_days
+        self.names = []
+        self.coef = None
+
+    def fit(self, names, first_ordinal, values, total=None):
+        """
+        Fit the series in `values` (series x days, daily tonnes from `first_ordinal` on;
+        days without rows are 0). Trailing days without any data are treated as not yet
+        recorded: the model is fitted on the `history_days` days up to the last day with
+        data (`self.last`). `total` names the series summed into the total (default all).
+        Returns self; `self.coef` stays None when there is no data.
+        """
+        self.names = list(names)
+        self.values = np.asarray(values, dtype=float).reshape(len(self.names), -1)
+        self.first = first_ordinal
+        self.in_total = np.array([total is None or name in total for name in self.names], dtype=bool)
+        recorded = np.flatnonzero(self.values.any(axis=0))
+        if not len(recorded):
+            self.last = None
+            return self
+        end = int(recorded[-1]) + 1
+        start = max(int(recorded[0]), end - self.history_days)
+        self.last = first_ordinal + end - 1
+        self.days = end - start
+        self.origin = first_ordinal + start
+        # No yearly terms on under half a year, nor weekday offsets on under two weeks
+        self.used_harmonics = min(self.harmonics, self.days // DAYS_PER_HARMONIC)
+        self.weekdays = self.days >= 14
+
+        x = design(np.arange(self.origin, self.last + 1), self.origin, self.used_harmonics, self.weekdays)
+        y = self.values[:, start:end].T
+        penalty = np.full(x.shape[1], self.ridge * self.days)
+        penalty[0] = 0.0
+        # One solve for every series: (X'X + P) B = X'Y
+        self.coef = np.linalg.solve(x.T @ x + np.diag(penalty), x.T @ y)
+        residuals = y - x @ self.coef
+        dof = max(self.days - x.shape[1], 1)
+        self.sigma = np.sqrt((residuals ** 2).sum(axis=0) / dof)
+        self.sigma_total = float(np.sqrt((residuals[:, self.in_total].sum(axis=1) ** 2).sum() / dof))
+        return self
+
+    def predict(self, first_ordinal, days):
+        """Expected daily tonnes (series x days) from `first_ordinal` on, never negative."""
+        x = design(np.arange(first_ordinal, first_ordinal + days), self.origin, self.used_harmonics, self.weekdays)
+        return np.maximum(x @ self.coef, 0.0).T
+
+    def actual(self, start_ord, end_ord):
+        """Recorded daily tonnes (series x days) for an inclusive ordinal range within the fitted data."""
+        i0 = max(start_ord - self.first, 0)
+        i1 = max(min(end_ord - self.first + 1, self.values.shape[1]), i0)
+        return self.values[:, i0:i1], self.first + i0
+
+    def project(self, start_ord, end_ord, z=1.96):
+        """
+        Totals for the inclusive period [start_ord, end_ord]: recorded tonnes up to
+        `self.last` plus forecast tonnes after it, per series and for the total, with a
+        ~95% (z) interval on the forecast part (daily residual spread x sqrt(days)),
+        and the same split per month.
+        """
+        actual, actual_first = self.actual(start_ord, min(end_ord, self.last))
+        forecast_first = max(self.last + 1, start_ord)
+        horizon = max(end_ord - forecast_first + 1, 0)
+        predicted = self.predict(forecast_first, horizon)
+
+        actual_sums = actual.sum(axis=1)
+        forecast_sums = predicted.sum(axis=1)
+        spread = z * np.sqrt(horizon) * self.sigma
+        series = []
+        for i, name in enumerate(self.names):
+            series.append(self._totals(name, actual_sums[i], forecast_sums[i], spread[i]))
+        total = self._totals('total', actual_sums[self.in_total].sum(), forecast_sums[self.in_total].sum(),
+                             z * np.sqrt(horizon) * self.sigma_total)
+
+        months = OrderedDict()
+        for ords, daily, key in ((np.arange(actual_first, actual_first + actual.shape[1]), actual, 'actual'),
+                                 (np.arange(forecast_first, forecast_first + horizon), predicted, 'forecast')):
+            if not len(ords):
+                continue
+            labels = month_labels(ords)
+            starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+            sums = np.add.reduceat(daily[self.in_total].sum(axis=0), starts)
+            for label, value in zip(labels[starts].tolist(), sums.tolist()):
+                month = months.setdefault(label, {'month': label, 'actual': 0.0, 'forecast': 0.0})
+                month[key] += value
+        monthly = [{'month': m['month'], 'actual': round(m['actual'], 2), 'forecast': round(m['forecast'], 2)}
+                   for m in months.values()]
+        return {'series': series, 'total': total, 'monthly': monthly, 'forecast_days': horizon}
+
+    @staticmethod
+    def _totals(name, actual, forecast, spread):
+        actual, forecast, spread = float(actual), float(forecast), float(spread)
+        return {
+            'name': name,
+            'actual': round(actual, 2),
+            'forecast': round(forecast, 2),
+            'projected': round(actual + forecast, 2),
+            'lower': round(actual + max(forecast - spread, 0.0), 2),
+            'upper': round(actual + forecast + spread, 2),
+        }
+
+
+class ModelCache:
+    """Fitted models by key, dropped after `ttl` seconds or on invalidate() (least recently used beyond `max_entries`)."""
+
+    def __init__(self, ttl=600.0, max_entries=32):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.stats = {'hit': 0, 'fit': 0}
+
+    def get_or_fit(self, key, fit):
+        """(model, cached) for `key`, calling fit() when there is no fresh entry."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.stats['hit'] += 1
+                return entry[1], True
+        model = fit()
+        with self._lock:
+            self._entries[key] = (now, model)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.stats['fit'] += 1
+        return model, False
+
+    def invalidate(self):
+        """Drop every fitted model (new data arrived)."""
+        with self._lock:
+            self._entries.clear()
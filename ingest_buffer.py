@@ -0,0 +1,201 @@
+"""
+In-process micro-batching for high-rate ingest (smart-meter readings).
+
+Requests hand their parsed rows to a MicroBatcher and wait on a ticket. A
+background thread drains the buffer whenever it holds `max_batch_rows` rows or
+its oldest row has waited `max_delay_ms`, and writes each batch with one
+callback (multi-row INSERTs + a single COMMIT). Tickets are released only after
+that commit, so an acknowledged reading is durable. When a combined write fails,
+each request's rows are written again on their own, so only the requests whose
+rows are rejected fail and the others are still committed.
+
+Backpressure: at most `max_pending_rows` rows may be buffered or in flight.
+When MySQL falls behind, submit() waits up to `submit_timeout` seconds for room
+and then raises Backpressure so the endpoint can answer 503 + Retry-After.
+Each worker process has its own buffer.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class Backpressure(Exception):
+    """The buffer is full; the client should retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__('Ingest buffer is full')
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """Completion handle for one submit(); wait() returns once its rows are committed."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.arrived = time.monotonic()
+        self.error = None
+        self.flush_ms = None
+        self._done = threading.Event()
+
+    def _finish(self, error=None, flush_ms=None):
+        self.error = error
+        self.flush_ms = flush_ms
+        self._done.set()
+
+    def wait(self, timeout=None):
+        """True when committed, False on timeout; re-raises the flush error."""
+        if not self._done.wait(timeout):
+            return False
+        if self.error is not None:
+            raise self.error
+        return True
+
+
+class MicroBatcher:
+    def __init__(self, writer, max_batch_rows=5000, max_delay_ms=100, max_pending_rows=100000,
+                 submit_timeout=2.0, rate_window=60.0):
+        # writer(rows) must insert and commit every row, or raise
+        self.writer = writer
+        self.max_batch_rows = max_batch_rows
+        self.max_delay = max_delay_ms / 1000.0
+        self.max_pending_rows = max_pending_rows
+        self.submit_timeout = submit_timeout
+        self.rate_window = rate_window
+        self._cond = threading.Condition()
+        self._tickets = deque()
+        self._buffered = 0      # rows waiting for a flush
+        self._in_flight = 0     # rows in the flush currently running
+        self._thread_pid = None
+        # (finished_at, rows) per flush, for the sustained rate
+        self._flushes = deque()
+        self._started = time.monotonic()
+        self.stats = {'rows': 0, 'flushes': 0, 'failed_flushes': 0, 'failed_requests': 0, 'rejected_rows': 0,
+                      'last_flush_rows': 0, 'last_flush_ms': 0.0}
+
+    def _ensure_thread(self):
+        # Threads do not survive a fork, so start one per worker process
+        if self._thread_pid == os.getpid():
+            return
+        self._thread_pid = os.getpid()
+        threading.Thread(target=self._run, name='ingest-flusher', daemon=True).start()
+
+    def submit(self, rows):
+        """Buffer `rows` and return a Ticket. Raises Backpressure when there is no room in time."""
+        rows = list(rows)
+        if not rows:
+            ticket = Ticket(rows)
+            ticket._finish()
+            return ticket
+        if len(rows) > self.max_pending_rows:
+            raise ValueError(f'At most {self.max_pending_rows} rows per request')
+        deadline = time.monotonic() + self.submit_timeout
+        with self._cond:
+            self._ensure_thread()
+            while self._buffered + self._in_flight + len(rows) > self.max_pending_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stats['rejected_rows'] += len(rows)
+                    raise Backpressure(retry_after=max(1, round(self.stats['last_flush_ms'] / 1000 * 2)))
+                self._cond.wait(remaining)
+            ticket = Ticket(rows)
+            self._tickets.append(ticket)
+            self._buffered += len(rows)
+            self._cond.notify_all()
+            return ticket
+
+    def _take_batch(self):
+        """Pop whole tickets up to max_batch_rows (always at least one ticket)."""
+        batch = []
+        count = 0
+        while self._tickets and (not batch or count + len(self._tickets[0].rows) <= self.max_batch_rows):
+            ticket = self._tickets.popleft()
+            batch.append(ticket)
+            count += len(ticket.rows)
+        self._buffered -= count
+        self._in_flight = count
+        return batch, count
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._buffered >= self.max_batch_rows:
+                        break
+                    if self._tickets:
+                        wait = self._tickets[0].arrived + self.max_delay - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                batch, count = self._take_batch()
+
+            rows = [row for ticket in batch for row in ticket.rows]
+            t0 = time.perf_counter()
+            errors = self._write(batch, rows)
+            flush_ms = (time.perf_counter() - t0) * 1000
+            committed = sum(len(ticket.rows) for ticket, error in zip(batch, errors) if error is None)
+
+            with self._cond:
+                self._in_flight = 0
+                if committed:
+                    now = time.monotonic()
+                    self._flushes.append((now, committed))
+                    self.stats['rows'] += committed
+                    self.stats['flushes'] += 1
+                    self.stats['last_flush_rows'] = committed
+                    self.stats['last_flush_ms'] = round(flush_ms, 2)
+                if committed < count:
+                    self.stats['failed_flushes'] += 1
+                    self.stats['failed_requests'] += sum(error is not None for error in errors)
+                # Room was freed; wake blocked submitters
+                self._cond.notify_all()
+            for ticket, error in zip(batch, errors):
+                ticket._finish(error, flush_ms)
+
+    def _write(self, batch, rows):
+        """Write a batch; on failure write each ticket's rows on their own. Returns the error per ticket."""
+        try:
+            self.writer(rows)
+            return [None] * len(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                logger.exception(f"Ingest flush of {len(rows)} rows failed")
+                return [e]
+            logger.warning(f"Ingest flush of {len(rows)} rows failed ({e}); writing its {len(batch)} requests separately")
+        errors = []
+        for ticket in batch:
+            try:
+                self.writer(ticket.rows)
+                errors.append(None)
+            except Exception as e:
+                logger.warning(f"Ingest write of {len(ticket.rows)} rows failed: {e}")
+                errors.append(e)
+        return errors
+
+    def rows_per_second(self):
+        """Committed rows per second over the last `rate_window` seconds."""
+        with self._cond:
+            now = time.monotonic()
+            while self._flushes and self._flushes[0][0] < now - self.rate_window:
+                self._flushes.popleft()
+            # A young process has not been up for a full window yet
+            span = max(min(self.rate_window, now - self._started), 1.0)
+            return sum(count for _, count in self._flushes) / span
+
+    def pending_rows(self):
+        with self._cond:
+            return self._buffered + self._in_flight
+
+    def snapshot(self):
+        """Counters plus the current backlog and sustained rate (for /api/ingest/stats)."""
+        rate = self.rows_per_second()
+        with self._cond:
+            return dict(self.stats, pending_rows=self._buffered + self._in_flight,
+                        rows_per_sec=round(rate, 1), rate_window_seconds=self.rate_window,
+                        max_batch_rows=self.max_batch_rows, max_delay_ms=self.max_delay * 1000,
+                        max_pending_rows=self.max_pending_rows)
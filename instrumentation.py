@@ -0,0 +1,205 @@
+"""
+Lightweight per-request timing for the Flask app.
+
+When enabled, each request gets a RequestTimer on `flask.g`. Connections from
+get_db_connection() are wrapped so every `cursor.execute` / `executemany` /
+`commit` is timed and queries slower than `slow_query_ms` are logged with their
+normalized SQL and parameters. Code can add named spans (`with span('aggregate')`);
+span times are exclusive of nested spans and queries. The totals are sent back in
+a `Server-Timing` header.
+
+When disabled, connections are not wrapped and the request hooks return after
+a single attribute check. The switch can be flipped at runtime.
+"""
+import logging
+import re
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+
+logger = logging.getLogger(__name__)
+
+# Server-Timing metric names, in header order
+SPAN_ORDER = ('acquire', 'db', 'aggregate', 'serialize', 'compress')
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+class Settings:
+    """Process-wide switches (each worker has its own copy)."""
+
+    def __init__(self, enabled=False, slow_query_ms=200.0):
+        self.enabled = enabled
+        self.slow_query_ms = slow_query_ms
+
+    def as_dict(self):
+        return {'enabled': self.enabled, 'slow_query_ms': self.slow_query_ms}
+
+
+settings = Settings()
+
+
+def normalize_sql(sql):
+    """Collapse whitespace so the same statement logs identically."""
+    return _WHITESPACE.sub(' ', str(sql)).strip()
+
+
+def _format_params(params, limit=300):
+    text = repr(params)
+    return text if len(text) <= limit else text[:limit] + '...'
+
+
+class RequestTimer:
+    """Accumulated span durations (ms) for one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = {}
+        self.queries = 0
+        # Time spent in nested spans/queries, per open span
+        self._children = []
+
+    def record(self, name, ms):
+        total, count = self.spans.get(name, (0.0, 0))
+        self.spans[name] = (total + ms, count + 1)
+        if self._children:
+            self._children[-1] += ms
+
+    @contextmanager
+    def span(self, name):
+        self._children.append(0.0)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - t0) * 1000
+            nested = self._children.pop()
+            self.record(name, elapsed - nested)
+            if self._children:
+                # The parent's exclusive time excludes this span entirely, not just its own part
+                self._children[-1] += nested
+
+    def server_timing(self):
+        """Value for the Server-Timing response header."""
+        parts = []
+        names = [n for n in SPAN_ORDER if n in self.spans] + sorted(set(self.spans) - set(SPAN_ORDER))
+        for name in names:
+            ms, count = self.spans[name]
+            desc = f';desc="{self.queries} queries"' if name == 'db' else ''
+            parts.append(f"{name};dur={ms:.2f}{desc}")
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.2f}")
+        return ', '.join(parts)
+
+
+def current():
+    """The active RequestTimer, or None when disabled or outside a request."""
+    if not settings.enabled or not has_request_context():
+        return None
+    return g.get('request_timer')
+
+
+def start_request():
+    if settings.enabled:
+        g.request_timer = RequestTimer()
+
+
+def finish_request(response):
+    timer = current()
+    if timer is not None:
+        response.headers['Server-Timing'] = timer.server_timing()
+    return response
+
+
+@contextmanager
+def span(name):
+    """Time a block as `name` (no-op unless instrumentation is on for this request)."""
+    timer = current()
+    if timer is None:
+        yield
+        return
+    with timer.span(name):
+        yield
+
+
+def timed(name, func):
+    """Wrap `func` so each call is recorded as span `name`."""
+    def wrapper(*args, **kwargs):
+        timer = current()
+        if timer is None:
+            return func(*args, **kwargs)
+        with timer.span(name):
+            return func(*args, **kwargs)
+    wrapper.__wrapped__ = func
+    return wrapper
+
+
+def _observe(timer, started, sql, params, many=False):
+    ms = (time.perf_counter() - started) * 1000
+    if timer is not None:
+        timer.record('db', ms)
+        timer.queries += 1
+    if settings.slow_query_ms and ms >= settings.slow_query_ms:
+        detail = f"{len(params)} rows" if many and params is not None else _format_params(params)
+        where = f" [{request.method} {request.path}]" if has_request_context() else ''
+        logger.warning(f"Slow query ({ms:.1f} ms){where}: {normalize_sql(sql)} | params: {detail}")
+
+
+class TimedCursor:
+    """Cursor proxy that times statements; everything else passes through."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, operation, *args, **kwargs):
+        timer = current()
+        t0 = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, *args, **kwargs)
+        finally:
+            _observe(timer, t0, operation, args[0] if args else kwargs.get('params'))
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        timer = current()
+        t0 = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            _observe(timer, t0, operation, seq_params, many=True)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class TimedConnection:
+    """Connection proxy handing out TimedCursors and timing commits."""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self._connection.cursor(*args, **kwargs))
+
+    def commit(self):
+        timer = current()
+        t0 = time.perf_counter()
+        try:
+            return self._connection.commit()
+        finally:
+            _observe(timer, t0, 'COMMIT', None)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+def wrap_connection(connection, acquire_started=None):
+    """Wrap a fresh connection when instrumentation is on; records pool/connect wait as `acquire`."""
+    if not settings.enabled or connection is None:
+        return connection
+    timer = current()
+    if timer is not None and acquire_started is not None:
+        timer.record('acquire', (time.perf_counter() - acquire_started) * 1000)
+    return TimedConnection(connection)
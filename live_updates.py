@@ -0,0 +1,265 @@
+"""
+Publish/subscribe broker for the dashboard's server-sent events stream.
+
+Ingest endpoints publish small deltas after they commit; each open
+`/api/stream` connection holds a bounded queue and receives them as SSE
+messages. A short history lets reconnecting clients resume from
+`Last-Event-ID`; a client that falls too far behind is told to reload.
+
+Streams are held by whichever worker process accepted them, so events must
+reach every worker:
+- RedisRelay: events go through Redis pub/sub and every worker (the publisher
+  included) delivers them to its streams. Ids come from one Redis counter, so a
+  client can resume on any worker.
+- VersionWatch: without Redis, each worker polls a shared data version (a
+  `cache_versions` row bumped by every write) and sends its streams a `reload`
+  when another worker wrote. Deltas then only reach the writer's own streams.
+"""
+import json
+import logging
+import queue
+import secrets
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+
+class EventBroker:
+    """Fan-out of (id, type, data) events to SSE subscribers."""
+
+    def __init__(self, history=200, queue_size=100, max_subscribers=500, relay=None, watch=None):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.relay = relay
+        self.watch = watch
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._history = deque(maxlen=history)
+        # Locally numbered ids start at a random offset per process, so an id issued by
+        # another worker (or before a restart) is not mistaken for one of ours
+        self._next_id = 1 if relay is not None else (secrets.randbelow(1 << 31) << 20) + 1
+
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        """Register a subscriber, or return None when the connection limit is reached."""
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            sub = Subscription(self.queue_size)
+            self._subscribers.add(sub)
+        # Started here rather than at import so the threads live in the worker, not a pre-fork master
+        for background in (self.relay, self.watch):
+            if background is not None:
+                background.start(self)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def publish(self, event_type, data):
+        """Send an event to every worker's subscribers (never blocks the publishing request)."""
+        if self.relay is not None:
+            try:
+                return self.relay.send(event_type, data)
+            except Exception:
+                logger.exception("Could not relay live event; asking this worker's clients to reload")
+                event_type, data = 'reload', {'reason': 'relay_error'}
+        return self.deliver(None, event_type, data)
+
+    def deliver(self, event_id, event_type, data):
+        """Queue an event for this worker's subscribers; `event_id` None numbers it locally."""
+        with self._lock:
+            if event_id is None:
+                event_id = self._next_id
+            self._next_id = max(self._next_id, event_id + 1)
+            event = (event_id, event_type, data)
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            try:
+                sub.queue.put_nowait(event)
+            except queue.Full:
+                sub.overflowed = True
+        return event[0]
+
+    def _replay(self, last_event_id):
+        """Events after `last_event_id`, or None if they are no longer in history (or it is not ours)."""
+        with self._lock:
+            history = list(self._history)
+            next_id = self._next_id
+        oldest = history[0][0] if history else next_id
+        if last_event_id >= next_id or last_event_id < oldest - 1:
+            return None
+        return [event for event in history if event[0] > last_event_id]
+
+    @staticmethod
+    def format(event_id, event_type, data):
+        return f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+    def stream(self, sub, last_event_id=None, heartbeat=20.0):
+        """Generator of SSE text for one subscriber; unsubscribes when the client goes away."""
+        try:
+            yield "retry: 5000\n\n"
+            if last_event_id is not None:
+                missed = self._replay(last_event_id)
+                if missed is None:
+                    yield self.format(self._next_id - 1, 'reload', {'reason': 'history_expired'})
+                else:
+                    for event in missed:
+                        yield self.format(*event)
+            while True:
+                if sub.overflowed:
+                    # Dropped events: drain and ask the client to refetch instead
+                    sub.overflowed = False
+                    event_id = 0
+                    while not sub.queue.empty():
+                        event_id = sub.queue.get_nowait()[0]
+                    yield self.format(event_id, 'reload', {'reason': 'overflow'})
+                    continue
+                try:
+                    event = sub.queue.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield self.format(*event)
+        finally:
+            self.unsubscribe(sub)
+
+
+class RedisRelay:
+    """
+    Live events shared by every worker through Redis pub/sub. send() numbers the event
+    with an INCR counter and publishes it in one script, so the channel carries events
+    in id order; a listener thread per worker delivers them to the local broker.
+    """
+
+    SEND_SCRIPT = """
+        local id = redis.call('INCR', KEYS[1])
+        redis.call('PUBLISH', KEYS[2], id .. ' ' .. ARGV[1])
+        return id
+    """
+
+    def __init__(self, client, prefix='campus-carbon:', poll_timeout=1.0):
+        self.client = client
+        self.counter = prefix + 'live:event_id'
+        self.channel = prefix + 'live:events'
+        self.poll_timeout = poll_timeout
+        self._lock = threading.Lock()
+        self._thread = None
+        self._subscribed = threading.Event()
+
+    def send(self, event_type, data):
+        message = json.dumps([event_type, data], separators=(',', ':'))
+        return int(self.client.eval(self.SEND_SCRIPT, 2, self.counter, self.channel, message))
+
+    def start(self, broker):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._listen, args=(broker,), name='live-relay', daemon=True)
+            self._thread.start()
+        # Events sent before the subscription is in place would not come back to this worker
+        self._subscribed.wait(self.poll_timeout)
+
+    def _listen(self, broker):
+        while True:
+            pubsub = None
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                self._subscribed.set()
+                while True:
+                    message = pubsub.get_message(timeout=self.poll_timeout)
+                    if message is None or message.get('type') != 'message':
+                        continue
+                    payload = message['data']
+                    if isinstance(payload, bytes):
+                        payload = payload.decode('utf-8')
+                    event_id, _, body = payload.partition(' ')
+                    event_type, data = json.loads(body)
+                    broker.deliver(int(event_id), event_type, data)
+            except Exception:
+                # Events published while disconnected are lost: make clients refetch
+                logger.exception("Live event relay disconnected; reconnecting")
+                broker.deliver(None, 'reload', {'reason': 'relay_reconnect'})
+                time.sleep(self.poll_timeout)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+
+class VersionWatch:
+    """
+    Poll a shared data version every `interval` seconds while this worker has
+    subscribers, and send them a `reload` when it advanced by more than this worker's
+    own writes (note_local_write(), called after each commit). `version()` returns
+    the current number, or None when it cannot be read.
+    """
+
+    def __init__(self, version, interval=2.0):
+        self.version = version
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread = None
+        self._seen = None
+        self._own = 0
+
+    def note_local_write(self):
+        with self._lock:
+            self._own += 1
+
+    def forget_local_write(self):
+        """Undo note_local_write() for a write whose version bump failed."""
+        with self._lock:
+            self._own = max(self._own - 1, 0)
+
+    def check(self, broker):
+        """Compare the version with the last one seen; returns True when a reload was sent."""
+        version = self.version()
+        if version is None:
+            return False
+        with self._lock:
+            if self._seen is None:
+                self._seen, self._own = version, 0
+                return False
+            advanced = version - self._seen
+            remote = advanced > self._own
+            self._own = max(self._own - advanced, 0)
+            self._seen = version
+        if remote:
+            broker.deliver(None, 'reload', {'reason': 'remote_write'})
+        return remote
+
+    def start(self, broker):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, args=(broker,), name='live-version-watch',
+                                            daemon=True)
+            self._thread.start()
+
+    def _run(self, broker):
+        while True:
+            try:
+                if broker.has_subscribers():
+                    self.check(broker)
+            except Exception:
+                logger.exception("Could not check the shared data version")
+            time.sleep(self.interval)
@@ -0,0 +1,341 @@
+"""
+Minimal Prometheus-style metrics (counters, gauges, histograms) for the Flask app.
+
+Single process: `/metrics` renders this process's registry. With several
+workers (Gunicorn), set METRICS_DIR to a directory shared by all workers. Each
+worker then writes a JSON snapshot of its registry there (at most every
+`flush_interval` seconds, plus just before serving a scrape) and `/metrics`
+merges every snapshot. Counters and histograms are summed across all files, so
+totals survive worker restarts. Gauges are summed only over workers that are
+still alive. Snapshot files are named by pid and process start time, so a
+recycled pid never takes over an exited worker's file; at each scrape the
+counters and histograms of exited workers are folded into
+`metrics_aggregate.json` and their files removed.
+
+Gauges that mirror state owned elsewhere (pool size, cache stats) are filled
+by collector callbacks at snapshot time.
+"""
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; exited workers' files are then kept
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+AGGREGATE_FILE = 'metrics_aggregate.json'
+
+
+def _key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(pairs, extra=()):
+    pairs = list(pairs) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, registry, name, help_text):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.values = {}
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = _key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+            self.registry.dirty = True
+
+    def set_total(self, value, **labels):
+        """Mirror a running total kept elsewhere (collectors only)."""
+        with self.registry.lock:
+            self.values[_key(labels)] = value
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self.registry.lock:
+            self.values[_key(labels)] = value
+            self.registry.dirty = True
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help_text, buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, help_text)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = _key(labels)
+        with self.registry.lock:
+            # [per-bucket counts..., +Inf count, sum]
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[len(self.buckets)] += 1
+            state[-1] += value
+            self.registry.dirty = True
+
+
+def _merge(merged, snapshot, gauges=True):
+    """Add a snapshot's values into `merged` ({name: entry with a {key tuple: value} dict}); returns it."""
+    for name, data in snapshot.items():
+        if data['kind'] == 'gauge' and not gauges:
+            continue
+        entry = merged.setdefault(name, {'kind': data['kind'], 'help': data['help'],
+                                         'buckets': data['buckets'], 'values': {}})
+        for key, value in data['values']:
+            key = tuple(tuple(pair) for pair in key)
+            if isinstance(value, list):
+                current = entry['values'].get(key)
+                entry['values'][key] = value if current is None else [a + b for a, b in zip(current, value)]
+            else:
+                entry['values'][key] = entry['values'].get(key, 0) + value
+    return merged
+
+
+def _as_snapshot(merged):
+    """The snapshot (JSON) form of a _merge() result."""
+    return {
+        name: dict(entry, values=[[list(map(list, key)), value] for key, value in entry['values'].items()])
+        for name, entry in merged.items()
+    }
+
+
+class Registry:
+    def __init__(self, directory=None, flush_interval=5.0):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.collectors = []
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.dirty = False
+        self._flusher_pid = None
+        self._instance = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _add(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text):
+        return self._add(Counter(self, name, help_text))
+
+    def gauge(self, name, help_text):
+        return self._add(Gauge(self, name, help_text))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(self, name, help_text, buckets))
+
+    def add_collector(self, func):
+        """`func()` is called before each snapshot/render to refresh gauges."""
+        self.collectors.append(func)
+
+    def _collect(self):
+        for func in self.collectors:
+            try:
+                func()
+            except Exception:
+                logger.exception("Metrics collector failed")
+
+    def snapshot(self):
+        self._collect()
+        with self.lock:
+            self.dirty = False
+            return {
+                name: {
+                    'kind': m.kind,
+                    'help': m.help,
+                    'buckets': list(getattr(m, 'buckets', ())),
+                    'values': [[list(map(list, key)), value if not isinstance(value, list) else list(value)]
+                               for key, value in m.values.items()],
+                }
+                for name, m in self.metrics.items()
+            }
+
+    # ---- Multi-process ----
+    def _instance_name(self):
+        """'<pid>-<start ms>' of this process (renewed after a fork)."""
+        pid = os.getpid()
+        if self._instance is None or self._instance[0] != pid:
+            self._instance = (pid, f"{pid}-{int(time.time() * 1000)}")
+        return self._instance[1]
+
+    def _path(self, name=None):
+        return os.path.join(self.directory, f"metrics_{name or self._instance_name()}.json")
+
+    def flush(self):
+        """Write this worker's snapshot (atomic rename) into the shared directory."""
+        if not self.directory:
+            return
+        path = self._path()
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def start_flusher(self):
+        """
+        Background thread flushing metrics every `flush_interval` seconds. Safe to call
+        on every request: it starts once per process (threads do not survive a fork).
+        """
+        if not self.directory or self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+
+        def loop():
+            while True:
+                time.sleep(self.flush_interval)
+                if self.dirty or self.collectors:
+                    try:
+                        self.flush()
+                    except Exception:
+                        logger.exception("Could not write metrics snapshot")
+
+        threading.Thread(target=loop, name='metrics-flusher', daemon=True).start()
+
+    def _load_snapshots(self):
+        """[(pid, start ms, path, snapshot)] of every worker file (`metrics_<pid>-<start>.json`)."""
+        snapshots = []
+        for path in glob.glob(os.path.join(self.directory, 'metrics_*.json')):
+            try:
+                pid, _, started = os.path.basename(path)[len('metrics_'):-len('.json')].partition('-')
+                pid, started = int(pid), int(started or 0)
+                with open(path, encoding='utf-8') as f:
+                    snapshots.append((pid, started, path, json.load(f)))
+            except (ValueError, OSError):
+                continue
+        return snapshots
+
+    def _load_aggregate(self):
+        try:
+            with open(os.path.join(self.directory, AGGREGATE_FILE), encoding='utf-8') as f:
+                return json.load(f)
+        except (ValueError, OSError):
+            return {}
+
+    @staticmethod
+    def _alive(pid):
+        try:
+            os.kill(pid, 0)
+            return True
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+
+    def _live_paths(self, snapshots):
+        """Files of running workers: this one, and the newest file of every other live pid."""
+        newest = {}
+        for pid, started, path, _ in snapshots:
+            if pid != os.getpid() and started >= newest.get(pid, (-1, None))[0]:
+                newest[pid] = (started, path)
+        live = {path for pid, (_, path) in newest.items() if self._alive(pid)}
+        live.add(self._path())
+        return live
+
+    def _retire(self, snapshots):
+        """Fold exited workers' counters and histograms into the aggregate file and remove theirs."""
+        merged = _merge({}, self._load_aggregate())
+        for _, _, _, snapshot in snapshots:
+            _merge(merged, snapshot, gauges=False)
+        path = os.path.join(self.directory, AGGREGATE_FILE)
+        with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(_as_snapshot(merged), f)
+        os.replace(f"{path}.tmp", path)
+        for _, _, retired, _ in snapshots:
+            try:
+                os.remove(retired)
+            except FileNotFoundError:
+                pass
+
+    def _gather(self):
+        """
+        (snapshots to count without gauges, live workers' snapshots) from the shared
+        directory. Exited workers' files are folded into the aggregate file first.
+        """
+        self.flush()
+        with open(os.path.join(self.directory, 'metrics.lock'), 'a') as lock_file:
+            # One scrape at a time, or two could fold the same file into the aggregate
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                snapshots = self._load_snapshots()
+                live_paths = self._live_paths(snapshots)
+                dead = [entry for entry in snapshots if entry[2] not in live_paths]
+                if dead and fcntl is not None:
+                    self._retire(dead)
+                    dead = []
+                totals = [self._load_aggregate()] + [snapshot for _, _, _, snapshot in dead]
+                live = [snapshot for _, _, path, snapshot in snapshots if path in live_paths]
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return totals, live
+
+    # ---- Exposition ----
+    def render(self):
+        """Prometheus text format, merged across workers when METRICS_DIR is set."""
+        if self.directory:
+            totals, snapshots = self._gather()
+        else:
+            totals, snapshots = [], [self.snapshot()]
+        merged = {}
+        for snapshot in totals:
+            _merge(merged, snapshot, gauges=False)
+        for snapshot in snapshots:
+            _merge(merged, snapshot)
+
+        lines = []
+        for name in sorted(merged):
+            entry = merged[name]
+            lines.append(f"# HELP {name} {entry['help']}")
+            lines.append(f"# TYPE {name} {entry['kind']}")
+            for key, value in sorted(entry['values'].items()):
+                if entry['kind'] == 'histogram':
+                    buckets = entry['buckets']
+                    for bound, count in zip(buckets, value):
+                        lines.append(f"{name}_bucket{_format_labels(key, [('le', _format_value(bound))])} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {value[len(buckets)]}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_value(value[-1])}")
+                    lines.append(f"{name}_count{_format_labels(key)} {value[len(buckets)]}")
+                else:
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,197 @@
+"""
+On-demand profiling of individual requests.
+
+Two profilers are available:
+- `cprofile`: deterministic cProfile. Saved as a `.prof` file (open with pstats or
+  snakeviz), or returned inline as a pstats text summary. Only one cProfile can be
+  active per process (sys.monitoring on Python 3.12+), so overlapping requests skip it.
+- `speedscope`: a sampling profiler. A helper thread snapshots the request
+  thread's stack every `interval_ms`. Saved or returned as speedscope JSON
+  (https://www.speedscope.app) for flame graphs. Many can run at once.
+
+app.py decides which requests to profile (an explicit `__profile` parameter from an
+authenticated user, or random sampling); this module only runs the profilers and
+stores results.
+"""
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+MODES = ('cprofile', 'speedscope')
+
+_cprofile_lock = threading.Lock()
+
+
+class CProfileSession:
+    mode = 'cprofile'
+    extension = 'prof'
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+
+    def start(self):
+        if not _cprofile_lock.acquire(blocking=False):
+            return False
+        try:
+            self.profiler.enable()
+        except ValueError:
+            # Another profiler (e.g. a debugger) already owns the hook
+            _cprofile_lock.release()
+            return False
+        return True
+
+    def stop(self):
+        self.profiler.disable()
+        _cprofile_lock.release()
+
+    def write(self, path):
+        self.profiler.dump_stats(path)
+
+    def summary(self, limit=60):
+        out = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=out)
+        stats.sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
+
+
+class SamplingSession:
+    """Samples one thread's Python stack on a timer."""
+    mode = 'speedscope'
+    extension = 'speedscope.json'
+
+    def __init__(self, interval_ms=1.0, name='request'):
+        self.interval = interval_ms / 1000.0
+        self.name = name
+        self.thread_id = threading.get_ident()
+        self.frames = []
+        self.frame_index = {}
+        self.samples = []
+        self.weights = []
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def _frame_id(self, code, line):
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        idx = self.frame_index.get(key)
+        if idx is None:
+            idx = self.frame_index[key] = len(self.frames)
+            self.frames.append({'name': code.co_name, 'file': code.co_filename, 'line': code.co_firstlineno})
+        return idx
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_id(frame.f_code, frame.f_lineno))
+                frame = frame.f_back
+            stack.reverse()
+            self.samples.append(stack)
+            self.weights.append((now - last) * 1000)
+            last = now
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._sampler = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+        self._sampler.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+        self.elapsed_ms = (time.perf_counter() - self.started) * 1000
+
+    def speedscope(self):
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': self.name,
+            'exporter': 'campus-carbon profiling.py',
+            'shared': {'frames': self.frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': self.name,
+                'unit': 'milliseconds',
+                'startValue': 0,
+                'endValue': round(self.elapsed_ms, 3),
+                'samples': self.samples,
+                'weights': [round(w, 3) for w in self.weights],
+            }],
+        }
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.speedscope(), f, separators=(',', ':'))
+
+    def summary(self):
+        return json.dumps(self.speedscope(), separators=(',', ':'))
+
+
+def create_session(mode, interval_ms=1.0, name='request'):
+    if mode == 'cprofile':
+        return CProfileSession()
+    return SamplingSession(interval_ms=interval_ms, name=name)
+
+
+class ProfileStore:
+    """Directory of saved profiles, pruned to the newest `keep` files."""
+
+    _SAFE = re.compile(r'[^A-Za-z0-9_.-]+')
+
+    def __init__(self, directory, keep=50):
+        self.directory = directory
+        self.keep = keep
+
+    def save(self, session, method, path, elapsed_ms):
+        os.makedirs(self.directory, exist_ok=True)
+        slug = self._SAFE.sub('_', path.strip('/')) or 'root'
+        stamp = datetime.now().strftime('%Y%m%dT%H%M%S%f')
+        name = f"{stamp}_{method}_{slug}_{int(elapsed_ms)}ms.{session.extension}"
+        session.write(os.path.join(self.directory, name))
+        self._prune()
+        return name
+
+    def _prune(self):
+        files = self.list()
+        for entry in files[self.keep:]:
+            try:
+                os.remove(os.path.join(self.directory, entry['name']))
+            except OSError:
+                pass
+
+    def list(self):
+        """Saved profiles, newest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(('.prof', '.speedscope.json')):
+                continue
+            full = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(full)
+            except OSError:
+                continue
+            entries.append({'name': name, 'bytes': stat.st_size,
+                            'created': datetime.fromtimestamp(stat.st_mtime).isoformat(timespec='seconds')})
+        entries.sort(key=lambda e: e['name'], reverse=True)
+        return entries
+
+    def path(self, name):
+        """Absolute path of a saved profile, or None for unknown / unsafe names."""
+        if name != os.path.basename(name) or not any(e['name'] == name for e in self.list()):
+            return None
+        return os.path.join(self.directory, name)
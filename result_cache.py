@@ -0,0 +1,395 @@
+"""
+Result cache shared by every worker (dashboard, bootstrap, recommendations and
+cumulative stats payloads).
+
+Backends:
+- MemoryBackend: a dict in this process (one worker, or development).
+- SQLiteBackend: one WAL-mode SQLite file, shared by the workers of one host.
+- RedisBackend: any server speaking the Redis protocol (Redis, Valkey, KeyDB...),
+  shared across hosts. Needs the optional `redis` package, or pass any client
+  with the same get/set/incr methods (e.g. a local stand-in).
+
+Writes are recorded in a short log kept in the backend (note_write(): a numbered
+date range and the sites written). Each entry stores the log position read before
+computing it and the dates and sites its value depends on; a lookup only serves it
+when no later write overlaps them, so ingest for today leaves older windows and
+other sites cached. An entry older than the log (WRITE_LOG_SIZE writes) is
+recomputed. invalidate() drops everything instead, through a generation number
+every key embeds.
+
+Values are stored as JSON text, zlib-compressed when larger than COMPRESS_MIN_BYTES.
+"""
+import hashlib
+import json
+import logging
+import os
+import secrets
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+
+try:
+    import redis
+except ImportError:  # optional: pip install .[cache]
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESS_MIN_BYTES = 512
+
+# Writes remembered for scoped invalidation; entries computed before the oldest one miss
+WRITE_LOG_SIZE = 1000
+
+# Redis: number the write and append it in one step, keeping the last ARGV[2] writes
+LOG_WRITE_SCRIPT = """
+local seq = redis.call('INCR', KEYS[1])
+redis.call('ZADD', KEYS[2], seq, seq .. ' ' .. ARGV[1])
+redis.call('ZREMRANGEBYRANK', KEYS[2], 0, -tonumber(ARGV[2]) - 1)
+return seq
+"""
+
+# Redis: drop a lease only while it is still ours
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def pack(text):
+    """JSON text -> stored bytes (b'z' + zlib data, or b'j' + UTF-8 for small values)."""
+    data = text.encode('utf-8')
+    if len(data) >= COMPRESS_MIN_BYTES:
+        return b'z' + zlib.compress(data, 6)
+    return b'j' + data
+
+
+def unpack(blob):
+    blob = bytes(blob)
+    if blob[:1] == b'z':
+        return zlib.decompress(blob[1:]).decode('utf-8')
+    return blob[1:].decode('utf-8')
+
+
+def overlaps(scope, write):
+    """Whether a write (first, last, sites) touches an entry's (first, last, sites); None sites means all."""
+    first, last, sites = scope
+    w_first, w_last, w_sites = write
+    if w_first > last or w_last < first:
+        return False
+    return sites is None or w_sites is None or bool(set(sites) & set(w_sites))
+
+
+class MemoryBackend:
+    """Entries in this process only, least recently used dropped past `max_entries`."""
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._writes = deque(maxlen=WRITE_LOG_SIZE)
+        self._write_seq = 0
+        self._leases = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.time():
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def generation(self):
+        return self._generation
+
+    def bump_generation(self):
+        with self._lock:
+            self._generation += 1
+            # Nothing can reach the old entries any more
+            self._entries.clear()
+
+    def write_seq(self):
+        return self._write_seq
+
+    def log_write(self, write):
+        with self._lock:
+            self._write_seq += 1
+            self._writes.append((self._write_seq, write))
+            return self._write_seq
+
+    def writes_since(self, seq):
+        with self._lock:
+            return [(n, write) for n, write in self._writes if n > seq]
+
+    def acquire(self, name, owner, ttl):
+        with self._lock:
+            holder = self._leases.get(name)
+            if holder is not None and holder[1] > time.time():
+                return False
+            self._leases[name] = (owner, time.time() + ttl)
+            return True
+
+    def release(self, name, owner):
+        with self._lock:
+            if self._leases.get(name, (None,))[0] == owner:
+                del self._leases[name]
+
+    def usage(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': sum(len(v) for v, _ in self._entries.values())}
+
+
+class SQLiteBackend:
+    """Cache entries in a local SQLite file (one connection per thread)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._sets = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('generation', 0)")
+            conn.execute("CREATE TABLE IF NOT EXISTS writes (seq INTEGER PRIMARY KEY AUTOINCREMENT, write TEXT NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        # Connections must not cross a fork
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._connect().execute(
+            "SELECT value FROM entries WHERE key = ? AND expires > ?", (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl):
+        conn = self._connect()
+        now = time.time()
+        conn.execute("INSERT OR REPLACE INTO entries (key, value, expires) VALUES (?, ?, ?)", (key, value, now + ttl))
+        # Keep the file small: drop expired entries now and then
+        self._sets += 1
+        if self._sets % 100 == 0:
+            conn.execute("DELETE FROM entries WHERE expires <= ?", (now,))
+
+    def generation(self):
+        return self._connect().execute("SELECT value FROM meta WHERE name = 'generation'").fetchone()[0]
+
+    def bump_generation(self):
+        self._connect().execute("UPDATE meta SET value = value + 1 WHERE name = 'generation'")
+
+    def write_seq(self):
+        row = self._connect().execute("SELECT MAX(seq) FROM writes").fetchone()
+        return row[0] or 0
+
+    def log_write(self, write):
+        conn = self._connect()
+        seq = conn.execute("INSERT INTO writes (write) VALUES (?)", (json.dumps(write),)).lastrowid
+        conn.execute("DELETE FROM writes WHERE seq <= ?", (seq - WRITE_LOG_SIZE,))
+        return seq
+
+    def writes_since(self, seq):
+        rows = self._connect().execute("SELECT seq, write FROM writes WHERE seq > ? ORDER BY seq", (seq,))
+        return [(n, tuple(json.loads(write))) for n, write in rows]
+
+    def acquire(self, name, owner, ttl):
+        now = time.time()
+        # Taken when free or expired (one statement, so two workers cannot both win)
+        cursor = self._connect().execute(
+            "INSERT INTO leases (name, owner, expires) VALUES (?, ?, ?) ON CONFLICT (name) DO UPDATE SET "
+            "owner = excluded.owner, expires = excluded.expires WHERE leases.expires <= ?",
+            (name, owner, now + ttl, now))
+        return cursor.rowcount == 1
+
+    def release(self, name, owner):
+        self._connect().execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    def usage(self):
+        row = self._connect().execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM entries").fetchone()
+        return {'entries': row[0], 'bytes': row[1]}
+
+
+class RedisBackend:
+    """Cache entries in Redis (TTL via PX); the generation is an INCR counter."""
+
+    def __init__(self, url=None, client=None, prefix='campus-carbon:'):
+        if client is None:
+            if redis is None:
+                raise RuntimeError('The redis package is not installed (pip install .[cache])')
+            client = redis.Redis.from_url(url, socket_timeout=1.0)
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, value, px=int(ttl * 1000))
+
+    def generation(self):
+        return int(self.client.get(self.prefix + 'generation') or 0)
+
+    def bump_generation(self):
+        self.client.incr(self.prefix + 'generation')
+
+    def write_seq(self):
+        return int(self.client.get(self.prefix + 'write_seq') or 0)
+
+    def log_write(self, write):
+        return int(self.client.eval(LOG_WRITE_SCRIPT, 2, self.prefix + 'write_seq', self.prefix + 'writes',
+                                    json.dumps(write), WRITE_LOG_SIZE))
+
+    def writes_since(self, seq):
+        out = []
+        for member in self.client.zrangebyscore(self.prefix + 'writes', f'({seq}', '+inf'):
+            n, write = (member.decode() if isinstance(member, bytes) else member).split(' ', 1)
+            out.append((int(n), tuple(json.loads(write))))
+        return out
+
+    def acquire(self, name, owner, ttl):
+        return bool(self.client.set(self.prefix + 'lease:' + name, owner, nx=True, px=int(ttl * 1000)))
+
+    def release(self, name, owner):
+        self.client.eval(RELEASE_SCRIPT, 1, self.prefix + 'lease:' + name, owner)
+
+    def usage(self):
+        return None
+
+
+class ResultCache:
+    def __init__(self, backend, ttl=300.0, encode=json.dumps, decode=json.loads):
+        self.backend = backend
+        self.ttl = ttl
+        self.encode = encode
+        self.decode = decode
+        self.stats = {'hit': 0, 'miss': 0, 'error': 0, 'invalidate': 0, 'stored_bytes': 0}
+
+    def get_or_compute(self, name, params, compute, scope=None):
+        """
+        Cached value of compute() for (name, params). `scope` is the (first, last, sites)
+        the value depends on (ISO dates; sites None for all); None means every write
+        invalidates it. Backend failures never fail the request: the value is then
+        computed without the cache. Returns (value, hit).
+        """
+        try:
+            key = self._key(name, params)
+            blob = self._lookup(key, scope)
+            if blob is not None:
+                self.stats['hit'] += 1
+                return self.decode(unpack(blob)), True
+            seq = self.backend.write_seq()
+        except Exception:
+            logger.exception("Result cache lookup failed")
+            self.stats['error'] += 1
+            return compute(), False
+
+        self.stats['miss'] += 1
+        value = compute()
+        try:
+            blob = pack(self.encode(value))
+            self.backend.set(key, str(seq).encode() + b':' + blob, self.ttl)
+            self.stats['stored_bytes'] += len(blob)
+        except Exception:
+            logger.exception("Result cache store failed")
+            self.stats['error'] += 1
+        return value, False
+
+    def contains(self, name, params, scope=None):
+        """Whether get_or_compute() would serve (name, params) from the cache (False on backend errors)."""
+        try:
+            return self._lookup(self._key(name, params), scope) is not None
+        except Exception:
+            logger.exception("Result cache lookup failed")
+            self.stats['error'] += 1
+            return False
+
+    def _key(self, name, params):
+        digest = hashlib.sha1(repr(params).encode()).hexdigest()
+        return f"{name}:{self.backend.generation()}:{digest}"
+
+    def _lookup(self, key, scope):
+        """The stored (packed) value for `key` if no later write overlaps `scope`, else None."""
+        blob = self.backend.get(key)
+        if blob is None:
+            return None
+        seq, _, blob = bytes(blob).partition(b':')
+        return blob if self._unchanged(int(seq), scope) else None
+
+    def lease(self, name, ttl):
+        """
+        Claim `name` for one worker (across every worker sharing the backend) for at most
+        `ttl` seconds. Returns a function that gives it back, or None when another worker
+        holds it or the backend fails.
+        """
+        owner = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(8)}"
+        try:
+            if not self.backend.acquire(name, owner, ttl):
+                return None
+        except Exception:
+            logger.exception("Result cache lease failed")
+            self.stats['error'] += 1
+            return None
+
+        def release():
+            try:
+                self.backend.release(name, owner)
+            except Exception:
+                logger.exception("Result cache lease release failed")
+        return release
+
+    def _unchanged(self, seq, scope):
+        """Whether no write logged after `seq` overlaps `scope` (False when the log no longer reaches back)."""
+        writes = self.backend.writes_since(seq)
+        if not writes:
+            return self.backend.write_seq() <= seq
+        if writes[0][0] != seq + 1 or scope is None:
+            return False
+        return not any(overlaps(scope, write) for _, write in writes)
+
+    def note_write(self, first, last, sites):
+        """Record a write of dates first..last (ISO) at `sites`, so overlapping entries miss in every worker."""
+        try:
+            self.backend.log_write((first, last, sorted(sites) if sites is not None else None))
+            self.stats['invalidate'] += 1
+        except Exception:
+            logger.exception("Result cache invalidation failed")
+            self.stats['error'] += 1
+
+    def invalidate(self):
+        """Make every cached result unreachable, in every worker."""
+        try:
+            self.backend.bump_generation()
+            self.stats['invalidate'] += 1
+        except Exception:
+            logger.exception("Result cache invalidation failed")
+            self.stats['error'] += 1
+
+    def snapshot(self):
+        info = dict(self.stats, backend=type(self.backend).__name__, ttl_seconds=self.ttl)
+        try:
+            info['generation'] = self.backend.generation()
+            info['write_seq'] = self.backend.write_seq()
+            info['usage'] = self.backend.usage()
+        except Exception:
+            pass
+        return info
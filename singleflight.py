@@ -0,0 +1,177 @@
+"""
+Single-flight request coalescing.
+
+Group.do(key, fn) runs fn() once for all concurrent callers with the same key:
+the first caller (the leader) computes, the others wait for it and get the same
+result (or exception). Nothing is cached; once the leader finishes, the next
+caller computes afresh. Keys must include everything the result depends on
+(normalized arguments and version(), which bump() advances after every write),
+so a shared result is never one the caller could not have computed itself.
+
+Optional cross-process mode (`shared_dir`): each leader also takes an flock on
+`<dir>/<key hash>.lock`. A leader that had to wait for that lock reuses the
+result file the other process wrote if it finished after this leader arrived,
+so one computation serves every worker on the host. The data version is then
+the mtime of a stamp file that bump() touches, so a write in any worker changes
+the key everywhere. Results cross processes via `encode`/`decode` (JSON text
+by default).
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; cross-process mode is then disabled
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class Group:
+    def __init__(self, shared_dir=None, wait_timeout=30.0, encode=json.dumps, decode=json.loads):
+        self.shared_dir = shared_dir if fcntl is not None else None
+        self.wait_timeout = wait_timeout
+        self.encode = encode
+        self.decode = decode
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._version = 0
+        self._writes = 0
+        self._stamp = os.path.join(self.shared_dir, 'data-version') if self.shared_dir else None
+        # leader: computed here; shared: waited on a thread in this process;
+        # shared_process: reused another worker's result; timeout: gave up waiting
+        self.stats = {'leader': 0, 'shared': 0, 'shared_process': 0, 'timeout': 0}
+        if shared_dir and fcntl is None:
+            logger.warning("Cross-process single-flight needs fcntl; coalescing within each worker only.")
+
+    def version(self):
+        """Current data version, to be part of every key."""
+        if self._stamp:
+            try:
+                return os.stat(self._stamp).st_mtime_ns
+            except FileNotFoundError:
+                return 0
+        return self._version
+
+    def bump(self):
+        """Data changed: calls started from now on no longer join earlier ones."""
+        with self._lock:
+            self._version += 1
+        if self._stamp:
+            try:
+                os.makedirs(self.shared_dir, exist_ok=True)
+                with open(self._stamp, 'a'):
+                    pass
+                os.utime(self._stamp)
+            except OSError:
+                logger.exception("Could not update the shared data version")
+
+    def do(self, key, fn):
+        """fn() for the first caller with `key`, its result for concurrent callers. Returns (result, shared)."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+            else:
+                call.waiters += 1
+                leader = False
+
+        if not leader:
+            if not call.done.wait(self.wait_timeout):
+                # The leader is stuck; do not let it hold everyone hostage
+                self.stats['timeout'] += 1
+                return fn(), False
+            self.stats['shared'] += 1
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result, shared = self._lead(key, fn)
+            return call.result, shared
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _lead(self, key, fn):
+        if not self.shared_dir:
+            self.stats['leader'] += 1
+            return fn(), False
+
+        os.makedirs(self.shared_dir, exist_ok=True)
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        lock_path = os.path.join(self.shared_dir, digest + '.lock')
+        result_path = os.path.join(self.shared_dir, digest + '.json')
+        arrived = time.time()
+        deadline = time.monotonic() + self.wait_timeout
+        with open(lock_path, 'a') as lock_file:
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() > deadline:
+                        self.stats['timeout'] += 1
+                        return fn(), False
+                    time.sleep(0.005)
+            try:
+                shared = self._read_result(result_path, arrived)
+                if shared is not None:
+                    self.stats['shared_process'] += 1
+                    return shared, True
+                self.stats['leader'] += 1
+                result = fn()
+                self._write_result(result_path, result)
+                return result, False
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_result(self, path, arrived):
+        """Another process's result, if it was computed while this caller waited."""
+        try:
+            if os.path.getmtime(path) < arrived:
+                return None
+            with open(path, encoding='utf-8') as f:
+                return self.decode(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def _write_result(self, path, result):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(self.encode(result))
+            os.replace(tmp, path)
+        except (OSError, TypeError, ValueError):
+            logger.exception("Could not share single-flight result")
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self._prune()
+
+    def _prune(self):
+        """Remove result/lock files of keys nobody has asked for in a while."""
+        cutoff = time.time() - max(self.wait_timeout * 2, 300)
+        for name in os.listdir(self.shared_dir):
+            path = os.path.join(self.shared_dir, name)
+            try:
+                if path != self._stamp and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
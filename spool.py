@@ -0,0 +1,334 @@
+"""
+Write-ahead spool for ingest while MySQL is unavailable.
+
+Writes that cannot reach the database are appended to a local segment file as
+one JSON line per request: {"id", "kind", "rows"}. Appends are group-committed:
+a writer returns once an fsync covering its line has completed, and one fsync
+covers every line written while the previous one was running, so concurrent
+requests share the cost.
+
+Segments are named `<pid>-<unix time>-<n>.open` while a worker writes them and are renamed
+to `.ready` when sealed (size limit or a drain pass). A drainer claims a ready
+segment by renaming it to `.draining-<pid>`, which is atomic, so workers sharing
+the directory never replay the same segment. Segments left `.open` or
+`.draining` by a worker that died are picked up by the others.
+
+Replay is at-least-once. The `apply` callback must skip record ids it has already
+committed (app.py keeps them in `ingest_spool_applied`), which makes it exactly-once.
+
+A batch that fails is retried one record at a time, so a single bad record cannot
+hold back the rest: the records after it are applied, and the failed record is put
+back with its attempt count. After `max_attempts` failed passes it is moved to the
+dead-letter file (`dead-letter.jsonl`) instead of blocking the spool for good. apply()
+raises Unavailable when the database cannot be reached at all; that never counts
+against a record.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+DEAD_LETTER_FILE = 'dead-letter.jsonl'
+SEGMENT_SUFFIXES = ('.open', '.ready')
+
+
+class Unavailable(Exception):
+    """Raised by apply() when the target cannot be reached; the records are kept for the next pass."""
+
+
+def _is_segment(name):
+    return name.endswith(SEGMENT_SUFFIXES) or '.draining-' in name
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Spool:
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, fsync=True, max_attempts=3):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.max_attempts = max_attempts
+        self.dead_letter_path = os.path.join(directory, DEAD_LETTER_FILE)
+        self._dead_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._file = None
+        self._file_pid = None
+        self._segment = 0
+        self._written = 0       # lines appended to the open segment
+        self._synced = 0        # lines covered by the last fsync
+        self._drainer_pid = None
+        self.stats = {'records': 0, 'rows': 0, 'fsyncs': 0, 'replayed_records': 0,
+                      'replayed_rows': 0, 'duplicates': 0, 'drain_failures': 0, 'corrupt_lines': 0,
+                      'record_failures': 0, 'dead_lettered': 0}
+
+    # ---- writing ----
+
+    def _open_segment(self):
+        os.makedirs(self.directory, exist_ok=True)
+        pid = os.getpid()
+        if self._file_pid != pid:
+            # A forked worker must not share the parent's open segment
+            self._file = None
+            self._file_pid = pid
+            self._written = self._synced = 0
+        while self._file is None:
+            self._segment += 1
+            path = os.path.join(self.directory, f"{pid}-{int(time.time())}-{self._segment:06d}.open")
+            if not os.path.exists(path):
+                self._file = open(path, 'ab')
+                self._path = path
+
+    def _seal(self):
+        """Close the open segment and mark it ready for replay (caller holds _write_lock)."""
+        if self._file is None or self._file_pid != os.getpid():
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        os.rename(self._path, self._path[:-len('.open')] + '.ready')
+        self._written = self._synced = 0
+
+    def append(self, kind, rows):
+        """Durably spool `rows` (JSON-serialisable) of `kind`; returns the record id."""
+        record_id = uuid.uuid4().hex
+        line = json.dumps({'id': record_id, 'kind': kind, 'rows': rows}, separators=(',', ':')).encode() + b'\n'
+        with self._write_lock:
+            self._open_segment()
+            self._file.write(line)
+            self._written += 1
+            seq = self._written
+            segment = self._file
+            self.stats['records'] += 1
+            self.stats['rows'] += len(rows)
+            if self._file.tell() >= self.segment_bytes:
+                self._seal()
+                return record_id
+        self._sync(segment, seq)
+        return record_id
+
+    def _sync(self, segment, seq):
+        """Group commit: flush + fsync unless a concurrent fsync already covered line `seq`."""
+        with self._sync_lock:
+            with self._write_lock:
+                if segment is not self._file or self._synced >= seq:
+                    return  # sealed (sealing fsyncs) or already covered
+                segment.flush()
+                target = self._written
+            if self.fsync:
+                os.fsync(segment.fileno())
+                self.stats['fsyncs'] += 1
+            with self._write_lock:
+                self._synced = max(self._synced, target)
+
+    # ---- replay ----
+
+    def _segments(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+
+        def created(name):
+            # Oldest first across workers, so replay roughly follows arrival order
+            parts = name.split('-')
+            return (parts[1] if len(parts) > 2 else '', name)
+        return sorted((name for name in names if _is_segment(name)), key=created)
+
+    def backlog_bytes(self):
+        """Bytes spooled and not yet replayed (all workers)."""
+        total = 0
+        for name in self._segments():
+            try:
+                total += os.path.getsize(os.path.join(self.directory, name))
+            except OSError:
+                pass
+        return total
+
+    def has_backlog(self):
+        """True while anything is waiting for replay (new writes then queue behind it)."""
+        return any(self._segments())
+
+    def _claimable(self, name):
+        if name.endswith('.ready'):
+            return True
+        try:
+            if name.endswith('.open'):
+                pid = int(name.split('-', 1)[0])
+            elif '.draining-' in name:
+                pid = int(name.rsplit('-', 1)[1])
+            else:
+                return False
+        except ValueError:
+            return False  # not a spool segment
+        return pid != os.getpid() and not _pid_alive(pid)
+
+    def _claim(self, name):
+        """Rename a segment to `.draining-<pid>`; None when another worker got it first."""
+        base = name.rsplit('.', 1)[0]
+        target = os.path.join(self.directory, f"{base}.draining-{os.getpid()}")
+        try:
+            os.rename(os.path.join(self.directory, name), target)
+        except FileNotFoundError:
+            return None
+        return target
+
+    def _read(self, path):
+        records = []
+        with open(path, 'rb') as f:
+            for number, line in enumerate(f, start=1):
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # A torn final line from a crash mid-append was never acknowledged
+                    self.stats['corrupt_lines'] += 1
+                    logger.warning(f"Skipping unreadable spool line {number} in {path}")
+        return records
+
+    def drain(self, apply, batch_records=500):
+        """
+        Seal this worker's segment and replay every claimable segment through
+        apply(records), which must commit them (skipping known ids) or raise.
+        A failed batch is retried record by record; records that fail are put back
+        (or dead-lettered) and the rest applied. When apply() raises Unavailable the
+        records not yet applied are put back for the next pass and it is re-raised.
+        Returns the number of records replayed.
+        """
+        with self._write_lock:
+            if self._written:
+                self._seal()
+        replayed = 0
+        for name in self._segments():
+            if not self._claimable(name):
+                continue
+            path = self._claim(name)
+            if path is None:
+                continue
+            records = self._read(path)
+            retry = []
+            i = single_until = 0
+            try:
+                while i < len(records):
+                    batch = records[i:i + (1 if i < single_until else batch_records)]
+                    try:
+                        applied = apply(batch)
+                    except Unavailable:
+                        raise
+                    except Exception as e:
+                        if len(batch) > 1:
+                            logger.warning(f"Spool replay batch failed ({e}); retrying its records one at a time")
+                            single_until = i + len(batch)
+                            continue
+                        self._failed(batch[0], e, retry)
+                        i += 1
+                        continue
+                    self.stats['duplicates'] += len(batch) - applied
+                    self.stats['replayed_records'] += applied
+                    self.stats['replayed_rows'] += sum(len(r['rows']) for r in batch)
+                    replayed += applied
+                    i += len(batch)
+            except Exception:
+                self.stats['drain_failures'] += 1
+                # Put back what is left; records already applied are skipped by id next time
+                if i == 0 and not retry:
+                    os.rename(path, path.rsplit('.', 1)[0] + '.ready')
+                else:
+                    self._put_back(path, retry + records[i:])
+                raise
+            self._put_back(path, retry)
+        return replayed
+
+    def _failed(self, record, error, retry):
+        """Count a failed replay of `record`: retry it next pass, or dead-letter it after max_attempts."""
+        self.stats['record_failures'] += 1
+        record['attempts'] = record.get('attempts', 0) + 1
+        if record['attempts'] >= self.max_attempts:
+            self._dead_letter(record, error)
+        else:
+            logger.warning(f"Spooled record {record.get('id')} failed to replay "
+                           f"(attempt {record['attempts']} of {self.max_attempts}): {error}")
+            retry.append(record)
+
+    def _dead_letter(self, record, error):
+        """Append a record that keeps failing to the dead-letter file (fsynced)."""
+        line = json.dumps(dict(record, error=str(error), dead_at=time.strftime('%Y-%m-%dT%H:%M:%S')),
+                          separators=(',', ':')).encode() + b'\n'
+        with self._dead_lock:
+            with open(self.dead_letter_path, 'ab') as f:
+                f.write(line)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+        self.stats['dead_lettered'] += 1
+        logger.error(f"Spooled record {record.get('id')} moved to {self.dead_letter_path} "
+                     f"after {record.get('attempts', 0)} failed replays: {error}")
+
+    def _put_back(self, path, records):
+        """Replace a claimed segment with the records still to replay, ready for the next pass."""
+        base = path.rsplit('.', 1)[0]
+        if not records:
+            os.remove(path)
+            return
+        tmp = base + '.putback'
+        with open(tmp, 'wb') as f:
+            for record in records:
+                f.write(json.dumps(record, separators=(',', ':')).encode() + b'\n')
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.rename(tmp, base + '.ready')
+        os.remove(path)
+
+    def dead_letters(self, limit=20):
+        """(count, last `limit` records) of the dead-letter file (every worker's)."""
+        try:
+            with open(self.dead_letter_path, 'rb') as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return 0, []
+        recent = []
+        for line in lines[-limit:] if limit else []:
+            try:
+                recent.append(json.loads(line))
+            except ValueError:
+                pass
+        return len(lines), recent
+
+    def start_drainer(self, apply, interval=5.0):
+        """Drain every `interval` seconds in a background thread (one per worker process)."""
+        if interval <= 0 or self._drainer_pid == os.getpid():
+            return
+        self._drainer_pid = os.getpid()
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                if not self.has_backlog():
+                    continue
+                try:
+                    count = self.drain(apply)
+                    if count:
+                        logger.info(f"Replayed {count} spooled ingest records")
+                except Exception as e:
+                    logger.warning(f"Spool replay deferred: {e}")
+
+        threading.Thread(target=loop, name='spool-drainer', daemon=True).start()
+
+    def snapshot(self):
+        dead, recent = self.dead_letters(limit=5)
+        return dict(self.stats, directory=self.directory, backlog_bytes=self.backlog_bytes(),
+                    fsync=self.fsync, dead_letter={'path': self.dead_letter_path, 'records': dead,
+                                                   'recent': recent})
@@ -1,5 +1,6 @@
 let trendChart, donutChart, monthlyBarChart, yearlyBarChart, weeklyBarChart;
 let humanTrendChart, humanBreakdownChart, humanComparisonChart; // CORE FEATURE charts
+let dashboardState = null; // Last /api/dashboard payload, patched in place by live updates
 
 function getDateRange(days) {
     const endDate = new Date();
@@ -12,52 +13,95 @@ function getDateRange(days) {
     };
 }
 
+// Selected site code from #siteFilter ('' = all sites)
+function selectedSite() {
+    const select = document.getElementById('siteFilter');
+    return select ? select.value : '';
+}
+
+function siteQuery(prefix = '&') {
+    const site = selectedSite();
+    return site ? `${prefix}site=${encodeURIComponent(site)}` : '';
+}
+
+function loadSites() {
+    fetch('/api/sites')
+        .then(response => response.json())
+        .then(data => {
+            const select = document.getElementById('siteFilter');
+            if (!select || !data.sites) return;
+            data.sites.forEach(site => {
+                const option = document.createElement('option');
+                option.value = site.code;
+                option.textContent = site.campus && site.campus !== site.code ? `${site.name} (${site.campus})` : site.name;
+                select.appendChild(option);
+            });
+            // Nothing to choose between with a single site
+            document.getElementById('siteSelector').style.display = data.sites.length > 1 ? '' : 'none';
+        })
+        .catch(error => {
+            console.error('Error fetching sites:', error);
+        });
+}
+
+function changeSite() {
+    updateDashboard();
+    updateCumulativeStats();
+    loadRecommendations();
+}
+
 function updateDashboard() {
     const days = parseInt(document.getElementById('dateRange').value);
     const dateRange = getDateRange(days);
+    const site = selectedSite();
     
-    fetch(`/api/dashboard?start_date=${dateRange.start}&end_date=${dateRange.end}`)
+    fetch(`/api/dashboard?start_date=${dateRange.start}&end_date=${dateRange.end}${siteQuery()}`)
         .then(response => response.json())
         .then(data => {
             console.log('📊 Dashboard data received:', data);
-            updateKPIs(data.kpis);
-            
-            // Choose appropriate granularity based on time range
-            let trendData, trendLabel;
-            if (days <= 7) {
-                // For 7 days or less, use daily data
-                trendData = data.daily_trend || [];
-                trendLabel = 'date';
-            } else if (days <= 90) {
-                // For 30-90 days, use weekly data
-                trendData = data.weekly_trend || [];
-                trendLabel = 'label';
-            } else {
-                // For 6 months, 1 year, use monthly data
-                trendData = data.monthly_trend || [];
-                trendLabel = 'month';
-            }
-            
-            updateTrendChart(trendData, trendLabel, days);
-            updateMonthlyBarChart(data.monthly_trend || []);
-            updateYearlyBarChart(data.yearly_comparison || []);
-            updateWeeklyBarChart(data.weekly_comparison || []);
-            updateDonutChart(data.source_breakdown || []);
-            
-            // CORE FEATURE: Update human emissions KPIs only
-            console.log('🔍 Checking human_emissions data:', data.human_emissions);
-            if (data.human_emissions) {
-                console.log('✅ Human emissions data found, updating KPIs...');
-                updateHumanKPIs(data.human_emissions);
-            } else {
-                console.warn('⚠️ No human_emissions data in response!');
-            }
+            dashboardState = { data: data, days: days, range: dateRange, site: site };
+            renderDashboard(data, days);
         })
         .catch(error => {
             console.error('Error fetching dashboard data:', error);
         });
 }
 
+function renderDashboard(data, days) {
+    updateKPIs(data.kpis);
+
+    // Choose appropriate granularity based on time range
+    let trendData, trendLabel;
+    if (days <= 7) {
+        // For 7 days or less, use daily data
+        trendData = data.daily_trend || [];
+        trendLabel = 'date';
+    } else if (days <= 90) {
+        // For 30-90 days, use weekly data
+        trendData = data.weekly_trend || [];
+        trendLabel = 'label';
+    } else {
+        // For 6 months, 1 year, use monthly data
+        trendData = data.monthly_trend || [];
+        trendLabel = 'month';
+    }
+
+    updateTrendChart(trendData, trendLabel, days);
+    updateMonthlyBarChart(data.monthly_trend || []);
+    updateYearlyBarChart(data.yearly_comparison || []);
+    updateWeeklyBarChart(data.weekly_comparison || []);
+    updateDonutChart(data.source_breakdown || []);
+
+    // CORE FEATURE: Update human emissions KPIs only
+    console.log('🔍 Checking human_emissions data:', data.human_emissions);
+    if (data.human_emissions) {
+        console.log('✅ Human emissions data found, updating KPIs...');
+        updateHumanKPIs(data.human_emissions);
+    } else {
+        console.warn('⚠️ No human_emissions data in response!');
+    }
+}
+
 function updateKPIs(kpis) {
     if (!kpis) return;
 
@@ -411,42 +455,201 @@ function updateHumanKPIs(humanData) {
 
 // Update cumulative statistics (all-time totals)
 function updateCumulativeStats() {
-    fetch('/api/human_cumulative_stats')
+    fetch(`/api/human_cumulative_stats${siteQuery('?')}`)
         .then(response => response.json())
         .then(data => {
             console.log('📊 Cumulative stats:', data);
-            
-            // Check if elements exist before updating
-            const totalEmissionsEl = document.getElementById('cumulativeTotalEmissions');
-            if (totalEmissionsEl && data.total_emissions !== undefined) {
-                totalEmissionsEl.textContent = data.total_emissions.toFixed(2);
-            }
-            
-            const daysEl = document.getElementById('cumulativeDays');
-            if (daysEl && data.total_records !== undefined) {
-                daysEl.textContent = data.total_records;
-            }
-            
-            const avgPopEl = document.getElementById('cumulativeAvgPopulation');
-            if (avgPopEl && data.average_population !== undefined) {
-                avgPopEl.textContent = data.average_population;
-            }
-            
-            const avgStudentsEl = document.getElementById('cumulativeAvgStudents');
-            if (avgStudentsEl && data.average_students !== undefined) {
-                avgStudentsEl.textContent = data.average_students;
-            }
-            
-            const avgStaffEl = document.getElementById('cumulativeAvgStaff');
-            if (avgStaffEl && data.average_staff !== undefined) {
-                avgStaffEl.textContent = data.average_staff;
-            }
+            renderCumulativeStats(data);
         })
         .catch(error => {
             console.error('Error fetching cumulative stats:', error);
         });
 }
 
+function renderCumulativeStats(data) {
+    // Check if elements exist before updating
+    const totalEmissionsEl = document.getElementById('cumulativeTotalEmissions');
+    if (totalEmissionsEl && data.total_emissions !== undefined) {
+        totalEmissionsEl.textContent = Number(data.total_emissions).toFixed(2);
+    }
+
+    const daysEl = document.getElementById('cumulativeDays');
+    if (daysEl && data.total_records !== undefined) {
+        daysEl.textContent = data.total_records;
+    }
+
+    const avgPopEl = document.getElementById('cumulativeAvgPopulation');
+    if (avgPopEl && data.average_population !== undefined) {
+        avgPopEl.textContent = data.average_population;
+    }
+
+    const avgStudentsEl = document.getElementById('cumulativeAvgStudents');
+    if (avgStudentsEl && data.average_students !== undefined) {
+        avgStudentsEl.textContent = data.average_students;
+    }
+
+    const avgStaffEl = document.getElementById('cumulativeAvgStaff');
+    if (avgStaffEl && data.average_staff !== undefined) {
+        avgStaffEl.textContent = data.average_staff;
+    }
+}
+
+// ---- Live updates (server-sent events from /api/stream) ----
+
+function roundTo(value, places) {
+    const factor = Math.pow(10, places);
+    return Math.round(value * factor) / factor;
+}
+
+// Add `delta` to the series entry whose `key` equals `label` (inserting it in order if missing)
+function addToSeries(series, key, label, delta) {
+    if (!series) return;
+    const item = series.find(d => d[key] === label);
+    if (item) {
+        item.emissions = roundTo(Number(item.emissions) + delta, 2);
+    } else {
+        series.push({ [key]: label, emissions: roundTo(delta, 2) });
+        series.sort((a, b) => (a[key] > b[key] ? 1 : (a[key] < b[key] ? -1 : 0)));
+    }
+}
+
+function isoWeekLabel(dateStr) {
+    const d = new Date(dateStr + 'T00:00:00Z');
+    const day = d.getUTCDay() || 7;
+    d.setUTCDate(d.getUTCDate() + 4 - day);
+    const yearStart = new Date(Date.UTC(d.getUTCFullYear(), 0, 1));
+    const week = Math.ceil(((d - yearStart) / 86400000 + 1) / 7);
+    return `${d.getUTCFullYear()}-W${String(week).padStart(2, '0')}`;
+}
+
+function recomputeKpis(data) {
+    const kpis = data.kpis;
+    const breakdown = data.source_breakdown || [];
+    if (!kpis) return;
+
+    const total = Number(kpis.total_emissions);
+    breakdown.forEach(s => {
+        s.percentage = total > 0 ? roundTo(s.emissions / total * 100, 1) : 0;
+    });
+    if (breakdown.length) {
+        const biggest = breakdown.reduce((a, b) => (b.emissions > a.emissions ? b : a));
+        kpis.biggest_source = biggest.source;
+        kpis.biggest_source_percent = biggest.percentage;
+    }
+    const previous = Number(kpis.previous_emissions ?? 0);
+    if (previous > 0) {
+        kpis.percent_change = roundTo((total - previous) / previous * 100, 2);
+    }
+}
+
+function applyActivityDelta(payload) {
+    if (!dashboardState) return;
+    const { data, range, site } = dashboardState;
+    const inRange = date => date >= range.start && date <= range.end;
+    let touched = false;
+
+    (payload.changes || []).forEach(change => {
+        if (!inRange(change.date) || (site && change.site !== site)) return;
+        touched = true;
+        addToSeries(data.daily_trend, 'date', change.date, change.emissions);
+        addToSeries(data.weekly_trend, 'label', change.week, change.emissions);
+        addToSeries(data.weekly_comparison, 'label', change.week, change.emissions);
+        addToSeries(data.monthly_trend, 'month', change.month, change.emissions);
+        addToSeries(data.yearly_comparison, 'year', change.year, change.emissions);
+        if (data.source_breakdown) {
+            const item = data.source_breakdown.find(s => s.source === change.source);
+            if (item) {
+                item.emissions = roundTo(item.emissions + change.emissions, 2);
+            } else {
+                data.source_breakdown.push({ source: change.source, emissions: roundTo(change.emissions, 2), percentage: 0 });
+            }
+        }
+        if (data.kpis) {
+            data.kpis.total_emissions = roundTo(Number(data.kpis.total_emissions) + change.emissions, 2);
+            if (change.source === 'electricity') {
+                data.kpis.energy_saved = Math.round(Number(data.kpis.energy_saved) + change.raw);
+            }
+        }
+    });
+    if (!touched) return;
+
+    // Server-computed daily totals are authoritative for the daily series
+    const dailyTotals = site ? (payload.site_daily_totals || {})[site] : payload.daily_totals;
+    Object.entries(dailyTotals || {}).forEach(([date, total]) => {
+        const item = (data.daily_trend || []).find(d => d.date === date);
+        if (item && inRange(date)) item.emissions = roundTo(total, 2);
+    });
+
+    recomputeKpis(data);
+    renderDashboard(data, dashboardState.days);
+}
+
+function applyHumanDelta(payload) {
+    const site = selectedSite();
+    const stats = payload.cumulative_stats || {};
+    if (!site) {
+        // Cumulative stats in the event cover every site
+        renderCumulativeStats({
+            total_emissions: stats.total_emissions_tonnes,
+            total_records: stats.total_records,
+            average_population: stats.average_population,
+            average_students: stats.average_students,
+            average_staff: stats.average_staff
+        });
+    } else if (payload.entry && payload.entry.site === site) {
+        updateCumulativeStats();
+    }
+
+    if (!dashboardState || !dashboardState.data.human_emissions) return;
+    const { range } = dashboardState;
+    const human = dashboardState.data.human_emissions;
+    const entry = payload.entry;
+    if (!entry || entry.date < range.start || entry.date > range.end) return;
+    if (dashboardState.site && entry.site !== dashboardState.site) return;
+
+    // The day's headcount summed over the selected sites
+    const daySites = (payload.day_sites || [entry]).filter(s => !dashboardState.site || s.site === dashboardState.site);
+    const students = daySites.reduce((sum, s) => sum + s.student_count, 0);
+    const staff = daySites.reduce((sum, s) => sum + s.staff_count, 0);
+
+    // Upsert the day's headcount and apply the emissions difference to the series
+    // (kg CO2e per person on that date; 0 when no human_daily factor applies)
+    const factor = payload.factor || 0;
+    const rows = human.population_data || (human.population_data = []);
+    const existing = rows.find(r => r.date === entry.date);
+    const delta = (students + staff - (existing ? existing.total : 0)) * factor / 1000;
+    const row = { date: entry.date, students: students, staff: staff,
+                  total: students + staff, emissions: roundTo((students + staff) * factor / 1000, 3) };
+    if (existing) {
+        Object.assign(existing, row);
+    } else {
+        rows.push(row);
+        rows.sort((a, b) => (a.date > b.date ? 1 : -1));
+    }
+
+    human.total_emissions = roundTo(parseFloat(human.total_emissions || 0) + delta, 2);
+    addToSeries(human.daily_trend, 'date', entry.date, delta);
+    addToSeries(human.weekly_trend, 'label', isoWeekLabel(entry.date), delta);
+    addToSeries(human.monthly_trend, 'month', entry.date.slice(0, 7), delta);
+    human.avg_student_count = Math.floor(rows.reduce((sum, r) => sum + r.students, 0) / rows.length);
+    human.avg_staff_count = Math.floor(rows.reduce((sum, r) => sum + r.staff, 0) / rows.length);
+    human.avg_total_count = human.avg_student_count + human.avg_staff_count;
+    updateHumanKPIs(human);
+}
+
+function connectLiveUpdates() {
+    if (!window.EventSource) return;
+    // EventSource reconnects by itself and resends Last-Event-ID
+    const source = new EventSource('/api/stream');
+    source.addEventListener('activity', e => applyActivityDelta(JSON.parse(e.data)));
+    source.addEventListener('human', e => applyHumanDelta(JSON.parse(e.data)));
+    source.addEventListener('reload', () => {
+        updateDashboard();
+        updateCumulativeStats();
+        loadRecommendations();
+    });
+}
+
 function updateHumanTrendChart(humanData, days) {
     const canvas = document.getElementById('humanTrendChart');
     if (!canvas) return;
@@ -702,71 +905,9 @@ function updateHumanComparisonChart(humanData, days) {
 }
 
 function loadRecommendations() {
-    fetch('/api/recommendations')
+    fetch(`/api/recommendations${siteQuery('?')}`)
         .then(response => response.json())
-        .then(data => {
-            const container = document.getElementById('recommendationsContainer');
-            container.innerHTML = '';
-            
-            // Add summary banner if available
-            if (data.summary) {
-                const summaryBanner = document.createElement('div');
-                summaryBanner.style.cssText = 'padding: 20px; background: linear-gradient(135deg, #00d4aa 0%, #00a88a 100%); border-radius: 10px; margin-bottom: 30px; color: white;';
-                summaryBanner.innerHTML = `
-                    <h3 style="margin: 0 0 10px 0; font-size: 22px;">✨ ${data.summary.message}</h3>
-                    <p style="margin: 0; font-size: 16px;">
-                        ${data.summary.total_recommendations} recommendations available • 
-                        ${data.summary.high_priority} high priority • 
-                        Potential reduction: ${data.summary.estimated_total_reduction}
-                    </p>
-                `;
-                container.appendChild(summaryBanner);
-            }
-            
-            data.recommendations.forEach((rec, index) => {
-                const card = document.createElement('div');
-                card.className = `recommendation-card priority-${rec.priority.toLowerCase()}`;
-                card.style.cursor = 'pointer';
-                
-                // Build actionable steps list
-                let stepsHTML = '';
-                if (rec.actionable_steps && rec.actionable_steps.length > 0) {
-                    stepsHTML = `
-                        <div class="steps-container" id="steps-${index}" style="display: none; margin-top: 15px; padding: 15px; background: rgba(0, 0, 0, 0.2); border-radius: 8px;">
-                            <h5 style="color: #00d4aa; margin: 0 0 10px 0;">🎯 Actionable Steps:</h5>
-                            <ul style="margin: 0; padding-left: 20px; line-height: 1.8;">
-                                ${rec.actionable_steps.map(step => `<li>${step}</li>`).join('')}
-                            </ul>
-                            ${rec.expected_reduction ? `<p style="margin: 15px 0 5px 0; color: #00d4aa;"><strong>📈 Impact:</strong> ${rec.expected_reduction}</p>` : ''}
-                            ${rec.cost ? `<p style="margin: 5px 0; color: #ffa502;"><strong>💰 Cost:</strong> ${rec.cost}</p>` : ''}
-                            ${rec.timeframe ? `<p style="margin: 5px 0; color: #0099ff;"><strong>⏱️ Timeframe:</strong> ${rec.timeframe}</p>` : ''}
-                        </div>
-                    `;
-                }
-                
-                card.innerHTML = `
-                    <div onclick="toggleSteps(${index})">
-                        <h4 style="margin-bottom: 10px;">${rec.title}</h4>
-                        <p style="margin-bottom: 10px;">${rec.description}</p>
-                        <div style="display: flex; justify-content: space-between; align-items: center; flex-wrap: wrap; gap: 10px;">
-                            <div>
-                                <span class="priority-badge priority-${rec.priority.toLowerCase()}" style="margin-right: 10px;">
-                                    ${rec.priority} Priority
-                                </span>
-                                ${rec.impact ? `<span class="priority-badge" style="background: #0099ff; border-color: #0099ff;">
-                                    Impact: ${rec.impact}
-                                </span>` : ''}
-                            </div>
-                            <span style="color: #00d4aa; font-size: 14px;">
-                                ${rec.actionable_steps ? `⬇️ Click for ${rec.actionable_steps.length} action steps` : ''}
-                            </span>
-                        </div>
-                    </div>
-                    ${stepsHTML}
-                `;
-                container.appendChild(card);
-            });
-        })
+        .then(data => renderRecommendations(data))
         .catch(error => {
             console.error('Error fetching recommendations:', error);
             document.getElementById('recommendationsContainer').innerHTML = 
@@ -774,6 +915,70 @@ function loadRecommendations() {
         });
 }
 
+function renderRecommendations(data) {
+    const container = document.getElementById('recommendationsContainer');
+    container.innerHTML = '';
+    
+    // Add summary banner if available
+    if (data.summary) {
+        const summaryBanner = document.createElement('div');
+        summaryBanner.style.cssText = 'padding: 20px; background: linear-gradient(135deg, #00d4aa 0%, #00a88a 100%); border-radius: 10px; margin-bottom: 30px; color: white;';
+        summaryBanner.innerHTML = `
+            <h3 style="margin: 0 0 10px 0; font-size: 22px;">✨ ${data.summary.message}</h3>
+            <p style="margin: 0; font-size: 16px;">
+                ${data.summary.total_recommendations} recommendations available • 
+                ${data.summary.high_priority} high priority • 
+                Potential reduction: ${data.summary.estimated_total_reduction}
+            </p>
+        `;
+        container.appendChild(summaryBanner);
+    }
+    
+    data.recommendations.forEach((rec, index) => {
+        const card = document.createElement('div');
+        card.className = `recommendation-card priority-${rec.priority.toLowerCase()}`;
+        card.style.cursor = 'pointer';
+        
+        // Build actionable steps list
+        let stepsHTML = '';
+        if (rec.actionable_steps && rec.actionable_steps.length > 0) {
+            stepsHTML = `
+                <div class="steps-container" id="steps-${index}" style="display: none; margin-top: 15px; padding: 15px; background: rgba(0, 0, 0, 0.2); border-radius: 8px;">
+                    <h5 style="color: #00d4aa; margin: 0 0 10px 0;">🎯 Actionable Steps:</h5>
+                    <ul style="margin: 0; padding-left: 20px; line-height: 1.8;">
+                        ${rec.actionable_steps.map(step => `<li>${step}</li>`).join('')}
+                    </ul>
+                    ${rec.expected_reduction ? `<p style="margin: 15px 0 5px 0; color: #00d4aa;"><strong>📈 Impact:</strong> ${rec.expected_reduction}</p>` : ''}
+                    ${rec.cost ? `<p style="margin: 5px 0; color: #ffa502;"><strong>💰 Cost:</strong> ${rec.cost}</p>` : ''}
+                    ${rec.timeframe ? `<p style="margin: 5px 0; color: #0099ff;"><strong>⏱️ Timeframe:</strong> ${rec.timeframe}</p>` : ''}
+                </div>
+            `;
+        }
+        
+        card.innerHTML = `
+            <div onclick="toggleSteps(${index})">
+                <h4 style="margin-bottom: 10px;">${rec.title}</h4>
+                <p style="margin-bottom: 10px;">${rec.description}</p>
+                <div style="display: flex; justify-content: space-between; align-items: center; flex-wrap: wrap; gap: 10px;">
+                    <div>
+                        <span class="priority-badge priority-${rec.priority.toLowerCase()}" style="margin-right: 10px;">
+                            ${rec.priority} Priority
+                        </span>
+                        ${rec.impact ? `<span class="priority-badge" style="background: #0099ff; border-color: #0099ff;">
+                            Impact: ${rec.impact}
+                        </span>` : ''}
+                    </div>
+                    <span style="color: #00d4aa; font-size: 14px;">
+                        ${rec.actionable_steps ? `⬇️ Click for ${rec.actionable_steps.length} action steps` : ''}
+                    </span>
+                </div>
+            </div>
+            ${stepsHTML}
+        `;
+        container.appendChild(card);
+    });
+}
+
 // Toggle steps visibility
 function toggleSteps(index) {
     const stepsContainer = document.getElementById(`steps-${index}`);
@@ -786,8 +991,53 @@ function toggleSteps(index) {
     }
 }
 
+// Initial page data: inlined by the server when it matches the selected range,
+// otherwise one /api/dashboard/bootstrap request instead of three separate calls
+function renderBootstrap(bootstrap, days) {
+    dashboardState = {
+        data: bootstrap.dashboard,
+        days: days,
+        range: { start: bootstrap.start_date, end: bootstrap.end_date },
+        site: selectedSite()
+    };
+    renderDashboard(bootstrap.dashboard, days);
+    renderCumulativeStats(bootstrap.human_cumulative_stats);
+    renderRecommendations(bootstrap.recommendations);
+}
+
+function loadInitialData() {
+    const days = parseInt(document.getElementById('dateRange').value);
+    const inline = document.getElementById('dashboardBootstrap');
+    // The inlined data covers all sites
+    if (inline && !selectedSite()) {
+        try {
+            const bootstrap = JSON.parse(inline.textContent);
+            if (bootstrap && bootstrap.days === days) {
+                renderBootstrap(bootstrap, days);
+                return;
+            }
+        } catch (error) {
+            console.error('Error reading inline dashboard data:', error);
+        }
+    }
+
+    const dateRange = getDateRange(days);
+    fetch(`/api/dashboard/bootstrap?start_date=${dateRange.start}&end_date=${dateRange.end}${siteQuery()}`)
+        .then(response => {
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            return response.json();
+        })
+        .then(bootstrap => renderBootstrap(bootstrap, days))
+        .catch(error => {
+            console.error('Error fetching dashboard bootstrap:', error);
+            updateDashboard();
+            loadRecommendations();
+            updateCumulativeStats();
+        });
+}
+
 document.addEventListener('DOMContentLoaded', function() {
-    updateDashboard();
-    loadRecommendations();
-    updateCumulativeStats();  // Load all-time cumulative statistics
+    loadInitialData();        // Dashboard, recommendations and all-time cumulative statistics
+    loadSites();              // Site filter options (hidden for single-site deployments)
+    connectLiveUpdates();     // Patch charts in place as new data is committed
 });
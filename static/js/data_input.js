@@ -24,6 +24,7 @@ document.getElementById("dataForm").addEventListener("submit", function (e) {
     source_type: document.getElementById("source_type").value,
     raw_value: parseFloat(document.getElementById("raw_value").value),
     unit: document.getElementById("unit").value,
+    site: document.getElementById("site").value.trim(),
   };
 
   fetch("/api/data", {
@@ -82,6 +83,7 @@ if (humanForm) {
       date: document.getElementById("human_date").value,
       student_count: parseInt(document.getElementById("student_count").value),
       staff_count: parseInt(document.getElementById("staff_count").value),
+      site: document.getElementById("human_site").value.trim(),
     };
 
     fetch("/api/human_data", {
@@ -160,9 +162,10 @@ if (csvInput) {
         return;
       }
 
-      const header = lines[0].trim();
+      const header = lines[0].trim().toLowerCase();
       const expectedHeader = "date,source_type,raw_value,unit";
-      if (header.toLowerCase() !== expectedHeader) {
+      const hasSite = header === expectedHeader + ",site";
+      if (header !== expectedHeader && !hasSite) {
         messageContainer.innerHTML = `<div class="error-message">Invalid CSV format.</div>`;
         return;
       }
@@ -170,11 +173,11 @@ if (csvInput) {
       const records = [];
       for (let i = 1; i < lines.length; i++) {
         const cols = lines[i].split(",").map((c) => c.trim());
-        if (cols.length !== 4) {
+        if (cols.length !== (hasSite ? 5 : 4)) {
           messageContainer.innerHTML = `<div class="error-message">Invalid CSV format.</div>`;
           return;
         }
-        const [date, source_type, raw_value, unit] = cols;
+        const [date, source_type, raw_value, unit, site] = cols;
         // Basic validation
         if (!date || !source_type || !raw_value || !unit) {
           messageContainer.innerHTML = `<div class="error-message">Invalid CSV format.</div>`;
@@ -186,7 +189,8 @@ if (csvInput) {
           return;
         }
 
-        records.push({ date, source_type, raw_value: parsedValue, unit });
+        records.push(hasSite && site ? { date, source_type, raw_value: parsedValue, unit, site }
+                                     : { date, source_type, raw_value: parsedValue, unit });
       }
 
       // Send to server
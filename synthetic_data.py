@@ -0,0 +1,336 @@
+"""
+Synthetic campus data at production scale (python synthetic_data.py --help).
+
+Generates years of activity per source and site, shaped like
+Documents/activity_data_sample.csv, with:
+- seasonality: a yearly cosine per source (electricity peaks in the hot months),
+- weekday effects and academic term breaks (occupancy-driven sources drop),
+- a yearly growth trend, day-to-day noise and outliers (spikes, meter dropouts),
+- headcounts per site and day,
+and bulk-loads it into the configured database (DB_BACKEND, DB_* settings).
+
+With --interval (minutes) metered sources also get sub-daily readings along a
+daily load curve, stored the way ingest and compaction leave them: raw
+meter_readings for the last RAW_RETENTION_DAYS, hourly rollups before that for
+HOURLY_RETENTION_MONTHS, and daily sums in activity_data for every day.
+
+Generation is vectorized with NumPy (pip install .[analytics]): one
+(days, readings per day) array per site and source.
+
+Usage:
+  python synthetic_data.py --years 3 --sites 8 --truncate
+  python synthetic_data.py --years 1 --sites 20 --interval 15 --metered electricity,canteen_lpg
+  DB_BACKEND=sqlite DB_PATH=scale.db python synthetic_data.py --years 5 --sites 50 --entries-per-day 4
+"""
+import argparse
+import csv
+import math
+import os
+import statistics
+import time
+from datetime import date, datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError:  # optional: pip install .[analytics]
+    np = None
+
+SAMPLE_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Documents', 'activity_data_sample.csv')
+
+# Daily (mean, std, unit) per source; replaced by figures from SAMPLE_CSV when it exists
+DEFAULT_PROFILE = {
+    'electricity': (122805.0, 12896.0, 'kWh'),
+    'bus_diesel': (3949.0, 2428.0, 'Liters'),
+    'canteen_lpg': (668.0, 285.0, 'kg'),
+    'waste_landfill': (2055.0, 468.0, 'kg'),
+}
+
+# Per source: (seasonal amplitude, peak day of year, Mon..Sun factors, factor during term breaks)
+SOURCE_MODELS = {
+    'electricity': (0.18, 135, (1.0, 1.0, 1.0, 1.0, 0.97, 0.7, 0.55), 0.6),
+    'bus_diesel': (0.05, 30, (1.0, 1.0, 1.0, 1.0, 1.0, 0.35, 0.1), 0.15),
+    'canteen_lpg': (0.08, 15, (1.0, 1.0, 1.0, 1.0, 1.0, 0.5, 0.3), 0.25),
+    'waste_landfill': (0.1, 200, (1.0, 1.0, 1.0, 1.0, 1.05, 0.6, 0.4), 0.5),
+}
+DEFAULT_MODEL = (0.05, 1, (1.0, 1.0, 1.0, 1.0, 1.0, 0.8, 0.7), 0.7)
+
+# Relative weight of each hour of the day (normalized on use)
+LOAD_CURVES = {
+    'electricity': (0.5, 0.5, 0.5, 0.5, 0.5, 0.55, 0.8, 1.1, 1.5, 1.7, 1.8, 1.8,
+                    1.7, 1.8, 1.8, 1.7, 1.5, 1.2, 1.0, 0.9, 0.8, 0.7, 0.6, 0.5),
+    'canteen_lpg': (0, 0, 0, 0, 0, 0.3, 1.0, 1.5, 1.0, 0.4, 0.6, 1.6,
+                    2.0, 1.4, 0.5, 0.4, 0.6, 0.8, 1.4, 1.5, 0.8, 0.2, 0, 0),
+    'bus_diesel': (0, 0, 0, 0, 0, 0, 1.0, 2.5, 2.0, 0.5, 0.2, 0.2,
+                   0.3, 0.3, 0.2, 0.5, 1.5, 2.5, 1.5, 0.5, 0, 0, 0, 0),
+}
+DEFAULT_CURVE = (0.2,) * 7 + (1.0,) * 12 + (0.2,) * 5
+
+# Academic term breaks, ((month, day) first, (month, day) last); a break may wrap the new year
+TERM_BREAKS = (((5, 15), (7, 10)), ((12, 20), (1, 5)))
+
+# Headcount of a site of size 1.0 on a teaching weekday
+STUDENTS = 2500
+STAFF = 250
+HEADCOUNT_WEEKDAYS = (1.0, 1.0, 1.0, 1.0, 0.95, 0.3, 0.1)
+HEADCOUNT_BREAK = 0.15
+
+NOISE = 0.08          # lognormal sigma of day-to-day variation
+READING_NOISE = 0.05  # lognormal sigma of each sub-daily reading
+
+# date(1970, 1, 1).toordinal(); converts day ordinals to numpy datetime64[D]
+EPOCH_ORDINAL = 719163
+
+
+def load_profile(path=SAMPLE_CSV):
+    """Per-source daily mean/std/unit from the sample CSV (or DEFAULT_PROFILE)."""
+    if not os.path.exists(path):
+        return dict(DEFAULT_PROFILE)
+    values, units = {}, {}
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            try:
+                values.setdefault(row['source_type'], []).append(float(row['raw_value']))
+                units[row['source_type']] = row['unit']
+            except (KeyError, ValueError):
+                continue
+    profile = {
+        source: (statistics.mean(vals), statistics.pstdev(vals), units[source])
+        for source, vals in values.items() if len(vals) > 1
+    }
+    return profile or dict(DEFAULT_PROFILE)
+
+
+def site_codes(count):
+    """'main' plus b02, b03, ... for the other buildings."""
+    return ['main'] + [f"b{n:02d}" for n in range(2, count + 1)]
+
+
+def calendar(start, days):
+    """Per-day arrays: date strings, weekday (0 = Monday), day of year, term break flag, years since start."""
+    ords = start.toordinal() + np.arange(days)
+    d64 = (ords - EPOCH_ORDINAL).astype('datetime64[D]')
+    month = d64.astype('datetime64[M]').astype(np.int64) % 12 + 1
+    day = (d64 - d64.astype('datetime64[M]')).astype(np.int64) + 1
+    month_day = month * 100 + day
+    in_break = np.zeros(days, dtype=bool)
+    for (m1, d1), (m2, d2) in TERM_BREAKS:
+        first, last = m1 * 100 + d1, m2 * 100 + d2
+        if first <= last:
+            in_break |= (month_day >= first) & (month_day <= last)
+        else:
+            in_break |= (month_day >= first) | (month_day <= last)
+    return {
+        'd64': d64,
+        'dates': np.datetime_as_string(d64, unit='D'),
+        # date.fromordinal(1) is a Monday
+        'weekday': (ords - 1) % 7,
+        'doy': (d64 - d64.astype('datetime64[Y]')).astype(np.int64) + 1,
+        'in_break': in_break,
+        'years': (ords - ords[0]) / 365.25,
+    }
+
+
+def daily_values(rng, cal, source, mean, size, growth, outliers):
+    """One site's daily totals for `source` (float array, one per day)."""
+    amplitude, peak, weekdays, break_factor = SOURCE_MODELS.get(source, DEFAULT_MODEL)
+    days = len(cal['doy'])
+    values = (mean * size
+              * (1 + amplitude * np.cos(2 * np.pi * (cal['doy'] - peak) / 365.25))
+              * np.asarray(weekdays)[cal['weekday']]
+              * np.where(cal['in_break'], break_factor, 1.0)
+              * (1 + growth) ** cal['years']
+              * rng.lognormal(0.0, NOISE, days))
+    spikes = rng.random(days) < outliers
+    values[spikes] *= rng.uniform(2.0, 5.0, int(spikes.sum()))
+    # Meter dropouts: a day recorded as zero
+    values[rng.random(days) < outliers / 2] = 0.0
+    return values
+
+
+def headcounts(rng, cal, size):
+    """(students, staff) int arrays for one site."""
+    occupancy = (np.asarray(HEADCOUNT_WEEKDAYS)[cal['weekday']]
+                 * np.where(cal['in_break'], HEADCOUNT_BREAK, 1.0))
+    days = len(occupancy)
+    students = np.rint(STUDENTS * size * occupancy * rng.normal(1.0, 0.03, days)).clip(0).astype(np.int64)
+    staff = np.rint(STAFF * size * np.maximum(occupancy, 0.3) * rng.normal(1.0, 0.03, days)).clip(0).astype(np.int64)
+    return students, staff
+
+
+def readings(rng, daily, source, interval):
+    """(days, readings per day) array spreading each day along the source's load curve."""
+    per_hour = 60 // interval
+    curve = np.repeat(np.asarray(LOAD_CURVES.get(source, DEFAULT_CURVE), dtype=float), per_hour)
+    curve /= curve.sum()
+    return daily[:, None] * curve[None, :] * rng.lognormal(0.0, READING_NOISE, (len(daily), len(curve)))
+
+
+def generate_site(rng, cal, site, size, profile, interval=0, metered=(), entries_per_day=1,
+                  growth=0.03, outliers=0.005, cutoffs=None):
+    """
+    Rows for one site as {table: [tuple, ...]} in the column order of statements().
+    `cutoffs` ({'raw': datetime, 'hourly': datetime}) decides which sub-daily
+    readings stay raw and which are stored as hourly rollups.
+    """
+    days = len(cal['dates'])
+    dates = cal['dates'].tolist()
+    out = {'activity_data': [], 'human_population': [], 'meter_readings': [], 'meter_readings_hourly': []}
+    series = {}
+    for source, (mean, _, unit) in profile.items():
+        daily = daily_values(rng, cal, source, mean, size, growth, outliers)
+        if interval and source in metered:
+            slots = readings(rng, daily, source, interval)
+            daily = slots.sum(axis=1)
+            _add_readings(out, cal, site, source, unit, slots, interval, cutoffs)
+        series[source] = (daily, unit)
+    students, staff = headcounts(rng, cal, size)
+    out['human_population'] = list(zip([site] * days, dates, students.tolist(), staff.tolist()))
+
+    # Drawn last, so --entries-per-day does not change the daily totals
+    for source, (daily, unit) in series.items():
+        if entries_per_day > 1:
+            # Several entries per day (e.g. per meter), summing to the daily total
+            weights = rng.random((days, entries_per_day)) + 0.5
+            parts = (daily[:, None] * weights / weights.sum(axis=1, keepdims=True)).round(3)
+            out['activity_data'].extend(
+                (site, d, source, value, unit)
+                for d, row in zip(dates, parts.tolist()) for value in row)
+        else:
+            out['activity_data'].extend((site, d, source, value, unit)
+                                        for d, value in zip(dates, daily.round(3).tolist()))
+    return out
+
+
+def _add_readings(out, cal, site, source, unit, slots, interval, cutoffs):
+    """Raw rows after cutoffs['raw'], hourly sums from cutoffs['hourly'] up to it."""
+    raw_from = np.datetime64(cutoffs['raw'], 'm')
+    hourly_from = np.datetime64(cutoffs['hourly'], 'm')
+    per_hour = 60 // interval
+    starts = cal['d64'].astype('datetime64[m]')
+
+    times = starts[:, None] + np.arange(slots.shape[1]) * np.timedelta64(interval, 'm')
+    recent = times >= raw_from
+    if recent.any():
+        stamps = np.char.replace(np.datetime_as_string(times[recent], unit='s'), 'T', ' ').tolist()
+        out['meter_readings'].extend((site, t, source, value, unit)
+                                     for t, value in zip(stamps, slots[recent].round(4).tolist()))
+
+    hours = times[:, ::per_hour]
+    totals = slots.reshape(len(slots), -1, per_hour).sum(axis=2)
+    older = (hours >= hourly_from) & (hours < raw_from)
+    if older.any():
+        stamps = np.char.replace(np.datetime_as_string(hours[older], unit='s'), 'T', ' ').tolist()
+        out['meter_readings_hourly'].extend((site, t, source, unit, value, per_hour)
+                                            for t, value in zip(stamps, totals[older].round(4).tolist()))
+
+
+# ---- Bulk load ----
+
+def statements(backend):
+    """INSERT per table; reruns without --truncate replace headcounts and add to hourly rollups."""
+    return {
+        'activity_data': "INSERT INTO activity_data (site_code, date, source_type, raw_value, unit) "
+                         "VALUES (%s, %s, %s, %s, %s)",
+        'human_population': backend.upsert('human_population', ('site_code', 'date', 'student_count', 'staff_count'),
+                                           keys=('site_code', 'date'), replace=('student_count', 'staff_count')),
+        'meter_readings': "INSERT INTO meter_readings (site_code, reading_time, source_type, raw_value, unit) "
+                          "VALUES (%s, %s, %s, %s, %s)",
+        'meter_readings_hourly': backend.upsert(
+            'meter_readings_hourly', ('site_code', 'hour', 'source_type', 'unit', 'raw_total', 'reading_count'),
+            keys=('site_code', 'hour', 'source_type'), add=('raw_total', 'reading_count')),
+    }
+
+
+def insert_batches(connection, cursor, statement, rows, batch_rows):
+    for start in range(0, len(rows), batch_rows):
+        cursor.executemany(statement, rows[start:start + batch_rows])
+        connection.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--years', type=float, default=3.0, help='history length ending at --end')
+    parser.add_argument('--end', type=date.fromisoformat, default=date.today(), help='last day (YYYY-MM-DD)')
+    parser.add_argument('--sites', type=int, default=1, help="buildings: 'main' plus b02, b03, ...")
+    parser.add_argument('--interval', type=int, default=0,
+                        help='minutes between meter readings for --metered sources (divides 60; 0 = daily only)')
+    parser.add_argument('--metered', default='electricity', help='comma separated sources with sub-daily readings')
+    parser.add_argument('--entries-per-day', type=int, default=1,
+                        help='activity_data rows per source, site and day (the daily total is split across them)')
+    parser.add_argument('--growth', type=float, default=0.03, help='yearly growth of every source')
+    parser.add_argument('--outliers', type=float, default=0.005, help='share of days with a spike or dropout')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch-rows', type=int, default=10000, help='rows per INSERT batch and commit')
+    parser.add_argument('--truncate', action='store_true',
+                        help='DELETE existing activity, headcount and meter rows first')
+    parser.add_argument('--dry-run', action='store_true', help='generate and count rows without loading them')
+    args = parser.parse_args()
+
+    if np is None:
+        raise SystemExit("numpy is not installed (pip install .[analytics])")
+    if args.interval and (args.interval < 0 or 60 % args.interval):
+        raise SystemExit("--interval must divide 60 (1, 5, 10, 15, 30, 60, ...)")
+
+    import db_backends
+    import downsampling
+
+    days = max(1, math.ceil(args.years * 365.25))
+    start = args.end - timedelta(days=days - 1)
+    rng = np.random.default_rng(args.seed)
+    profile = load_profile()
+    metered = [s.strip() for s in args.metered.split(',') if s.strip()]
+    policy = downsampling.RetentionPolicy(raw_days=int(os.environ.get('RAW_RETENTION_DAYS', 14)),
+                                          hourly_months=int(os.environ.get('HOURLY_RETENTION_MONTHS', 13)))
+    cutoffs = policy.cutoffs(datetime.combine(args.end + timedelta(days=1), datetime.min.time()))
+    cal = calendar(start, days)
+    sites = site_codes(args.sites)
+    # Main campus at full size, other buildings smaller and varied
+    sizes = [1.0] + (0.3 * rng.lognormal(0.0, 0.5, len(sites) - 1)).tolist()
+
+    backend = connection = cursor = None
+    if not args.dry_run:
+        backend = db_backends.from_env()
+        connection = backend.connect()
+        cursor = connection.cursor()
+    counts = {}
+    t0 = time.perf_counter()
+    generate_s = 0.0
+    try:
+        if cursor is not None:
+            if args.truncate:
+                for table in ('activity_data', 'human_population', 'meter_readings', 'meter_readings_hourly'):
+                    cursor.execute(f"DELETE FROM {table}")
+                connection.commit()
+            upsert_site = backend.upsert('sites', ('code', 'name', 'campus'), keys=('code',), replace=('name',))
+            cursor.executemany(upsert_site, [(code, 'Main campus' if code == 'main' else f"Building {code[1:]}",
+                                              'main') for code in sites])
+            connection.commit()
+            inserts = statements(backend)
+        for n, (site, size) in enumerate(zip(sites, sizes), 1):
+            g0 = time.perf_counter()
+            tables = generate_site(rng, cal, site, size, profile, interval=args.interval, metered=metered,
+                                   entries_per_day=args.entries_per_day, growth=args.growth,
+                                   outliers=args.outliers, cutoffs=cutoffs)
+            generate_s += time.perf_counter() - g0
+            for table, rows in tables.items():
+                counts[table] = counts.get(table, 0) + len(rows)
+                if cursor is not None and rows:
+                    insert_batches(connection, cursor, inserts[table], rows, args.batch_rows)
+            print(f"\r   {n}/{len(sites)} sites, {sum(counts.values()):,} rows", end='', flush=True)
+    finally:
+        if cursor is not None:
+            cursor.close()
+            connection.close()
+
+    elapsed = time.perf_counter() - t0
+    total = sum(counts.values())
+    target = 'generated (dry run)' if args.dry_run else f"loaded into {backend.name}"
+    print(f"\r✅ {total:,} rows {target} for {len(sites)} site(s), {start} → {args.end}, "
+          f"in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s, {generate_s:.1f}s generating)")
+    for table, count in counts.items():
+        if count:
+            print(f"   {table:<22} {count:>12,}")
+
+
+if __name__ == '__main__':
+    main()
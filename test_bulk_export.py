@@ -0,0 +1,69 @@
+"""
+Tests for the streaming export encoders (bulk_export.py): CSV and NDJSON are
+produced batch by batch with the same columns, and the columnar formats
+round-trip through pyarrow when it is installed.
+
+Run: python test_bulk_export.py   (or via pytest)
+"""
+import csv
+import io
+import json
+from datetime import date
+
+import bulk_export
+
+ROWS = [
+    ('activity', date(2025, 1, 1), 'main', 'electricity', 1200.0, 'kWh', None, None, 0.708, 'kg_co2e_per_kwh', 849.6),
+    ('activity', date(2025, 1, 1), 'north', 'lpg, bottled', 3.5, 'kg', None, None, None, None, None),
+    ('human', date(2025, 1, 2), 'main', 'human_daily', 1500.0, 'person_days', 1400, 100, 1.0,
+     'kg_co2e_per_person_per_day', 1500.0),
+]
+
+
+def batches():
+    return iter([ROWS[:2], [], ROWS[2:]])
+
+
+def test_csv_is_streamed_per_batch():
+    chunks = list(bulk_export.encode('csv', batches()))
+    assert len(chunks) == 3
+    rows = list(csv.reader(io.StringIO(b''.join(chunks).decode('utf-8'))))
+    assert rows[0] == list(bulk_export.COLUMNS)
+    assert rows[1][:5] == ['activity', '2025-01-01', 'main', 'electricity', '1200.0']
+    assert rows[2][3] == 'lpg, bottled' and rows[2][8:] == ['', '', '']
+    assert rows[3][6:8] == ['1400', '100'] and len(rows) == 4
+    # An empty export still has its header
+    assert b''.join(bulk_export.encode('csv', iter([]))).decode().splitlines() == [','.join(bulk_export.COLUMNS)]
+
+
+def test_ndjson_rows():
+    lines = b''.join(bulk_export.encode('ndjson', batches())).decode('utf-8').splitlines()
+    records = [json.loads(line) for line in lines]
+    assert len(records) == 3
+    assert records[0]['date'] == '2025-01-01' and records[0]['emissions_kg_co2e'] == 849.6
+    assert records[1]['factor'] is None
+    assert records[2]['record_type'] == 'human' and records[2]['staff_count'] == 100
+
+
+def test_columnar_round_trip():
+    if bulk_export.pa is None:
+        assert not bulk_export.available('parquet') and bulk_export.available('csv')
+        return
+    import pyarrow.parquet as pq
+    table = pq.read_table(io.BytesIO(b''.join(bulk_export.encode('parquet', batches()))))
+    assert table.num_rows == 3 and table.column_names == list(bulk_export.COLUMNS)
+    assert table.column('date').to_pylist()[2] == date(2025, 1, 2)
+    reader = bulk_export.pa.ipc.open_stream(b''.join(bulk_export.encode('arrow', batches())))
+    assert reader.read_all().column('emissions_kg_co2e').to_pylist() == [849.6, None, 1500.0]
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("STREAMING EXPORT ENCODERS")
+    print("=" * 70)
+    test_csv_is_streamed_per_batch()
+    print("✓ CSV is written batch by batch")
+    test_ndjson_rows()
+    print("✓ NDJSON carries every column")
+    test_columnar_round_trip()
+    print("✓ Parquet/Arrow round-trip" if bulk_export.pa else "- pyarrow not installed; columnar formats skipped")
@@ -0,0 +1,146 @@
+"""
+Tests for the DuckDB/Parquet history snapshot (columnar_store.py): per-source and
+per-day totals read from the snapshot for old dates plus SQLite for recent ones
+match SQLite alone, and a snapshot is withdrawn once rows older than its cutoff
+are added or upserted. Skipped without duckdb.
+
+Run: python test_columnar_store.py   (or via pytest)
+"""
+import os
+import random
+import shutil
+from datetime import date, timedelta
+
+import columnar_store
+from test_db_backends import make_backend
+
+SOURCES = ('electricity', 'bus_diesel', 'canteen_lpg')
+SITES = ('main', 'north')
+
+DAILY_SQL = """
+    SELECT date, source_type, SUM(raw_value) as raw_total
+    FROM activity_data WHERE date BETWEEN %s AND %s
+    GROUP BY date, source_type ORDER BY date, source_type
+"""
+HUMAN_SQL = """
+    SELECT COUNT(DISTINCT date) as days, SUM(total_count) as people
+    FROM human_population WHERE date BETWEEN %s AND %s
+"""
+
+
+def make_db(days=400, seed=7):
+    """A SQLite backend (test_db_backends.make_backend) with `days` days of rows up to today; (backend, directory)."""
+    rnd = random.Random(seed)
+    backend, directory = make_backend()
+    activity, human = [], []
+    first = date.today() - timedelta(days=days)
+    for n in range(days + 1):
+        day = first + timedelta(days=n)
+        for site in SITES:
+            for source in SOURCES:
+                for _ in range(rnd.randint(0, 2)):
+                    activity.append((site, day, source, rnd.uniform(1, 1000)))
+            human.append((site, day, rnd.randint(100, 900), rnd.randint(10, 90)))
+    insert(backend, activity, human)
+    return backend, directory
+
+
+def insert(backend, activity=(), human=()):
+    """Add (site, date, source, value) readings and upsert (site, date, students, staff) headcounts."""
+    connection = backend.connect()
+    cursor = connection.cursor()
+    cursor.executemany("INSERT INTO activity_data (site_code, date, source_type, raw_value, unit) "
+                       "VALUES (%s, %s, %s, %s, 'u')", list(activity))
+    cursor.executemany(backend.upsert('human_population', ('site_code', 'date', 'student_count', 'staff_count'),
+                                      keys=('site_code', 'date'), replace=('student_count', 'staff_count')),
+                       list(human))
+    connection.commit()
+    connection.close()
+
+
+def split_rows(history, cursor, query, start, end):
+    """What app.grouped_rows does: history up to the cutoff, SQLite after it."""
+    cutoff = history.cutoff()
+    last_old = (date.fromisoformat(cutoff) - timedelta(days=1)).isoformat()
+    rows = history.fetchall(query, (start, min(end, last_old))) if start < cutoff else []
+    if end >= cutoff:
+        cursor.execute(query, (max(start, cutoff), end))
+        rows += cursor.fetchall()
+    return rows
+
+
+def test_split_queries_match_sql():
+    if columnar_store.duckdb is None:
+        return
+    backend, directory = make_db()
+    try:
+        connection = backend.connect()
+        history = columnar_store.HistorySnapshot(os.path.join(directory, 'columnar'), recent_days=30)
+        history.refresh(connection)
+        cursor = connection.cursor(dictionary=True)
+        assert history.usable(cursor)
+        rnd = random.Random(3)
+        today = date.today()
+        for _ in range(25):
+            start = (today - timedelta(days=rnd.randint(0, 420))).isoformat()
+            end = (today - timedelta(days=rnd.randint(0, 60))).isoformat()
+            start, end = min(start, end), max(start, end)
+            cursor.execute(DAILY_SQL, (start, end))
+            want = {(str(r['date']), r['source_type']): r['raw_total'] for r in cursor.fetchall()}
+            got = {(str(r['date']), r['source_type']): r['raw_total']
+                   for r in split_rows(history, cursor, DAILY_SQL, start, end)}
+            assert want.keys() == got.keys()
+            assert all(abs(want[k] - got[k]) < 1e-6 for k in want)
+            cursor.execute(HUMAN_SQL, (start, end))
+            want = cursor.fetchone()
+            parts = split_rows(history, cursor, HUMAN_SQL, start, end)
+            assert sum(int(r['days'] or 0) for r in parts) == want['days']
+            assert sum(int(r['people'] or 0) for r in parts) == (want['people'] or 0)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_older_rows_withdraw_the_snapshot():
+    if columnar_store.duckdb is None:
+        return
+    backend, directory = make_db(days=100)
+    snapshots = os.path.join(directory, 'columnar')
+    try:
+        connection = backend.connect()
+        history = columnar_store.HistorySnapshot(snapshots, recent_days=30, check_interval=3600)
+        history.refresh(connection)
+        cursor = connection.cursor(dictionary=True)
+        assert history.usable(cursor)
+
+        # Recent rows stay in MySQL's part of the split
+        insert(backend, [('main', date.today(), 'electricity', 5)])
+        history.mark_dirty()
+        assert history.usable(cursor)
+
+        # A backfilled row is caught by the id watermark
+        insert(backend, [('main', date.today() - timedelta(days=60), 'electricity', 5)])
+        history.mark_dirty()
+        assert not history.usable(cursor)
+        assert history.cutoff() is None and not os.path.exists(os.path.join(snapshots, 'current.json'))
+
+        # An in-place headcount update has to be reported
+        history.refresh(connection)
+        assert history.usable(cursor)
+        history.note_write([date.today()])
+        assert history.usable(cursor)
+        history.note_write([date.today() - timedelta(days=45)])
+        assert not history.usable(cursor) and history.stats['stale'] == 2
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    if columnar_store.duckdb is None:
+        raise SystemExit("duckdb is required for the columnar history snapshot")
+    print("=" * 70)
+    print("COLUMNAR HISTORY SNAPSHOT")
+    print("=" * 70)
+    test_split_queries_match_sql()
+    print("✓ Snapshot + SQL split matches SQL for random windows")
+    test_older_rows_withdraw_the_snapshot()
+    print("✓ Backfilled and upserted older rows withdraw the snapshot")
@@ -0,0 +1,134 @@
+"""
+Tests for the public dashboard endpoints in app.py on a SQLite database with two
+years of sample data: `include=` (alias `fields=`) returns exactly the named
+sections, with the same values as the full payload, and unknown section names
+are rejected with 400. /api/dashboard/bootstrap equals the three endpoints it
+replaces, and the page inlines it for the DASHBOARD_DEFAULT_DAYS period it selects.
+
+Run: python test_dashboard_api.py   (or via pytest)
+"""
+import json
+import random
+import re
+import shutil
+from datetime import date, timedelta
+
+from test_db_backends import make_app_client
+
+SOURCES = ('electricity', 'bus_diesel', 'canteen_lpg', 'waste_landfill')
+TODAY = date.today()
+WINDOW = f'start_date={TODAY - timedelta(days=120)}&end_date={TODAY - timedelta(days=30)}'
+
+
+def sample_client(seed=7):
+    """(app, client, directory) with activity and headcounts for every day of the last two years."""
+    app, client, directory = make_app_client()
+    rnd = random.Random(seed)
+    activity, human = [], []
+    day = TODAY - timedelta(days=730)
+    while day <= TODAY:
+        for source in SOURCES:
+            activity.append(('main', day, source, round(rnd.uniform(0, 5000), 2), 'unit'))
+        human.append(('main', day, rnd.randint(0, 4000), rnd.randint(0, 500)))
+        day += timedelta(days=1)
+    connection = app.backend.connect()
+    cursor = connection.cursor()
+    cursor.executemany("INSERT INTO activity_data (site_code, date, source_type, raw_value, unit) "
+                       "VALUES (%s, %s, %s, %s, %s)", activity)
+    cursor.executemany(app.HUMAN_UPSERT, human)
+    connection.commit()
+    connection.close()
+    return app, client, directory
+
+
+def test_include_returns_only_those_sections():
+    app, client, directory = sample_client()
+    try:
+        full = client.get(f'/api/dashboard?{WINDOW}').get_json()
+        assert set(app.DASHBOARD_SECTIONS) <= set(full)
+        assert full['kpis']['total_emissions'] > 0
+        for include in (['kpis'], ['monthly_trend', 'source_breakdown'], ['human_emissions', 'daily_trend']):
+            for param in ('include', 'fields'):
+                response = client.get(f"/api/dashboard?{WINDOW}&{param}={','.join(include)}")
+                assert response.status_code == 200
+                subset = response.get_json()
+                assert set(subset) & set(app.DASHBOARD_SECTIONS) == set(include), (include, sorted(subset))
+                for section in include:
+                    assert subset[section] == full[section], section
+        # Blank names are ignored; only blanks means every section
+        assert set(client.get(f'/api/dashboard?{WINDOW}&include=kpis,,').get_json()) & set(app.DASHBOARD_SECTIONS) == {'kpis'}
+        assert client.get(f'/api/dashboard?{WINDOW}&include=,').get_json() == full
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_unknown_section_is_rejected():
+    app, client, directory = sample_client()
+    try:
+        for query in ('include=kpis,bogus', 'include=bogus', 'fields=KPIS', 'include=kpis, nope'):
+            for path in ('/api/dashboard', '/api/dashboard/bootstrap'):
+                response = client.get(f'{path}?{WINDOW}&{query}')
+                assert response.status_code == 400, (path, query)
+                assert 'Unknown dashboard section' in response.get_json()['error']
+        assert 'bogus' in client.get(f'/api/dashboard?{WINDOW}&include=kpis,bogus').get_json()['error']
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_bootstrap_matches_separate_endpoints():
+    _, client, directory = sample_client()
+    try:
+        for query in (WINDOW, f'{WINDOW}&site=main', f'{WINDOW}&include=kpis,human_emissions'):
+            response = client.get(f'/api/dashboard/bootstrap?{query}')
+            assert response.status_code == 200
+            bootstrap = response.get_json()
+            site = '&site=main' if 'site=' in query else ''
+            assert bootstrap['dashboard'] == client.get(f'/api/dashboard?{query}').get_json()
+            assert bootstrap['human_cumulative_stats'] == client.get(f'/api/human_cumulative_stats?{site}').get_json()
+            assert bootstrap['recommendations'] == client.get(f'/api/recommendations?{site}').get_json()
+            assert (bootstrap['start_date'], bootstrap['end_date']) == (
+                str(TODAY - timedelta(days=120)), str(TODAY - timedelta(days=30)))
+        assert client.get(f'/api/dashboard/bootstrap?{WINDOW}').get_json()['dashboard']['kpis']['total_emissions'] > 0
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def inline_bootstrap(html):
+    match = re.search(r'<script id="dashboardBootstrap" type="application/json">(.*?)</script>', html, re.S)
+    return json.loads(match.group(1)) if match else None
+
+
+def test_inline_bootstrap_uses_default_days():
+    app, client, directory = sample_client()
+    saved = app.DASHBOARD_DEFAULT_DAYS
+    try:
+        for days in (app.DASHBOARD_DEFAULT_DAYS, 30):
+            app.DASHBOARD_DEFAULT_DAYS = days
+            html = client.get('/').get_data(as_text=True)
+            bootstrap = inline_bootstrap(html)
+            assert bootstrap['days'] == days
+            # dashboard.js uses the inline data only when it matches the selected period
+            selected = re.findall(r'<option value="(\d+)" selected>', html)
+            assert selected == [str(days)]
+            # ... whose window getDateRange(days) builds the same way
+            start, end = TODAY - timedelta(days=days), TODAY
+            assert (bootstrap['start_date'], bootstrap['end_date']) == (str(start), str(end))
+            expected = client.get(f'/api/dashboard/bootstrap?start_date={start}&end_date={end}').get_json()
+            assert dict(expected, days=days) == bootstrap
+    finally:
+        app.DASHBOARD_DEFAULT_DAYS = saved
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("DASHBOARD API")
+    print("=" * 70)
+    test_include_returns_only_those_sections()
+    print("✓ include=/fields= return only the named sections, equal to the full payload's")
+    test_unknown_section_is_rejected()
+    print("✓ Unknown section names get 400 naming them")
+    test_bootstrap_matches_separate_endpoints()
+    print("✓ /api/dashboard/bootstrap equals /api/dashboard, /api/human_cumulative_stats and /api/recommendations")
+    test_inline_bootstrap_uses_default_days()
+    print("✓ The page inlines the bootstrap for DASHBOARD_DEFAULT_DAYS and selects that period")
@@ -0,0 +1,220 @@
+"""
+Tests for the database backends (db_backends.py): the SQLite schema loads, SQLite
+connections behave like mysql.connector ones for the app's SQL, the upsert /
+delete / time-bucket helpers work on SQLite, the meter compactor runs on it,
+and the MySQL helpers produce the statements the app used to hardcode.
+
+Run: python test_db_backends.py   (or via pytest)
+"""
+import os
+import shutil
+import tempfile
+from datetime import date, datetime
+
+import db_backends
+import downsampling
+import factor_cache
+
+SCHEMA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database', 'schema_sqlite.sql')
+
+
+def make_backend():
+    """A SQLite backend on a fresh file with the schema loaded; returns (backend, directory)."""
+    directory = tempfile.mkdtemp(prefix='sqlite-backend-test-')
+    backend = db_backends.SQLiteBackend(os.path.join(directory, 'test.db'))
+    connection = backend.connect()
+    cursor = connection.cursor()
+    with open(SCHEMA, encoding='utf-8') as f:
+        for statement in f.read().split(';'):
+            if statement.strip():
+                cursor.execute(statement)
+    connection.commit()
+    connection.close()
+    return backend, directory
+
+
+# app.py reads its configuration once, at import: import it off MySQL with the analytics
+# store, columnar history and shared result cache disabled, then restore the env
+APP_ENV = {'DB_BACKEND': 'sqlite', 'DB_PATH': os.path.join(tempfile.gettempdir(), 'app-test.db'),
+           'PROFILE_DIR': os.path.join(tempfile.gettempdir(), 'app-test-profiles'),
+           'ANALYTICS_STORE': '0', 'COLUMNAR_HISTORY': '0', 'RESULT_CACHE': 'off'}
+
+
+def import_app():
+    saved = {name: os.environ.get(name) for name in APP_ENV}
+    os.environ.update(APP_ENV)
+    try:
+        import app
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    return app
+
+
+def make_app_client(users=('admin',)):
+    """
+    app.py's test client on a fresh make_backend() database with `users` (password
+    'secret'); returns (app module, client, directory).
+    """
+    app = import_app()
+    backend, directory = make_backend()
+    connection = backend.connect()
+    connection.cursor().executemany("INSERT INTO users (username, password) VALUES (%s, %s)",
+                                    [(username, 'secret') for username in users])
+    connection.commit()
+    connection.close()
+    app.backend = backend
+    app.emission_factors = factor_cache.EmissionFactorCache(check_interval=0)
+    return app, app.app.test_client(), directory
+
+
+def login(client, username):
+    """Authorization header for `username` (created by make_app_client)."""
+    response = client.post('/api/login', json={'username': username, 'password': 'secret'})
+    assert response.status_code == 200, response.get_json()
+    return {'Authorization': f"Bearer {response.get_json()['token']}"}
+
+
+def test_sqlite_connection_like_mysql_connector():
+    backend, directory = make_backend()
+    try:
+        connection = backend.connect()
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("INSERT INTO activity_data (site_code, date, source_type, raw_value, unit) "
+                       "VALUES (%s, %s, %s, %s, %s)", ('main', date(2025, 3, 1), 'electricity', 12.5, 'kWh'))
+        assert cursor.lastrowid == 1 and cursor.rowcount == 1
+        cursor.executemany("INSERT INTO human_population (site_code, date, student_count, staff_count) "
+                           "VALUES (%s, %s, %s, %s)", [('main', '2025-03-01', 100, 10), ('north', '2025-03-01', 50, 5)])
+        connection.commit()
+
+        cursor.execute("SELECT date, raw_value FROM activity_data WHERE source_type LIKE %s", ('elec%%',))
+        assert cursor.fetchall() == [{'date': date(2025, 3, 1), 'raw_value': 12.5}]
+        # Generated column, as on MySQL
+        cursor.execute("SELECT SUM(total_count) AS people FROM human_population WHERE date = %s", ('2025-03-01',))
+        assert cursor.fetchone() == {'people': 165}
+        plain = connection.cursor(buffered=False)
+        plain.execute("SELECT version FROM cache_versions WHERE name = %s", (factor_cache.VERSION_KEY,))
+        assert plain.fetchone() == (1,)
+        try:
+            plain.execute("INSERT INTO users (username, password) VALUES (%s, %s)", ('admin', 'x'))
+            plain.execute("INSERT INTO users (username, password) VALUES (%s, %s)", ('admin', 'y'))
+            raise AssertionError('expected IntegrityError')
+        except backend.IntegrityError:
+            connection.rollback()
+        connection.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_sqlite_upserts_and_limited_deletes():
+    backend, directory = make_backend()
+    try:
+        connection = backend.connect()
+        cursor = connection.cursor()
+        human = backend.upsert('human_population', ('site_code', 'date', 'student_count', 'staff_count'),
+                               keys=('site_code', 'date'), replace=('student_count', 'staff_count'))
+        cursor.execute(human, ('main', '2025-03-01', 100, 10))
+        cursor.execute(human, ('main', '2025-03-01', 120, 12))
+        cursor.execute("SELECT student_count, staff_count, total_count FROM human_population")
+        assert cursor.fetchall() == [(120, 12, 132)]
+
+        factor_cache.bump_factor_version(cursor, backend)
+        factor_cache.bump_factor_version(cursor, backend)
+        cursor.execute("SELECT version FROM cache_versions WHERE name = %s", (factor_cache.VERSION_KEY,))
+        assert cursor.fetchone() == (3,)
+
+        cursor.executemany("INSERT INTO ingest_spool_applied (id, applied_at) VALUES (%s, %s)",
+                           [(f"{n:032d}", datetime(2025, 1, 1 + n % 5)) for n in range(12)])
+        delete = backend.delete_limited('ingest_spool_applied', 'applied_at < %s')
+        cursor.execute(delete, (datetime(2025, 1, 4), 5))
+        assert cursor.rowcount == 5
+        cursor.execute(delete, (datetime(2025, 1, 4), 5))
+        assert cursor.rowcount == 3
+        connection.commit()
+        connection.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_compactor_on_sqlite():
+    backend, directory = make_backend()
+    try:
+        connection = backend.connect()
+        cursor = connection.cursor()
+        readings = [('main', datetime(2025, 3, 1, hour, minute), 'electricity', 1.5, 'kWh')
+                    for hour in range(3) for minute in (0, 15, 30, 45)]
+        cursor.executemany("INSERT INTO meter_readings (site_code, reading_time, source_type, raw_value, unit) "
+                           "VALUES (%s, %s, %s, %s, %s)", readings)
+        connection.commit()
+
+        policy = downsampling.RetentionPolicy(raw_days=14, hourly_months=13)
+        compactor = downsampling.Compactor(backend.connect, policy, batch_size=5, dialect=backend)
+        assert compactor.run_once(now=datetime(2025, 3, 2))['rolled_up'] == 12
+        # A late reading is added to its hour
+        cursor.execute("INSERT INTO meter_readings (site_code, reading_time, source_type, raw_value, unit) "
+                       "VALUES (%s, %s, %s, %s, %s)", ('main', datetime(2025, 3, 1, 1, 59), 'electricity', 4.0, 'kWh'))
+        connection.commit()
+        compactor.run_once(now=datetime(2025, 3, 2))
+        cursor.execute(f"SELECT {backend.strftime('%Y-%m-%d %H:%M', 'hour')}, raw_total, reading_count "
+                       "FROM meter_readings_hourly ORDER BY hour", ())
+        assert cursor.fetchall() == [('2025-03-01 00:00', 6.0, 4), ('2025-03-01 01:00', 10.0, 5),
+                                     ('2025-03-01 02:00', 6.0, 4)]
+        connection.commit()
+
+        # Raw rows age out after raw_days, hourly rows after hourly_months
+        result = compactor.run_once(now=datetime(2025, 4, 1))
+        assert result == {'rolled_up': 0, 'raw_deleted': 13, 'hourly_deleted': 0}
+        assert compactor.run_once(now=datetime(2026, 5, 1))['hourly_deleted'] == 3
+        connection.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_mysql_statements():
+    mysql = db_backends.MySQLDialect()
+    assert mysql.upsert('sites', ('code', 'name'), keys=('code',), replace=('name',)) == (
+        "INSERT INTO sites (code, name) VALUES (%s, %s) ON DUPLICATE KEY UPDATE name = VALUES(name)")
+    assert mysql.upsert('cache_versions', ('name', 'version'), keys=('name',), add=('version',)).endswith(
+        "ON DUPLICATE KEY UPDATE version = version + VALUES(version)")
+    assert mysql.strftime('%Y-%m-%d %H:%M', 'reading_time') == "DATE_FORMAT(reading_time, '%%Y-%%m-%%d %%H:%%i')"
+    assert mysql.delete_limited('meter_readings_hourly', 'hour < %s') == (
+        "DELETE FROM meter_readings_hourly WHERE hour < %s LIMIT %s")
+
+
+def test_from_env():
+    saved = {k: os.environ.get(k) for k in ('DB_BACKEND', 'DB_PATH')}
+    try:
+        os.environ['DB_BACKEND'], os.environ['DB_PATH'] = 'SQLite', 'x.db'
+        backend = db_backends.from_env()
+        assert backend.name == 'sqlite' and backend.path == 'x.db'
+        os.environ['DB_BACKEND'] = 'postgres'
+        try:
+            db_backends.from_env()
+            raise AssertionError('expected ValueError')
+        except ValueError:
+            pass
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("DATABASE BACKENDS")
+    print("=" * 70)
+    test_sqlite_connection_like_mysql_connector()
+    print("✓ SQLite connections take %s parameters and return dict rows, dates and generated columns")
+    test_sqlite_upserts_and_limited_deletes()
+    print("✓ Upserts replace or add, limited deletes stop at the limit")
+    test_compactor_on_sqlite()
+    print("✓ The meter compactor rolls up and expires rows on SQLite")
+    test_mysql_statements()
+    print("✓ MySQL statements are unchanged")
+    test_from_env()
+    print("✓ DB_BACKEND selects the backend")
@@ -0,0 +1,46 @@
+"""
+Tests for meter reading retention (downsampling.py): tier cutoffs and which
+tier serves a dashboard window at a given granularity.
+
+Run: python test_downsampling.py   (or via pytest)
+"""
+from datetime import datetime
+
+import downsampling
+
+NOW = datetime(2025, 3, 31, 15, 30)
+
+
+def test_cutoffs():
+    cutoffs = downsampling.RetentionPolicy(raw_days=14, hourly_months=13).cutoffs(NOW)
+    assert cutoffs['raw'] == datetime(2025, 3, 17)
+    assert cutoffs['hourly'] == datetime(2024, 2, 29)  # clamped to the end of February
+    assert cutoffs['daily'] is None
+
+
+def test_choose_tier():
+    policy = downsampling.RetentionPolicy(raw_days=14, hourly_months=13)
+    recent = datetime(2025, 3, 25)
+    last_year = datetime(2024, 6, 1)
+    assert policy.choose_tier('day', recent, NOW) == 'daily'
+    # Coarsest tier that is fine enough: hourly rollups even while raw rows exist
+    assert policy.choose_tier('hour', recent, NOW) == 'hourly'
+    assert policy.choose_tier('raw', recent, NOW) == 'raw'
+    assert policy.choose_tier('hour', last_year, NOW) == 'hourly'
+    assert policy.choose_tier('day', datetime(2019, 1, 1), NOW) == 'daily'
+    for granularity, start in (('raw', last_year), ('hour', datetime(2023, 1, 1)), ('week', recent)):
+        try:
+            policy.choose_tier(granularity, start, NOW)
+            raise AssertionError(f'expected ValueError for {granularity} from {start}')
+        except ValueError:
+            pass
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("METER READING RETENTION")
+    print("=" * 70)
+    test_cutoffs()
+    print("✓ Tier cutoffs follow the retention settings")
+    test_choose_tier()
+    print("✓ Coarsest covering tier is chosen; expired windows are rejected")
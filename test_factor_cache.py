@@ -0,0 +1,130 @@
+"""
+Tests for effective-dated emission factors (factor_cache.py): dates are looked up
+in the right period, ranges split where any factor changes, changes are narrowed
+to the dates they affect, and add_factor_period() cuts the period in effect short
+instead of rewriting history. The table tests run on the SQLite backend.
+
+Run: python test_factor_cache.py   (or via pytest)
+"""
+import os
+import shutil
+import tempfile
+from datetime import date
+
+import db_backends
+import factor_cache
+
+SCHEMA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database', 'schema_sqlite.sql')
+
+
+def period(source, factor, valid_from=None, valid_to=None):
+    return {'source_type': source, 'factor': factor, 'factor_unit': 'kg', 'valid_from': valid_from,
+            'valid_to': valid_to}
+
+
+TIMELINE = factor_cache.FactorTimeline([
+    period('electricity', 0.7, None, '2024-12-31'),
+    period('electricity', 0.6, date(2025, 1, 1)),
+    period('bus_diesel', 2.68),
+    period('waste_landfill', 1.25, '2024-03-01', '2024-03-31'),
+])
+
+
+def test_lookup_by_date():
+    assert TIMELINE.factor('electricity', '2024-12-31') == 0.7
+    assert TIMELINE.factor('electricity', date(2025, 1, 1)) == 0.6
+    assert TIMELINE.factor('electricity', '2025-01-01 13:00') == 0.6
+    assert TIMELINE.factor('bus_diesel', '1999-01-01') == 2.68
+    # Outside every period, or an unknown source: no factor
+    assert TIMELINE.factor('waste_landfill', '2024-02-29') is None
+    assert TIMELINE.factor('waste_landfill', '2024-04-01') is None
+    assert TIMELINE.factor('canteen_lpg', '2024-04-01') is None
+    assert TIMELINE.on('2024-03-15') == {'electricity': 0.7, 'bus_diesel': 2.68, 'waste_landfill': 1.25}
+
+
+def test_segments_and_scope():
+    assert TIMELINE.segments('2024-01-01', '2024-02-29') == [('2024-01-01', '2024-02-29')]
+    assert TIMELINE.segments('2024-02-15', '2025-01-10') == [
+        ('2024-02-15', '2024-02-29'), ('2024-03-01', '2024-03-31'),
+        ('2024-04-01', '2024-12-31'), ('2025-01-01', '2025-01-10')]
+    assert TIMELINE.segments('2025-01-01', '2025-01-01') == [('2025-01-01', '2025-01-01')]
+    # The scope of a window only depends on the factors inside it
+    assert TIMELINE.scope('2023-01-01', '2023-12-31') == (
+        ('bus_diesel', '2023-01-01', '2023-12-31', 2.68), ('electricity', '2023-01-01', '2023-12-31', 0.7))
+    later = factor_cache.FactorTimeline([
+        period('electricity', 0.7, None, '2024-12-31'), period('electricity', 0.5, '2025-01-01'),
+        period('bus_diesel', 2.68), period('waste_landfill', 1.25, '2024-03-01', '2024-03-31')])
+    assert later.scope('2023-01-01', '2023-12-31') == TIMELINE.scope('2023-01-01', '2023-12-31')
+    assert later.scope('2024-06-01', '2025-05-31') != TIMELINE.scope('2024-06-01', '2025-05-31')
+
+
+def test_changed_range():
+    assert TIMELINE.changed_range(TIMELINE) is None
+    updated = factor_cache.FactorTimeline([
+        period('electricity', 0.7, None, '2024-12-31'), period('electricity', 0.55, '2025-01-01', '2025-06-30'),
+        period('electricity', 0.6, '2025-07-01'),
+        period('bus_diesel', 2.68), period('waste_landfill', 1.25, '2024-03-01', '2024-03-31')])
+    assert updated.changed_range(TIMELINE) == ('2025-01-01', '2025-06-30')
+    assert TIMELINE.changed_range(factor_cache.FactorTimeline()) == ('1000-01-01', '9999-12-31')
+
+
+def test_add_factor_period():
+    directory = tempfile.mkdtemp(prefix='factor-test-')
+    try:
+        backend = db_backends.SQLiteBackend(os.path.join(directory, 'test.db'))
+        connection = backend.connect()
+        cursor = connection.cursor()
+        with open(SCHEMA, encoding='utf-8') as f:
+            for statement in f.read().split(';'):
+                if statement.strip():
+                    cursor.execute(statement)
+
+        def periods(source):
+            cursor.execute("SELECT valid_from, valid_to, factor FROM emission_factors WHERE source_type = %s "
+                           "ORDER BY valid_from", (source,))
+            return [(str(valid_from), valid_to and str(valid_to), round(factor, 3))
+                    for valid_from, valid_to, factor in cursor.fetchall()]
+
+        assert factor_cache.add_factor_period(cursor, 'electricity', 0.65, 'kg_co2e_per_kwh', '2025-01-01') == (
+            '2025-01-01', None)
+        assert periods('electricity') == [('1000-01-01', '2024-12-31', 0.708), ('2025-01-01', None, 0.65)]
+        # A correction between two periods ends where the next one starts
+        assert factor_cache.add_factor_period(cursor, 'electricity', 0.69, 'kg_co2e_per_kwh', date(2024, 7, 1)) == (
+            '2024-07-01', '2024-12-31')
+        assert periods('electricity') == [('1000-01-01', '2024-06-30', 0.708), ('2024-07-01', '2024-12-31', 0.69),
+                                          ('2025-01-01', None, 0.65)]
+        # The same valid_from replaces the factor and keeps the period
+        factor_cache.add_factor_period(cursor, 'electricity', 0.64, 'kg_co2e_per_kwh', '2025-01-01')
+        assert periods('electricity')[-1] == ('2025-01-01', None, 0.64)
+        # A new source without a date applies everywhere
+        factor_cache.add_factor_period(cursor, 'solar_offset', -0.1, 'kg_co2e_per_kwh')
+        assert periods('solar_offset') == [('1000-01-01', None, -0.1)]
+        connection.commit()
+
+        cache = factor_cache.EmissionFactorCache()
+        timeline = cache.timeline(connection)
+        assert timeline.factor('electricity', '2024-08-01') == 0.69
+        assert cache.get(connection)['electricity']['periods'][0]['valid_to'] == '2024-06-30'
+        factor_cache.add_factor_period(cursor, 'electricity', 0.5, 'kg_co2e_per_kwh', '2026-01-01')
+        factor_cache.bump_factor_version(cursor, backend)
+        connection.commit()
+        cache.invalidate()
+        assert cache.timeline(connection).factor('electricity', '2026-02-01') == 0.5
+        assert cache.last_change == ('2026-01-01', '9999-12-31')
+        connection.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("EFFECTIVE-DATED EMISSION FACTORS")
+    print("=" * 70)
+    test_lookup_by_date()
+    print("✓ Dates are looked up in their period; gaps have no factor")
+    test_segments_and_scope()
+    print("✓ Ranges split where factors change; window scopes ignore factors outside them")
+    test_changed_range()
+    print("✓ Factor changes are narrowed to the dates they affect")
+    test_add_factor_period()
+    print("✓ New factors cut the period in effect short instead of rewriting history")
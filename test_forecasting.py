@@ -0,0 +1,120 @@
+"""
+Tests for emissions forecasting (forecasting.py): one batched fit recovers each
+series' trend, yearly season and weekday pattern, matches fitting the series one by
+one, treats trailing days without data as not yet recorded, and splits a period into
+recorded and forecast tonnes; fitted models are cached until invalidated.
+Skipped when numpy is not installed.
+
+Run: python test_forecasting.py   (or via pytest)
+"""
+from datetime import date
+
+import forecasting
+
+np = forecasting.np
+
+FIRST = date(2023, 1, 1).toordinal()
+DAYS = 3 * 365
+
+
+def synthetic():
+    """Two noiseless series: a growing seasonal one with weekend dips, and a flat one."""
+    ords = np.arange(FIRST, FIRST + DAYS)
+    t = (ords - FIRST) / 365.25
+    season = np.cos(2 * np.pi * ords / 365.25)
+    weekend = ((ords - 1) % 7 >= 5).astype(float)
+    heating = 10 + 2 * t + 3 * season - 4 * weekend
+    flat = np.full(DAYS, 1.5)
+    return np.vstack([heating, flat])
+
+
+def test_batch_fit_recovers_series():
+    if np is None:
+        return
+    values = synthetic()
+    model = forecasting.SeasonalTrendModel(ridge=0.0).fit(['heating', 'flat'], FIRST, values)
+    assert model.last == FIRST + DAYS - 1 and model.days == DAYS and model.used_harmonics == 3
+    # Noiseless series are reproduced, and the next year continues the pattern
+    assert np.allclose(model.predict(FIRST, DAYS), values, atol=1e-6)
+    ords = np.arange(model.last + 1, model.last + 366)
+    expected = (10 + 2 * (ords - FIRST) / 365.25 + 3 * np.cos(2 * np.pi * ords / 365.25)
+                - 4 * ((ords - 1) % 7 >= 5))
+    assert np.allclose(model.predict(model.last + 1, 365)[0], expected, atol=1e-6)
+    assert np.allclose(model.predict(model.last + 1, 365)[1], 1.5, atol=1e-6)
+
+    # The one batched solve gives the same coefficients as fitting each series alone
+    rng = np.random.default_rng(7)
+    noisy = values + rng.normal(0, 0.5, values.shape)
+    batch = forecasting.SeasonalTrendModel().fit(['heating', 'flat'], FIRST, noisy)
+    for i, name in enumerate(['heating', 'flat']):
+        single = forecasting.SeasonalTrendModel().fit([name], FIRST, noisy[i:i + 1])
+        assert np.allclose(batch.coef[:, i], single.coef[:, 0])
+        assert abs(batch.sigma[i] - 0.5) < 0.05
+
+
+def test_short_and_empty_history():
+    if np is None:
+        return
+    # Trailing days without data are not recorded yet; 100 days are too few for yearly terms
+    values = np.zeros((1, 130))
+    values[0, :100] = 2.0
+    model = forecasting.SeasonalTrendModel().fit(['electricity'], FIRST, values)
+    assert model.last == FIRST + 99 and model.days == 100 and model.used_harmonics == 0 and model.weekdays
+    assert np.allclose(model.predict(model.last + 1, 30), 2.0, atol=1e-3)
+    assert forecasting.SeasonalTrendModel().fit(['electricity'], FIRST, np.zeros((1, 30))).coef is None
+
+
+def test_projection():
+    if np is None:
+        return
+    values = np.zeros((2, 59))
+    values[0, :] = 3.0      # 2023-01-01 .. 2023-02-28
+    values[1, :] = 0.5
+    model = forecasting.SeasonalTrendModel().fit(['bus_diesel', 'human'], FIRST, values, total={'bus_diesel'})
+    projection = model.project(FIRST, date(2023, 3, 31).toordinal())
+    assert projection['forecast_days'] == 31
+    diesel, human = projection['series']
+    assert diesel['name'] == 'bus_diesel' and diesel['actual'] == 177.0 and abs(diesel['forecast'] - 93.0) < 0.1
+    assert diesel['lower'] <= diesel['projected'] <= diesel['upper']
+    assert human['actual'] == 29.5
+    # The total only covers the sources named in `total`
+    total = projection['total']
+    assert total['actual'] == 177.0 and total['projected'] == diesel['projected']
+    assert [m['month'] for m in projection['monthly']] == ['2023-01', '2023-02', '2023-03']
+    assert projection['monthly'][0] == {'month': '2023-01', 'actual': 93.0, 'forecast': 0.0}
+    assert projection['monthly'][2]['actual'] == 0.0 and abs(projection['monthly'][2]['forecast'] - 93.0) < 0.1
+
+
+def test_model_cache():
+    cache = forecasting.ModelCache(ttl=60.0, max_entries=2)
+    fits = []
+
+    def fit(name):
+        fits.append(name)
+        return name
+
+    assert cache.get_or_fit('a', lambda: fit('a')) == ('a', False)
+    assert cache.get_or_fit('a', lambda: fit('a')) == ('a', True)
+    cache.get_or_fit('b', lambda: fit('b'))
+    cache.get_or_fit('c', lambda: fit('c'))
+    # 'a' was the least recently used entry beyond max_entries
+    assert cache.get_or_fit('a', lambda: fit('a')) == ('a', False)
+    cache.invalidate()
+    assert cache.get_or_fit('c', lambda: fit('c')) == ('c', False)
+    assert fits == ['a', 'b', 'c', 'a', 'c'] and cache.stats == {'hit': 1, 'fit': 5}
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("EMISSIONS FORECASTING")
+    print("=" * 70)
+    if np is None:
+        print("numpy is not installed; skipping the model tests")
+    test_batch_fit_recovers_series()
+    print("✓ One batched fit recovers every series' trend, season and weekday pattern")
+    test_short_and_empty_history()
+    print("✓ Short histories drop the yearly terms; unrecorded trailing days are ignored")
+    test_projection()
+    print("✓ Periods split into recorded and forecast tonnes, per series, in total and per month")
+    test_model_cache()
+    print("✓ Fitted models are cached until invalidated")
@@ -2,9 +2,9 @@
 Comprehensive Test for Human CO2 Emissions Calculations
 Tests the entire data flow from database to API to ensure accuracy
 """
-import mysql.connector
 from dotenv import load_dotenv
-import os
+
+import db_backends
 
 load_dotenv()
 
@@ -13,12 +13,7 @@ print("HUMAN CO₂ EMISSIONS CALCULATION VERIFICATION")
 print("=" * 70)
 
 # Connect to database
-conn = mysql.connector.connect(
-    host=os.getenv('DB_HOST', 'localhost'),
-    user=os.getenv('DB_USER', 'root'),
-    password=os.getenv('DB_PASSWORD'),
-    database=os.getenv('DB_NAME', 'campus_carbon')
-)
+conn = db_backends.from_env().connect()
 cursor = conn.cursor(dictionary=True)
 
 print("\n📊 TEST 1: Verify Emission Factor")
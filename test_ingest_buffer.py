@@ -0,0 +1,116 @@
+"""
+Tests for the micro-batching ingest buffer (ingest_buffer.py): concurrent
+submissions are coalesced into few flushes, tickets complete only after their
+flush, flush errors reach the waiting request (and only the request whose rows
+were rejected) and a full buffer pushes back.
+
+Run: python test_ingest_buffer.py   (or via pytest)
+"""
+import threading
+import time
+
+import ingest_buffer
+
+
+def test_concurrent_submits_are_batched():
+    flushed = []
+    batcher = ingest_buffer.MicroBatcher(flushed.append, max_batch_rows=1000, max_delay_ms=50)
+
+    tickets = []
+    lock = threading.Lock()
+
+    def submit(n):
+        ticket = batcher.submit([(n, i) for i in range(100)])
+        with lock:
+            tickets.append(ticket)
+
+    threads = [threading.Thread(target=submit, args=(n,)) for n in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for ticket in tickets:
+        assert ticket.wait(5)
+
+    assert sum(len(rows) for rows in flushed) == 2000
+    # 2000 rows with 1000-row batches: a couple of flushes, not one per request
+    assert len(flushed) <= 4, [len(rows) for rows in flushed]
+    assert all(len(rows) <= 1000 for rows in flushed)
+    assert batcher.snapshot()['rows'] == 2000
+
+
+def test_flush_error_reaches_waiter():
+    def failing_writer(rows):
+        raise RuntimeError('database unavailable')
+
+    batcher = ingest_buffer.MicroBatcher(failing_writer, max_delay_ms=5)
+    ticket = batcher.submit([1, 2, 3])
+    try:
+        ticket.wait(5)
+        raise AssertionError('flush error was swallowed')
+    except RuntimeError as e:
+        assert 'unavailable' in str(e)
+    assert batcher.stats['failed_flushes'] == 1
+
+
+def test_bad_request_fails_alone():
+    written = []
+    release = threading.Event()
+
+    def writer(rows):
+        release.wait(5)
+        if 'bad' in rows:
+            raise ValueError('Out of range value for column raw_value')
+        written.extend(rows)
+
+    batcher = ingest_buffer.MicroBatcher(writer, max_batch_rows=1000, max_delay_ms=1)
+    # The first flush holds the writer while the next two requests are buffered into one flush
+    first = batcher.submit(['a1', 'a2'])
+    time.sleep(0.05)
+    bad = batcher.submit(['b1', 'bad'])
+    last = batcher.submit(['c1'])
+    release.set()
+    assert first.wait(5) and last.wait(5)
+    try:
+        bad.wait(5)
+        raise AssertionError('expected the write error')
+    except ValueError:
+        pass
+    assert sorted(written) == ['a1', 'a2', 'c1']
+    assert batcher.stats['failed_requests'] == 1 and batcher.stats['rows'] == 3
+
+
+def test_full_buffer_applies_backpressure():
+    release = threading.Event()
+
+    def slow_writer(rows):
+        release.wait(5)
+
+    batcher = ingest_buffer.MicroBatcher(slow_writer, max_batch_rows=100, max_delay_ms=1,
+                                         max_pending_rows=150, submit_timeout=0.1)
+    first = batcher.submit(range(100))
+    time.sleep(0.05)  # the flusher is now stuck writing the first batch
+    try:
+        batcher.submit(range(100))
+        raise AssertionError('expected Backpressure')
+    except ingest_buffer.Backpressure as e:
+        assert e.retry_after >= 1
+    assert batcher.stats['rejected_rows'] == 100
+
+    release.set()
+    assert first.wait(5)
+    assert batcher.submit(range(100)).wait(5)
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("INGEST MICRO-BATCHING")
+    print("=" * 70)
+    test_concurrent_submits_are_batched()
+    print("✓ Concurrent submits are coalesced into batched flushes")
+    test_flush_error_reaches_waiter()
+    print("✓ Flush errors are reported to the waiting request")
+    test_bad_request_fails_alone()
+    print("✓ A request with rejected rows fails alone; the rest of its flush is committed")
+    test_full_buffer_applies_backpressure()
+    print("✓ A full buffer rejects new rows until the flush completes")
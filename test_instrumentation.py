@@ -0,0 +1,125 @@
+"""
+Tests for request timing (instrumentation.py) as app.py wires it up: timed requests
+carry a Server-Timing header with the pool, SQL, aggregation and serialization spans,
+queries at or over slow_query_ms are logged with their SQL and route, and turning
+timing off through /api/admin/instrumentation (admins only) removes the header.
+The other runtime admin endpoints are restricted the same way.
+
+Run: python test_instrumentation.py   (or via pytest)
+"""
+import logging
+import shutil
+
+import instrumentation
+from test_db_backends import login, make_app_client
+
+
+class LogCapture(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def with_settings(enabled, slow_query_ms, check):
+    # Importing app sets REQUEST_TIMING / SLOW_QUERY_MS: create the client first
+    _, client, directory = make_app_client(users=('admin', 'viewer'))
+    saved = (instrumentation.settings.enabled, instrumentation.settings.slow_query_ms)
+    instrumentation.settings.enabled, instrumentation.settings.slow_query_ms = enabled, slow_query_ms
+    try:
+        check(client)
+    finally:
+        instrumentation.settings.enabled, instrumentation.settings.slow_query_ms = saved
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_server_timing_header():
+    def check(client):
+        response = client.get('/api/dashboard?days=30')
+        assert response.status_code == 200
+        metrics = [part.split(';')[0] for part in response.headers['Server-Timing'].split(', ')]
+        # Known spans first, in SPAN_ORDER, and the request total last
+        known = [name for name in metrics if name in instrumentation.SPAN_ORDER]
+        assert known == [name for name in instrumentation.SPAN_ORDER if name in known]
+        assert {'acquire', 'db', 'aggregate', 'serialize'} <= set(known)
+        assert metrics[-1] == 'total'
+        db = next(part for part in response.headers['Server-Timing'].split(', ') if part.startswith('db;'))
+        queries = int(db.split('desc="')[1].split(' ')[0])
+        assert queries > 0
+
+    with_settings(True, 0, check)
+
+
+def test_slow_query_log_threshold():
+    capture = LogCapture()
+    instrumentation.logger.addHandler(capture)
+    try:
+        # Nothing reaches an hour
+        with_settings(True, 3600 * 1000, lambda client: client.get('/api/dashboard?days=30'))
+        assert not capture.messages
+        # Every statement takes at least a nanosecond
+        with_settings(True, 1e-6, lambda client: client.get('/api/dashboard?days=30'))
+        assert capture.messages
+        assert all(message.startswith('Slow query') for message in capture.messages)
+        assert any('[GET /api/dashboard]' in message and 'FROM activity_data' in message
+                   for message in capture.messages)
+        # SQL is logged on one line
+        assert not any('\n' in message for message in capture.messages)
+        # 0 disables the log, also while timing is off
+        del capture.messages[:]
+        with_settings(True, 0, lambda client: client.get('/api/dashboard?days=30'))
+        with_settings(False, 0, lambda client: client.get('/api/dashboard?days=30'))
+        assert not capture.messages
+    finally:
+        instrumentation.logger.removeHandler(capture)
+
+
+def test_disabled_removes_header():
+    def check(client):
+        assert 'Server-Timing' in client.get('/api/dashboard?days=30').headers
+        # Only admins change the settings
+        viewer = login(client, 'viewer')
+        assert client.post('/api/admin/instrumentation', json={'enabled': False}, headers=viewer).status_code == 403
+        assert client.post('/api/admin/instrumentation', json={'enabled': False}).status_code == 401
+        assert instrumentation.settings.enabled
+
+        admin = login(client, 'admin')
+        assert client.post('/api/admin/instrumentation', json={'enabled': 'no'}, headers=admin).status_code == 400
+        response = client.post('/api/admin/instrumentation', json={'enabled': False}, headers=admin)
+        assert response.status_code == 200
+        body = response.get_json()
+        assert body['enabled'] is False and isinstance(body['pid'], int)
+        assert 'Server-Timing' not in client.get('/api/dashboard?days=30').headers
+
+        client.post('/api/admin/instrumentation', json={'enabled': True}, headers=admin)
+        assert 'Server-Timing' in client.get('/api/dashboard?days=30').headers
+
+    with_settings(True, 0, check)
+
+
+def test_admin_endpoints_need_an_admin():
+    def check(client):
+        viewer, admin = login(client, 'viewer'), login(client, 'admin')
+        for path in ('/api/admin/result_cache', '/api/admin/columnar', '/api/admin/warmup'):
+            assert client.get(path).status_code == 401
+            assert client.get(path, headers=viewer).status_code == 403
+            assert client.post(path, headers=viewer).status_code == 403
+            assert client.get(path, headers=admin).status_code == 200
+
+    with_settings(False, 0, check)
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("REQUEST TIMING")
+    print("=" * 70)
+    test_server_timing_header()
+    print("✓ Timed requests carry Server-Timing with acquire, db (query count), aggregate, serialize, total")
+    test_slow_query_log_threshold()
+    print("✓ Queries at or over slow_query_ms are logged with route and SQL; 0 disables the log")
+    test_disabled_removes_header()
+    print("✓ Admins can turn timing off at runtime, which removes the header; others get 401/403")
+    test_admin_endpoints_need_an_admin()
+    print("✓ The result cache, columnar and warm-up admin endpoints answer admins only")
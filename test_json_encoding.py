@@ -0,0 +1,108 @@
+"""
+Tests for response encoding in app.py: the orjson and standard-library JSON
+providers encode dates, datetimes, Decimals and the rest of a payload the same
+way (through jsonify() too), and JSON responses are gzip/brotli compressed
+according to Accept-Encoding.
+
+Run: python test_json_encoding.py   (or via pytest)
+"""
+import gzip
+import json
+import shutil
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+from test_db_backends import make_app_client
+
+PAYLOAD = {
+    'day': date(2025, 3, 1),
+    'at': datetime(2025, 3, 1, 12, 30, 5),
+    'at_micro': datetime(2025, 3, 1, 12, 30, 5, 250000),
+    'at_utc': datetime(2025, 3, 1, 12, 30, tzinfo=timezone.utc),
+    'total': Decimal('1234.50'),
+    'rows': [{'date': date(2024, 12, 31), 'raw_total': Decimal('0.1'), 'emissions': 1.25}],
+    'count': 3,
+    'name': 'Main campus',
+    'none': None,
+}
+
+EXPECTED = {
+    'day': '2025-03-01',
+    'at': '2025-03-01T12:30:05',
+    'at_micro': '2025-03-01T12:30:05.250000',
+    'at_utc': '2025-03-01T12:30:00+00:00',
+    'total': '1234.50',
+    'rows': [{'date': '2024-12-31', 'raw_total': '0.1', 'emissions': 1.25}],
+    'count': 3,
+    'name': 'Main campus',
+    'none': None,
+}
+
+
+def providers(app):
+    found = [app.StdlibJSONProvider(app.app)]
+    if app.orjson is not None:
+        found.append(app.OrjsonProvider(app.app))
+    return found
+
+
+def test_backends_encode_alike():
+    app, _, directory = make_app_client()
+    try:
+        for provider in providers(app):
+            assert json.loads(provider.dumps(PAYLOAD)) == EXPECTED, type(provider).__name__
+            with app.app.app_context():
+                response = provider.response(PAYLOAD)
+                assert response.mimetype == 'application/json'
+                assert json.loads(response.get_data(as_text=True)) == EXPECTED
+                assert json.loads(provider.response(day=date(2025, 3, 1)).get_data(as_text=True)) == {'day': '2025-03-01'}
+        # The installed provider (serialize span included) does the same
+        assert json.loads(app.app.json.dumps(PAYLOAD)) == EXPECTED
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_compression_negotiation():
+    app, client, directory = make_app_client()
+    saved = app.COMPRESS_MIN_SIZE
+    app.COMPRESS_MIN_SIZE = 200
+    try:
+        plain = client.get('/api/dashboard?days=30', headers={'Accept-Encoding': 'identity'})
+        body = plain.get_data()
+        assert 'Content-Encoding' not in plain.headers and 'Accept-Encoding' in plain.headers['Vary']
+        assert len(body) >= app.COMPRESS_MIN_SIZE
+
+        zipped = client.get('/api/dashboard?days=30', headers={'Accept-Encoding': 'gzip, deflate'})
+        assert zipped.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(zipped.get_data()) == body
+
+        # q=0 refuses an encoding; brotli is preferred when installed
+        refused = client.get('/api/dashboard?days=30', headers={'Accept-Encoding': 'gzip;q=0'})
+        assert 'Content-Encoding' not in refused.headers and refused.get_data() == body
+        either = client.get('/api/dashboard?days=30', headers={'Accept-Encoding': 'gzip, br'})
+        if app.brotli is not None:
+            assert either.headers['Content-Encoding'] == 'br'
+            assert app.brotli.decompress(either.get_data()) == body
+        else:
+            assert either.headers['Content-Encoding'] == 'gzip'
+        assert app.choose_encoding('*') == 'gzip'
+        assert app.choose_encoding('br;q=0, gzip;q=0.5') == 'gzip'
+        assert app.choose_encoding('') is None
+
+        # Below the threshold responses are sent as they are
+        app.COMPRESS_MIN_SIZE = len(body) + 1
+        small = client.get('/api/dashboard?days=30', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in small.headers and small.get_data() == body
+    finally:
+        app.COMPRESS_MIN_SIZE = saved
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("RESPONSE ENCODING")
+    print("=" * 70)
+    test_backends_encode_alike()
+    print("✓ orjson and stdlib encode dates (ISO 8601), datetimes and Decimals alike, also via jsonify()")
+    test_compression_negotiation()
+    print("✓ gzip/brotli follow Accept-Encoding (q=0 refuses) and the size threshold")
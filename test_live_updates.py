@@ -0,0 +1,130 @@
+"""
+Tests for the live update broker (live_updates.py): events reach every worker's
+streams through the Redis relay with shared ids, the version watch makes other
+workers' clients reload after a write, and an id from another worker is never
+replayed against this worker's history.
+
+Run: python test_live_updates.py   (or via pytest)
+"""
+import queue
+import threading
+
+import live_updates
+
+
+class FakeRedis:
+    """Stand-in for the eval/pubsub calls RedisRelay makes (one shared channel)."""
+
+    def __init__(self):
+        self.counter = 0
+        self.queues = []
+        self._lock = threading.Lock()
+
+    def eval(self, script, numkeys, counter, channel, message):
+        with self._lock:
+            self.counter += 1
+            for q in list(self.queues):
+                q.put({'type': 'message', 'data': f"{self.counter} {message}".encode()})
+            return self.counter
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return FakePubSub(self)
+
+
+class FakePubSub:
+    def __init__(self, server):
+        self.server = server
+        self.queue = queue.Queue()
+
+    def subscribe(self, channel):
+        self.server.queues.append(self.queue)
+
+    def get_message(self, timeout=None):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.server.queues.remove(self.queue)
+
+
+def next_event(sub):
+    return sub.queue.get(timeout=2)
+
+
+def test_redis_relay_reaches_every_worker():
+    server = FakeRedis()
+    workers = [live_updates.EventBroker(relay=live_updates.RedisRelay(server, poll_timeout=0.05))
+               for _ in range(2)]
+    subs = [broker.subscribe() for broker in workers]
+
+    event_id = workers[0].publish('activity', {'changes': []})
+    assert event_id == 1
+    assert [next_event(sub) for sub in subs] == [(1, 'activity', {'changes': []})] * 2
+    workers[1].publish('human', {'entry': {}})
+    assert [next_event(sub)[:2] for sub in subs] == [(2, 'human')] * 2
+
+    # Ids are shared, so a client can resume on the other worker
+    assert workers[1]._replay(1) == [(2, 'human', {'entry': {}})]
+
+
+def test_version_watch_reloads_after_another_workers_write():
+    version = {'value': 7}
+    watches = [live_updates.VersionWatch(lambda: version['value']) for _ in range(2)]
+    workers = [live_updates.EventBroker(watch=watch) for watch in watches]
+    for watch, broker in zip(watches, workers):
+        assert not watch.check(broker)    # first check only records the version
+
+    # Worker 0 writes: its own clients got the delta, worker 1's must reload
+    version['value'] += 1
+    watches[0].note_local_write()
+    assert not watches[0].check(workers[0])
+    assert watches[1].check(workers[1])
+    sub = workers[1].subscribe()
+    assert not watches[1].check(workers[1])
+
+    # A write noted before the next check is not reported; one more from elsewhere is
+    version['value'] += 2
+    watches[1].note_local_write()
+    assert watches[1].check(workers[1])
+    assert next_event(sub)[1:] == ('reload', {'reason': 'remote_write'})
+
+    # A write whose version bump failed is not counted against later remote writes
+    watches[1].note_local_write()
+    watches[1].forget_local_write()
+    version['value'] += 1
+    assert watches[1].check(workers[1])
+    assert next_event(sub)[1:] == ('reload', {'reason': 'remote_write'})
+    workers[1].unsubscribe(sub)
+
+
+def test_foreign_event_id_asks_for_reload():
+    first, second = live_updates.EventBroker(), live_updates.EventBroker()
+    own = first.publish('activity', {})
+    first.publish('activity', {})
+    second.publish('activity', {})
+    assert first._replay(own) == [(own + 1, 'activity', {})]
+    assert first._replay(own + 1) == []
+    # An id from the other worker (above or below this one's range) is not resumed
+    foreign = second._next_id - 1
+    assert first._replay(foreign) is None
+
+    sub = first.subscribe()
+    stream = first.stream(sub, last_event_id=foreign)
+    assert next(stream) == "retry: 5000\n\n"
+    assert next(stream) == first.format(own + 1, 'reload', {'reason': 'history_expired'})
+    stream.close()
+    assert not first.has_subscribers()
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("LIVE UPDATES")
+    print("=" * 70)
+    test_redis_relay_reaches_every_worker()
+    print("✓ The Redis relay delivers every event, with shared ids, on every worker")
+    test_version_watch_reloads_after_another_workers_write()
+    print("✓ Another worker's write makes this worker's clients reload")
+    test_foreign_event_id_asks_for_reload()
+    print("✓ An event id from another worker is answered with a reload")
@@ -0,0 +1,104 @@
+"""
+Tests for the multi-worker metrics merge (metrics.py): with METRICS_DIR, counters
+and histograms of every worker snapshot add up, gauges of exited workers (also
+one whose pid was recycled by this process) are skipped, and exited workers'
+files are folded into the aggregate file so later scrapes count them once.
+
+Run: python test_metrics.py   (or via pytest)
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import metrics
+
+
+def exited_pid():
+    """The pid of a process that has already exited."""
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def worker_snapshot(requests, latencies, connections):
+    """A snapshot as another worker would write it."""
+    registry = metrics.Registry()
+    fill(registry, requests, latencies, connections)
+    return registry.snapshot()
+
+
+def fill(registry, requests, latencies, connections):
+    counter = registry.counter('requests_total', 'Requests.')
+    histogram = registry.histogram('latency_seconds', 'Latency.', buckets=(0.1, 1.0))
+    gauge = registry.gauge('connections', 'Open connections.')
+    counter.inc(requests, route='/a')
+    for latency in latencies:
+        histogram.observe(latency, route='/a')
+    gauge.set(connections)
+    return registry
+
+
+def write(directory, name, snapshot):
+    with open(os.path.join(directory, f"metrics_{name}.json"), 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f)
+
+
+def values(text):
+    """{sample name with labels: value} from Prometheus text."""
+    return {line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1])
+            for line in text.splitlines() if line and not line.startswith('#')}
+
+
+def test_snapshots_add_up_and_dead_gauges_are_skipped():
+    directory = tempfile.mkdtemp(prefix='metrics-test-')
+    try:
+        registry = fill(metrics.Registry(directory), 1, [0.05], 1)
+        dead = exited_pid()
+        write(directory, f"{dead}-1000", worker_snapshot(10, [0.5, 2.0], 100))
+        # A live worker (the parent process) and an earlier process that had this pid
+        write(directory, f"{os.getppid()}-1000", worker_snapshot(100, [0.05], 1000))
+        write(directory, f"{os.getpid()}-1", worker_snapshot(1000, [5.0], 10000))
+
+        first = values(registry.render())
+        assert first['requests_total{route="/a"}'] == 1111
+        assert first['latency_seconds_count{route="/a"}'] == 5
+        assert first['latency_seconds_bucket{route="/a",le="0.1"}'] == 2
+        assert first['latency_seconds_bucket{route="/a",le="1"}'] == 3
+        assert first['latency_seconds_bucket{route="/a",le="+Inf"}'] == 5
+        assert abs(first['latency_seconds_sum{route="/a"}'] - 7.6) < 1e-9
+        # Only this worker and the live one
+        assert first['connections'] == 1001
+
+        # Exited workers were folded into the aggregate file and are counted once from now on
+        files = sorted(os.listdir(directory))
+        assert metrics.AGGREGATE_FILE in files
+        assert f"metrics_{dead}-1000.json" not in files and f"metrics_{os.getpid()}-1.json" not in files
+        assert f"metrics_{os.getppid()}-1000.json" in files
+        registry.metrics['requests_total'].inc(route='/a')
+        second = values(registry.render())
+        assert second['requests_total{route="/a"}'] == 1112
+        assert second['latency_seconds_count{route="/a"}'] == 5
+        assert second['connections'] == 1001
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_single_process_renders_own_registry():
+    registry = fill(metrics.Registry(), 3, [0.2], 7)
+    rendered = values(registry.render())
+    assert rendered['requests_total{route="/a"}'] == 3
+    assert rendered['latency_seconds_bucket{route="/a",le="1"}'] == 1
+    assert rendered['connections'] == 7
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("METRICS")
+    print("=" * 70)
+    test_snapshots_add_up_and_dead_gauges_are_skipped()
+    print("✓ Worker counters and histograms add up; exited workers' gauges are skipped and their files folded")
+    test_single_process_renders_own_registry()
+    print("✓ Without METRICS_DIR the process renders its own registry")
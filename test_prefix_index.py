@@ -0,0 +1,252 @@
+"""
+Correctness test for the prefix-sum index in analytics_store.py.
+Loads randomized activity/headcount data into a SQLite database (db_backends), then
+checks that O(1) range lookups and the store's dashboard payload match the app's SQL
+dashboard aggregation (build_dashboard_data and its daily queries) for many random
+date windows and site filters, including after incremental inserts, rows committed
+below ids already read, and a factor change.
+
+Run: python test_prefix_index.py   (or via pytest)
+"""
+import random
+import shutil
+from datetime import date, datetime, timedelta
+
+import analytics_store
+import factor_cache
+from test_db_backends import import_app, make_backend
+
+# The app aggregates on whatever connection it is handed
+app = import_app()
+
+SOURCES = {'electricity': 0.708, 'bus_diesel': 2.68, 'canteen_lpg': 2.93, 'waste_landfill': 1.25}
+# (source_type, factor, valid_from, valid_to): a new grid factor mid-range, a source
+# without a factor for a while, and a new per-person factor
+PERIODS = [(source, factor, '1000-01-01', None) for source, factor in SOURCES.items()
+           if source not in ('electricity', 'waste_landfill')] + [
+    ('electricity', 0.708, '1000-01-01', '2023-06-30'),
+    ('electricity', 0.65, '2023-07-01', None),
+    ('waste_landfill', 1.25, '1000-01-01', '2023-02-28'),
+    ('waste_landfill', 1.1, '2023-04-01', None),
+    ('human_daily', 1.0, '1000-01-01', '2023-08-31'),
+    ('human_daily', 1.2, '2023-09-01', None),
+]
+SITES = ('main', 'north', 'city')
+SITE_FILTERS = (None, ('main',), ('city', 'north'), ('missing',))
+
+
+class Fixture:
+    """A SQLite backend on a fresh file with the schema and PERIODS loaded."""
+
+    def __init__(self):
+        self.backend, self.directory = make_backend()
+        self.execute('DELETE FROM emission_factors')
+        self.executemany("INSERT INTO emission_factors (source_type, factor, factor_unit, valid_from, valid_to) "
+                         "VALUES (%s, %s, 'kg', %s, %s)", PERIODS)
+        # Every fixture is a new database at factor version 1: do not reuse another one's factors
+        app.emission_factors = factor_cache.EmissionFactorCache(check_interval=0)
+
+    def connect(self):
+        return self.backend.connect()
+
+    def execute(self, *statements):
+        connection = self.connect()
+        cursor = connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        connection.commit()
+        connection.close()
+
+    def executemany(self, statement, rows):
+        connection = self.connect()
+        connection.cursor().executemany(statement, rows)
+        connection.commit()
+        connection.close()
+
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def insert_random(db, rnd, start, days):
+    """Random rows over `days` days: gaps, several rows per day and a source without a factor."""
+    activity, human = [], []
+    for offset in range(days):
+        d = start + timedelta(days=offset)
+        for source in list(SOURCES) + ['unknown_source']:
+            for _ in range(rnd.choice((0, 0, 1, 1, 2))):
+                activity.append((rnd.choice(SITES), d, source, round(rnd.uniform(0, 150000), 2), 'unit'))
+        for site in SITES:
+            if rnd.random() < 0.4:
+                human.append((site, d, rnd.randint(0, 4000), rnd.randint(0, 500)))
+    db.executemany("INSERT INTO activity_data (site_code, date, source_type, raw_value, unit) "
+                   "VALUES (%s, %s, %s, %s, %s)", activity)
+    db.executemany(app.HUMAN_UPSERT, human)
+
+
+def app_totals(connection, a, b, sites):
+    """Unrounded per-source and headcount totals from the app's daily dashboard queries."""
+    factors = app.emission_factors.timeline(connection)
+    _, params = app.site_filter_sql(sites)
+    cursor = connection.cursor(dictionary=True)
+    try:
+        sources, raw = {}, {}
+        rows = app.grouped_rows(cursor, app.daily_activity_query(sites), a.isoformat(), b.isoformat(), params,
+                                keys=('date', 'source_type'))
+        for row in app.apply_factors(rows, factors):
+            sources[row['source_type']] = sources.get(row['source_type'], 0.0) + row['emissions_tonnes']
+            raw[row['source_type']] = raw.get(row['source_type'], 0.0) + row['raw_total']
+        human = app.grouped_rows(cursor, app.daily_human_query(sites), a.isoformat(), b.isoformat(), params,
+                                 keys=('date',))
+        app.build_human_emissions(human, factors)
+    finally:
+        cursor.close()
+    return {
+        'sources': sources,
+        'electricity_raw': raw.get('electricity', 0.0),
+        'human_days': len(human),
+        'students': sum(int(row['student_count']) for row in human),
+        'staff': sum(int(row['staff_count']) for row in human),
+        'human_emissions': sum(row['emissions_tonnes'] for row in human),
+    }
+
+
+def check_windows(db, store, rnd, lo_date, hi_date, windows=300):
+    connection = db.connect()
+    span = (hi_date - lo_date).days
+    try:
+        for n in range(windows):
+            # Windows may start before / end after the loaded data
+            a = lo_date + timedelta(days=rnd.randint(-30, span + 30))
+            b = a + timedelta(days=rnd.randint(0, 400))
+            sites = rnd.choice(SITE_FILTERS)
+            where = (a, b, sites)
+            totals = store.range_totals(a.toordinal(), b.toordinal(), sites)
+            expected = app_totals(connection, a, b, sites)
+
+            assert set(totals['sources']) == set(expected['sources']), (where, totals['sources'], expected)
+            for source, tonnes in expected['sources'].items():
+                assert abs(totals['sources'][source] - tonnes) < 1e-6, (where, source)
+            assert abs(totals['total'] - sum(expected['sources'].values())) < 1e-6, where
+            assert abs(totals['electricity_raw'] - expected['electricity_raw']) < 1e-6, where
+            assert abs(totals['human_emissions'] - expected['human_emissions']) < 1e-6, where
+            for key in ('human_days', 'students', 'staff'):
+                assert totals[key] == expected[key], (where, key)
+            assert totals['people'] == expected['students'] + expected['staff'], where
+
+            # The whole payload, as /api/dashboard serves it from either path
+            if n % 10 == 0:
+                start_dt, end_dt = datetime(a.year, a.month, a.day), datetime(b.year, b.month, b.day)
+                window_days = max((end_dt - start_dt).days, 1)
+                want = app.build_dashboard_data(connection, start_dt, end_dt, window_days,
+                                                set(app.DASHBOARD_SECTIONS), sites)
+                got = store.dashboard(a.toordinal(), b.toordinal(), window_days, set(app.DASHBOARD_SECTIONS), sites)
+                for payload in (want, got):
+                    payload['source_breakdown'].sort(key=lambda row: row['source'])
+                assert got == want, where
+    finally:
+        connection.close()
+
+
+def test_prefix_index_matches_sql():
+    rnd = random.Random(2025)
+    db = Fixture()
+    try:
+        start = date(2023, 1, 1)
+        insert_random(db, rnd, start, 500)
+        store = analytics_store.EmissionsStore()
+        store.load(db.connect())
+        check_windows(db, store, rnd, start, start + timedelta(days=500))
+    finally:
+        db.close()
+
+
+def test_prefix_index_after_incremental_refresh():
+    rnd = random.Random(7)
+    db = Fixture()
+    try:
+        start = date(2024, 3, 1)
+        insert_random(db, rnd, start, 200)
+        store = analytics_store.EmissionsStore()
+        store.load(db.connect())
+
+        # New rows extend the range on both sides and overwrite some headcounts
+        insert_random(db, rnd, start - timedelta(days=90), 150)
+        insert_random(db, rnd, start + timedelta(days=180), 120)
+        store.refresh(db.connect())
+        check_windows(db, store, rnd, start - timedelta(days=90), start + timedelta(days=300))
+    finally:
+        db.close()
+
+
+def test_rows_committed_below_seen_ids():
+    rnd = random.Random(5)
+    db = Fixture()
+    try:
+        start = date(2024, 1, 1)
+        insert_random(db, rnd, start, 60)
+        # A slow transaction holds ids 1..20 while the later rows are read
+        connection = db.connect()
+        cursor = connection.cursor()
+        cursor.execute("SELECT id, site_code, date, source_type, raw_value, unit FROM activity_data WHERE id <= 20")
+        late = cursor.fetchall()
+        connection.close()
+        db.execute("DELETE FROM activity_data WHERE id <= 20")
+        store = analytics_store.EmissionsStore(settle_seconds=3600)
+        store.load(db.connect())
+        assert store.settled_id == 0
+
+        db.executemany("INSERT INTO activity_data (id, site_code, date, source_type, raw_value, unit) "
+                       "VALUES (%s, %s, %s, %s, %s, %s)", late)
+        for _ in range(2):
+            store.refresh(db.connect())
+            check_windows(db, store, rnd, start, start + timedelta(days=60))
+
+        # Once settled, the tail rows are added for good and not counted twice
+        store.settle_seconds = 0
+        for _ in range(2):
+            store.refresh(db.connect())
+            check_windows(db, store, rnd, start, start + timedelta(days=60))
+        assert store.settled_id > 0 and store._tail == {}
+    finally:
+        db.close()
+
+
+def test_prefix_index_after_factor_change():
+    rnd = random.Random(11)
+    db = Fixture()
+    try:
+        start = date(2023, 1, 1)
+        insert_random(db, rnd, start, 400)
+        store = analytics_store.EmissionsStore()
+        store.load(db.connect())
+        before = store.range_totals(start.toordinal(), date(2023, 12, 31).toordinal())
+
+        # New electricity and per-person factors from 2024 on: earlier windows keep their totals
+        connection = db.connect()
+        cursor = connection.cursor()
+        factor_cache.add_factor_period(cursor, 'electricity', 0.5, 'kg', '2024-01-01')
+        factor_cache.add_factor_period(cursor, 'human_daily', 0.9, 'kg', '2024-01-01')
+        factor_cache.bump_factor_version(cursor, db.backend)
+        connection.commit()
+        connection.close()
+        store.refresh(db.connect())
+        assert store.range_totals(start.toordinal(), date(2023, 12, 31).toordinal()) == before
+        check_windows(db, store, rnd, start, start + timedelta(days=400))
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    if analytics_store.np is None:
+        raise SystemExit("numpy is required for the analytics store")
+    print("=" * 70)
+    print("PREFIX-SUM INDEX VS SQL AGGREGATION")
+    print("=" * 70)
+    test_prefix_index_matches_sql()
+    print("✓ Random windows match the app's SQL dashboard")
+    test_prefix_index_after_incremental_refresh()
+    print("✓ Random windows match the app's SQL dashboard after incremental refresh")
+    test_rows_committed_below_seen_ids()
+    print("✓ Rows committed late, below ids already read, are picked up once")
+    test_prefix_index_after_factor_change()
+    print("✓ A factor change re-weights only the dates it covers")
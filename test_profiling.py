@@ -0,0 +1,88 @@
+"""
+Tests for per-request profiling (profiling.py as app.py wires it up): only users
+listed in PROFILE_ADMINS may profile a request or read saved profiles, and an
+admin's `__profile=speedscope` request returns (inline) or saves a valid
+speedscope document.
+
+Run: python test_profiling.py   (or via pytest)
+"""
+import json
+import os
+import shutil
+
+import profiling
+from test_db_backends import login, make_app_client
+
+
+def profiled_client():
+    """(app, client, directory) with profiles saved under the fixture directory."""
+    app, client, directory = make_app_client(users=('admin', 'viewer'))
+    app.PROFILE_DIR = os.path.join(directory, 'profiles')
+    app.profile_store = profiling.ProfileStore(app.PROFILE_DIR)
+    app.PROFILE_INTERVAL_MS = 0.1
+    return app, client, directory
+
+
+def check_speedscope(document):
+    assert document['$schema'] == 'https://www.speedscope.app/file-format-schema.json'
+    frames = document['shared']['frames']
+    assert all(isinstance(frame['name'], str) and 'file' in frame for frame in frames)
+    (profile,) = document['profiles']
+    assert profile['type'] == 'sampled' and profile['unit'] == 'milliseconds'
+    assert profile['startValue'] == 0 and profile['endValue'] >= 0
+    assert len(profile['samples']) == len(profile['weights'])
+    assert all(0 <= index < len(frames) for stack in profile['samples'] for index in stack)
+    assert all(weight >= 0 for weight in profile['weights'])
+
+
+def test_profiling_needs_an_admin():
+    app, client, directory = profiled_client()
+    try:
+        assert client.get('/api/dashboard?days=30&__profile=speedscope').status_code == 401
+        viewer = login(client, 'viewer')
+        response = client.get('/api/dashboard?days=30&__profile=speedscope', headers=viewer)
+        assert response.status_code == 403
+        assert 'X-Profile' not in response.headers
+        assert client.get('/api/dashboard?days=30&__profile=1', headers=viewer).status_code == 403
+        assert client.get('/api/admin/profiles', headers=viewer).status_code == 403
+        assert app.profile_store.list() == []
+        # Without __profile the request is served as usual
+        assert client.get('/api/dashboard?days=30', headers=viewer).status_code == 200
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_admin_gets_a_speedscope_document():
+    app, client, directory = profiled_client()
+    try:
+        admin = login(client, 'admin')
+        response = client.get('/api/dashboard?days=30&__profile=speedscope&__profile_output=inline', headers=admin)
+        assert response.status_code == 200 and response.mimetype == 'application/json'
+        assert response.headers['X-Profile-Status'] == '200'
+        document = json.loads(response.get_data(as_text=True))
+        check_speedscope(document)
+        assert document['name'].startswith('GET /api/dashboard?')
+
+        # Saved: listed and downloadable
+        response = client.get('/api/dashboard?days=30&__profile=speedscope', headers=admin)
+        assert response.status_code == 200 and 'kpis' in response.get_json()
+        name = response.headers['X-Profile']
+        assert name.endswith('.speedscope.json')
+        listed = client.get('/api/admin/profiles', headers=admin).get_json()['profiles']
+        assert [entry['name'] for entry in listed] == [name]
+        download = client.get(f'/api/admin/profiles/{name}', headers=admin)
+        assert download.status_code == 200
+        check_speedscope(json.loads(download.get_data(as_text=True)))
+        assert client.get('/api/dashboard?days=30&__profile=flame', headers=admin).status_code == 400
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("REQUEST PROFILING")
+    print("=" * 70)
+    test_profiling_needs_an_admin()
+    print("✓ Non-admins get 401/403 for __profile and the profile list; nothing is saved")
+    test_admin_gets_a_speedscope_document()
+    print("✓ Admins get a valid speedscope document inline, or saved, listed and downloadable")
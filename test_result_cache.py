@@ -0,0 +1,143 @@
+"""
+Tests for the shared result cache (result_cache.py): values round-trip through
+the compact encoding, two workers sharing a SQLite file see each other's entries,
+invalidation from one worker reaches the other, a write only invalidates the
+entries whose dates and sites it overlaps, and a lease is held by one worker at a time.
+
+Run: python test_result_cache.py   (or via pytest)
+"""
+import os
+import shutil
+import tempfile
+import time
+
+import result_cache
+
+
+def test_pack_round_trip():
+    small = '{"a": 1}'
+    large = '{"rows": [' + ', '.join(['{"date": "2025-01-01", "emissions": 1.25}'] * 200) + ']}'
+    assert result_cache.unpack(result_cache.pack(small)) == small
+    packed = result_cache.pack(large)
+    assert packed[:1] == b'z' and len(packed) < len(large) / 10
+    assert result_cache.unpack(packed) == large
+
+
+def test_sqlite_backend_is_shared_and_invalidated():
+    directory = tempfile.mkdtemp(prefix='result-cache-test-')
+    try:
+        path = os.path.join(directory, 'results.sqlite3')
+        # Two caches on one file behave like two workers
+        worker_a = result_cache.ResultCache(result_cache.SQLiteBackend(path))
+        worker_b = result_cache.ResultCache(result_cache.SQLiteBackend(path))
+        computed = []
+
+        def compute():
+            computed.append(1)
+            return {'total_emissions': 12.5, 'sites': ['main']}
+
+        assert worker_a.get_or_compute('dashboard', ('2025-01-01', 'main'), compute) == (compute(), False)
+        computed.clear()
+        value, hit = worker_b.get_or_compute('dashboard', ('2025-01-01', 'main'), compute)
+        assert hit and value == {'total_emissions': 12.5, 'sites': ['main']} and not computed
+        # Different parameters are a different entry
+        assert worker_b.get_or_compute('dashboard', ('2025-01-01', 'north'), compute)[1] is False
+
+        worker_a.invalidate()
+        assert worker_b.get_or_compute('dashboard', ('2025-01-01', 'main'), compute)[1] is False
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_writes_invalidate_overlapping_entries():
+    directory = tempfile.mkdtemp(prefix='result-cache-test-')
+    try:
+        path = os.path.join(directory, 'results.sqlite3')
+        for worker_a, worker_b in ((result_cache.ResultCache(result_cache.SQLiteBackend(path)),
+                                    result_cache.ResultCache(result_cache.SQLiteBackend(path))),
+                                   (result_cache.ResultCache(result_cache.MemoryBackend()),) * 2):
+            scopes = {
+                'old': ('2019-01-01', '2019-12-31', None),
+                'recent': ('2025-06-01', '2025-06-30', None),
+                'recent_main': ('2025-06-01', '2025-06-30', ['main']),
+                'all_time': ('1000-01-01', '9999-12-31', ['north']),
+            }
+
+            def cached(name, worker=worker_a):
+                return worker.get_or_compute(name, (), lambda: {'name': name}, scopes[name])[1]
+
+            assert not any(cached(name) for name in scopes)
+            assert all(cached(name, worker_b) for name in scopes)
+
+            # Today's ingest at one site: other dates and sites stay cached
+            worker_b.note_write('2025-06-15', '2025-06-15', {'city'})
+            assert [cached(name) for name in scopes] == [True, False, True, True]
+            # ...until the write reaches them
+            worker_a.note_write('2019-03-01', '2019-03-02', {'main', 'north'})
+            assert [cached(name) for name in scopes] == [False, True, True, False]
+            assert all(cached(name, worker_b) for name in scopes)
+
+            # Entries without a scope miss after any write, and so do entries older than the log
+            assert not worker_a.get_or_compute('unscoped', (), dict)[1]
+            assert worker_a.get_or_compute('unscoped', (), dict)[1]
+            worker_a.note_write('2030-01-01', '2030-01-01', {'main'})
+            assert not worker_a.get_or_compute('unscoped', (), dict)[1]
+            for _ in range(result_cache.WRITE_LOG_SIZE + 1):
+                worker_a.note_write('2030-01-01', '2030-01-01', {'main'})
+            assert not cached('old')
+            assert cached('old', worker_b)
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_lease_is_held_by_one_worker():
+    directory = tempfile.mkdtemp(prefix='result-cache-test-')
+    try:
+        path = os.path.join(directory, 'results.sqlite3')
+        worker_a = result_cache.ResultCache(result_cache.SQLiteBackend(path))
+        worker_b = result_cache.ResultCache(result_cache.SQLiteBackend(path))
+        release = worker_a.lease('warmup', 60)
+        assert release is not None and worker_b.lease('warmup', 60) is None
+        assert worker_b.lease('other', 60) is not None
+        release()
+        release = worker_b.lease('warmup', 60)
+        assert release is not None and worker_a.lease('warmup', 60) is None
+
+        # An expired lease (its holder died mid warm-up) can be taken over
+        assert worker_a.lease('crashed', 0.05) is not None
+        assert worker_b.lease('crashed', 60) is None
+        time.sleep(0.1)
+        assert worker_b.lease('crashed', 60) is not None
+
+        # Cached entries are reported without being computed
+        assert not worker_a.contains('stats', ())
+        worker_b.get_or_compute('stats', (), lambda: {'ok': True})
+        assert worker_a.contains('stats', ())
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_backend_failure_falls_back_to_compute():
+    class Broken:
+        def generation(self):
+            raise ConnectionError('cache server down')
+
+    cache = result_cache.ResultCache(Broken())
+    assert cache.get_or_compute('stats', (), lambda: {'ok': True}) == ({'ok': True}, False)
+    assert cache.stats['error'] == 1
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("SHARED RESULT CACHE")
+    print("=" * 70)
+    test_pack_round_trip()
+    print("✓ Values round-trip through the compressed encoding")
+    test_sqlite_backend_is_shared_and_invalidated()
+    print("✓ Workers share entries and invalidation")
+    test_writes_invalidate_overlapping_entries()
+    print("✓ A write only invalidates the entries whose dates and sites it overlaps")
+    test_lease_is_held_by_one_worker()
+    print("✓ A lease is held by one worker at a time and expires")
+    test_backend_failure_falls_back_to_compute()
+    print("✓ A failing backend never fails the request")
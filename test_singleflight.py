@@ -0,0 +1,117 @@
+"""
+Tests for single-flight coalescing (singleflight.py): concurrent callers with
+the same key share one computation and its errors, a bumped data version starts
+a fresh one, and the cross-process mode shares a result between processes.
+
+Run: python test_singleflight.py   (or via pytest)
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import singleflight
+
+
+def run_concurrently(count, target):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def test_concurrent_calls_share_one_computation():
+    group = singleflight.Group()
+    computed = []
+    results = []
+
+    def compute():
+        computed.append(1)
+        time.sleep(0.1)
+        return {'total': 42}
+
+    run_concurrently(20, lambda: results.append(group.do(('window', group.version()), compute)))
+    assert len(computed) == 1
+    assert all(result == {'total': 42} for result, _ in results)
+    assert sum(shared for _, shared in results) == 19
+    assert group.stats['leader'] == 1 and group.stats['shared'] == 19
+
+    # Not a cache: the next call computes again
+    group.do(('window', group.version()), compute)
+    assert len(computed) == 2
+
+
+def test_errors_reach_every_waiter():
+    group = singleflight.Group()
+    errors = []
+
+    def fail():
+        time.sleep(0.05)
+        raise RuntimeError('database unavailable')
+
+    def call():
+        try:
+            group.do('k', fail)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    run_concurrently(5, call)
+    assert errors == ['database unavailable'] * 5
+
+
+def test_bump_changes_the_key():
+    group = singleflight.Group()
+    before = group.version()
+    group.bump()
+    assert group.version() != before
+
+
+def _cross_process_worker(directory, start_at, out):
+    group = singleflight.Group(shared_dir=directory)
+    time.sleep(max(0.0, start_at - time.time()))
+
+    def compute():
+        with open(os.path.join(directory, f'computed-{os.getpid()}'), 'w'):
+            pass
+        time.sleep(0.3)
+        return {'rows': [1, 2, 3]}
+
+    result, _ = group.do(('window', group.version()), compute)
+    out.put(result)
+
+
+def test_cross_process_sharing():
+    if singleflight.fcntl is None:
+        return
+    directory = tempfile.mkdtemp(prefix='singleflight-test-')
+    try:
+        ctx = multiprocessing.get_context('fork')
+        out = ctx.Queue()
+        start_at = time.time() + 0.2
+        procs = [ctx.Process(target=_cross_process_worker, args=(directory, start_at, out)) for _ in range(3)]
+        for p in procs:
+            p.start()
+        results = [out.get(timeout=10) for _ in procs]
+        for p in procs:
+            p.join()
+        assert results == [{'rows': [1, 2, 3]}] * 3
+        assert len([n for n in os.listdir(directory) if n.startswith('computed-')]) == 1
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("SINGLE-FLIGHT COALESCING")
+    print("=" * 70)
+    test_concurrent_calls_share_one_computation()
+    print("✓ Concurrent identical calls share one computation")
+    test_errors_reach_every_waiter()
+    print("✓ The leader's error is raised in every waiter")
+    test_bump_changes_the_key()
+    print("✓ A data change starts a new computation")
+    test_cross_process_sharing()
+    print("✓ Workers sharing SINGLEFLIGHT_DIR compute once")
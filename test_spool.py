@@ -0,0 +1,117 @@
+"""
+Tests for the ingest write-ahead spool (spool.py): spooled records are replayed
+once, a torn last line is skipped, a replay while the database is down leaves
+the segment for the next pass, and a record that keeps failing is dead-lettered
+without holding back the others.
+
+Run: python test_spool.py   (or via pytest)
+"""
+import os
+import shutil
+import tempfile
+import threading
+
+import spool
+
+
+def make_spool():
+    return spool.Spool(tempfile.mkdtemp(prefix='spool-test-'))
+
+
+def test_append_and_drain():
+    s = make_spool()
+    try:
+        threads = [threading.Thread(target=lambda n=n: s.append('activity', [[n, 1.5]])) for n in range(20)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert s.has_backlog()
+        # One fsync may cover several concurrent appends
+        assert 1 <= s.stats['fsyncs'] <= 20
+
+        applied = []
+        assert s.drain(lambda records: applied.extend(records) or len(records), batch_records=6) == 20
+        assert sorted(r['rows'][0][0] for r in applied) == list(range(20))
+        assert len({r['id'] for r in applied}) == 20
+        assert not s.has_backlog()
+    finally:
+        shutil.rmtree(s.directory)
+
+
+def test_torn_line_is_skipped():
+    s = make_spool()
+    try:
+        s.append('human', [['main', '2025-01-01', 10, 2]])
+        with open(os.path.join(s.directory, '1-1-000001.ready'), 'wb') as f:
+            f.write(b'{"id":"abc","kind":"hu')
+        applied = []
+        assert s.drain(lambda records: applied.extend(records) or len(records)) == 1
+        assert applied[0]['kind'] == 'human'
+        assert s.stats['corrupt_lines'] == 1
+    finally:
+        shutil.rmtree(s.directory)
+
+
+def test_failed_replay_keeps_segment():
+    s = make_spool()
+    try:
+        s.append('activity', [['main', '2025-01-01', 'electricity', 1.0, 'kWh']])
+
+        def down(records):
+            raise spool.Unavailable('Database connection error')
+
+        try:
+            s.drain(down)
+            raise AssertionError('expected the replay error')
+        except spool.Unavailable:
+            pass
+        assert [name for name in os.listdir(s.directory) if name.endswith('.ready')]
+        assert s.stats['record_failures'] == 0
+        assert s.drain(lambda records: len(records)) == 1
+        assert os.listdir(s.directory) == []
+    finally:
+        shutil.rmtree(s.directory)
+
+
+def test_bad_record_is_dead_lettered():
+    s = spool.Spool(tempfile.mkdtemp(prefix='spool-test-'), max_attempts=2)
+    try:
+        for n in range(5):
+            s.append('activity', [['main', 'notadate' if n == 2 else '2025-01-0%d' % (n + 1), 'electricity', 1.0,
+                                   'kWh']])
+        applied = []
+
+        def apply(records):
+            # Like a transaction: the whole batch fails when one of its rows is rejected
+            if any(r['rows'][0][1] == 'notadate' for r in records):
+                raise ValueError('Incorrect date value')
+            applied.extend(r['id'] for r in records)
+            return len(records)
+
+        # The other records go through; the bad one is put back for another attempt
+        assert s.drain(apply) == 4 and len(applied) == 4
+        assert s.has_backlog() and s.stats['record_failures'] == 1
+        assert s.drain(apply) == 0
+        # Then moved to the dead-letter file, which is not backlog
+        assert not s.has_backlog()
+        count, recent = s.dead_letters()
+        assert count == 1 and recent[0]['rows'][0][1] == 'notadate' and recent[0]['attempts'] == 2
+        assert 'Incorrect date value' in recent[0]['error']
+        assert s.snapshot()['dead_letter']['records'] == 1
+    finally:
+        shutil.rmtree(s.directory)
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("INGEST SPOOL")
+    print("=" * 70)
+    test_append_and_drain()
+    print("✓ Concurrent appends are group-committed and replayed once each")
+    test_torn_line_is_skipped()
+    print("✓ A torn final line is skipped")
+    test_failed_replay_keeps_segment()
+    print("✓ A failed replay leaves the segment for the next pass")
+    test_bad_record_is_dead_lettered()
+    print("✓ A record that keeps failing is dead-lettered without blocking the others")
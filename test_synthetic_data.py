@@ -0,0 +1,104 @@
+"""
+Tests for the synthetic data generator (synthetic_data.py): the calendar flags
+weekdays and term breaks, generated series follow the season and the weekly
+pattern, sub-daily readings add up to the daily rows and are split into raw and
+hourly tiers at the retention cutoffs, and a seed reproduces the same data.
+Skipped without numpy.
+
+Run: python test_synthetic_data.py   (or via pytest)
+"""
+from datetime import date, datetime
+
+import synthetic_data
+
+PROFILE = {'electricity': (1000.0, 100.0, 'kWh'), 'bus_diesel': (50.0, 10.0, 'Liters')}
+CUTOFFS = {'raw': datetime(2025, 3, 25), 'hourly': datetime(2025, 3, 1)}
+
+
+def test_calendar():
+    if synthetic_data.np is None:
+        return
+    cal = synthetic_data.calendar(date(2024, 12, 30), 10)
+    assert cal['dates'][0] == '2024-12-30' and cal['dates'][-1] == '2025-01-08'
+    assert cal['weekday'][0] == 0  # 2024-12-30 was a Monday
+    assert cal['doy'][2] == 1
+    # The winter break wraps the new year and ends on 5 January
+    assert cal['in_break'].tolist() == [True] * 7 + [False] * 3
+
+
+def test_season_and_week():
+    np = synthetic_data.np
+    if np is None:
+        return
+    cal = synthetic_data.calendar(date(2023, 1, 1), 3 * 365)
+    values = synthetic_data.daily_values(np.random.default_rng(1), cal, 'electricity', 1000.0, 1.0,
+                                         growth=0.0, outliers=0.0)
+    month = cal['d64'].astype('datetime64[M]').astype(int) % 12 + 1
+    teaching = ~cal['in_break']
+    weekday, weekend = teaching & (cal['weekday'] < 5), teaching & (cal['weekday'] == 6)
+    assert values[weekday].mean() > 1.5 * values[weekend].mean()
+    # Electricity peaks in the hot months (April) and is lowest around November
+    assert values[weekday & (month == 4)].mean() > values[weekday & (month == 11)].mean() * 1.2
+    assert values[teaching].mean() > values[cal['in_break'] & (cal['weekday'] < 5)].mean()
+
+
+def test_readings_add_up_and_follow_retention():
+    np = synthetic_data.np
+    if np is None:
+        return
+    cal = synthetic_data.calendar(date(2025, 2, 1), 59)  # through 31 March
+    tables = synthetic_data.generate_site(np.random.default_rng(5), cal, 'b02', 0.5, PROFILE, interval=15,
+                                          metered=('electricity',), cutoffs=CUTOFFS)
+    activity = {(d, s): v for site, d, s, v, _ in tables['activity_data']}
+    assert len(activity) == 2 * 59 and all(site == 'b02' for site, *_ in tables['activity_data'])
+    assert len(tables['human_population']) == 59
+
+    raw = tables['meter_readings']
+    assert {t[:10] for _, t, *_ in raw} == {f"2025-03-{d:02d}" for d in range(25, 32)}
+    assert len(raw) == 7 * 96 and raw[0][1] == '2025-03-25 00:00:00' and raw[1][1] == '2025-03-25 00:15:00'
+    day_total = sum(v for _, t, _, v, _ in raw if t.startswith('2025-03-30'))
+    assert abs(day_total - activity[('2025-03-30', 'electricity')]) < 0.01
+
+    hourly = tables['meter_readings_hourly']
+    assert len(hourly) == 24 * 24 and all(count == 4 for *_, count in hourly)
+    assert min(h for _, h, *_ in hourly) == '2025-03-01 00:00:00'
+    day_total = sum(v for _, h, _, _, v, _ in hourly if h.startswith('2025-03-10'))
+    assert abs(day_total - activity[('2025-03-10', 'electricity')]) < 0.01
+    # Unmetered sources only get daily rows
+    assert {s for _, _, s, *_ in raw} == {'electricity'}
+
+
+def test_entries_per_day_and_seed():
+    np = synthetic_data.np
+    if np is None:
+        return
+    cal = synthetic_data.calendar(date(2025, 1, 1), 30)
+
+    def generate(seed, entries):
+        return synthetic_data.generate_site(np.random.default_rng(seed), cal, 'main', 1.0, PROFILE,
+                                            entries_per_day=entries, cutoffs=CUTOFFS)
+
+    assert generate(3, 1) == generate(3, 1)
+    assert generate(3, 1) != generate(4, 1)
+    daily, split = generate(3, 1)['activity_data'], generate(3, 4)['activity_data']
+    assert len(split) == 4 * len(daily)
+    totals = {}
+    for _, d, s, v, _ in split:
+        totals[(d, s)] = totals.get((d, s), 0.0) + v
+    assert all(abs(totals[(d, s)] - v) < 0.01 for _, d, s, v, _ in daily)
+
+
+if __name__ == '__main__':
+    if synthetic_data.np is None:
+        raise SystemExit("numpy is required for the synthetic data generator")
+    print("=" * 70)
+    print("SYNTHETIC DATA")
+    print("=" * 70)
+    test_calendar()
+    print("✓ Calendar flags weekdays and term breaks across the new year")
+    test_season_and_week()
+    print("✓ Series follow the season, the week and term breaks")
+    test_readings_add_up_and_follow_retention()
+    print("✓ Sub-daily readings add up to the daily rows and split into raw/hourly tiers")
+    test_entries_per_day_and_seed()
+    print("✓ Split daily entries keep the total; the seed reproduces the data")
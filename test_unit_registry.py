@@ -0,0 +1,74 @@
+"""
+Tests for the unit registry (unit_registry.py): unit names and aliases resolve,
+emission factor units name each source's canonical unit, values are converted to
+it (MWh -> kWh, tonnes -> kg), and unknown or incompatible units are all reported
+with their row indices.
+
+Run: python test_unit_registry.py   (or via pytest)
+"""
+import unit_registry
+
+FACTOR_UNITS = {
+    'electricity': 'kg_co2e_per_kwh',
+    'bus_diesel': 'kg_co2e_per_liter',
+    'canteen_lpg': 'kg_co2e_per_kg',
+    'human_daily': 'kg_co2e_per_person_per_day',
+}
+
+
+def test_lookup():
+    assert unit_registry.lookup('kWh') == unit_registry.lookup(' KWH ') == ('kWh', 'energy', 1.0)
+    assert unit_registry.lookup('litres').name == 'Liters'
+    assert unit_registry.lookup('metric tons').name == 't'
+    assert unit_registry.lookup('furlongs') is None and unit_registry.lookup(None) is None
+    assert unit_registry.factor_unit('kg_co2e_per_liter').name == 'Liters'
+    assert unit_registry.factor_unit('kg_co2e_per_person_per_day') is None
+    assert set(unit_registry.canonical_units(FACTOR_UNITS)) == {'electricity', 'bus_diesel', 'canteen_lpg'}
+
+
+def test_normalize():
+    values, names, errors = unit_registry.normalize(
+        ['electricity', 'electricity', 'bus_diesel', 'canteen_lpg', 'waste_landfill', 'electricity'],
+        [1250.0, 1.5, 2.0, 0.25, 500.0, 3.6],
+        ['kWh', 'MWh', 'gal', 'tonnes', 'lbs', 'GJ'],
+        FACTOR_UNITS)
+    assert errors == []
+    assert names == ['kWh', 'kWh', 'Liters', 'kg', 'kg', 'kWh']
+    expected = [1250.0, 1500.0, 7.570823568, 250.0, 226.796185, 1000.0]
+    assert all(abs(got - want) < 1e-9 for got, want in zip(values, expected)), values
+
+
+def test_rejections_are_reported_together():
+    values, names, errors = unit_registry.normalize(
+        ['electricity', 'electricity', 'bus_diesel', 'electricity', 'bus_diesel'],
+        [1.0, 2.0, 3.0, 4.0, 5.0],
+        ['kWh', 'kg', 'L', 'MWhh', 'kg'],
+        FACTOR_UNITS)
+    assert [index for index, _ in errors] == [1, 3, 4]
+    assert errors[0][1] == 'Unit "kg" cannot be converted to kWh for electricity'
+    assert errors[1][1] == 'Unknown unit "MWhh"'
+    assert values[0] == 1.0 and values[2] == 3.0 and values[1] is None
+
+
+def test_without_numpy_path():
+    saved = unit_registry.np
+    unit_registry.np = None
+    try:
+        values, names, errors = unit_registry.normalize(['electricity'], [2.5], ['MWh'], FACTOR_UNITS)
+        assert values == [2500.0] and names == ['kWh'] and errors == []
+    finally:
+        unit_registry.np = saved
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("UNIT REGISTRY")
+    print("=" * 70)
+    test_lookup()
+    print("✓ Units, aliases and factor units resolve")
+    test_normalize()
+    print("✓ Values are converted to each source's canonical unit")
+    test_rejections_are_reported_together()
+    print("✓ Unknown and incompatible units are reported with their rows")
+    test_without_numpy_path()
+    print("✓ Conversion works without numpy")
@@ -0,0 +1,100 @@
+"""
+Tests for the dashboard warm-up scheduler (warmup.py): the rollover timer aims
+just past the next local/UTC midnight, a worker warms once at start, a
+burst of write triggers is coalesced into one warm-up, and a worker that cannot
+claim the warm-up skips it and looks again later.
+
+Run: python test_warmup.py   (or via pytest)
+"""
+import threading
+import time
+from datetime import datetime, timezone
+
+import warmup
+
+
+def test_rollover_is_next_midnight():
+    now = datetime(2025, 3, 14, 23, 59, 0, tzinfo=timezone.utc).timestamp()
+    wait = warmup.seconds_until_rollover(now, delay=0)
+    # Local midnight may come first, never later than the UTC one
+    assert 0 < wait <= 60
+    local_noon = datetime(2025, 3, 14, 12).timestamp()
+    assert 0 < warmup.seconds_until_rollover(local_noon, delay=5) <= 12 * 3600 + 5
+
+
+def test_startup_and_coalesced_triggers():
+    runs = []
+    done = threading.Event()
+
+    def warm():
+        runs.append(time.monotonic())
+        done.set()
+        return 3
+
+    warmer = warmup.Warmer(warm, min_interval=0.3)
+    warmer.start()
+    assert done.wait(2)
+    warmer.start()  # already running in this process
+    done.clear()
+    for _ in range(20):
+        warmer.trigger()
+    assert done.wait(2)
+    time.sleep(0.5)
+    assert len(runs) == 2
+    assert runs[1] - runs[0] >= 0.3
+    assert warmer.stats['runs'] == 2 and warmer.stats['payloads'] == 6
+    assert warmer.stats['last_reason'] == 'write'
+
+
+def test_only_the_claiming_worker_warms():
+    runs = []
+    done = threading.Event()
+    held = {'by_other': True}
+    released = []
+
+    def warm():
+        runs.append(time.monotonic())
+        done.set()
+        return 0
+
+    def claim():
+        if held['by_other']:
+            return None
+        return lambda: released.append(1)
+
+    warmer = warmup.Warmer(warm, min_interval=0.2, claim=claim)
+    warmer.start()
+    time.sleep(0.5)
+    # Another worker holds the claim: this one keeps skipping without warming
+    assert not runs and warmer.stats['skipped'] >= 2
+    held['by_other'] = False
+    assert done.wait(2)
+    time.sleep(0.1)
+    assert len(runs) == 1 and released == [1]
+    assert warmer.stats['last_reason'] == 'startup'
+
+
+def test_failure_is_counted():
+    def warm():
+        raise RuntimeError('database down')
+
+    warmer = warmup.Warmer(warm)
+    try:
+        warmer.run_once()
+    except RuntimeError:
+        pass
+    assert warmer.stats['failures'] == 1 and warmer.stats['runs'] == 0
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("DASHBOARD WARM-UP")
+    print("=" * 70)
+    test_rollover_is_next_midnight()
+    print("✓ The rollover timer fires just after the next midnight")
+    test_startup_and_coalesced_triggers()
+    print("✓ Warms at start; a burst of writes gives one warm-up")
+    test_only_the_claiming_worker_warms()
+    print("✓ Only the worker holding the claim warms; the others retry later")
+    test_failure_is_counted()
+    print("✓ Failed warm-ups are counted")
@@ -0,0 +1,120 @@
+"""
+Unit registry for ingested activity values.
+
+Every known unit belongs to a dimension (energy, volume, mass) and has a scale to
+that dimension's base unit. Ingest converts each value to the unit its source's
+emission factor is expressed per (`kg_co2e_per_kwh` -> kWh), or to the base unit
+for sources without such a factor, and stores the converted value, so read
+queries multiply raw_value by the factor as is. An upload in MWh or tonnes is
+scaled at ingest instead of being 1000x off; units that are unknown or of the
+wrong dimension for the source are rejected.
+
+normalize() looks each distinct (source_type, unit) pair up once and converts
+the values with one array multiply (numpy when installed, `pip install .[analytics]`).
+"""
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+Unit = namedtuple('Unit', 'name dimension scale')
+
+# name, dimension, scale to the dimension's base unit, aliases (matched case-insensitively)
+_UNITS = (
+    ('Wh', 'energy', 0.001, ()),
+    ('kWh', 'energy', 1.0, ('kilowatt_hour', 'kilowatt_hours')),
+    ('MWh', 'energy', 1000.0, ('megawatt_hour', 'megawatt_hours')),
+    ('GWh', 'energy', 1000000.0, ()),
+    ('MJ', 'energy', 1 / 3.6, ()),
+    ('GJ', 'energy', 1000 / 3.6, ()),
+    ('therm', 'energy', 29.3071, ('therms',)),
+    ('MMBtu', 'energy', 293.071, ()),
+    ('mL', 'volume', 0.001, ('milliliter', 'milliliters', 'millilitre', 'millilitres')),
+    ('Liters', 'volume', 1.0, ('l', 'liter', 'litre', 'litres', 'ltr')),
+    ('kL', 'volume', 1000.0, ('kiloliter', 'kiloliters', 'kilolitre', 'kilolitres')),
+    ('m3', 'volume', 1000.0, ('m³', 'cubic_meter', 'cubic_meters', 'cubic_metre', 'cubic_metres')),
+    ('gal', 'volume', 3.785411784, ('gallon', 'gallons', 'us_gal')),
+    ('g', 'mass', 0.001, ('gram', 'grams')),
+    ('kg', 'mass', 1.0, ('kgs', 'kilogram', 'kilograms')),
+    ('t', 'mass', 1000.0, ('tonne', 'tonnes', 'metric_ton', 'metric_tons')),
+    ('lb', 'mass', 0.45359237, ('lbs', 'pound', 'pounds')),
+)
+
+UNITS = {}
+for _name, _dimension, _scale, _aliases in _UNITS:
+    for _alias in (_name,) + _aliases:
+        UNITS[_alias.lower()] = Unit(_name, _dimension, _scale)
+
+BASE_UNITS = {unit.dimension: unit for unit in UNITS.values() if unit.scale == 1.0}
+
+
+def lookup(name):
+    """The Unit called `name` (case and surrounding/inner spaces ignored), or None."""
+    if name is None:
+        return None
+    return UNITS.get('_'.join(str(name).split()).lower())
+
+
+def factor_unit(factor_unit_name):
+    """The activity unit an emission factor is expressed per ('kg_co2e_per_kwh' -> kWh), or None."""
+    _, per, rest = str(factor_unit_name or '').partition('_per_')
+    return lookup(rest) if per else None
+
+
+def canonical_units(factor_units):
+    """{source_type: Unit} to store each source in, from {source_type: factor_unit}."""
+    canonical = {}
+    for source, name in factor_units.items():
+        unit = factor_unit(name)
+        if unit is not None:
+            canonical[source] = unit
+    return canonical
+
+
+def _conversion(source, unit_name, canonical):
+    """(scale, stored unit name, error) for one (source_type, unit) pair."""
+    unit = lookup(unit_name)
+    if unit is None:
+        return None, None, f'Unknown unit "{unit_name}"'
+    target = canonical.get(source) or BASE_UNITS[unit.dimension]
+    if target.dimension != unit.dimension:
+        return None, None, f'Unit "{unit_name}" cannot be converted to {target.name} for {source}'
+    return unit.scale / target.scale, target.name, None
+
+
+def normalize(source_types, values, unit_names, factor_units):
+    """
+    Convert parallel columns of activity values to each source's canonical unit.
+    `factor_units` is {source_type: factor_unit}. Returns (values, unit names, errors),
+    with errors as [(index, message)] for rows whose unit is unknown or of the wrong
+    dimension (their converted value is None).
+    """
+    canonical = canonical_units(factor_units)
+    pairs = {}
+    conversions = []
+    codes = []
+    for source, unit_name in zip(source_types, unit_names):
+        key = (source, unit_name)
+        code = pairs.get(key)
+        if code is None:
+            code = pairs[key] = len(conversions)
+            conversions.append(_conversion(source, unit_name, canonical))
+        codes.append(code)
+
+    scales = [scale if scale is not None else float('nan') for scale, _, _ in conversions]
+    if np is not None:
+        converted = (np.asarray(values, dtype=float) * np.asarray(scales)[np.asarray(codes, dtype=np.int64)]).tolist()
+    else:
+        converted = [float(value) * scales[code] for value, code in zip(values, codes)]
+
+    errors = []
+    names = []
+    for i, code in enumerate(codes):
+        _, name, error = conversions[code]
+        names.append(name)
+        if error:
+            errors.append((i, error))
+            converted[i] = None
+    return converted, names, errors
@@ -1,19 +1,14 @@
-import mysql.connector
 from dotenv import load_dotenv
-import os
 import requests
 
+import db_backends
+
 load_dotenv()
 
 print("=== VERIFICATION TEST ===\n")
 
 # 1. Check database
-conn = mysql.connector.connect(
-    host=os.getenv('DB_HOST', 'localhost'),
-    user=os.getenv('DB_USER', 'root'),
-    password=os.getenv('DB_PASSWORD'),
-    database=os.getenv('DB_NAME', 'campus_carbon')
-)
+conn = db_backends.from_env().connect()
 cursor = conn.cursor(dictionary=True)
 
 print("1. Database Check:")
@@ -0,0 +1,100 @@
+"""
+Background warm-up of the dashboard's standard windows.
+
+A Warmer runs `warm()` (app.py: compute the 7/30/90/180/365-day dashboard,
+bootstrap, recommendation and cumulative-stat payloads through the result
+cache) in a thread:
+- once when the worker starts,
+- after writes (trigger()), at most every `min_interval` seconds, so a busy
+  ingest stream causes one warm-up per interval rather than one per batch,
+- just after each date rollover (local and UTC midnight), when the default
+  windows move to new dates.
+
+With `claim` (app.py: a lease in the shared result cache) only one worker warms at
+a time; the others skip their turn and look again `min_interval` later, when the
+payloads the winner computed are already cached and warm() has little left to do.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+
+def seconds_until_rollover(now=None, delay=5.0):
+    """Seconds until the next local or UTC midnight (whichever is first), plus `delay`."""
+    now = now or time.time()
+    local = datetime.fromtimestamp(now)
+    utc = datetime.fromtimestamp(now, timezone.utc)
+    next_local = datetime(local.year, local.month, local.day) + timedelta(days=1)
+    next_utc = datetime(utc.year, utc.month, utc.day, tzinfo=timezone.utc) + timedelta(days=1)
+    return min(next_local.timestamp(), next_utc.timestamp()) - now + delay
+
+
+class Warmer:
+    def __init__(self, warm, min_interval=5.0, claim=None):
+        # warm() computes and caches the payloads that are missing; returns how many it produced.
+        # claim() returns a function releasing the claim, or None while another worker warms.
+        self.warm = warm
+        self.min_interval = min_interval
+        self.claim = claim
+        self._wake = threading.Event()
+        self._reason = None
+        self._thread_pid = None
+        self.stats = {'runs': 0, 'failures': 0, 'skipped': 0, 'payloads': 0, 'last_run': None,
+                      'last_reason': None, 'last_ms': 0.0}
+
+    def start(self):
+        """Start the scheduler thread (once per worker process); it warms immediately."""
+        if self._thread_pid == os.getpid():
+            return
+        self._thread_pid = os.getpid()
+        self._reason = 'startup'
+        self._wake.set()
+        threading.Thread(target=self._run, name='dashboard-warmup', daemon=True).start()
+
+    def trigger(self, reason='write'):
+        """Ask for a warm-up soon (coalesced with other triggers within min_interval)."""
+        self._reason = self._reason or reason
+        self._wake.set()
+
+    def run_once(self, reason='manual'):
+        t0 = time.perf_counter()
+        try:
+            count = self.warm()
+        except Exception:
+            self.stats['failures'] += 1
+            raise
+        self.stats['runs'] += 1
+        self.stats['payloads'] += count
+        self.stats['last_run'] = datetime.now().isoformat(timespec='seconds')
+        self.stats['last_reason'] = reason
+        self.stats['last_ms'] = round((time.perf_counter() - t0) * 1000, 2)
+        return count
+
+    def _run(self):
+        last = 0.0
+        while True:
+            woken = self._wake.wait(seconds_until_rollover())
+            if woken:
+                # Let a burst of writes settle into one warm-up
+                time.sleep(max(0.0, last + self.min_interval - time.monotonic()))
+            reason = (self._reason or 'write') if woken else 'rollover'
+            self._reason = None
+            self._wake.clear()
+            last = time.monotonic()
+            release = self.claim() if self.claim is not None else (lambda: None)
+            if release is None:
+                # Another worker is warming: check what it left missing on the next round
+                self.stats['skipped'] += 1
+                self.trigger(reason)
+                continue
+            try:
+                count = self.run_once(reason)
+                logger.info(f"Dashboard warm-up ({reason}): {count} payloads in {self.stats['last_ms']} ms")
+            except Exception:
+                logger.exception(f"Dashboard warm-up ({reason}) failed")
+            finally:
+                release()